@@ -1,23 +1,24 @@
-import os
-from pathlib import Path
+import json
+import sys
+from contextlib import redirect_stdout
 
-# 設定你的路徑
-label_path = r"D:\product_recognition\03_AI_Lab\yolo11_data\drink\test\labels" # 請確認這是你 labels 的實際路徑
-num_classes = 31
+from dataset_check import print_summary, validate_dataset
 
-print(f"--- 開始掃描標籤 (目標範圍: 0-30) ---")
-found_error = False
+# 設定你的路徑 (也可以從命令列傳入：python Tools.py <data.yaml> [report.json])
+data_yaml = r"D:\product_recognition\03_AI_Lab\yolo11_data\drink\data.yaml"
+report_path = None
 
-for txt_file in Path(label_path).glob('*.txt'):
-    with open(txt_file, 'r') as f:
-        for i, line in enumerate(f):
-            parts = line.split()
-            if not parts: continue
-            
-            class_id = int(parts[0])
-            if class_id >= num_classes:
-                print(f"❌ 錯誤位置: {txt_file.name} | 第 {i+1} 行 | ID 為 {class_id}")
-                found_error = True
+if len(sys.argv) > 1:
+    data_yaml = sys.argv[1]
+if len(sys.argv) > 2:
+    report_path = sys.argv[2]
 
-if not found_error:
-    print("✅ 訓練集標籤檢查完畢，未發現越界。請也對 valid/labels 執行相同檢查。")
\ No newline at end of file
+# 人類可讀的訊息走 stderr，stdout 只輸出機器可讀的 JSON 報告
+with redirect_stdout(sys.stderr):
+    print(f"--- 開始掃描資料集 (依 data.yaml 檢查 train / val / test) ---")
+    report = validate_dataset(data_yaml, report_path=report_path)
+    print_summary(report)
+
+json.dump(report, sys.stdout, ensure_ascii=False, indent=2)
+print()
+sys.exit(0 if report['ok'] else 1)
@@ -0,0 +1,117 @@
+import hashlib
+import json
+import os
+
+# ==========================================
+# 擴充清單 (Manifest)：記錄每張原圖產生過哪些變體
+# ==========================================
+# 存在資料集根目錄 (與 train/ 同層) 的 augment_manifest.json，結構如下：
+# {
+#   "version": 1,
+#   "sources": {
+#     "train/images/a.jpg": {
+#       "image": {"mtime_ns": ..., "size": ..., "sha1": "..."},
+#       "label": {"mtime_ns": ..., "size": ..., "sha1": "..."} 或 null,
+#       "variants": {"_flip": {"image": "train/images/a_flip.jpg",
+#                              "label": "train/labels/a_flip.txt", "by": "augment_dataset"}}
+#     }
+#   }
+# }
+# 重跑時先比對 mtime + size，只有不一致才計算雜湊，未變動的資料集不需要讀任何圖片。
+
+MANIFEST_NAME = "augment_manifest.json"
+MANIFEST_VERSION = 1
+
+
+def file_sha1(path, chunk_size=1 << 20):
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def bytes_sha1(data):
+    return hashlib.sha1(data).hexdigest()
+
+
+def scan_stats(folder):
+    """用 os.scandir 一次取得整個資料夾的 {檔名: (mtime_ns, size)}"""
+    stats = {}
+    if not os.path.isdir(folder):
+        return stats
+    with os.scandir(folder) as it:
+        for e in it:
+            if e.is_file():
+                st = e.stat()
+                stats[e.name] = (st.st_mtime_ns, st.st_size)
+    return stats
+
+
+def make_fingerprint(stat, sha1):
+    return {'mtime_ns': stat[0], 'size': stat[1], 'sha1': sha1}
+
+
+class AugmentManifest:
+    def __init__(self, data_root):
+        self.data_root = data_root
+        self.path = os.path.join(data_root, MANIFEST_NAME)
+        self.sources = {}
+        self.dirty = False
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ 擴充清單損毀，將重新建立：{e}")
+            return
+        if data.get('version') == MANIFEST_VERSION:
+            self.sources = data.get('sources', {})
+
+    def rel(self, path):
+        return os.path.relpath(path, self.data_root).replace(os.sep, '/')
+
+    def abs(self, rel_path):
+        return os.path.join(self.data_root, *rel_path.split('/'))
+
+    def get(self, rel_path):
+        return self.sources.get(rel_path)
+
+    def set(self, rel_path, record):
+        self.sources[rel_path] = record
+        self.dirty = True
+
+    def remove(self, rel_path):
+        if self.sources.pop(rel_path, None) is not None:
+            self.dirty = True
+
+    def matches(self, fingerprint, stat, path):
+        """
+        檢查檔案是否與清單紀錄相同
+        mtime + size 一致就直接相信；不一致時以內容雜湊為準 (例如只是被 touch 過)
+        """
+        if fingerprint is None or stat is None:
+            return fingerprint is None and stat is None
+        if fingerprint['mtime_ns'] == stat[0] and fingerprint['size'] == stat[1]:
+            return True
+        if fingerprint['size'] != stat[1]:
+            return False
+        if file_sha1(path) == fingerprint['sha1']:
+            fingerprint['mtime_ns'] = stat[0]
+            self.dirty = True
+            return True
+        return False
+
+    def save(self):
+        if not self.dirty:
+            return
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': MANIFEST_VERSION, 'sources': self.sources}, f,
+                      ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_path, self.path)
+        self.dirty = False
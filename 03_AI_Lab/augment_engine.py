@@ -0,0 +1,286 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+import cv2
+import numpy as np
+
+import yolo_labels
+from aug_manifest import AugmentManifest, bytes_sha1, make_fingerprint, scan_stats
+
+# ==========================================
+# 線下資料擴充引擎 (多核心、串流式)
+# ==========================================
+# 每張原圖只解碼一次，所有變體都從同一份解碼後的影像產生；
+# 任務以「有上限的佇列」送進 Process Pool，避免一次把上萬張圖排進記憶體。
+# 要處理哪些原圖由 augment_manifest.json 決定 (見 aug_manifest.py)。
+
+IMG_EXTS = ('.jpg', '.jpeg', '.png')
+
+
+def _flip(img):
+    return cv2.flip(img, 1)
+
+
+def _bright(img):
+    return cv2.convertScaleAbs(img, alpha=1.2, beta=30)
+
+
+def _dark(img):
+    return cv2.convertScaleAbs(img, alpha=0.8, beta=-30)
+
+
+# 變體清單：(後綴, 影像處理函式, 標籤轉換函式；None 代表標籤座標不變)
+# 注意：函式必須定義在模組層級，子行程才能 pickle
+VARIANTS = [
+    ("_flip", _flip, yolo_labels.hflip),
+    ("_bright", _bright, None),
+    ("_dark", _dark, None),
+]
+VARIANT_FUNCS = {suffix: (func, label_func) for suffix, func, label_func in VARIANTS}
+AUG_SUFFIXES = tuple(suffix for suffix, _, _ in VARIANTS)
+
+
+def is_source_image(name, suffixes=AUG_SUFFIXES):
+    """判斷是否為原始圖片 (副檔名正確且不帶擴充後綴)"""
+    return name.lower().endswith(IMG_EXTS) and not any(x in name for x in suffixes)
+
+
+def augment_one(task):
+    """
+    子行程工作：解碼一張原圖，產生指定的變體並寫回硬碟
+    task 欄位：
+      img_path / lab_path / img_dir / lab_dir / base_name
+      images: 需要重新產生圖片 (連同標籤) 的後綴
+      labels: 只需要重寫標籤的後綴 (原圖沒變、只有標籤被修改)
+    回傳 dict：寫入數量、錯誤訊息，以及原圖/標籤的 sha1 (寫入清單用)
+    """
+    result = {'written': 0, 'error': None, 'image_sha1': None, 'label_sha1': None}
+
+    # 標籤只解析一次成 (N, 5) 陣列，所有變體共用
+    labels = None
+    if os.path.exists(task['lab_path']):
+        with open(task['lab_path'], 'rb') as f:
+            raw = f.read()
+        result['label_sha1'] = bytes_sha1(raw)
+        labels = yolo_labels.parse_labels(raw.decode())
+
+    img = None
+    if task['images']:
+        with open(task['img_path'], 'rb') as f:
+            buf = f.read()
+        result['image_sha1'] = bytes_sha1(buf)
+        img = cv2.imdecode(np.frombuffer(buf, np.uint8), cv2.IMREAD_COLOR)
+        if img is None:
+            result['error'] = f"無法讀取 {task['img_path']}"
+            return result
+
+    for suffix in task['images'] + task['labels']:
+        func, label_func = VARIANT_FUNCS[suffix]
+        if suffix in task['images']:
+            cv2.imwrite(os.path.join(task['img_dir'], f"{task['base_name']}{suffix}.jpg"), func(img))
+
+        aug_lab_path = os.path.join(task['lab_dir'], f"{task['base_name']}{suffix}.txt")
+        if labels is not None:
+            yolo_labels.save_labels(aug_lab_path, label_func(labels) if label_func else labels)
+        elif os.path.exists(aug_lab_path):
+            # 原始標籤已被刪除，舊的變體標籤也不能留
+            os.remove(aug_lab_path)
+        result['written'] += 1
+    return result
+
+
+class _Progress:
+    """定時印出進度與吞吐量 (張/秒)"""
+
+    def __init__(self, total, interval=1.0):
+        self.total = total
+        self.done = 0
+        self.interval = interval
+        self.start = time.perf_counter()
+        self._last = 0.0
+
+    @property
+    def rate(self):
+        elapsed = time.perf_counter() - self.start
+        return self.done / elapsed if elapsed > 0 else 0.0
+
+    def step(self, n=1):
+        self.done += n
+        now = time.perf_counter()
+        if now - self._last >= self.interval or self.done == self.total:
+            self._last = now
+            print(f"\r⏳ 擴充進度 {self.done}/{self.total} 張原圖 | {self.rate:.1f} 張/秒", end="", flush=True)
+
+
+def plan_tasks(manifest, img_dir, lab_dir, suffixes=AUG_SUFFIXES, exclude=AUG_SUFFIXES):
+    """
+    對照擴充清單，列出需要處理的原圖
+    - 清單中沒有紀錄、或原圖內容已變動：重新產生全部變體
+    - 只有標籤被修改：只重寫變體標籤 (不解碼圖片)
+    - 變體圖片不在目錄中：補產生缺少的那幾個
+    mtime + size 都沒變的原圖完全不會被開啟
+    """
+    img_stats = scan_stats(img_dir)
+    lab_stats = scan_stats(lab_dir)
+
+    tasks = []
+    for name in sorted(img_stats):
+        if not is_source_image(name, exclude):
+            continue
+        base_name = os.path.splitext(name)[0]
+        img_path = os.path.join(img_dir, name)
+        lab_path = os.path.join(lab_dir, base_name + ".txt")
+        img_stat = img_stats[name]
+        lab_stat = lab_stats.get(base_name + ".txt")
+        record = manifest.get(manifest.rel(img_path))
+
+        if record is None or not manifest.matches(record['image'], img_stat, img_path):
+            # 新圖或原圖已被修改：所有紀錄過的變體都要重做
+            done = tuple(record['variants']) if record else ()
+            images = tuple(s for s in VARIANT_FUNCS if s in suffixes or s in done)
+            labels = ()
+        else:
+            present = {s for s in record['variants'] if f"{base_name}{s}.jpg" in img_stats}
+            images = tuple(s for s in suffixes if s not in present)
+            labels = ()
+            if not manifest.matches(record['label'], lab_stat, lab_path):
+                labels = tuple(s for s in VARIANT_FUNCS if s in present)
+
+        if images or labels:
+            tasks.append({
+                'img_path': img_path, 'lab_path': lab_path,
+                'img_dir': img_dir, 'lab_dir': lab_dir, 'base_name': base_name,
+                'images': images, 'labels': labels,
+                'img_stat': img_stat, 'lab_stat': lab_stat,
+            })
+    return tasks
+
+
+def prune_missing_sources(manifest, img_dir):
+    """
+    原圖已被刪除的紀錄：刪除它產生的變體圖片與標籤，並從清單移除
+    (否則變體會一直留在 train 裡，Tools.py 的清理也會一直把它們列為目標)
+    回傳 (移除的紀錄數, 刪除的檔案數)
+    """
+    prefix = manifest.rel(img_dir) + '/'
+    present = scan_stats(img_dir)
+    orphans = [rel for rel in manifest.sources
+               if rel.startswith(prefix) and rel[len(prefix):] not in present]
+    removed = 0
+    for rel in orphans:
+        for variant in manifest.get(rel)['variants'].values():
+            for rel_path in (variant.get('image'), variant.get('label')):
+                if not rel_path:
+                    continue
+                try:
+                    os.remove(manifest.abs(rel_path))
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+        manifest.remove(rel)
+    if orphans:
+        print(f"🧹 {len(orphans)} 張原圖已被刪除，一併移除 {removed} 個變體檔案")
+    return len(orphans), removed
+
+
+def _record_result(manifest, task, result, augmenter):
+    """把處理結果寫回清單：原圖與標籤的指紋，以及這次產生的變體"""
+    rel_img = manifest.rel(task['img_path'])
+    record = manifest.get(rel_img) or {'image': None, 'label': None, 'variants': {}}
+
+    if result['image_sha1'] is not None:
+        record['image'] = make_fingerprint(task['img_stat'], result['image_sha1'])
+    if result['label_sha1'] is not None:
+        record['label'] = make_fingerprint(task['lab_stat'], result['label_sha1'])
+    elif task['lab_stat'] is None:
+        record['label'] = None
+
+    has_label = record['label'] is not None
+    for suffix in task['images'] + task['labels']:
+        entry = record['variants'].get(suffix, {'by': augmenter})
+        if suffix in task['images']:
+            entry = {'by': augmenter}
+        entry['image'] = manifest.rel(os.path.join(task['img_dir'], f"{task['base_name']}{suffix}.jpg"))
+        entry['label'] = manifest.rel(os.path.join(task['lab_dir'], f"{task['base_name']}{suffix}.txt")) if has_label else None
+        record['variants'][suffix] = entry
+    manifest.set(rel_img, record)
+
+
+def run_tasks(tasks, workers=None, max_pending=None, on_result=None):
+    """
+    以有上限的佇列把任務分散到多個行程
+    workers <= 1 時直接在目前行程執行 (方便除錯與 Windows 互動環境)
+    """
+    if workers is None:
+        workers = max(1, (os.cpu_count() or 1) - 1)
+    max_pending = max_pending or workers * 4
+
+    progress = _Progress(len(tasks))
+    stats = {'sources': len(tasks), 'variants_written': 0, 'errors': []}
+
+    def collect(task, result):
+        stats['variants_written'] += result['written']
+        if result['error']:
+            stats['errors'].append(result['error'])
+        elif on_result is not None:
+            on_result(task, result)
+        progress.step()
+
+    if workers <= 1 or len(tasks) <= 1:
+        for task in tasks:
+            collect(task, augment_one(task))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            pending = {}
+            for task in tasks:
+                if len(pending) >= max_pending:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for fut in done:
+                        collect(pending.pop(fut), fut.result())
+                pending[pool.submit(augment_one, task)] = task
+            for fut, task in pending.items():
+                collect(task, fut.result())
+
+    if tasks:
+        print()
+    stats['seconds'] = time.perf_counter() - progress.start
+    stats['images_per_sec'] = progress.rate
+    return stats
+
+
+def run_augmentation(data_root, workers=None, max_pending=None, suffixes=AUG_SUFFIXES,
+                     exclude=AUG_SUFFIXES, augmenter="augment_dataset"):
+    """
+    對 train/ 執行線下擴充，回傳統計資料
+    suffixes: 要產生的變體；exclude: 檔名帶有這些後綴者不視為原圖
+    """
+    img_dir = os.path.join(data_root, "train", "images")
+    lab_dir = os.path.join(data_root, "train", "labels")
+    if not os.path.exists(img_dir):
+        print(f"⚠️ 找不到目錄：{img_dir}")
+        return None
+
+    manifest = AugmentManifest(data_root)
+    pruned, _ = prune_missing_sources(manifest, img_dir)
+    tasks = plan_tasks(manifest, img_dir, lab_dir, suffixes=suffixes, exclude=exclude)
+    if not tasks:
+        manifest.save()
+        print("ℹ️ 擴充清單顯示所有變體皆為最新，略過。")
+        return {'sources': 0, 'variants_written': 0, 'errors': [], 'seconds': 0.0, 'images_per_sec': 0.0,
+                'pruned': pruned}
+
+    print(f"🧵 共 {len(tasks)} 張原圖待處理，使用 {workers or max(1, (os.cpu_count() or 1) - 1)} 個行程...")
+    try:
+        stats = run_tasks(tasks, workers=workers, max_pending=max_pending,
+                          on_result=lambda task, result: _record_result(manifest, task, result, augmenter))
+    finally:
+        # 中途中斷也保留已完成的紀錄，下次只補剩下的
+        manifest.save()
+    stats['pruned'] = pruned
+
+    for err in stats['errors']:
+        print(f"⚠️ {err}")
+    print(f"📈 產生 {stats['variants_written']} 個變體，耗時 {stats['seconds']:.1f} 秒 "
+          f"({stats['images_per_sec']:.1f} 張原圖/秒)")
+    return stats
@@ -0,0 +1,177 @@
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+from augment_engine import AUG_SUFFIXES, VARIANT_FUNCS, is_source_image, run_augmentation
+
+# ==========================================
+# 線下擴充 vs 虛擬擴充：效能比較
+# ==========================================
+# 1. pipeline：抽樣 N 張原圖到暫存資料夾，分別模擬兩種模式下「一個 epoch 的輸入管線」
+#    (讀檔 + JPEG 解碼 + 縮放到 imgsz + 擴充)，兩邊都處理 4N 個樣本，比較：
+#    額外磁碟用量、前處理時間、每個 epoch 的讀取量與耗時、cache=ram 時需要的記憶體
+# 2. training (選用，--train)：實際用 Ultralytics 各訓練 1 個 epoch，比較每個樣本的耗時
+#    (兩種模式一個 epoch 的樣本數應該相同；不同時只看 epoch 時間會誤判，所以以樣本為單位比較)
+
+IMGSZ = 640
+
+
+def _load_resized(buf):
+    """與 Ultralytics load_image 相同：解碼後長邊縮放到 IMGSZ"""
+    im = cv2.imdecode(np.frombuffer(buf, np.uint8), cv2.IMREAD_COLOR)
+    h0, w0 = im.shape[:2]
+    r = IMGSZ / max(h0, w0)
+    if r != 1:
+        im = cv2.resize(im, (int(round(w0 * r)), int(round(h0 * r))), interpolation=cv2.INTER_LINEAR)
+    return im
+
+
+def _epoch_offline(img_dir):
+    """線下模式：原圖與所有變體各讀一次"""
+    bytes_read, ram = 0, 0
+    start = time.perf_counter()
+    names = sorted(os.listdir(img_dir))
+    for name in names:
+        with open(os.path.join(img_dir, name), 'rb') as f:
+            buf = f.read()
+        bytes_read += len(buf)
+        ram += _load_resized(buf).nbytes
+    return {'samples': len(names), 'seconds': time.perf_counter() - start,
+            'bytes_read': bytes_read, 'ram_cache_bytes': ram}
+
+
+def _epoch_virtual(img_dir, repeats):
+    """虛擬模式：每張原圖讀 repeats 次，第 k 次套用第 k 種變體 (與 VirtualAugMixin 的索引 i // n 相同)"""
+    bytes_read, ram, samples = 0, 0, 0
+    start = time.perf_counter()
+    names = sorted(os.listdir(img_dir))
+    for k in range(repeats):
+        for name in names:
+            with open(os.path.join(img_dir, name), 'rb') as f:
+                buf = f.read()
+            bytes_read += len(buf)
+            im = _load_resized(buf)
+            if k:
+                im = VARIANT_FUNCS[AUG_SUFFIXES[k - 1]][0](im)
+            samples += 1
+    # cache=ram 時只需要快取原圖
+    for name in names:
+        with open(os.path.join(img_dir, name), 'rb') as f:
+            ram += _load_resized(f.read()).nbytes
+    return {'samples': samples, 'seconds': time.perf_counter() - start,
+            'bytes_read': bytes_read, 'ram_cache_bytes': ram}
+
+
+def bench_pipeline(data_root, sample=200, workers=None):
+    src_img = os.path.join(data_root, "train", "images")
+    src_lab = os.path.join(data_root, "train", "labels")
+    names = sorted(n for n in os.listdir(src_img) if is_source_image(n))[:sample]
+    if not names:
+        print(f"⚠️ {src_img} 中沒有原始圖片")
+        return None
+
+    tmp_root = tempfile.mkdtemp(prefix="aug_bench_")
+    try:
+        img_dir = os.path.join(tmp_root, "train", "images")
+        lab_dir = os.path.join(tmp_root, "train", "labels")
+        os.makedirs(img_dir)
+        os.makedirs(lab_dir)
+        for n in names:
+            shutil.copy2(os.path.join(src_img, n), img_dir)
+            lab = os.path.splitext(n)[0] + ".txt"
+            if os.path.exists(os.path.join(src_lab, lab)):
+                shutil.copy2(os.path.join(src_lab, lab), lab_dir)
+        source_bytes = sum(os.path.getsize(os.path.join(img_dir, n)) for n in names)
+
+        print(f"📏 虛擬模式：{len(names)} 張原圖 x {len(AUG_SUFFIXES) + 1} 個樣本")
+        virtual = _epoch_virtual(img_dir, repeats=len(AUG_SUFFIXES) + 1)
+        virtual.update({'disk_bytes': 0, 'prep_seconds': 0.0})
+
+        print(f"📏 線下模式：先產生變體再讀取")
+        stats = run_augmentation(tmp_root, workers=workers)
+        total_bytes = sum(e.stat().st_size for e in os.scandir(img_dir))
+        offline = _epoch_offline(img_dir)
+        offline.update({'disk_bytes': total_bytes - source_bytes, 'prep_seconds': stats['seconds']})
+    finally:
+        shutil.rmtree(tmp_root, ignore_errors=True)
+
+    for r in (offline, virtual):
+        r['samples_per_sec'] = r['samples'] / r['seconds'] if r['seconds'] else 0.0
+    return {'sources': len(names), 'source_bytes': source_bytes, 'offline': offline, 'virtual': virtual}
+
+
+def bench_training(data_yaml, weights="yolo11n.pt", epochs=1, **train_kwargs):
+    """
+    實際訓練比較 (需要 GPU 或足夠時間)：線下模式使用磁碟上現有的變體，
+    虛擬模式使用 VirtualAugMixin；兩者都關閉驗證與繪圖，回傳 epoch 時間、每個 epoch 的樣本數與每樣本毫秒數
+    """
+    from ultralytics import YOLO
+    from lab_trainer import make_trainer
+
+    results = {}
+    for mode in ("offline", "virtual"):
+        epoch_times = []
+        model = YOLO(weights)
+        marks = {}
+
+        def epoch_start(trainer):
+            marks['t'] = time.perf_counter()
+            # 加權抽樣時每個 epoch 的張數由 sampler 決定
+            marks['samples'] = len(getattr(trainer.train_loader, 'sampler', None) or trainer.train_loader.dataset)
+
+        model.add_callback("on_train_epoch_start", epoch_start)
+        model.add_callback("on_train_epoch_end", lambda trainer: epoch_times.append(time.perf_counter() - marks['t']))
+        model.train(data=data_yaml, epochs=epochs, val=False, plots=False,
+                    trainer=make_trainer(virtual_augment=(mode == "virtual")),
+                    project='03_AI_Lab/runs/bench', name=f"augment_{mode}", exist_ok=True, **train_kwargs)
+        samples = marks.get('samples', 0)
+        results[mode] = {'epoch_seconds': epoch_times, 'samples_per_epoch': samples,
+                         'ms_per_sample': [t * 1000 / samples for t in epoch_times] if samples else []}
+    if results['offline']['samples_per_epoch'] != results['virtual']['samples_per_epoch']:
+        print(f"⚠️ 每個 epoch 的樣本數不同 (線下 {results['offline']['samples_per_epoch']}、"
+              f"虛擬 {results['virtual']['samples_per_epoch']})，請以 ms_per_sample 比較")
+    return results
+
+
+def print_report(report):
+    off, vir = report['offline'], report['virtual']
+    mb = 1024 * 1024
+    print(f"{'':12}{'線下擴充':>14}{'虛擬擴充':>14}")
+    print(f"{'額外磁碟':12}{off['disk_bytes'] / mb:>12.1f}MB{vir['disk_bytes'] / mb:>12.1f}MB")
+    print(f"{'前處理':12}{off['prep_seconds']:>13.2f}s{vir['prep_seconds']:>13.2f}s")
+    print(f"{'epoch 讀取':12}{off['bytes_read'] / mb:>12.1f}MB{vir['bytes_read'] / mb:>12.1f}MB")
+    print(f"{'樣本數':12}{off['samples']:>14}{vir['samples']:>14}")
+    print(f"{'epoch 耗時':12}{off['seconds']:>13.2f}s{vir['seconds']:>13.2f}s")
+    print(f"{'每樣本':12}{off['seconds'] * 1000 / max(off['samples'], 1):>12.2f}ms"
+          f"{vir['seconds'] * 1000 / max(vir['samples'], 1):>12.2f}ms")
+    print(f"{'樣本/秒':12}{off['samples_per_sec']:>14.1f}{vir['samples_per_sec']:>14.1f}")
+    print(f"{'RAM 快取':12}{off['ram_cache_bytes'] / mb:>12.1f}MB{vir['ram_cache_bytes'] / mb:>12.1f}MB")
+
+
+if __name__ == '__main__':
+    # 用法：python bench_augment.py <資料集根目錄> [抽樣張數] [輸出 JSON] [--train]
+    #   --train  另外用 Ultralytics 實際各訓練 1 個 epoch (資料集根目錄下的 data.yaml)，比較每樣本耗時
+    TRAIN = '--train' in sys.argv
+    args = [a for a in sys.argv[1:] if a != '--train']
+    DATA_ROOT = args[0] if len(args) > 0 else r"D:\product_recognition\03_AI_Lab\yolo11_data\drink"
+    SAMPLE = int(args[1]) if len(args) > 1 else 200
+    OUTPUT = args[2] if len(args) > 2 else None
+
+    report = bench_pipeline(DATA_ROOT, sample=SAMPLE)
+    if report:
+        print_report(report)
+        if TRAIN:
+            report['training'] = bench_training(os.path.join(DATA_ROOT, "data.yaml"))
+            for mode, r in report['training'].items():
+                per_sample = ", ".join(f"{ms:.2f}" for ms in r['ms_per_sample'])
+                print(f"🏋️ {mode}：每個 epoch {r['samples_per_epoch']} 個樣本，每樣本 {per_sample} ms")
+        if OUTPUT:
+            with open(OUTPUT, 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+            print(f"📝 報告已寫入 {OUTPUT}")
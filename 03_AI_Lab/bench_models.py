@@ -0,0 +1,294 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from augment_engine import IMG_EXTS
+from dataset_check import load_data_yaml, resolve_split_dirs
+from hw_profile import cpu_cores, memory_gb
+
+# ==========================================
+# 匯出格式效能比較：.pt / ONNX FP32 / ONNX FP16 / ONNX INT8 / TFLite
+# ==========================================
+# main.py 匯出 ONNX (half=True)、resume_train.py 匯出 ONNX (FP32)、
+# 04_App_Dev/onnx_change_tflite.py 再轉成 TFLite，這裡把找得到的模型全部在 CPU 上跑同一組圖片：
+#   - 單張延遲 p50 / p95 / p99 (前處理 + 推論 + NMS，與實際使用相同)
+#   - batch 1 / 4 / 16 的吞吐量 (固定 batch=1 的模型會逐張推論，native_batch 會標示)
+#   - 載入時間、第一次推論時間、峰值記憶體 (RSS)
+#   - 有給 data.yaml 時，以 Ultralytics val 計算 mAP，並與 .pt 比較差異
+# 每個模型在獨立的子行程中量測，峰值記憶體才不會互相影響。結果寫成 JSON，方便比較不同次的訓練。
+
+BATCH_SIZES = (1, 4, 16)
+REPORT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "runs", "bench")
+
+
+# ------------------------------------------
+# 找出模型檔與分類
+# ------------------------------------------
+
+def artifact_kind(path):
+    ext = os.path.splitext(path)[1].lower()
+    name = os.path.basename(path).lower()
+    if ext == '.pt':
+        return 'pt'
+    if ext == '.onnx':
+        if 'int8' in name:
+            return 'onnx_int8'   # onnx_change_tflite.py 量化後輸入仍是 float，只能從檔名判斷
+        import onnx
+        # 只讀圖結構，判斷輸入是不是 float16 (main.py 的 half=True)
+        graph = onnx.load(path, load_external_data=False).graph
+        elem_type = graph.input[0].type.tensor_type.elem_type
+        return 'onnx_fp16' if elem_type == onnx.TensorProto.FLOAT16 else 'onnx_fp32'
+    if ext == '.tflite':
+        if 'int8' in name or 'integer_quant' in name:
+            return 'tflite_int8'
+        return 'tflite_fp16' if 'float16' in name else 'tflite_fp32'
+    return None
+
+
+def find_artifacts(paths):
+    """paths 可以是模型檔或資料夾 (例如 runs/train/<name>/weights、04_App_Dev/assets/models)"""
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                found += [os.path.join(root, f) for f in sorted(files)
+                          if f.lower().endswith(('.pt', '.onnx', '.tflite'))]
+        elif os.path.exists(path):
+            found.append(path)
+        else:
+            print(f"⚠️ 找不到 {path}")
+    # .pt 排第一個當作基準
+    artifacts = [(artifact_kind(p), os.path.abspath(p)) for p in found]
+    return sorted(artifacts, key=lambda a: (a[0] != 'pt', a[1]))
+
+
+def default_image_dir(data_yaml):
+    dirs = resolve_split_dirs(load_data_yaml(data_yaml), data_yaml)
+    for split in ("val", "test", "train"):
+        if dirs.get(split):
+            return dirs[split][0]
+    return None
+
+
+def load_images(img_dir, count):
+    """固定取排序後的前 count 張，每次比較的圖片都相同"""
+    names = sorted(n for n in os.listdir(img_dir) if n.lower().endswith(IMG_EXTS))[:count]
+    images = [cv2.imread(os.path.join(img_dir, n)) for n in names]
+    return [im for im in images if im is not None]
+
+
+# ------------------------------------------
+# 子行程：載入單一模型並量測
+# ------------------------------------------
+
+def peak_rss_mb():
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024
+    except ImportError:
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().peak_wset / 1024 ** 2   # Windows
+    except (ImportError, AttributeError):
+        return None
+
+
+class UltralyticsRunner:
+    """讓 .pt 也有 detect_batch 介面，走 Ultralytics 自己的前處理與 NMS"""
+
+    def __init__(self, path, conf, imgsz, threads=None):
+        import torch
+        from ultralytics import YOLO
+        if threads:
+            torch.set_num_threads(threads)
+        self.model = YOLO(path)
+        self.conf, self.imgsz = conf, imgsz
+        self.max_batch = max(BATCH_SIZES)
+
+    def detect_batch(self, images):
+        return self.model.predict(images, imgsz=self.imgsz, conf=self.conf, device='cpu', verbose=False)
+
+
+def load_runner(kind, path, conf, imgsz, threads=None):
+    if kind == 'pt':
+        return UltralyticsRunner(path, conf, imgsz, threads)
+    if kind.startswith('onnx'):
+        from inference import OnnxDetector
+        return OnnxDetector(path, conf=conf, max_batch=max(BATCH_SIZES), threads=threads)
+    from inference import TFLiteDetector
+    return TFLiteDetector(path, conf=conf, threads=threads)
+
+
+def percentiles(samples_ms):
+    arr = np.asarray(samples_ms)
+    p50, p95, p99 = np.percentile(arr, [50, 95, 99])
+    return {'p50_ms': round(float(p50), 3), 'p95_ms': round(float(p95), 3),
+            'p99_ms': round(float(p99), 3), 'mean_ms': round(float(arr.mean()), 3)}
+
+
+def evaluate_map(path, data_yaml, imgsz):
+    """Ultralytics val 可以直接讀 .pt / .onnx / .tflite；batch=1 讓固定 batch 的匯出檔也能跑"""
+    from ultralytics import YOLO
+    metrics = YOLO(path, task='detect').val(data=data_yaml, imgsz=imgsz, batch=1, device='cpu',
+                                            plots=False, verbose=False)
+    return {'map50': round(float(metrics.box.map50), 5), 'map50_95': round(float(metrics.box.map), 5)}
+
+
+def bench_artifact(kind, path, img_dir, count, imgsz=640, conf=0.25, threads=None,
+                   warmup=3, data_yaml=None):
+    images = load_images(img_dir, count)
+    result = {'kind': kind, 'path': path, 'size_mb': round(os.path.getsize(path) / 1024 ** 2, 2),
+              'images': len(images)}
+    rss_before = peak_rss_mb()
+
+    start = time.perf_counter()
+    runner = load_runner(kind, path, conf, imgsz, threads)
+    result['load_seconds'] = round(time.perf_counter() - start, 4)
+    result['native_batch'] = runner.max_batch
+
+    start = time.perf_counter()
+    runner.detect_batch(images[:1])
+    result['first_inference_ms'] = round((time.perf_counter() - start) * 1000, 3)
+    for _ in range(warmup):
+        runner.detect_batch(images[:1])
+
+    # 單張延遲
+    latencies = []
+    for img in images:
+        t = time.perf_counter()
+        runner.detect_batch([img])
+        latencies.append((time.perf_counter() - t) * 1000)
+    result['latency'] = percentiles(latencies)
+
+    # 不同 batch 的吞吐量 (圖片不足一批時重複使用)
+    result['throughput'] = {}
+    for batch in BATCH_SIZES:
+        pool = images * -(-batch // len(images))
+        chunks = [pool[i:i + batch] for i in range(0, max(len(images), batch), batch)]
+        t = time.perf_counter()
+        done = 0
+        for chunk in chunks:
+            runner.detect_batch(chunk)
+            done += len(chunk)
+        result['throughput'][str(batch)] = round(done / (time.perf_counter() - t), 3)
+
+    result['peak_rss_mb'] = round(peak_rss_mb() or 0, 1)
+    result['model_rss_mb'] = round((peak_rss_mb() or 0) - (rss_before or 0), 1)
+
+    # mAP 放在最後，不影響上面的記憶體量測
+    if data_yaml:
+        try:
+            result.update(evaluate_map(path, data_yaml, imgsz))
+        except Exception as e:
+            result['map_error'] = str(e)
+    return result
+
+
+def run_isolated(kind, path, config):
+    """在獨立子行程執行 bench_artifact，回傳結果 dict"""
+    payload = json.dumps(dict(config, kind=kind, path=path))
+    proc = subprocess.run([sys.executable, os.path.abspath(__file__), '--worker', payload],
+                          capture_output=True, text=True, encoding='utf-8', errors='replace')
+    lines = [line for line in proc.stdout.splitlines() if line.startswith('{')]
+    if proc.returncode != 0 or not lines:
+        tail = (proc.stderr or proc.stdout).strip().splitlines()[-5:]
+        return {'kind': kind, 'path': path, 'error': "\n".join(tail)}
+    return json.loads(lines[-1])
+
+
+# ------------------------------------------
+# 整體流程與報告
+# ------------------------------------------
+
+def bench_models(paths, img_dir=None, data_yaml=None, count=100, imgsz=640, conf=0.25, threads=None):
+    artifacts = find_artifacts(paths)
+    if not artifacts:
+        print("⚠️ 沒有找到任何 .pt / .onnx / .tflite")
+        return None
+    img_dir = img_dir or (default_image_dir(data_yaml) if data_yaml else None)
+    if not img_dir:
+        print("⚠️ 請指定 --images 或 --data")
+        return None
+
+    config = {'img_dir': img_dir, 'count': count, 'imgsz': imgsz, 'conf': conf,
+              'threads': threads, 'data_yaml': data_yaml}
+    total_gb, _ = memory_gb()
+    report = {'created': time.strftime('%Y-%m-%dT%H:%M:%S'), 'cpu_cores': cpu_cores(),
+              'ram_gb': round(total_gb, 1), 'config': config, 'results': []}
+
+    for kind, path in artifacts:
+        print(f"⏱️ [{kind}] {path}")
+        report['results'].append(run_isolated(kind, path, config))
+
+    # 以 .pt 的 mAP 為基準計算差異
+    baseline = next((r for r in report['results'] if r['kind'] == 'pt' and 'map50' in r), None)
+    if baseline:
+        report['baseline'] = baseline['path']
+        for r in report['results']:
+            if 'map50' in r:
+                r['map50_drift'] = round(r['map50'] - baseline['map50'], 5)
+                r['map50_95_drift'] = round(r['map50_95'] - baseline['map50_95'], 5)
+    return report
+
+
+def print_report(report, previous=None):
+    prev = {r['path']: r for r in previous['results']} if previous else {}
+    print(f"{'格式':12}{'大小MB':>8}{'載入s':>8}{'p50ms':>9}{'p95ms':>9}{'p99ms':>9}"
+          f"{'b1/s':>8}{'b4/s':>8}{'b16/s':>8}{'RSS MB':>9}{'mAP50':>8}{'drift':>8}")
+    for r in report['results']:
+        if 'error' in r:
+            print(f"{r['kind']:12} ❌ {r['error'].splitlines()[-1] if r['error'] else '失敗'}")
+            continue
+        lat, tp = r['latency'], r['throughput']
+        map50 = f"{r['map50']:.3f}" if 'map50' in r else '-'
+        drift = f"{r['map50_drift']:+.3f}" if 'map50_drift' in r else '-'
+        print(f"{r['kind']:12}{r['size_mb']:>8.1f}{r['load_seconds']:>8.2f}{lat['p50_ms']:>9.1f}"
+              f"{lat['p95_ms']:>9.1f}{lat['p99_ms']:>9.1f}{tp['1']:>8.1f}{tp['4']:>8.1f}{tp['16']:>8.1f}"
+              f"{r['peak_rss_mb']:>9.0f}{map50:>8}{drift:>8}")
+        old = prev.get(r['path'])
+        if old and 'latency' in old:
+            change = (lat['p50_ms'] - old['latency']['p50_ms']) / old['latency']['p50_ms'] * 100
+            print(f"{'':12}與上次相比 p50 {change:+.1f}%"
+                  + (f"，mAP50 {r['map50'] - old['map50']:+.4f}" if 'map50' in r and 'map50' in old else ""))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 2 and sys.argv[1] == '--worker':
+        cfg = json.loads(sys.argv[2])
+        print(json.dumps(bench_artifact(**cfg), ensure_ascii=False))
+        sys.exit(0)
+
+    # 用法：python bench_models.py runs/train/grocery_v4_stable_final/weights ../04_App_Dev/assets/models \
+    #         --data yolo11_data/drink/data.yaml [--images 資料夾] [--count 100] [--out report.json]
+    parser = argparse.ArgumentParser(description="比較 .pt / ONNX / TFLite 在 CPU 上的效能與 mAP")
+    parser.add_argument('paths', nargs='+', help="模型檔或資料夾")
+    parser.add_argument('--data', default=None, help="data.yaml (計算 mAP，並提供預設的驗證圖片)")
+    parser.add_argument('--images', default=None, help="量測延遲用的圖片資料夾")
+    parser.add_argument('--count', type=int, default=100)
+    parser.add_argument('--imgsz', type=int, default=640)
+    parser.add_argument('--conf', type=float, default=0.25)
+    parser.add_argument('--threads', type=int, default=None)
+    parser.add_argument('--out', default=None, help="輸出 JSON (預設 runs/bench/models_<時間>.json)")
+    parser.add_argument('--compare', default=None, help="上一次的報告 JSON，列出差異")
+    args = parser.parse_args()
+
+    report = bench_models(args.paths, args.images, args.data, args.count, args.imgsz, args.conf, args.threads)
+    if report:
+        previous = None
+        if args.compare:
+            with open(args.compare, 'r', encoding='utf-8') as f:
+                previous = json.load(f)
+        print_report(report, previous)
+        out = args.out or os.path.join(REPORT_DIR, time.strftime("models_%Y%m%d_%H%M%S.json"))
+        os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+        with open(out, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"📝 報告已寫入 {out}")
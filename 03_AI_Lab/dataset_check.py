@@ -0,0 +1,307 @@
+import json
+import math
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+import yaml
+
+from aug_manifest import scan_stats
+from augment_engine import AUG_SUFFIXES, IMG_EXTS
+
+# ==========================================
+# 資料集完整性檢查 (訓練前的 Pre-flight Gate)
+# ==========================================
+# 讀取 data.yaml (nc / names / train / val / test)，一次掃描所有 split：
+#   - 標籤格式 (每行 5 欄)、類別範圍 (0 ~ nc-1)、座標範圍 (0 ~ 1)
+#   - 孤兒檔案：有標籤沒圖片 (錯誤)、有圖片沒標籤 (警告，可能是負樣本背景圖)
+#   - 以感知雜湊 (dHash) 找出重複圖片，特別是 train / val 之間的資料洩漏
+#   - 每個類別在各 split 的實例數
+# 感知雜湊以 (mtime, size) 快取在 data.yaml 旁的 .dataset_check_cache.json，
+# 第二次之後只需要計算新增的圖片，因此可以在每次訓練前執行。
+
+SPLITS = ("train", "val", "test")
+CACHE_NAME = ".dataset_check_cache.json"
+# 檔案數少於此值時直接在目前行程處理，省下開行程的成本
+PARALLEL_MIN_FILES = 2000
+CHUNK_SIZE = 500
+
+
+def load_data_yaml(data_yaml):
+    with open(data_yaml, 'r', encoding='utf-8') as f:
+        config = yaml.safe_load(f)
+    names = config.get('names', [])
+    if isinstance(names, dict):
+        names = [names[k] for k in sorted(names)]
+    config['names'] = list(names)
+    return config
+
+
+def resolve_split_dirs(config, data_yaml):
+    """
+    依 Ultralytics 的規則解析 split 路徑
+    Roboflow 匯出的 data.yaml 常寫成 ../train/images，找不到時改用去掉 ../ 的路徑
+    """
+    root = config.get('path') or os.path.dirname(os.path.abspath(data_yaml))
+    if not os.path.isabs(root):
+        root = os.path.join(os.path.dirname(os.path.abspath(data_yaml)), root)
+
+    dirs = {}
+    for split in SPLITS:
+        value = config.get(split)
+        if not value:
+            continue
+        entries = value if isinstance(value, list) else [value]
+        resolved = []
+        for entry in entries:
+            candidate = os.path.normpath(os.path.join(root, entry))
+            if not os.path.exists(candidate) and entry.startswith('../'):
+                candidate = os.path.normpath(os.path.join(root, entry[3:]))
+            resolved.append(candidate)
+        dirs[split] = resolved
+    return dirs
+
+
+def image_to_label_dir(img_dir):
+    """.../images -> .../labels (與 Ultralytics img2label_paths 相同)"""
+    head, tail = os.path.split(img_dir)
+    if tail == 'images':
+        return os.path.join(head, 'labels')
+    sa, sb = f"{os.sep}images{os.sep}", f"{os.sep}labels{os.sep}"
+    return sb.join(img_dir.rsplit(sa, 1)) if sa in img_dir else img_dir
+
+
+def family_of(name):
+    """去掉擴充後綴，同一張原圖的 _flip/_bright/_dark 視為同一家族"""
+    stem = os.path.splitext(name)[0]
+    for suffix in AUG_SUFFIXES:
+        if stem.endswith(suffix):
+            return stem[:-len(suffix)]
+    return stem
+
+
+# ------------------------------------------
+# 子行程工作
+# ------------------------------------------
+
+def check_label_files(args):
+    """
+    檢查一批標籤檔，回傳 (問題清單, 各類別實例數)
+    args = (split, label_paths, nc)
+    """
+    split, paths, nc = args
+    issues = []
+    counts = defaultdict(int)
+
+    for path in paths:
+        name = os.path.basename(path)
+        with open(path, 'r') as f:
+            lines = f.read().splitlines()
+        for i, line in enumerate(lines, 1):
+            parts = line.split()
+            if not parts:
+                continue
+            if len(parts) != 5:
+                issues.append(('error', split, name, i, 'bad_format', f"{len(parts)} 個欄位"))
+                continue
+            try:
+                values = [float(p) for p in parts]
+            except ValueError:
+                issues.append(('error', split, name, i, 'bad_format', "非數值"))
+                continue
+
+            cls = values[0]
+            # nan / inf 不能轉成 int，先排除，否則一行壞標籤就讓整個檢查中斷
+            if not math.isfinite(cls) or cls != int(cls) or not 0 <= cls < nc:
+                issues.append(('error', split, name, i, 'class_out_of_range', f"class_id={parts[0]}"))
+            else:
+                counts[int(cls)] += 1
+
+            x, y, w, h = values[1:]
+            if not all(0.0 <= v <= 1.0 for v in (x, y, w, h)) or w <= 0 or h <= 0:
+                issues.append(('error', split, name, i, 'coord_out_of_bounds', f"{x} {y} {w} {h}"))
+            elif x - w / 2 < -0.01 or x + w / 2 > 1.01 or y - h / 2 < -0.01 or y + h / 2 > 1.01:
+                issues.append(('warning', split, name, i, 'box_exceeds_image', f"{x} {y} {w} {h}"))
+    return issues, dict(counts)
+
+
+def dhash(path, hash_size=8):
+    """64-bit 差異雜湊；用縮小解碼 (IMREAD_REDUCED_GRAYSCALE_4) 加速"""
+    img = cv2.imread(path, cv2.IMREAD_REDUCED_GRAYSCALE_4)
+    if img is None:
+        return None
+    small = cv2.resize(img, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return f"{int(np.packbits(bits).view('>u8')[0]):016x}"
+
+
+def hash_images(paths):
+    return [(p, dhash(p)) for p in paths]
+
+
+# ------------------------------------------
+# 主流程
+# ------------------------------------------
+
+def _chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _run(func, jobs, parallel, workers):
+    if not parallel:
+        return [func(job) for job in jobs]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(func, jobs))
+
+
+def _load_cache(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def validate_dataset(data_yaml, workers=None, check_duplicates=True, report_path=None):
+    """
+    掃描 data.yaml 中所有 split，回傳 dict 格式的檢查報告
+    report['ok'] 為 False 代表有錯誤，不應開始訓練
+    """
+    start = time.perf_counter()
+    config = load_data_yaml(data_yaml)
+    nc = int(config.get('nc', 0))
+    names = config['names']
+    workers = workers or max(1, (os.cpu_count() or 1) - 1)
+
+    issues = []
+    if len(names) != nc:
+        issues.append(('error', None, os.path.basename(data_yaml), None, 'names_mismatch',
+                       f"nc={nc} 但 names 有 {len(names)} 個"))
+
+    # 1. 列出每個 split 的圖片與標籤 (每個資料夾只 scandir 一次)
+    label_jobs = []
+    images = {}            # split -> [圖片路徑]
+    split_stats = {}
+    for split, img_dirs in resolve_split_dirs(config, data_yaml).items():
+        images[split] = []
+        n_labels = 0
+        for img_dir in img_dirs:
+            if not os.path.isdir(img_dir):
+                issues.append(('error', split, img_dir, None, 'missing_split_dir', "找不到圖片資料夾"))
+                continue
+            lab_dir = image_to_label_dir(img_dir)
+            img_stats = {n: s for n, s in scan_stats(img_dir).items() if n.lower().endswith(IMG_EXTS)}
+            lab_names = {n for n in scan_stats(lab_dir) if n.endswith('.txt')}
+            img_stems = {os.path.splitext(n)[0] for n in img_stats}
+            lab_stems = {n[:-4] for n in lab_names}
+
+            for stem in sorted(lab_stems - img_stems):
+                issues.append(('error', split, stem + ".txt", None, 'orphan_label', "標籤沒有對應圖片"))
+            for name in sorted(img_stats):
+                if os.path.splitext(name)[0] not in lab_stems:
+                    issues.append(('warning', split, name, None, 'missing_label', "圖片沒有標籤 (負樣本?)"))
+
+            paths = [os.path.join(lab_dir, n) for n in sorted(lab_names)]
+            label_jobs += [(split, chunk, nc) for chunk in _chunks(paths, CHUNK_SIZE)]
+            images[split] += [(os.path.join(img_dir, n), img_stats[n]) for n in sorted(img_stats)]
+            n_labels += len(paths)
+        split_stats[split] = {'images': len(images[split]), 'labels': n_labels, 'instances': 0}
+
+    total_files = sum(len(job[1]) for job in label_jobs)
+    parallel = workers > 1 and total_files >= PARALLEL_MIN_FILES
+
+    # 2. 標籤內容檢查 (所有 split 的標籤切塊後一起平行處理)
+    class_counts = {name: {split: 0 for split in images} for name in names}
+    for (split, _, _), (chunk_issues, counts) in zip(label_jobs, _run(check_label_files, label_jobs, parallel, workers)):
+        issues += chunk_issues
+        for cls, n in counts.items():
+            split_stats[split]['instances'] += n
+            if cls < len(names):
+                class_counts[names[cls]][split] += n
+
+    for name, per_split in class_counts.items():
+        if per_split.get('train', 0) == 0 and 'train' in images:
+            issues.append(('warning', 'train', name, None, 'empty_class', "此類別在訓練集沒有任何實例"))
+
+    # 3. 感知雜湊找重複圖片 (快取未變動的圖片)
+    duplicates = []
+    if check_duplicates:
+        cache_path = os.path.join(os.path.dirname(os.path.abspath(data_yaml)), CACHE_NAME)
+        cache = _load_cache(cache_path)
+        new_cache = {}
+        hashes = {}
+        todo = []
+        for split, entries in images.items():
+            for path, stat in entries:
+                cached = cache.get(path)
+                if cached and cached[0] == stat[0] and cached[1] == stat[1]:
+                    hashes[path] = cached[2]
+                    new_cache[path] = cached
+                else:
+                    todo.append((path, stat))
+
+        stat_of = dict(todo)
+        paths = [p for p, _ in todo]
+        for batch in _run(hash_images, list(_chunks(paths, CHUNK_SIZE // 5 or 1)),
+                          workers > 1 and len(paths) >= PARALLEL_MIN_FILES // 10, workers):
+            for path, h in batch:
+                if h is None:
+                    issues.append(('error', None, path, None, 'unreadable_image', "cv2 無法解碼"))
+                    continue
+                hashes[path] = h
+                new_cache[path] = [stat_of[path][0], stat_of[path][1], h]
+
+        if todo or len(new_cache) != len(cache):
+            with open(cache_path, 'w', encoding='utf-8') as f:
+                json.dump(new_cache, f, separators=(',', ':'))
+
+        split_of = {p: s for s, entries in images.items() for p, _ in entries}
+        groups = defaultdict(list)
+        for path, h in hashes.items():
+            groups[h].append(path)
+        for h, paths in groups.items():
+            # 同一張原圖與自己的擴充變體不算重複
+            if len({family_of(os.path.basename(p)) for p in paths}) > 1:
+                group = sorted(paths)
+                splits = sorted({split_of[p] for p in group})
+                duplicates.append({'hash': h, 'splits': splits, 'files': group})
+                level = 'error' if len(splits) > 1 else 'warning'
+                code = 'split_leak' if len(splits) > 1 else 'duplicate_image'
+                issues.append((level, ",".join(splits), group[0], None, code, f"與 {len(group) - 1} 張圖片重複"))
+
+    keys = ('level', 'split', 'file', 'line', 'code', 'detail')
+    records = [dict(zip(keys, issue)) for issue in issues]
+    errors = [r for r in records if r['level'] == 'error']
+    report = {
+        'data_yaml': os.path.abspath(data_yaml),
+        'nc': nc,
+        'ok': not errors,
+        'seconds': round(time.perf_counter() - start, 3),
+        'splits': split_stats,
+        'class_counts': class_counts,
+        'duplicates': duplicates,
+        'errors': errors,
+        'warnings': [r for r in records if r['level'] == 'warning'],
+    }
+
+    if report_path:
+        with open(report_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return report
+
+
+def print_summary(report, limit=10):
+    """把報告濃縮成幾行人類可讀的摘要"""
+    for split, s in report['splits'].items():
+        print(f"   [{split}] 圖片 {s['images']} 張 | 標籤 {s['labels']} 個 | 實例 {s['instances']} 個")
+    for r in report['errors'][:limit]:
+        where = f" 第 {r['line']} 行" if r['line'] else ""
+        print(f"❌ {r['code']}: [{r['split']}] {r['file']}{where} | {r['detail']}")
+    if len(report['errors']) > limit:
+        print(f"   ... 另有 {len(report['errors']) - limit} 個錯誤")
+    status = "✅ 資料集檢查通過" if report['ok'] else "❌ 資料集檢查未通過"
+    print(f"{status}：{len(report['errors'])} 個錯誤、{len(report['warnings'])} 個警告 ({report['seconds']} 秒)")
@@ -0,0 +1,159 @@
+import json
+import os
+import sys
+import time
+
+from aug_manifest import file_sha1, scan_stats
+from augment_engine import IMG_EXTS
+from dataset_check import image_to_label_dir, load_data_yaml, resolve_split_dirs
+
+# ==========================================
+# 資料集指紋 (與權重存在一起)
+# ==========================================
+# 訓練結束時把當下資料集每張圖片與標籤的雜湊寫進 runs/train/<name>/weights/dataset_fingerprint.json，
+# 之後拿這份權重做增量微調時，比對目前的資料集就知道哪些圖片是「權重沒看過的」：
+# {
+#   "version": 1, "created": ..., "names": [...],
+#   "splits": {"train": {"train/images/a.jpg": {"mtime_ns", "size", "sha1", "label_sha1"}}, "val": {...}}
+# }
+# 路徑以 data.yaml 的資料集根目錄為基準，搬到別台電腦也能比對；
+# 計算時沿用舊指紋中 mtime + size 相同的雜湊，只有新增或被修改的檔案需要讀取。
+
+FINGERPRINT_NAME = "dataset_fingerprint.json"
+FINGERPRINT_VERSION = 1
+SPLITS = ("train", "val")
+
+
+def dataset_root(data_yaml, config=None):
+    config = config or load_data_yaml(data_yaml)
+    root = config.get('path') or os.path.dirname(os.path.abspath(data_yaml))
+    if not os.path.isabs(root):
+        root = os.path.join(os.path.dirname(os.path.abspath(data_yaml)), root)
+    return os.path.normpath(root)
+
+
+def _rel(path, root):
+    return os.path.relpath(path, root).replace(os.sep, '/')
+
+
+def abs_path(root, rel):
+    """指紋中的相對路徑 -> 這台電腦上的絕對路徑"""
+    return os.path.join(root, *rel.split('/'))
+
+
+def _entry(path, stat, label_path, label_stat, old):
+    """沿用舊紀錄的雜湊 (mtime + size 相同時)，否則重新計算"""
+    same_image = old and old['mtime_ns'] == stat[0] and old['size'] == stat[1]
+    entry = {'mtime_ns': stat[0], 'size': stat[1], 'sha1': old['sha1'] if same_image else file_sha1(path)}
+    if label_stat is None:
+        entry['label_sha1'] = None
+    elif old and old.get('label_mtime_ns') == label_stat[0] and old.get('label_size') == label_stat[1]:
+        entry.update(label_mtime_ns=label_stat[0], label_size=label_stat[1], label_sha1=old['label_sha1'])
+    else:
+        entry.update(label_mtime_ns=label_stat[0], label_size=label_stat[1], label_sha1=file_sha1(label_path))
+    return entry
+
+
+def fingerprint_dataset(data_yaml, previous=None, splits=SPLITS):
+    """計算 train / val 每張圖片與標籤的指紋；previous 為舊指紋 (可為 None)"""
+    config = load_data_yaml(data_yaml)
+    root = dataset_root(data_yaml, config)
+    split_dirs = resolve_split_dirs(config, data_yaml)
+    old_splits = (previous or {}).get('splits', {})
+
+    result = {'version': FINGERPRINT_VERSION, 'created': time.time(), 'names': config['names'], 'splits': {}}
+    for split in splits:
+        old = old_splits.get(split, {})
+        entries = {}
+        for img_dir in split_dirs.get(split, []):
+            lab_dir = image_to_label_dir(img_dir)
+            label_stats = scan_stats(lab_dir)
+            for name, stat in sorted(scan_stats(img_dir).items()):
+                if not name.lower().endswith(IMG_EXTS):
+                    continue
+                rel = _rel(os.path.join(img_dir, name), root)
+                label_name = os.path.splitext(name)[0] + ".txt"
+                entries[rel] = _entry(os.path.join(img_dir, name), stat, os.path.join(lab_dir, label_name),
+                                      label_stats.get(label_name), old.get(rel))
+        result['splits'][split] = entries
+    return result
+
+
+def fingerprint_path(weights):
+    return os.path.join(os.path.dirname(os.path.abspath(weights)), FINGERPRINT_NAME)
+
+
+def load_fingerprint(weights):
+    """讀取權重旁的指紋；沒有或版本不符時回傳 None"""
+    path = fingerprint_path(weights)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return data if data.get('version') == FINGERPRINT_VERSION else None
+
+
+def save_fingerprint(weights_dir, fingerprint):
+    os.makedirs(weights_dir, exist_ok=True)
+    path = os.path.join(weights_dir, FINGERPRINT_NAME)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(fingerprint, f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(tmp_path, path)
+    return path
+
+
+def diff_fingerprint(old, new, split="train"):
+    """
+    比較兩份指紋的某個 split，回傳 {'added', 'changed', 'removed', 'unchanged'} (皆為相對路徑清單)
+    圖片或標籤任一內容不同即視為 changed (重新標註也要重新學)
+    """
+    before = old.get('splits', {}).get(split, {})
+    after = new.get('splits', {}).get(split, {})
+    result = {'added': [], 'changed': [], 'removed': sorted(set(before) - set(after)), 'unchanged': []}
+    for rel, entry in sorted(after.items()):
+        prev = before.get(rel)
+        if prev is None:
+            result['added'].append(rel)
+        elif prev['sha1'] != entry['sha1'] or prev.get('label_sha1') != entry.get('label_sha1'):
+            result['changed'].append(rel)
+        else:
+            result['unchanged'].append(rel)
+    return result
+
+
+def diff_by_mtime(weights, fingerprint, split="train"):
+    """
+    舊權重沒有指紋時的退路：比權重檔更新的圖片/標籤視為新資料
+    (複製資料集會改掉 mtime，因此只是估計，之後的訓練都會存指紋)
+    """
+    cutoff = os.path.getmtime(weights) * 1e9
+    result = {'added': [], 'changed': [], 'removed': [], 'unchanged': []}
+    for rel, entry in sorted(fingerprint['splits'].get(split, {}).items()):
+        newer = entry['mtime_ns'] > cutoff or entry.get('label_mtime_ns', 0) > cutoff
+        result['added' if newer else 'unchanged'].append(rel)
+    return result
+
+
+def attach_fingerprint(model, fingerprint):
+    """訓練結束時把指紋寫進 runs/train/<name>/weights/，與 best.pt / last.pt 放在一起"""
+    def save(trainer):
+        save_fingerprint(os.path.join(trainer.save_dir, "weights"), fingerprint)
+
+    model.add_callback("on_train_end", save)
+
+
+if __name__ == '__main__':
+    # 用法：python dataset_fingerprint.py <data.yaml> [權重檔]  (給權重時列出該權重之後新增 / 修改的圖片)
+    DATA_YAML = sys.argv[1] if len(sys.argv) > 1 else r"D:\product_recognition\03_AI_Lab\yolo11_data\data.yaml"
+    WEIGHTS = sys.argv[2] if len(sys.argv) > 2 else None
+    base = load_fingerprint(WEIGHTS) if WEIGHTS else None
+    current = fingerprint_dataset(DATA_YAML, previous=base)
+    if WEIGHTS:
+        for split in SPLITS:
+            diff = diff_fingerprint(base, current, split) if base else diff_by_mtime(WEIGHTS, current, split)
+            print(f"{split}: 新增 {len(diff['added'])} | 修改 {len(diff['changed'])} | "
+                  f"刪除 {len(diff['removed'])} | 未變 {len(diff['unchanged'])}")
+    else:
+        print(json.dumps({s: len(e) for s, e in current['splits'].items()}, ensure_ascii=False))
@@ -0,0 +1,164 @@
+import os
+
+import numpy as np
+
+import yolo_labels
+from dataset_check import image_to_label_dir
+
+# ==========================================
+# 偵測指標 (以快取的預測結果計算，不需要重跑模型)
+# ==========================================
+# 預測：每張圖 (N, 6) [class, conf, x0, y0, x1, y1] 像素座標
+# 標註：每張圖 (M, 5) [class, x0, y0, x1, y1] 像素座標 (gt_boxes() 由 YOLO 標籤轉換)
+# mAP50 為各類別 AP (IoU 0.5，全點內插) 的平均；precision / recall 以 conf_thr 以上的框計算。
+# 與 Ultralytics val 的 mAP50 接近但不完全相同 (Ultralytics 另有 101 點內插)，用來比較同一份驗證集上的兩個模型。
+
+IOU_THR = 0.5
+CONF_THR = 0.25
+
+
+def gt_boxes(labels, shape):
+    """YOLO 正規化標籤 (N, 5) + 圖片 (h, w) -> (N, 5) [class, x0, y0, x1, y1]"""
+    if labels is None or not len(labels):
+        return np.zeros((0, 5))
+    h, w = shape
+    return np.column_stack([labels[:, 0], yolo_labels.xywhn_to_xyxy(labels, w, h)])
+
+
+def load_ground_truth(image_paths, shapes):
+    """image_paths：{鍵: 圖片路徑}、shapes：{鍵: (h, w)} -> {鍵: (N, 5) 標註框}"""
+    gt = {}
+    for key, path in image_paths.items():
+        label_path = os.path.join(image_to_label_dir(os.path.dirname(path)),
+                                  os.path.splitext(os.path.basename(path))[0] + ".txt")
+        gt[key] = gt_boxes(yolo_labels.load_labels(label_path), shapes[key])
+    return gt
+
+
+def iou_matrix(a, b):
+    """(N, 4) x (M, 4) 的 IoU 矩陣 (xyxy)"""
+    if not len(a) or not len(b):
+        return np.zeros((len(a), len(b)))
+    x0 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y0 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x1 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y1 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x1 - x0, 0, None) * np.clip(y1 - y0, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / (area_a[:, None] + area_b[None, :] - inter + 1e-9)
+
+
+def match(pred, gt, iou_thr=IOU_THR):
+    """
+    同類別內依 conf 由高到低貪婪配對
+    回傳 (每個預測框是否為 TP, 每個標註框配到的預測框索引或 -1)
+    """
+    tp = np.zeros(len(pred), dtype=bool)
+    assigned = np.full(len(gt), -1)
+    if not len(pred) or not len(gt):
+        return tp, assigned
+    ious = iou_matrix(pred[:, 2:6], gt[:, 1:5])
+    ious[pred[:, 0][:, None] != gt[:, 0][None, :]] = 0
+    for i in np.argsort(-pred[:, 1], kind='stable'):
+        j = int(np.argmax(ious[i]))
+        if ious[i, j] >= iou_thr and assigned[j] < 0:
+            tp[i] = True
+            assigned[j] = i
+            ious[:, j] = 0
+    return tp, assigned
+
+
+def average_precision(tp, conf, n_gt):
+    if n_gt == 0:
+        return None
+    if not len(tp):
+        return 0.0
+    order = np.argsort(-conf, kind='stable')
+    tp = tp[order].astype(np.float64)
+    tpc = np.cumsum(tp)
+    recall = tpc / n_gt
+    precision = tpc / np.arange(1, len(tp) + 1)
+    # 精確率包絡線 + 全點積分
+    mrec = np.concatenate([[0.0], recall, [1.0]])
+    mpre = np.concatenate([[1.0], precision, [0.0]])
+    mpre = np.flip(np.maximum.accumulate(np.flip(mpre)))
+    idx = np.where(mrec[1:] != mrec[:-1])[0]
+    return float(np.sum((mrec[idx + 1] - mrec[idx]) * mpre[idx + 1]))
+
+
+def evaluate(predictions, ground_truth, nc, iou_thr=IOU_THR, conf_thr=CONF_THR):
+    """
+    predictions / ground_truth：{圖片: 陣列}，只計算兩邊都有的圖片
+    回傳 {'images', 'map50', 'precision', 'recall', 'per_class': {類別: {'ap50', 'instances'}}}
+    """
+    tps, confs, classes = [], [], []
+    n_gt = np.zeros(nc, dtype=int)
+    tp_at, pred_at = 0, 0
+    images = [k for k in ground_truth if k in predictions]
+    for key in images:
+        pred, gt = predictions[key], ground_truth[key]
+        tp, _ = match(pred, gt, iou_thr)
+        tps.append(tp)
+        confs.append(pred[:, 1])
+        classes.append(pred[:, 0].astype(int))
+        n_gt += np.bincount(gt[:, 0].astype(int), minlength=nc)[:nc]
+        keep = pred[:, 1] >= conf_thr
+        tp_at += int(tp[keep].sum())
+        pred_at += int(keep.sum())
+
+    tp = np.concatenate(tps) if tps else np.zeros(0, dtype=bool)
+    conf = np.concatenate(confs) if confs else np.zeros(0)
+    cls = np.concatenate(classes) if classes else np.zeros(0, dtype=int)
+    per_class = {}
+    for c in range(nc):
+        mask = cls == c
+        ap = average_precision(tp[mask], conf[mask], n_gt[c])
+        if ap is not None:
+            per_class[c] = {'ap50': round(ap, 4), 'instances': int(n_gt[c])}
+
+    return {
+        'images': len(images),
+        'map50': round(float(np.mean([v['ap50'] for v in per_class.values()])), 4) if per_class else 0.0,
+        'precision': round(tp_at / pred_at, 4) if pred_at else 0.0,
+        'recall': round(tp_at / int(n_gt.sum()), 4) if n_gt.sum() else 0.0,
+        'per_class': per_class,
+    }
+
+
+def confusion_matrix(predictions, ground_truth, nc, iou_thr=0.45, conf_thr=CONF_THR):
+    """
+    (nc+1) x (nc+1) 混淆矩陣，列 = 真實類別、行 = 預測類別，最後一列/行為背景 (與 Ultralytics 相同慣例)
+    不分類別以 IoU 配對，所以「框對了、類別錯了」會落在非對角線上
+    類別編號不在 0 ~ nc-1 的標註 (資料集還沒驗證過) 不計入，只印出略過的數量
+    """
+    matrix = np.zeros((nc + 1, nc + 1), dtype=int)
+    skipped = 0
+    for key, gt in ground_truth.items():
+        pred = predictions.get(key)
+        if pred is None:
+            continue
+        valid = (gt[:, 0] >= 0) & (gt[:, 0] < nc)   # NaN 也不成立
+        skipped += int((~valid).sum())
+        gt = gt[valid]
+        pred = pred[pred[:, 1] >= conf_thr]
+        gt_cls = gt[:, 0].astype(int)
+        pred_cls = np.minimum(pred[:, 0].astype(int), nc)
+        ious = iou_matrix(gt[:, 1:5], pred[:, 2:6])
+        used_gt, used_pred = set(), set()
+        # IoU 由大到小配對，每個框只用一次
+        for g, p in zip(*np.unravel_index(np.argsort(-ious, axis=None), ious.shape)):
+            if ious[g, p] < iou_thr:
+                break
+            if g in used_gt or p in used_pred:
+                continue
+            used_gt.add(g)
+            used_pred.add(p)
+            matrix[gt_cls[g], pred_cls[p]] += 1
+        for g in set(range(len(gt))) - used_gt:
+            matrix[gt_cls[g], nc] += 1
+        for p in set(range(len(pred))) - used_pred:
+            matrix[nc, pred_cls[p]] += 1
+    if skipped:
+        print(f"⚠️ 混淆矩陣略過 {skipped} 個類別編號不在 0~{nc - 1} 的標註 (可用 dataset_check.py 找出來源)")
+    return matrix
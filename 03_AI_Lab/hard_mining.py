@@ -0,0 +1,152 @@
+import argparse
+import json
+import os
+
+import numpy as np
+
+from dataset_fingerprint import abs_path, dataset_root, fingerprint_dataset, load_fingerprint
+from det_metrics import CONF_THR, confusion_matrix, iou_matrix, load_ground_truth
+from pred_cache import cached_predictions
+from sample_weights import save_sample_weights
+
+# ==========================================
+# 難例挖掘 + 易混淆類別加權抽樣
+# ==========================================
+# main.py 用全域參數 (cls=2.0、mixup=0.2、copy_paste=0.4) 對付麥香 / 咖啡廣場、國農上拍這類混淆，
+# 代價是每一張圖都變貴。這裡改成把訓練時間集中在「模型目前做不好的圖」：
+#   1. 用目前最好的權重批次推論整個訓練集 (預測依權重 + 圖片雜湊快取，重跑只推論新圖片)
+#   2. 建立每個類別的混淆矩陣，找出最常互相認錯的類別組合
+#   3. 每張圖算一個難度分數 (每個標註框的 max(1 - 正確類別信心, 錯誤類別信心)，取平均；
+#      背景圖則為誤報的最高信心)，依分數排序
+#   4. 權重 = 1 + HARD_GAIN x 難度 + PAIR_GAIN x 圖中類別的錯誤率，寫成 sample_weights.py 格式的抽樣清單
+# 訓練時以 make_trainer(sample_weights=...) 讀取，容易的圖仍會被抽到 (權重至少 1)，只是比例較低。
+# 報告 (混淆組合、最難的圖片) 寫在 data.yaml 旁的 hard_mining_report.json。
+
+WEIGHTS_NAME = "hard_mining_weights.json"
+REPORT_NAME = "hard_mining_report.json"
+MATCH_IOU = 0.5
+HARD_GAIN = 3.0
+PAIR_GAIN = 2.0
+MAX_WEIGHT = 6.0
+TOP_IMAGES = 50
+TOP_PAIRS = 15
+
+
+def image_hardness(pred, gt, iou_thr=MATCH_IOU):
+    """
+    回傳 (難度 0~1, [(真實類別, 認成的類別)] )
+    每個標註框：正確類別的最高信心 p_ok、其他類別的最高信心 p_bad (IoU >= iou_thr 的預測框)，
+    成本 = max(1 - p_ok, p_bad)；漏抓 = 1
+    """
+    if not len(gt):
+        fp = pred[pred[:, 1] >= CONF_THR]
+        return (float(fp[:, 1].max()) if len(fp) else 0.0), []
+    ious = iou_matrix(gt[:, 1:5], pred[:, 2:6]) if len(pred) else np.zeros((len(gt), 0))
+    costs, confusions = [], []
+    for g in range(len(gt)):
+        near = ious[g] >= iou_thr
+        same = near & (pred[:, 0] == gt[g, 0]) if len(pred) else near
+        other = near & ~same
+        p_ok = float(pred[same, 1].max()) if same.any() else 0.0
+        p_bad = float(pred[other, 1].max()) if other.any() else 0.0
+        costs.append(max(1.0 - p_ok, p_bad))
+        if p_bad >= CONF_THR and p_bad > p_ok:
+            wrong = pred[other][np.argmax(pred[other, 1])]
+            confusions.append((int(gt[g, 0]), int(wrong[0])))
+    return float(np.mean(costs)), confusions
+
+
+def confused_pairs(matrix, names, top=TOP_PAIRS):
+    """混淆矩陣的非對角線 (不含背景)，依次數排序"""
+    nc = len(names)
+    pairs = []
+    for t in range(nc):
+        for p in range(nc):
+            if t != p and matrix[t, p]:
+                pairs.append({'true': names[t], 'pred': names[p], 'count': int(matrix[t, p]),
+                              'rate': round(matrix[t, p] / max(matrix[t].sum(), 1), 4)})
+    return sorted(pairs, key=lambda x: -x['count'])[:top]
+
+
+def class_error_rates(matrix):
+    """每個類別的標註框中，沒被正確辨識 (認錯 + 漏抓) 的比例"""
+    nc = matrix.shape[0] - 1
+    totals = matrix[:nc].sum(axis=1)
+    return np.where(totals > 0, 1 - np.diag(matrix)[:nc] / np.maximum(totals, 1), 0.0)
+
+
+def mine(data_yaml, weights, out_dir=None, batch=16, imgsz=640, epoch_fraction=None, device=None):
+    """
+    對訓練集做難例挖掘，寫出抽樣清單與報告，回傳抽樣清單路徑
+    epoch_fraction：每個 epoch 只抽訓練集的這個比例 (None = 與資料集相同)
+    """
+    if not os.path.exists(weights):
+        print(f"⚠️ 找不到權重 {weights}，略過難例挖掘")
+        return None
+    out_dir = out_dir or os.path.dirname(os.path.abspath(data_yaml))
+    root = dataset_root(data_yaml)
+    fingerprint = fingerprint_dataset(data_yaml, previous=load_fingerprint(weights), splits=("train",))
+    names = fingerprint['names']
+    nc = len(names)
+    entries = {rel: (abs_path(root, rel), e['sha1']) for rel, e in fingerprint['splits']['train'].items()}
+    if not entries:
+        print("⚠️ 訓練集沒有圖片")
+        return None
+
+    print(f"⛏️ 難例挖掘：{os.path.basename(weights)} x {len(entries)} 張訓練圖片")
+    preds, reused = cached_predictions(weights, entries, "train", batch=batch, imgsz=imgsz, device=device)
+    gt = load_ground_truth({rel: path for rel, (path, _) in entries.items()},
+                           {rel: p['shape'] for rel, p in preds.items()})
+    boxes = {rel: p['boxes'] for rel, p in preds.items()}
+
+    matrix = confusion_matrix(boxes, gt, nc)
+    errors = class_error_rates(matrix)
+
+    scored = []
+    for rel in entries:
+        score, confusions = image_hardness(boxes[rel], gt[rel])
+        classes = set(gt[rel][:, 0].astype(int).tolist())
+        pair_term = max((errors[c] for c in classes if c < nc), default=0.0)
+        weight = min(MAX_WEIGHT, 1.0 + HARD_GAIN * score + PAIR_GAIN * pair_term)
+        scored.append((rel, score, weight, confusions))
+    scored.sort(key=lambda x: -x[1])
+
+    epoch_samples = int(len(entries) * epoch_fraction) if epoch_fraction else None
+    weights_path = save_sample_weights(os.path.join(out_dir, WEIGHTS_NAME),
+                                       {abs_path(root, rel): w for rel, _, w, _ in scored},
+                                       epoch_samples=epoch_samples, source="hard_mining")
+
+    pairs = confused_pairs(matrix, names)
+    report = {
+        'weights': weights,
+        'images': len(entries),
+        'reused_predictions': reused,
+        'class_error_rate': {names[c]: round(float(errors[c]), 4) for c in range(nc)},
+        'confused_pairs': pairs,
+        'confusion_matrix': matrix.tolist(),
+        'hardest_images': [{'image': rel, 'score': round(s, 4), 'weight': round(w, 3),
+                            'confusions': [f"{names[t]}->{names[p] if p < nc else 'background'}" for t, p in c]}
+                           for rel, s, w, c in scored[:TOP_IMAGES]],
+        'sampling': weights_path,
+    }
+    with open(os.path.join(out_dir, REPORT_NAME), 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    hard_share = sum(w for _, _, w, _ in scored[:len(scored) // 10 or 1]) / sum(w for _, _, w, _ in scored)
+    print(f"📋 最常認錯的組合：" + ("、".join(f"{p['true']}->{p['pred']} x{p['count']}" for p in pairs[:5]) or "無"))
+    print(f"⚖️ 最難的 10% 圖片佔抽樣 {hard_share:.1%}；抽樣清單：{weights_path}")
+    return weights_path
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="以目前最好的權重挖掘訓練集中的難例，產生加權抽樣清單")
+    parser.add_argument('data', help="data.yaml")
+    parser.add_argument('weights', help="目前最好的權重 (best.pt)")
+    parser.add_argument('--out', help="輸出資料夾 (預設為 data.yaml 所在資料夾)")
+    parser.add_argument('--batch', type=int, default=16)
+    parser.add_argument('--imgsz', type=int, default=640)
+    parser.add_argument('--epoch-fraction', type=float, help="每個 epoch 只抽訓練集的這個比例")
+    parser.add_argument('--device')
+    opts = parser.parse_args()
+    mine(opts.data, opts.weights, out_dir=opts.out, batch=opts.batch, imgsz=opts.imgsz,
+         epoch_fraction=opts.epoch_fraction, device=opts.device)
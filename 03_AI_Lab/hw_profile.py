@@ -0,0 +1,185 @@
+import json
+import os
+import platform
+import sys
+
+import cv2
+
+# ==========================================
+# 硬體偵測與訓練參數自動選擇
+# ==========================================
+# 有 GPU：沿用原本調好的 batch / workers (device=0)；batch 給 None 則交給 Ultralytics AutoBatch (-1)
+# 只有 CPU：依核心數與可用記憶體估算最大可行的 batch，並把核心分給 DataLoader 與 torch，
+#          避免 torch、OpenCV、worker 互搶執行緒 (oversubscription)
+# 選定的設定會寫成 hardware_profile.json，存在該次訓練的 runs/train/<name> 資料夾。
+
+PROFILE_NAME = "hardware_profile.json"
+
+# CPU 以 FP32 訓練 640px 時，每張圖大約需要的記憶體 (GB)，依模型大小
+PER_IMAGE_GB = {'n': 0.35, 's': 0.6, 'm': 1.2, 'l': 1.6, 'x': 2.4}
+MODEL_BASE_GB = 1.5      # 模型、優化器狀態與 Python 本身
+WORKER_GB = 0.5          # 每個 DataLoader worker
+CPU_MAX_BATCH = 16
+
+
+def cpu_cores():
+    """實際可用的核心數 (尊重 taskset / 容器限制)"""
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def memory_gb():
+    """回傳 (總記憶體, 可用記憶體) GB；優先使用 psutil，沒有安裝時讀取系統資訊"""
+    try:
+        import psutil
+        vm = psutil.virtual_memory()
+        return vm.total / 1024 ** 3, vm.available / 1024 ** 3
+    except ImportError:
+        pass
+
+    if os.path.exists('/proc/meminfo'):
+        info = {}
+        with open('/proc/meminfo') as f:
+            for line in f:
+                key, value = line.split(':', 1)
+                info[key] = int(value.split()[0]) * 1024
+        return info['MemTotal'] / 1024 ** 3, info.get('MemAvailable', info['MemFree']) / 1024 ** 3
+
+    if sys.platform == 'win32':
+        import ctypes
+
+        class MEMORYSTATUSEX(ctypes.Structure):
+            _fields_ = [('dwLength', ctypes.c_ulong), ('dwMemoryLoad', ctypes.c_ulong),
+                        ('ullTotalPhys', ctypes.c_ulonglong), ('ullAvailPhys', ctypes.c_ulonglong),
+                        ('ullTotalPageFile', ctypes.c_ulonglong), ('ullAvailPageFile', ctypes.c_ulonglong),
+                        ('ullTotalVirtual', ctypes.c_ulonglong), ('ullAvailVirtual', ctypes.c_ulonglong),
+                        ('sullAvailExtendedVirtual', ctypes.c_ulonglong)]
+
+        stat = MEMORYSTATUSEX()
+        stat.dwLength = ctypes.sizeof(MEMORYSTATUSEX)
+        ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(stat))
+        return stat.ullTotalPhys / 1024 ** 3, stat.ullAvailPhys / 1024 ** 3
+
+    return 0.0, 0.0
+
+
+def gpu_info():
+    try:
+        import torch
+    except ImportError:
+        return None
+    if not torch.cuda.is_available():
+        return None
+    props = torch.cuda.get_device_properties(0)
+    return {'name': props.name, 'memory_gb': round(props.total_memory / 1024 ** 3, 2),
+            'count': torch.cuda.device_count()}
+
+
+def model_scale(weights):
+    """從 yolo11m.pt / best.pt 之類的檔名猜模型大小，猜不到時以 m 計算"""
+    stem = os.path.splitext(os.path.basename(str(weights)))[0].lower()
+    for prefix in ('yolo11', 'yolov8', 'yolo'):
+        if stem.startswith(prefix) and len(stem) > len(prefix) and stem[len(prefix)] in PER_IMAGE_GB:
+            return stem[len(prefix)]
+    return 'm'
+
+
+def select_profile(weights, imgsz=640, gpu_batch=8, gpu_workers=4, max_batch=CPU_MAX_BATCH):
+    """
+    偵測硬體並決定 device / batch / workers / 執行緒數
+    gpu_batch、gpu_workers：有 GPU 時使用的值 (保留原本腳本調好的設定)
+    """
+    cores = cpu_cores()
+    total_gb, avail_gb = memory_gb()
+    gpu = gpu_info()
+    scale = model_scale(weights)
+
+    profile = {
+        'host': platform.node(),
+        'platform': platform.platform(),
+        'cpu_cores': cores,
+        'ram_total_gb': round(total_gb, 2),
+        'ram_available_gb': round(avail_gb, 2),
+        'gpu': gpu,
+        'model_scale': scale,
+        'imgsz': imgsz,
+    }
+
+    if gpu:
+        profile.update({
+            'device': 0,
+            'batch': gpu_batch if gpu_batch is not None else -1,
+            'workers': min(gpu_workers, max(cores - 1, 0)),
+            'torch_threads': max(1, cores // 2),
+            'reason': "偵測到 CUDA GPU" + ("，batch 交給 AutoBatch" if gpu_batch is None else ""),
+        })
+        return profile
+
+    # CPU：大約 1/4 的核心給 DataLoader，其餘給 torch 計算
+    workers = max(1, cores // 4) if cores > 2 else 0
+    torch_threads = max(1, cores - workers)
+
+    per_image = PER_IMAGE_GB[scale] * (imgsz / 640) ** 2
+    budget = avail_gb * 0.7 - MODEL_BASE_GB - workers * WORKER_GB
+    batch = int(budget // per_image) if per_image > 0 else 1
+    batch = max(1, min(max_batch, batch))
+    if batch > 2:
+        batch -= batch % 2
+
+    profile.update({
+        'device': 'cpu',
+        'batch': batch,
+        'workers': workers,
+        'torch_threads': torch_threads,
+        'reason': f"僅 CPU：可用記憶體 {avail_gb:.1f} GB，每張圖估計 {per_image:.2f} GB",
+    })
+    return profile
+
+
+def apply_thread_limits(profile):
+    """
+    限制各函式庫的執行緒數，避免 oversubscription
+    - torch 計算使用 torch_threads
+    - OpenCV 在主行程關閉內部多執行緒 (資料增強已經由 DataLoader worker 平行處理)
+    - 子行程 (DataLoader worker) 透過環境變數繼承，只用 1 條 OpenMP/MKL 執行緒
+    """
+    for var in ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS'):
+        os.environ[var] = "1"
+    cv2.setNumThreads(0)
+    try:
+        import torch
+        torch.set_num_threads(profile['torch_threads'])
+    except ImportError:
+        pass
+
+
+def train_args(profile):
+    """轉成 model.train 的參數"""
+    return {'device': profile['device'], 'batch': profile['batch'], 'workers': profile['workers']}
+
+
+def attach_profile(model, profile):
+    """訓練開始時把硬體設定寫進 runs/train/<name>/hardware_profile.json"""
+    def save(trainer):
+        os.makedirs(trainer.save_dir, exist_ok=True)
+        with open(os.path.join(trainer.save_dir, PROFILE_NAME), 'w', encoding='utf-8') as f:
+            json.dump(profile, f, ensure_ascii=False, indent=2)
+
+    model.add_callback("on_pretrain_routine_start", save)
+
+
+def prepare_launch(model, weights, imgsz=640, gpu_batch=8, gpu_workers=4):
+    """一次完成：偵測 -> 限制執行緒 -> 掛上紀錄 callback，回傳 model.train 的參數"""
+    profile = select_profile(weights, imgsz=imgsz, gpu_batch=gpu_batch, gpu_workers=gpu_workers)
+    apply_thread_limits(profile)
+    attach_profile(model, profile)
+    print(f"🖥️ 硬體設定：device={profile['device']} | batch={profile['batch']} | "
+          f"workers={profile['workers']} | torch 執行緒={profile['torch_threads']} ({profile['reason']})")
+    return train_args(profile)
+
+
+if __name__ == '__main__':
+    # 只偵測、不訓練：python hw_profile.py [權重檔名]
+    print(json.dumps(select_profile(sys.argv[1] if len(sys.argv) > 1 else "yolo11m.pt"),
+                     ensure_ascii=False, indent=2))
@@ -0,0 +1,267 @@
+import json
+import math
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+from aug_manifest import bytes_sha1, scan_stats
+from augment_engine import IMG_EXTS
+from dataset_check import load_data_yaml, resolve_split_dirs
+
+# ==========================================
+# 解碼後影像快取 (Memory-mapped)
+# ==========================================
+# 每個 split 的圖片只解碼、縮放一次，存進一個 uint8 的 memmap 檔：
+#   <cache_dir>/<split>_<imgsz>.u8    shape = (容量, imgsz, imgsz, 3)，每張圖一格
+#   <cache_dir>/<split>_<imgsz>.json  索引：{圖片路徑: row / sha1 / mtime / 原始與縮放後尺寸}
+# 縮放規則與 Ultralytics load_image 相同 (長邊縮到 imgsz、保持比例)，
+# 圖片放在格子左上角，其餘補 114 (letterbox 的灰邊)。讀取時直接回傳 memmap 的切片，
+# 多個 DataLoader worker 共用同一份 OS page cache，不必各自持有解碼後的副本。
+# 圖片的 mtime/size 改變時比對 sha1，內容真的變了才重新解碼，並沿用同一格。
+
+CACHE_VERSION = 1
+PAD_VALUE = 114
+
+
+def norm_path(path):
+    return os.path.normcase(os.path.abspath(path))
+
+
+def cache_paths(cache_dir, split, imgsz):
+    base = os.path.join(cache_dir, f"{split}_{imgsz}")
+    return base + ".u8", base + ".json"
+
+
+def resize_like_ultralytics(im, imgsz):
+    """長邊縮放到 imgsz (與 BaseDataset.load_image 的 rect_mode 相同)"""
+    h0, w0 = im.shape[:2]
+    r = imgsz / max(h0, w0)
+    if r != 1:
+        w, h = (min(math.ceil(w0 * r), imgsz), min(math.ceil(h0 * r), imgsz))
+        im = cv2.resize(im, (w, h), interpolation=cv2.INTER_LINEAR)
+    return im
+
+
+def load_index(index_path):
+    try:
+        with open(index_path, 'r', encoding='utf-8') as f:
+            index = json.load(f)
+        if index.get('version') == CACHE_VERSION:
+            return index
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def open_memmap(data_path, capacity, imgsz, mode='r'):
+    return np.memmap(data_path, dtype=np.uint8, mode=mode, shape=(capacity, imgsz, imgsz, 3))
+
+
+# ------------------------------------------
+# 子行程工作：解碼一張圖並寫進指定的格子
+# ------------------------------------------
+
+_worker_maps = {}
+
+
+def _render(task):
+    data_path, capacity, imgsz, row, path, expect_sha1 = task
+    with open(path, 'rb') as f:
+        buf = f.read()
+    sha1 = bytes_sha1(buf)
+    if sha1 == expect_sha1:
+        # 只是 mtime 變了，內容相同，不需要重新解碼
+        return path, sha1, None
+
+    im = cv2.imdecode(np.frombuffer(buf, np.uint8), cv2.IMREAD_COLOR)
+    if im is None:
+        return path, None, None
+    h0, w0 = im.shape[:2]
+    im = resize_like_ultralytics(im, imgsz)
+    h, w = im.shape[:2]
+
+    key = (data_path, capacity)
+    if key not in _worker_maps:
+        _worker_maps.clear()
+        _worker_maps[key] = open_memmap(data_path, capacity, imgsz, mode='r+')
+    mm = _worker_maps[key]
+    slot = mm[row]
+    slot[:h, :w] = im
+    slot[h:, :] = PAD_VALUE
+    slot[:h, w:] = PAD_VALUE
+    mm.flush()
+    return path, sha1, (h0, w0, h, w)
+
+
+# ------------------------------------------
+# 建立 / 更新快取
+# ------------------------------------------
+
+def _grow(data_path, capacity, imgsz):
+    """把 memmap 檔案擴大到 capacity 格 (新增部分由檔案系統補 0)"""
+    nbytes = capacity * imgsz * imgsz * 3
+    mode = 'r+b' if os.path.exists(data_path) else 'w+b'
+    with open(data_path, mode) as f:
+        f.truncate(nbytes)
+
+
+def build_split_cache(img_dirs, cache_dir, split, imgsz=640, workers=None):
+    """建立或增量更新單一 split 的快取，回傳統計"""
+    data_path, index_path = cache_paths(cache_dir, split, imgsz)
+    index = load_index(index_path)
+    if index is None or index['imgsz'] != imgsz or not os.path.exists(data_path):
+        index = {'version': CACHE_VERSION, 'imgsz': imgsz, 'capacity': 0, 'entries': {}, 'free': []}
+    entries, free = index['entries'], index['free']
+
+    # 1. 列出目前的圖片 (每個資料夾 scandir 一次)
+    current = {}
+    for img_dir in img_dirs:
+        for name, stat in scan_stats(img_dir).items():
+            if name.lower().endswith(IMG_EXTS):
+                current[norm_path(os.path.join(img_dir, name))] = stat
+
+    # 2. 移除已刪除的圖片，空出來的格子給新圖使用
+    for path in [p for p in entries if p not in current]:
+        free.append(entries.pop(path)['row'])
+
+    # 3. 找出需要 (重新) 解碼的圖片
+    todo = []
+    next_row = index['capacity']
+    for path, stat in current.items():
+        entry = entries.get(path)
+        if entry and entry['mtime_ns'] == stat[0] and entry['size'] == stat[1]:
+            continue
+        if entry is None:
+            if free:
+                row = free.pop()
+            else:
+                row, next_row = next_row, next_row + 1
+            entries[path] = entry = {'row': row, 'sha1': None}
+            todo.append((path, None))
+        else:
+            todo.append((path, entry['sha1']))
+        entry['mtime_ns'], entry['size'] = stat
+
+    capacity = max([index['capacity']] + [e['row'] + 1 for e in entries.values()])
+    if capacity != index['capacity'] or not os.path.exists(data_path):
+        _grow(data_path, max(capacity, 1), imgsz)
+        index['capacity'] = capacity
+
+    # 4. 平行解碼並寫入 memmap
+    start = time.perf_counter()
+    rendered, failed = 0, []
+    tasks = [(data_path, max(capacity, 1), imgsz, entries[p]['row'], p, sha1) for p, sha1 in todo]
+    workers = workers or max(1, (os.cpu_count() or 1) - 1)
+    if workers > 1 and len(tasks) > 16:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_render, tasks, chunksize=16))
+    else:
+        results = [_render(t) for t in tasks]
+        _worker_maps.clear()
+
+    for path, sha1, shape in results:
+        if sha1 is None:
+            failed.append(path)
+            free.append(entries.pop(path)['row'])
+            continue
+        entries[path]['sha1'] = sha1
+        if shape is not None:
+            entries[path].update(zip(('h0', 'w0', 'h', 'w'), shape))
+            rendered += 1
+
+    tmp_path = index_path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(index, f, separators=(',', ':'))
+    os.replace(tmp_path, index_path)
+
+    return {'images': len(entries), 'rendered': rendered, 'failed': failed,
+            'seconds': time.perf_counter() - start,
+            'bytes': index['capacity'] * imgsz * imgsz * 3}
+
+
+def build_cache(data_yaml, cache_dir=None, imgsz=640, splits=("train", "val"), workers=None):
+    """依 data.yaml 為 train / val 建立快取，回傳 cache_dir"""
+    cache_dir = cache_dir or os.path.join(os.path.dirname(os.path.abspath(data_yaml)), "cache")
+    os.makedirs(cache_dir, exist_ok=True)
+    split_dirs = resolve_split_dirs(load_data_yaml(data_yaml), data_yaml)
+
+    print(f"🗄️ 更新影像快取 ({imgsz}px)：{cache_dir}")
+    for split in splits:
+        if split not in split_dirs:
+            continue
+        stats = build_split_cache(split_dirs[split], cache_dir, split, imgsz=imgsz, workers=workers)
+        print(f"   [{split}] {stats['images']} 張，本次解碼 {stats['rendered']} 張 "
+              f"({stats['seconds']:.1f} 秒)，快取大小 {stats['bytes'] / 1024 ** 3:.2f} GB")
+        for path in stats['failed']:
+            print(f"   ⚠️ 無法解碼 {path}")
+    return cache_dir
+
+
+# ------------------------------------------
+# 訓練端：從快取讀圖的 Dataset 混入類別
+# ------------------------------------------
+
+class MemmapCacheMixin:
+    """
+    混入 YOLODataset，load_image 優先從 memmap 快取讀取
+    快取沒有的圖片 (或 imgsz 不同) 會退回 Ultralytics 原本的讀圖流程
+    image_cache_dir 由訓練器在建立資料集後設定
+    """
+
+    image_cache_dir = None
+
+    def _cache_lookup(self):
+        # 延遲載入：每個 DataLoader worker 各自開啟 memmap，共用同一份 page cache
+        if getattr(self, '_cache_table', None) is None:
+            table, maps = {}, {}
+            for name in sorted(os.listdir(self.image_cache_dir)):
+                if not name.endswith(f"_{self.imgsz}.json"):
+                    continue
+                data_path = os.path.join(self.image_cache_dir, name[:-5] + ".u8")
+                index = load_index(os.path.join(self.image_cache_dir, name))
+                if index is None or not os.path.exists(data_path) or not index['capacity']:
+                    continue
+                maps[data_path] = open_memmap(data_path, index['capacity'], self.imgsz)
+                for path, e in index['entries'].items():
+                    if 'h' in e:
+                        table[path] = (data_path, e['row'], (e['h0'], e['w0']), (e['h'], e['w']))
+            self._cache_table, self._cache_maps = table, maps
+        return self._cache_table
+
+    def load_image(self, i, rect_mode=True, resize_short=False):
+        if self.image_cache_dir is None or not rect_mode or resize_short:
+            return super().load_image(i, rect_mode, resize_short)
+
+        hit = self._cache_lookup().get(norm_path(self.im_files[i]))
+        if hit is None:
+            return super().load_image(i, rect_mode, resize_short)
+
+        data_path, row, hw0, (h, w) = hit
+        im = self._cache_maps[data_path][row, :h, :w]
+        if self.augment:
+            # 訓練時部分增強 (如 RandomHSV) 會原地修改影像，必須複製；驗證時直接回傳切片
+            im = im.copy()
+            # Mosaic 從 buffer 挑選搭配的圖片，快取命中時也要維護 buffer
+            self.buffer.append(i)
+            if 1 < len(self.buffer) >= self.max_buffer_length:
+                self.buffer.pop(0)
+        return im, hw0, (h, w)
+
+    def __getstate__(self):
+        # memmap 被 pickle 時會變成完整陣列，送進 worker 前先移除，讓 worker 自行開啟
+        # (object.__getstate__ 要 Python 3.11 才有，Ultralytics 支援 3.8+，所以直接複製 __dict__)
+        state = self.__dict__.copy()
+        state['_cache_table'] = None
+        state['_cache_maps'] = None
+        return state
+
+
+if __name__ == '__main__':
+    # 用法：python image_cache.py <data.yaml> [cache_dir]
+    DATA_YAML = sys.argv[1] if len(sys.argv) > 1 else r"D:\product_recognition\03_AI_Lab\yolo11_data\drink\data.yaml"
+    CACHE_DIR = sys.argv[2] if len(sys.argv) > 2 else None
+    build_cache(DATA_YAML, CACHE_DIR)
@@ -0,0 +1,163 @@
+import json
+import os
+import sys
+
+from dataset_fingerprint import (abs_path, dataset_root, diff_by_mtime, diff_fingerprint, fingerprint_dataset,
+                                 load_fingerprint)
+from det_metrics import evaluate, load_ground_truth
+from pred_cache import cached_predictions
+from sample_weights import save_sample_weights
+
+# ==========================================
+# 增量微調：只針對基礎權重沒看過的圖片
+# ==========================================
+# 1. 比對基礎權重旁的 dataset_fingerprint.json 與目前資料集，找出新增 / 修改的訓練圖片
+#    (舊權重沒有指紋時，以權重檔的修改時間估計)
+# 2. 產生加權抽樣清單：每個 epoch 一半是新圖片 (每張約出現 OVERSAMPLE 次)，一半從舊圖片回放，避免遺忘
+#    epoch 只抽 epoch_samples 張，配合短排程 (INCREMENTAL_EPOCHS、訓練中不驗證)
+# 3. 訓練後以快取的預測比較基礎權重與新權重：基礎權重對未變動驗證圖的預測直接沿用，
+#    新權重的預測也會存下來，下一輪增量微調以它為基礎時同樣只需推論新圖片
+# 新增 / 修改既有商品的圖片 (幾十張圖) 只需要幾分鐘，不必重跑 250 epochs。
+# 類別清單改變 (新增 SKU) 時例外：nc 與基礎權重不同，Ultralytics 會重建 Detect 分類頭，所有類別都從頭學，
+# 短排程 + 不驗證學不回來，所以計畫改回完整排程 (FULL_SCHEDULE)，不寫抽樣清單。
+
+NEW_SHARE = 0.5            # 每個 epoch 中新圖片所佔比例
+OVERSAMPLE = 8             # 每張新圖片每個 epoch 大約出現幾次
+MIN_EPOCH_SAMPLES = 128
+INCREMENTAL_EPOCHS = 30
+FULL_SCHEDULE = {'epochs': 250, 'patience': 10}   # 與 resume_train.py 一般微調相同
+REPORT_NAME = "incremental_report.json"
+
+
+def plan_incremental(data_yaml, base_weights, sampling_path):
+    """
+    比對資料集與基礎權重，寫出加權抽樣清單
+    回傳計畫 dict；沒有新資料 (或全部都是新資料，應該完整訓練) 時回傳 None
+    類別清單與基礎權重不同時回傳 full=True 的計畫 (完整排程、不加權抽樣)
+    """
+    base = load_fingerprint(base_weights)
+    current = fingerprint_dataset(data_yaml, previous=base)
+    if base:
+        train_diff = diff_fingerprint(base, current, "train")
+        val_diff = diff_fingerprint(base, current, "val")
+        new_classes = [n for n in current['names'] if n not in base.get('names', [])]
+        names_changed = current['names'] != base.get('names')
+    else:
+        print(f"⚠️ {base_weights} 旁沒有資料集指紋，以權重檔的修改時間判斷新圖片 (本次訓練後會存指紋)")
+        train_diff = diff_by_mtime(base_weights, current, "train")
+        val_diff = diff_by_mtime(base_weights, current, "val")
+        new_classes = []
+        names_changed = False
+
+    new = train_diff['added'] + train_diff['changed']
+    old = train_diff['unchanged']
+    print(f"🧬 訓練集：新增 {len(train_diff['added'])} | 修改 {len(train_diff['changed'])} | "
+          f"刪除 {len(train_diff['removed'])} | 未變 {len(old)}"
+          + (f" | 新類別：{', '.join(new_classes)}" if new_classes else ""))
+    if names_changed:
+        return full_plan(current, train_diff, val_diff, new_classes)
+
+    if not new:
+        print("ℹ️ 基礎權重之後沒有新的訓練資料，不需要微調。")
+        return None
+    if not old:
+        print("⚠️ 訓練集全部都是新資料，增量微調沒有意義，請改用完整訓練。")
+        return None
+
+    root = dataset_root(data_yaml)
+    epoch_samples = min(len(new) + len(old), max(MIN_EPOCH_SAMPLES, int(len(new) * OVERSAMPLE / NEW_SHARE)))
+    new_weight = NEW_SHARE / len(new)
+    old_weight = (1 - NEW_SHARE) / len(old)
+    save_sample_weights(sampling_path, {abs_path(root, rel): new_weight for rel in new}, epoch_samples=epoch_samples,
+                        default=old_weight, source="incremental")
+    print(f"⚖️ 每個 epoch 抽 {epoch_samples} 張 (新圖片約各 {epoch_samples * NEW_SHARE / len(new):.1f} 次)，"
+          f"共 {INCREMENTAL_EPOCHS} epochs")
+
+    return {
+        'fingerprint': current,
+        'train_diff': train_diff,
+        'val_diff': val_diff,
+        'new_classes': new_classes,
+        'full': False,
+        'sampling_path': sampling_path,
+        'epoch_samples': epoch_samples,
+        # 短排程：訓練中不驗證 (最後一個 epoch 仍會驗證一次)，早停也就用不到
+        'train_args': {'epochs': INCREMENTAL_EPOCHS, 'patience': INCREMENTAL_EPOCHS, 'val': False,
+                       'warmup_epochs': 1, 'close_mosaic': 5},
+    }
+
+
+def full_plan(fingerprint, train_diff, val_diff, new_classes):
+    """類別清單改變：分類頭會重新初始化，改用完整排程 (全部圖片均勻抽樣、每個 epoch 驗證)"""
+    print(f"⚠️ 類別清單與基礎權重不同 (新類別：{', '.join(new_classes) or '無，順序或刪除有變'})，"
+          f"分類頭會從頭訓練，改用完整排程 ({FULL_SCHEDULE['epochs']} epochs)")
+    return {
+        'fingerprint': fingerprint,
+        'train_diff': train_diff,
+        'val_diff': val_diff,
+        'new_classes': new_classes,
+        'full': True,
+        'sampling_path': None,
+        'epoch_samples': None,
+        'train_args': dict(FULL_SCHEDULE),
+    }
+
+
+def compare_with_base(base_weights, new_weights, data_yaml, plan, report_dir=None, batch=16, imgsz=640):
+    """
+    以驗證集比較基礎權重與新權重 (全部 / 新驗證圖 / 未變動的驗證圖)
+    未變動的驗證圖代表「有沒有忘記舊商品」，新驗證圖代表「有沒有學會新商品」
+    """
+    fingerprint = plan['fingerprint']
+    root = dataset_root(data_yaml)
+    entries = {rel: (abs_path(root, rel), e['sha1']) for rel, e in fingerprint['splits'].get('val', {}).items()}
+    if not entries:
+        print("⚠️ 沒有驗證集，略過比較")
+        return None
+
+    base_preds, reused = cached_predictions(base_weights, entries, "val", batch=batch, imgsz=imgsz)
+    new_preds, _ = cached_predictions(new_weights, entries, "val", batch=batch, imgsz=imgsz)
+    gt = load_ground_truth({rel: path for rel, (path, _) in entries.items()},
+                           {rel: p['shape'] for rel, p in new_preds.items()})
+    nc = len(fingerprint['names'])
+
+    val_diff = plan['val_diff']
+    subsets = {
+        'all': list(entries),
+        'new': val_diff['added'] + val_diff['changed'],
+        'unchanged': val_diff['unchanged'],
+    }
+    report = {'base': base_weights, 'new': new_weights, 'reused_base_predictions': reused, 'subsets': {}}
+    print(f"📊 驗證比較 (基礎權重沿用快取 {reused}/{len(entries)} 張)：")
+    for name, rels in subsets.items():
+        if not rels:
+            continue
+        sub_gt = {rel: gt[rel] for rel in rels}
+        before = evaluate({k: v['boxes'] for k, v in base_preds.items()}, sub_gt, nc)
+        after = evaluate({k: v['boxes'] for k, v in new_preds.items()}, sub_gt, nc)
+        report['subsets'][name] = {'images': len(rels), 'base': before, 'new': after}
+        print(f"   {name:<9} {len(rels):>5} 張 | mAP50 {before['map50']:.3f} -> {after['map50']:.3f} | "
+              f"P {before['precision']:.3f} -> {after['precision']:.3f} | R {before['recall']:.3f} -> {after['recall']:.3f}")
+
+    for c in (fingerprint['names'].index(n) for n in plan['new_classes']):
+        ap = report['subsets']['all']['new']['per_class'].get(c)
+        if ap:
+            print(f"   🆕 {fingerprint['names'][c]}：AP50 {ap['ap50']:.3f} ({ap['instances']} 個標註)")
+
+    unchanged = report['subsets'].get('unchanged')
+    if unchanged and unchanged['new']['map50'] < unchanged['base']['map50'] - 0.02:
+        print("⚠️ 舊商品的 mAP50 下降超過 0.02，可能發生遺忘；可提高舊圖片比例 (NEW_SHARE) 或改用完整訓練")
+
+    if report_dir:
+        with open(os.path.join(report_dir, REPORT_NAME), 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return report
+
+
+if __name__ == '__main__':
+    # 只規劃、不訓練：python incremental_finetune.py <data.yaml> <基礎權重>
+    if len(sys.argv) < 3:
+        print("用法：python incremental_finetune.py <data.yaml> <基礎權重>")
+        sys.exit(1)
+    out = os.path.join(os.path.dirname(os.path.abspath(sys.argv[1])), "incremental_sampling.json")
+    plan_incremental(sys.argv[1], sys.argv[2], out)
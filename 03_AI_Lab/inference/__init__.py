@@ -0,0 +1,33 @@
+# ==========================================
+# 後台推論服務 (ONNX Runtime / CPU)
+# ==========================================
+# 讀取 model.export(format='onnx') 匯出的模型，多台收銀機共用一台後台主機推論：
+#   preprocess  - NumPy letterbox，直接寫進預先配置好的 batch buffer
+#   postprocess - YOLO11 輸出解碼 + 向量化 NMS
+#   detector    - OnnxDetector，一次推論一整個 batch
+#   tflite_detector - TFLiteDetector，同樣介面跑 App 端的 .tflite (效能比較用)
+#   batcher     - 動態 micro-batching：把同時進來的請求湊成一批
+#   server      - 本機 HTTP 端點 (POST /detect)
+#   catalog     - 商品目錄索引 (catalog.bin)：class_id -> 商品 id / 價格，O(1) 查詢
+# 要讓 batch > 1 生效，匯出時需加上 dynamic=True；固定 batch=1 的模型會自動逐張推論。
+
+# 子模組在第一次取用時才載入：只需要 catalog 的工具 (build_catalog.py) 不會連帶載入 onnxruntime / cv2
+_EXPORTS = {
+    "BatchBuffer": "inference.preprocess",
+    "CatalogIndex": "inference.catalog",
+    "MicroBatcher": "inference.batcher",
+    "OnnxDetector": "inference.detector",
+    "TFLiteDetector": "inference.tflite_detector",
+    "decode_predictions": "inference.postprocess",
+    "letterbox_into": "inference.preprocess",
+    "nms": "inference.postprocess",
+}
+
+__all__ = sorted(_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module 'inference' has no attribute {name!r}")
+    import importlib
+    return getattr(importlib.import_module(_EXPORTS[name]), name)
@@ -0,0 +1,70 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class MicroBatcher:
+    """
+    動態 micro-batching：背景執行緒收集同時進來的請求，
+    湊滿 max_batch 或等待超過 max_latency_ms 就送出一批推論
+    """
+
+    def __init__(self, detector, max_batch=8, max_latency_ms=10.0):
+        self.detector = detector
+        self.max_batch = max_batch
+        self.max_latency = max_latency_ms / 1000.0
+        self._queue = queue.Queue()
+        self._stop = threading.Event()
+        self.stats = {'requests': 0, 'batches': 0, 'max_batch_seen': 0}
+        self._thread = threading.Thread(target=self._loop, name="micro-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, image):
+        """送出一張 BGR 影像，回傳 Future，結果為偵測列表"""
+        fut = Future()
+        self._queue.put((image, fut))
+        return fut
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _collect(self):
+        try:
+            first = self._queue.get(timeout=0.1)
+        except queue.Empty:
+            return []
+        batch = [first]
+        deadline = time.perf_counter() + self.max_latency
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self):
+        while not self._stop.is_set():
+            batch = self._collect()
+            if not batch:
+                continue
+            images = [img for img, _ in batch]
+            done = 0
+            error = RuntimeError("偵測結果數量與請求不符")
+            try:
+                results = self.detector.detect_batch(images)
+                for (_, fut), result in zip(batch, results):
+                    fut.set_result(result)
+                    done += 1
+            except Exception as e:
+                error = e
+            # 任何沒拿到結果的請求都要結束，避免呼叫端永遠等待
+            for _, fut in batch[done:]:
+                fut.set_exception(error)
+            self.stats['requests'] += len(batch)
+            self.stats['batches'] += 1
+            self.stats['max_batch_seen'] = max(self.stats['max_batch_seen'], len(batch))
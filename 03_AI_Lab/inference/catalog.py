@@ -0,0 +1,106 @@
+import hashlib
+import struct
+
+# ==========================================
+# 商品目錄索引 (類別編號 -> 商品 id / 價格 / 類別)
+# ==========================================
+# 由 04_App_Dev/build_catalog.py 產生 assets/models/catalog.bin，與 labels.txt、模型放在一起。
+# 檔案格式 (little-endian)：
+#   header      HEADER_FMT：magic "PCAT"、版本、header / record 大小、類別數、商品數、
+#               各區段位移、labels.txt 的 sha1 (確認目錄與模型的類別順序一致)、建置時間
+#   categories  n_categories 個 (字串位移 u32, 長度 u16)
+#   records     count 個 RECORD_FMT：價格 i32、商品 id / 顯示名稱 (字串位移 u32, 長度 u16)、類別編號 u16
+#   strings     UTF-8 字串池
+# 偵測結果的 class_id 直接乘上 record 大小就是位移，查詢為 O(1)，不需要掃描 JSON。
+
+MAGIC = b"PCAT"
+VERSION = 1
+HEADER_FMT = "<4sHHHHIIII20sI"
+RECORD_FMT = "<iIHIHH"
+CATEGORY_FMT = "<IH"
+HEADER_SIZE = struct.calcsize(HEADER_FMT)
+RECORD_SIZE = struct.calcsize(RECORD_FMT)
+CATEGORY_SIZE = struct.calcsize(CATEGORY_FMT)
+
+
+def labels_sha1(labels):
+    return hashlib.sha1("\n".join(labels).encode('utf-8')).digest()
+
+
+def pack_catalog(labels, products, built_at=0):
+    """
+    labels：類別名稱 (依模型輸出順序)；products：{類別名稱: {'id', 'price', 'name', 'category'}}
+    回傳 catalog.bin 的位元組
+    """
+    pool = bytearray()
+    offsets = {}
+
+    def ref(text):
+        data = text.encode('utf-8')
+        if text not in offsets:
+            offsets[text] = len(pool)
+            pool.extend(data)
+        return offsets[text], len(data)
+
+    categories = sorted({products[label]['category'] for label in labels})
+    category_index = {c: i for i, c in enumerate(categories)}
+    category_bytes = b"".join(struct.pack(CATEGORY_FMT, *ref(c)) for c in categories)
+
+    records = bytearray()
+    for label in labels:
+        p = products[label]
+        records += struct.pack(RECORD_FMT, int(p['price']), *ref(p['id']), *ref(p['name']),
+                               category_index[p['category']])
+
+    categories_offset = HEADER_SIZE
+    records_offset = categories_offset + len(category_bytes)
+    strings_offset = records_offset + len(records)
+    header = struct.pack(HEADER_FMT, MAGIC, VERSION, HEADER_SIZE, RECORD_SIZE, len(categories), len(labels),
+                         categories_offset, records_offset, strings_offset, labels_sha1(labels), int(built_at))
+    return header + category_bytes + bytes(records) + bytes(pool)
+
+
+class CatalogIndex:
+    """讀取 catalog.bin；lookup(class_id) 以位移直接讀取，不建立任何字典"""
+
+    def __init__(self, data):
+        (magic, version, header_size, self.record_size, n_categories, self.count, categories_offset,
+         self.records_offset, self.strings_offset, self.labels_sha1, self.built_at) = \
+            struct.unpack_from(HEADER_FMT, data, 0)
+        if magic != MAGIC:
+            raise ValueError("不是商品目錄檔 (magic 不符)")
+        if version != VERSION:
+            raise ValueError(f"不支援的商品目錄版本：{version}")
+        self.data = data
+        self.categories = [self._string(*struct.unpack_from(CATEGORY_FMT, data, categories_offset + i * CATEGORY_SIZE))
+                           for i in range(n_categories)]
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            return cls(f.read())
+
+    def __len__(self):
+        return self.count
+
+    def _string(self, offset, length):
+        start = self.strings_offset + offset
+        return bytes(self.data[start:start + length]).decode('utf-8')
+
+    def lookup(self, class_id):
+        """回傳 {'product_id', 'name', 'price', 'category'}；超出範圍回傳 None"""
+        if not 0 <= class_id < self.count:
+            return None
+        price, id_off, id_len, name_off, name_len, category = \
+            struct.unpack_from(RECORD_FMT, self.data, self.records_offset + class_id * self.record_size)
+        return {'product_id': self._string(id_off, id_len), 'name': self._string(name_off, name_len),
+                'price': price, 'category': self.categories[category]}
+
+    def price(self, class_id):
+        if not 0 <= class_id < self.count:
+            return None
+        return struct.unpack_from("<i", self.data, self.records_offset + class_id * self.record_size)[0]
+
+    def matches_labels(self, labels):
+        """目錄是否以同一份 labels.txt (同樣的類別順序) 建立"""
+        return labels is not None and labels_sha1(labels) == self.labels_sha1
@@ -0,0 +1,93 @@
+import ast
+import threading
+
+import numpy as np
+import onnxruntime as ort
+
+from inference.catalog import CatalogIndex
+from inference.postprocess import decode_predictions
+from inference.preprocess import BatchBuffer
+
+
+def load_names(session, labels_path=None):
+    """類別名稱：優先讀 labels.txt，否則使用 Ultralytics 寫在 ONNX metadata 中的 names"""
+    if labels_path:
+        with open(labels_path, 'r', encoding='utf-8') as f:
+            return [line.strip() for line in f if line.strip()]
+    meta = session.get_modelmeta().custom_metadata_map
+    if 'names' in meta:
+        names = ast.literal_eval(meta['names'])
+        return [names[k] for k in sorted(names)] if isinstance(names, dict) else list(names)
+    return None
+
+
+class OnnxDetector:
+    """
+    以 ONNX Runtime (CPU) 執行 YOLO11 偵測
+    模型匯出時若有 dynamic=True，detect_batch 會一次推論整批；固定 batch=1 則逐張推論
+    """
+
+    catalog = None   # TFLiteDetector 沿用 to_dicts 但不經過這裡的 __init__
+
+    def __init__(self, model_path, conf=0.5, iou=0.45, max_batch=8, threads=None,
+                 labels_path=None, mode="letterbox", catalog_path=None):
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            opts.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(model_path, sess_options=opts, providers=["CPUExecutionProvider"])
+
+        inp = self.session.get_inputs()[0]
+        self.input_name = inp.name
+        self.imgsz = inp.shape[2] if isinstance(inp.shape[2], int) else 640
+        self.dynamic_batch = not isinstance(inp.shape[0], int)
+        self.max_batch = max_batch if self.dynamic_batch else 1
+        # main.py 以 half=True 匯出時輸入是 float16
+        dtype = np.float16 if inp.type == 'tensor(float16)' else np.float32
+
+        self.names = load_names(self.session, labels_path)
+        # 商品目錄 (build_catalog.py 產生)：class_id 直接對到商品 id 與價格
+        self.catalog = CatalogIndex.load(catalog_path) if catalog_path else None
+        if self.catalog is not None and not self.catalog.matches_labels(self.names):
+            raise ValueError(f"商品目錄 {catalog_path} 與模型的類別順序不一致，請重新執行 build_catalog.py")
+        self.conf, self.iou, self.mode = conf, iou, mode
+        self._buffer = BatchBuffer(self.max_batch, self.imgsz, dtype=dtype)
+        self._lock = threading.Lock()   # buffer 只有一份，同時間只允許一批使用
+
+    def _run(self, images):
+        with self._lock:
+            tensor, metas = self._buffer.fill(images, self.mode)
+            output = self.session.run(None, {self.input_name: tensor})[0]
+        if output.shape[0] != len(images):
+            raise RuntimeError(f"模型輸出 batch={output.shape[0]}，與輸入 {len(images)} 張不符 (匯出時需 dynamic=True)")
+        return decode_predictions(output.astype(np.float32, copy=False), metas,
+                                  [img.shape[:2] for img in images], self.conf, self.iou)
+
+    def detect_batch(self, images):
+        """images: BGR 影像列表；回傳每張圖的偵測結果列表"""
+        results = []
+        for i in range(0, len(images), self.max_batch):
+            results += self._run(images[i:i + self.max_batch])
+        return [self.to_dicts(r) for r in results]
+
+    def detect(self, image):
+        return self.detect_batch([image])[0]
+
+    def to_dicts(self, result):
+        """
+        轉成與 flutter_vision yoloOnImage 相同的格式：
+        {"box": [x1, y1, x2, y2, conf], "tag": 類別名稱}，另外附上 class_id
+        有商品目錄時再附上 product_id / price / category
+        """
+        boxes, scores, classes = result
+        out = []
+        for box, score, cls in zip(boxes.tolist(), scores.tolist(), classes.tolist()):
+            tag = self.names[cls] if self.names and cls < len(self.names) else str(cls)
+            item = {'box': box + [score], 'tag': tag, 'class_id': cls}
+            if self.catalog is not None:
+                product = self.catalog.lookup(cls)
+                if product:
+                    item.update(product_id=product['product_id'], price=product['price'],
+                                category=product['category'])
+            out.append(item)
+        return out
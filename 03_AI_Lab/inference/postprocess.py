@@ -0,0 +1,65 @@
+import numpy as np
+
+
+def box_iou(box, boxes):
+    """一個框對多個框的 IoU (xyxy)"""
+    x1 = np.maximum(box[0], boxes[:, 0])
+    y1 = np.maximum(box[1], boxes[:, 1])
+    x2 = np.minimum(box[2], boxes[:, 2])
+    y2 = np.minimum(box[3], boxes[:, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    return inter / (area + areas - inter + 1e-9)
+
+
+def nms(boxes, scores, classes, iou_thres=0.45, max_det=300):
+    """
+    依類別分開的 NMS：把不同類別的框平移到互不重疊的位置，一次處理所有類別
+    每輪保留最高分的框，並以向量運算一次剔除所有重疊過高的框
+    """
+    if len(boxes) == 0:
+        return np.zeros(0, dtype=np.int64)
+    offset = classes[:, None].astype(boxes.dtype) * (boxes.max() + 1)
+    shifted = boxes + offset
+
+    order = scores.argsort()[::-1]
+    keep = []
+    while order.size and len(keep) < max_det:
+        i = order[0]
+        keep.append(i)
+        if order.size == 1:
+            break
+        iou = box_iou(shifted[i], shifted[order[1:]])
+        order = order[1:][iou <= iou_thres]
+    return np.array(keep, dtype=np.int64)
+
+
+def decode_predictions(output, metas, orig_shapes, conf_thres=0.5, iou_thres=0.45, max_det=300):
+    """
+    解碼 YOLO11 輸出 (B, 4 + nc, N)：中心點 xywh + 各類別分數
+    回傳每張圖的 (boxes xyxy 原圖座標, scores, classes)
+    """
+    results = []
+    preds = output.transpose(0, 2, 1)  # (B, N, 4 + nc)
+    for pred, ((rw, rh), (left, top)), (h0, w0) in zip(preds, metas, orig_shapes):
+        cls_scores = pred[:, 4:]
+        classes = cls_scores.argmax(1)
+        scores = cls_scores[np.arange(len(classes)), classes]
+        mask = scores > conf_thres
+        pred, scores, classes = pred[mask], scores[mask], classes[mask]
+
+        boxes = np.empty((len(pred), 4), dtype=np.float32)
+        boxes[:, 0] = pred[:, 0] - pred[:, 2] / 2
+        boxes[:, 1] = pred[:, 1] - pred[:, 3] / 2
+        boxes[:, 2] = pred[:, 0] + pred[:, 2] / 2
+        boxes[:, 3] = pred[:, 1] + pred[:, 3] / 2
+
+        keep = nms(boxes, scores, classes, iou_thres, max_det)
+        boxes, scores, classes = boxes[keep], scores[keep], classes[keep]
+
+        # 還原到原圖座標
+        boxes[:, [0, 2]] = np.clip((boxes[:, [0, 2]] - left) / rw, 0, w0)
+        boxes[:, [1, 3]] = np.clip((boxes[:, [1, 3]] - top) / rh, 0, h0)
+        results.append((boxes, scores.astype(np.float32), classes))
+    return results
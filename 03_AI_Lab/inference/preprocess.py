@@ -0,0 +1,67 @@
+import cv2
+import numpy as np
+
+PAD_VALUE = 114
+
+
+def letterbox_params(img_h, img_w, new_shape=640):
+    """
+    計算 letterbox 的縮放比例與上下左右補邊 (與 Ultralytics LetterBox 相同算法)
+    回傳 (ratio, (new_w, new_h), (pad_left, pad_top))
+    """
+    if isinstance(new_shape, int):
+        new_shape = (new_shape, new_shape)
+    r = min(new_shape[0] / img_h, new_shape[1] / img_w)
+    new_w, new_h = int(round(img_w * r)), int(round(img_h * r))
+    dw, dh = (new_shape[1] - new_w) / 2, (new_shape[0] - new_h) / 2
+    return r, (new_w, new_h), (int(round(dw - 0.1)), int(round(dh - 0.1)))
+
+
+
+def letterbox_into(img, out, mode="letterbox"):
+    """
+    把 BGR 影像縮放後直接寫進 out (H, W, 3) uint8，回傳 (ratio, (pad_left, pad_top))
+    mode="letterbox"：等比例縮放、置中補灰邊 (與 Ultralytics 驗證時相同，模型就是這樣訓練的)
+    mode="stretch"  ：直接拉伸成正方形 (等同 App 端 predictFixedImage 的 img.copyResize，用於比對)
+    """
+    new_h, new_w = out.shape[:2]
+    h0, w0 = img.shape[:2]
+
+    if mode == "stretch":
+        cv2.resize(img, (new_w, new_h), dst=out, interpolation=cv2.INTER_LINEAR)
+        return (new_w / w0, new_h / h0), (0, 0)
+
+    r, (w, h), (left, top) = letterbox_params(h0, w0, (new_h, new_w))
+    resized = img if (w, h) == (w0, h0) else cv2.resize(img, (w, h), interpolation=cv2.INTER_LINEAR)
+    # 只填補邊，影像區域由縮放結果直接覆蓋
+    out[:top] = PAD_VALUE
+    out[top + h:] = PAD_VALUE
+    out[top:top + h, :left] = PAD_VALUE
+    out[top:top + h, left + w:] = PAD_VALUE
+    out[top:top + h, left:left + w] = resized
+    return (r, r), (left, top)
+
+
+class BatchBuffer:
+    """
+    預先配置的輸入緩衝區，重複使用避免每個請求都配置記憶體
+    raw: (B, H, W, 3) uint8 BGR；tensor: 模型輸入 (RGB、0~1)
+    layout="nchw"：(B, 3, H, W)，ONNX / PyTorch；layout="nhwc"：(B, H, W, 3)，onnx2tf 轉出的 TFLite
+    """
+
+    def __init__(self, max_batch, imgsz, dtype=np.float32, layout="nchw"):
+        self.raw = np.empty((max_batch, imgsz, imgsz, 3), dtype=np.uint8)
+        self.layout = layout
+        shape = (max_batch, 3, imgsz, imgsz) if layout == "nchw" else (max_batch, imgsz, imgsz, 3)
+        self.tensor = np.empty(shape, dtype=dtype)
+
+    def fill(self, images, mode="letterbox"):
+        """回傳 (模型輸入, 每張圖的 (ratio, pad))；模型輸入是 tensor 的前 n 格 view"""
+        n = len(images)
+        metas = [letterbox_into(img, self.raw[i], mode) for i, img in enumerate(images)]
+        # BGR -> RGB、HWC -> CHW、/255，寫進預先配置的 tensor (不產生中間陣列)
+        rgb = self.raw[:n, :, :, ::-1]
+        if self.layout == "nchw":
+            rgb = rgb.transpose(0, 3, 1, 2)
+        np.multiply(rgb, 1 / 255.0, out=self.tensor[:n], casting='unsafe')
+        return self.tensor[:n], metas
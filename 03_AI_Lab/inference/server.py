@@ -0,0 +1,100 @@
+import argparse
+import json
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import cv2
+import numpy as np
+
+from inference.batcher import MicroBatcher
+from inference.detector import OnnxDetector
+
+# 用法 (在 03_AI_Lab 目錄下)：
+#   python -m inference.server runs/train/<name>/weights/best.onnx --port 8000 [--catalog ../04_App_Dev/assets/models/catalog.bin]
+# 收銀機端：POST /detect，body 直接放 JPEG/PNG 位元組
+#   curl --data-binary @photo.jpg http://<後台IP>:8000/detect
+
+
+class DetectHandler(BaseHTTPRequestHandler):
+    batcher = None   # 由 serve() 設定
+
+    def _reply(self, code, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/health':
+            self._reply(200, {'status': 'ok', **self.batcher.stats})
+        else:
+            self._reply(404, {'error': 'not found'})
+
+    def do_POST(self):
+        if self.path != '/detect':
+            self._reply(404, {'error': 'not found'})
+            return
+        start = time.perf_counter()
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+        except ValueError:
+            length = 0
+        data = self.rfile.read(length) if length > 0 else b""
+        if not data:
+            self._reply(400, {'error': '沒有圖片資料'})
+            return
+        try:
+            img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+        except cv2.error:
+            img = None
+        if img is None:
+            self._reply(400, {'error': '無法解碼圖片'})
+            return
+        try:
+            detections = self.batcher.submit(img).result(timeout=30)
+        except Exception as e:
+            self._reply(500, {'error': str(e)})
+            return
+        self._reply(200, {'detections': detections,
+                          'latency_ms': round((time.perf_counter() - start) * 1000, 2)})
+
+    def log_message(self, format, *args):
+        pass   # 每個請求都印 log 會拖慢高併發
+
+
+def serve(model_path, host="0.0.0.0", port=8000, max_batch=8, max_latency_ms=10.0, **detector_kwargs):
+    detector = OnnxDetector(model_path, max_batch=max_batch, **detector_kwargs)
+    batcher = MicroBatcher(detector, max_batch=detector.max_batch, max_latency_ms=max_latency_ms)
+    DetectHandler.batcher = batcher
+    server = ThreadingHTTPServer((host, port), DetectHandler)
+
+    if not detector.dynamic_batch:
+        print("⚠️ 模型為固定 batch=1，請以 model.export(format='onnx', dynamic=True) 匯出才能批次推論")
+    print(f"🚀 推論服務啟動：http://{host}:{port}/detect (max_batch={detector.max_batch}, 等待上限 {max_latency_ms} ms)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        batcher.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="YOLO11 ONNX 批次推論服務")
+    parser.add_argument('model')
+    parser.add_argument('--host', default="0.0.0.0")
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--max-batch', type=int, default=8)
+    parser.add_argument('--max-latency-ms', type=float, default=10.0)
+    parser.add_argument('--conf', type=float, default=0.5)
+    parser.add_argument('--iou', type=float, default=0.45)
+    parser.add_argument('--threads', type=int, default=None)
+    parser.add_argument('--labels', default=None, help="labels.txt (未指定時使用模型 metadata)")
+    parser.add_argument('--catalog', default=None, help="build_catalog.py 產生的 catalog.bin (回傳價格)")
+    args = parser.parse_args()
+    serve(args.model, args.host, args.port, args.max_batch, args.max_latency_ms,
+          conf=args.conf, iou=args.iou, threads=args.threads, labels_path=args.labels,
+          catalog_path=args.catalog)
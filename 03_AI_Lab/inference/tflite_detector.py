@@ -0,0 +1,62 @@
+import threading
+
+import numpy as np
+
+from inference.detector import OnnxDetector
+from inference.postprocess import decode_predictions
+from inference.preprocess import BatchBuffer
+
+
+def load_interpreter(model_path, threads=None):
+    """依序嘗試 ai-edge-litert、tflite-runtime、tensorflow 的 TFLite Interpreter"""
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+    except ImportError:
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+    return Interpreter(model_path=model_path, num_threads=threads)
+
+
+class TFLiteDetector(OnnxDetector):
+    """
+    以 TFLite Interpreter 執行 YOLO11 偵測 (App 端實際使用的格式)，介面與 OnnxDetector 相同
+    - onnx2tf 轉出的模型輸入為 NHWC，座標輸出正規化到 0~1
+    - INT8 (全整數) 模型的輸入 / 輸出依 quantization 參數量化與還原
+    """
+
+    def __init__(self, model_path, conf=0.5, iou=0.45, threads=None, names=None, mode="letterbox"):
+        self.interpreter = load_interpreter(model_path, threads)
+        self.interpreter.allocate_tensors()
+        self.input = self.interpreter.get_input_details()[0]
+        self.output = self.interpreter.get_output_details()[0]
+
+        shape = self.input['shape']
+        nhwc = shape[-1] == 3
+        self.imgsz = int(shape[1] if nhwc else shape[2])
+        self.dynamic_batch = False
+        self.max_batch = 1
+        self.names = names
+        self.conf, self.iou, self.mode = conf, iou, mode
+        self._buffer = BatchBuffer(1, self.imgsz, layout="nhwc" if nhwc else "nchw")
+        self._lock = threading.Lock()
+
+    def _run(self, images):
+        with self._lock:
+            tensor, metas = self._buffer.fill(images, self.mode)
+            if self.input['dtype'] in (np.int8, np.uint8, np.int16):
+                scale, zero_point = self.input['quantization']
+                tensor = (tensor / scale + zero_point).astype(self.input['dtype'])
+            self.interpreter.set_tensor(self.input['index'], tensor)
+            self.interpreter.invoke()
+            output = self.interpreter.get_tensor(self.output['index'])
+
+        if self.output['dtype'] in (np.int8, np.uint8, np.int16):
+            scale, zero_point = self.output['quantization']
+            output = (output.astype(np.float32) - zero_point) * scale
+        else:
+            output = output.astype(np.float32)
+        output[:, :4] *= self.imgsz             # 正規化 xywh -> 像素
+        return decode_predictions(output, metas, [img.shape[:2] for img in images], self.conf, self.iou)
@@ -0,0 +1,111 @@
+import os
+
+import torch
+from torch.utils.data import WeightedRandomSampler
+from ultralytics.data.build import InfiniteDataLoader, seed_worker
+from ultralytics.data.dataset import YOLODataset
+from ultralytics.models.yolo.detect import DetectionTrainer
+
+from augment_engine import AUG_SUFFIXES
+from image_cache import MemmapCacheMixin
+from sample_weights import load_sample_weights, weights_for
+from virtual_augment import VirtualAugMixin
+
+# ==========================================
+# 實驗室專用訓練器 (擴充 Ultralytics DetectionTrainer)
+# ==========================================
+# 透過 model.train(trainer=make_trainer(...)) 使用。
+# Ultralytics 會拒絕不認識的訓練參數，所以設定都放在訓練器的類別屬性上。
+# 資料集類別必須定義在模組層級，Windows 的 DataLoader worker (spawn) 才能 pickle。
+# sample_weights 指向 sample_weights.py 格式的抽樣清單時，訓練集改用加權抽樣 (增量微調 / 難例挖掘)。
+
+
+class VirtualAugDataset(VirtualAugMixin, YOLODataset):
+    pass
+
+
+class CachedDataset(MemmapCacheMixin, YOLODataset):
+    pass
+
+
+class VirtualAugCachedDataset(VirtualAugMixin, MemmapCacheMixin, YOLODataset):
+    pass
+
+
+# (虛擬擴充, 影像快取) -> 資料集類別
+DATASET_CLASSES = {
+    (True, False): VirtualAugDataset,
+    (False, True): CachedDataset,
+    (True, True): VirtualAugCachedDataset,
+}
+
+
+class LabTrainer(DetectionTrainer):
+    virtual_augment = False
+    virtual_suffixes = AUG_SUFFIXES
+    image_cache_dir = None
+    sample_weights = None
+
+    def build_dataset(self, img_path, mode="train", batch=None):
+        dataset = super().build_dataset(img_path, mode, batch)
+        virtual = mode == "train" and self.virtual_augment
+        cached = self.image_cache_dir is not None
+        if not (virtual or cached):
+            return dataset
+        if type(dataset) is not YOLODataset:
+            print(f"⚠️ 虛擬擴充 / 影像快取只支援 YOLODataset，目前為 {type(dataset).__name__}，改用一般模式")
+            return dataset
+
+        dataset.__class__ = DATASET_CLASSES[(virtual, cached)]
+        if virtual:
+            dataset.virtual_suffixes = tuple(self.virtual_suffixes)
+        if cached:
+            dataset.image_cache_dir = self.image_cache_dir
+        return dataset
+
+    def get_dataloader(self, dataset_path, batch_size=16, rank=0, mode="train"):
+        if mode != "train" or not self.sample_weights:
+            return super().get_dataloader(dataset_path, batch_size, rank, mode)
+        if rank != -1:
+            print("⚠️ 加權抽樣不支援多 GPU (DDP)，改用一般隨機打亂")
+            return super().get_dataloader(dataset_path, batch_size, rank, mode)
+
+        dataset = self.build_dataset(dataset_path, mode, batch_size)
+        spec = load_sample_weights(self.sample_weights)
+        weights, matched = weights_for(dataset.im_files, spec)
+        # 虛擬擴充：資料集長度是原圖數的整數倍 (每種變體一份索引)，權重照樣展開，變體仍會被抽到
+        weights = weights * max(1, len(dataset) // max(len(weights), 1))
+        num_samples = spec.get('epoch_samples') or len(dataset)
+        print(f"⚖️ 加權抽樣 ({spec.get('source') or os.path.basename(self.sample_weights)})："
+              f"清單對到 {matched}/{len(dataset.im_files)} 張，每個 epoch 抽 {num_samples} 張")
+
+        # 與 Ultralytics build_dataloader 相同的設定，只把 shuffle 換成 sampler
+        # 每個 epoch 重新抽樣 (InfiniteDataLoader 每輪都會重新迭代 sampler)
+        batch = min(batch_size, num_samples)
+        batches = -(-num_samples // batch)
+        workers = min(os.cpu_count() or 1, self.args.workers, batches if batches > 1 else 0)
+        generator = torch.Generator()
+        generator.manual_seed(self.args.seed)
+        sampler = WeightedRandomSampler(weights, num_samples, replacement=True, generator=generator)
+        return InfiniteDataLoader(
+            dataset=dataset,
+            batch_size=batch,
+            shuffle=False,
+            num_workers=workers,
+            sampler=sampler,
+            prefetch_factor=4 if workers > 0 else None,
+            pin_memory=self.device.type == "cuda",
+            collate_fn=getattr(dataset, "collate_fn", None),
+            worker_init_fn=seed_worker,
+            generator=generator,
+        )
+
+
+def make_trainer(virtual_augment=False, virtual_suffixes=AUG_SUFFIXES, image_cache_dir=None, sample_weights=None):
+    """產生帶有指定設定的訓練器類別，交給 model.train(trainer=...)"""
+    return type("LabTrainer", (LabTrainer,), {
+        'virtual_augment': virtual_augment,
+        'virtual_suffixes': tuple(virtual_suffixes),
+        'image_cache_dir': image_cache_dir,
+        'sample_weights': sample_weights,
+    })
@@ -1,71 +1,32 @@
 import os
-import cv2
-import numpy as np
-import shutil
-import yaml
 from ultralytics import YOLO
-from pathlib import Path
+
+from augment_engine import run_augmentation
+from dataset_check import print_summary, validate_dataset
+from dataset_fingerprint import attach_fingerprint, fingerprint_dataset
+from hard_mining import mine
+from hw_profile import prepare_launch
+from image_cache import build_cache
+from lab_trainer import make_trainer
+from train_profiler import attach_profiler
+from virtual_augment import warn_offline_variants
 
 # ==========================================
 # 第一部分：增強版資料擴充 (含翻轉、光影)
 # ==========================================
 
-def augment_dataset(data_root):
+def augment_dataset(data_root, workers=None):
     train_img_dir = os.path.join(data_root, "train", "images")
-    train_lab_dir = os.path.join(data_root, "train", "labels")
     
     if not os.path.exists(train_img_dir):
         print(f"⚠️ 找不到目錄：{train_img_dir}")
         return
 
     print("🔄 啟動資料擴充：處理水平翻轉與光影變幻...")
-    
+
+    # 每張原圖只解碼一次，變體 (_flip / _bright / _dark) 由多個行程平行產生
     # 僅處理原始檔案，不處理已經帶有後綴的擴充檔
-    img_list = [f for f in os.listdir(train_img_dir) if f.lower().endswith(('.jpg', '.jpeg', '.png')) 
-                and not any(x in f for x in ['_flip', '_bright', '_dark'])]
-    
-    for img_name in img_list:
-        base_name = os.path.splitext(img_name)[0]
-        img_path = os.path.join(train_img_dir, img_name)
-        lab_path = os.path.join(train_lab_dir, base_name + ".txt")
-        
-        img = cv2.imread(img_path)
-        if img is None: continue
-
-        # 準備要產生的變體清單：(後綴, 影像處理函式)
-        variants = [
-            ("_flip", lambda x: cv2.flip(x, 1)),
-            ("_bright", lambda x: cv2.convertScaleAbs(x, alpha=1.2, beta=30)),
-            ("_dark", lambda x: cv2.convertScaleAbs(x, alpha=0.8, beta=-30))
-        ]
-
-        for suffix, func in variants:
-            aug_name = f"{base_name}{suffix}.jpg"
-            aug_img_path = os.path.join(train_img_dir, aug_name)
-            aug_lab_path = os.path.join(train_lab_dir, f"{base_name}{suffix}.txt")
-
-            if not os.path.exists(aug_img_path):
-                # 處理並儲存圖片
-                new_img = func(img)
-                cv2.imwrite(aug_img_path, new_img)
-                
-                # 處理標籤
-                if os.path.exists(lab_path):
-                    with open(lab_path, 'r') as f:
-                        lines = f.readlines()
-                    
-                    new_labels = []
-                    for line in lines:
-                        parts = line.split()
-                        if len(parts) == 5:
-                            cls, x, y, w, h = map(float, parts)
-                            # 如果是翻轉，需要重新計算 x 座標
-                            if suffix == "_flip":
-                                x = 1.0 - x
-                            new_labels.append(f"{int(cls)} {x:.6f} {y:.6f} {w:.6f} {h:.6f}")
-                    
-                    with open(aug_lab_path, 'w') as f:
-                        f.write("\n".join(new_labels))
+    run_augmentation(data_root, workers=workers)
 
     print(f"✅ 資料擴充已完成！目前訓練集規模：{len(os.listdir(train_img_dir))} 張圖片")
 
@@ -73,34 +34,60 @@ def augment_dataset(data_root):
 # 第二部分：訓練流程與一致性檢查
 # ==========================================
 
-def train_grocery_model():
+def train_grocery_model(virtual_augment=False, image_cache=False, hard_mining=False):
+    """
+    virtual_augment=True 時不產生 _flip/_bright/_dark 檔案，改在讀取資料時於記憶體中套用
+    (每個 epoch 的樣本數與線下模式相同，epochs / patience 不必調整)
+    image_cache=True 時先把 train/val 解碼成 memmap 快取，訓練期間不再重複解碼 JPEG
+    hard_mining=True 時先用上一次的 best.pt 挖掘難例，訓練時多抽容易認錯的圖片 (見 hard_mining.py)
+    """
     DATA_ROOT = r"D:\product_recognition\03_AI_Lab\yolo11_data\drink"
     DATA_YAML = os.path.join(DATA_ROOT, "data.yaml")
     MODEL_WEIGHTS = "yolo11m.pt" 
-
-    # 0. 檢查 YAML 內容 (確保 Index 23 的 Small_Water 有補進去)
-    with open(DATA_YAML, 'r') as f:
-        config = yaml.safe_load(f)
-    if len(config['names']) != config['nc']:
-        print(f"❌ 警告：nc={config['nc']} 但 names 只有 {len(config['names'])} 個！請修正 data.yaml")
+    # 難例挖掘用的「目前最好的權重」(上一次本腳本的訓練結果)
+    MINING_WEIGHTS = r"D:\product_recognition\03_AI_Lab\runs\train\grocery_v4_stable_final\weights\best.pt"
+
+    # 0. 資料集完整性檢查 (names/nc 一致、類別越界、座標、孤兒檔、重複圖片)
+    #    確保 Index 23 的 Small_Water 有補進去；完整報告寫在 data.yaml 旁
+    print("🔍 執行資料集檢查...")
+    report = validate_dataset(DATA_YAML, report_path=os.path.join(DATA_ROOT, "dataset_report.json"))
+    print_summary(report)
+    if not report['ok']:
+        print("❌ 資料集有錯誤，請先修正後再訓練 (詳見 dataset_report.json)")
         return
 
-    # 1. 執行手動擴充
-    augment_dataset(DATA_ROOT)
+    # 1. 執行手動擴充 (虛擬模式下變體只在 DataLoader 中產生，不寫入硬碟)
+    if virtual_augment:
+        warn_offline_variants(DATA_ROOT)
+    else:
+        augment_dataset(DATA_ROOT)
+
+    # 2. 更新影像快取 (只解碼新增或被修改的圖片)
+    cache_dir = build_cache(DATA_YAML, imgsz=640) if image_cache else None
+
+    # 2.5 難例挖掘：產生加權抽樣清單 (找不到舊權重時照常均勻抽樣)
+    sample_weights = mine(DATA_YAML, MINING_WEIGHTS) if hard_mining else None
 
-    # 2. 初始化 YOLO 模型
+    # 3. 初始化 YOLO 模型
     print(f"🚀 載入模型：{MODEL_WEIGHTS}...")
     model = YOLO(MODEL_WEIGHTS)
 
-    # 3. 開始訓練 (針對小樣本與混淆類別優化)
+    # 依硬體決定 device / batch / workers (GPU 維持 batch=8、workers=4；CPU 自動估算)
+    launch_args = prepare_launch(model, MODEL_WEIGHTS, imgsz=640, gpu_batch=8, gpu_workers=4)
+
+    # 記錄每個 batch 等資料 / 計算的時間與資料管線各步驟耗時 (runs/train/<name>/train_profile.jsonl)
+    attach_profiler(model)
+    # 權重旁存資料集指紋，resume_train.py 的增量微調靠它找出新圖片
+    attach_fingerprint(model, fingerprint_dataset(DATA_YAML))
+
+    # 4. 開始訓練 (針對小樣本與混淆類別優化)
     print("🏋️ 開始針對性強化訓練...")
     results = model.train(
         data=DATA_YAML,
         epochs=300,
         imgsz=640,
-        batch=8,
         patience=50,
-        workers=4,
+        **launch_args,
         
         # --- 權重與平滑 (防誤判) ---
         cls=2.0,           # 提高類別權重，讓模型更在意「認錯人」
@@ -115,12 +102,13 @@ def train_grocery_model():
         copy_paste=0.4,    # 最強招：隨機將商品貼到不同背景
         
         optimizer='SGD',   # 樣本少時 SGD 較穩定
-        device=0,
         project='03_AI_Lab/runs/train',
         name='grocery_v4_stable_final',
+        trainer=make_trainer(virtual_augment=virtual_augment, image_cache_dir=cache_dir,
+                             sample_weights=sample_weights),
     )
 
-    # 4. 驗證與匯出
+    # 5. 驗證與匯出
     model.val()
     print("📦 導出手機端專用 ONNX (FP16)...")
     model.export(format='onnx', opset=13, half=True, simplify=True)
@@ -0,0 +1,96 @@
+import json
+import os
+
+import numpy as np
+
+from aug_manifest import file_sha1
+
+# ==========================================
+# 預測結果快取 (依權重 + 圖片內容)
+# ==========================================
+# 同一份權重對同一張圖的預測不會變，存在權重旁的 <權重檔名>_<split>_predictions.json：
+# {"version": 1, "weights_sha1": ..., "settings": {imgsz, conf, iou, max_det},
+#  "images": {"val/images/a.jpg": {"sha1": 圖片雜湊, "shape": [h, w], "boxes": [[cls, conf, x0, y0, x1, y1], ...]}}}
+# 圖片雜湊來自 dataset_fingerprint，內容沒變的圖片直接沿用，只對新增 / 修改的圖片跑模型。
+# 權重檔被覆蓋 (雜湊不同) 或推論設定不同時整份作廢。
+
+CACHE_VERSION = 1
+PRED_CONF = 0.01     # 算 mAP 需要低信心的框；比 Ultralytics val 的 0.001 高一點，快取小很多
+PRED_IOU = 0.6
+MAX_DET = 100
+
+
+def cache_path(weights, split):
+    stem = os.path.splitext(os.path.basename(weights))[0]
+    return os.path.join(os.path.dirname(os.path.abspath(weights)), f"{stem}_{split}_predictions.json")
+
+
+def _load(path, weights_sha1, settings):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if (data.get('version') != CACHE_VERSION or data.get('weights_sha1') != weights_sha1
+            or data.get('settings') != settings):
+        return {}
+    return data.get('images', {})
+
+
+def _save(path, weights_sha1, settings, images):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'version': CACHE_VERSION, 'weights_sha1': weights_sha1, 'settings': settings, 'images': images},
+                  f, separators=(',', ':'))
+    os.replace(tmp_path, path)
+
+
+def predict_images(weights, paths, batch=16, imgsz=640, conf=PRED_CONF, iou=PRED_IOU, max_det=MAX_DET,
+                   device=None, model=None):
+    """以 Ultralytics 批次推論，逐張產生 (路徑, (h, w), (N, 6) 陣列)"""
+    if model is None:
+        from ultralytics import YOLO
+        model = YOLO(weights)
+    for i in range(0, len(paths), batch):
+        chunk = paths[i:i + batch]
+        results = model.predict(chunk, imgsz=imgsz, conf=conf, iou=iou, max_det=max_det,
+                                device=device, verbose=False)
+        for path, r in zip(chunk, results):
+            b = r.boxes
+            boxes = np.column_stack([b.cls.cpu().numpy(), b.conf.cpu().numpy(), b.xyxy.cpu().numpy()]) \
+                if len(b) else np.zeros((0, 6))
+            yield path, tuple(r.orig_shape), boxes
+
+
+def cached_predictions(weights, entries, split, batch=16, imgsz=640, device=None):
+    """
+    entries：{相對路徑: (絕對路徑, 圖片 sha1)}
+    回傳 ({相對路徑: {'shape': (h, w), 'boxes': (N, 6) 陣列}}, 沿用快取的張數)
+    """
+    settings = {'imgsz': imgsz, 'conf': PRED_CONF, 'iou': PRED_IOU, 'max_det': MAX_DET}
+    weights_sha1 = file_sha1(weights)
+    path = cache_path(weights, split)
+    cached = _load(path, weights_sha1, settings)
+
+    images, todo = {}, []
+    for rel, (abs_path, sha1) in entries.items():
+        hit = cached.get(rel)
+        if hit is not None and hit['sha1'] == sha1:
+            images[rel] = hit
+        else:
+            todo.append(rel)
+    reused = len(images)
+
+    if todo:
+        print(f"🔮 {os.path.basename(weights)} 推論 {len(todo)} 張 {split} 圖片 (沿用快取 {reused} 張)...")
+        abs_paths = [entries[rel][0] for rel in todo]
+        by_path = dict(zip(abs_paths, todo))
+        for abs_path, shape, boxes in predict_images(weights, abs_paths, batch=batch, imgsz=imgsz, device=device):
+            rel = by_path[abs_path]
+            images[rel] = {'sha1': entries[rel][1], 'shape': list(shape),
+                           'boxes': np.round(boxes, 4).tolist()}
+        # 只保留目前資料集還有的圖片
+        _save(path, weights_sha1, settings, images)
+
+    return {rel: {'shape': tuple(r['shape']), 'boxes': np.asarray(r['boxes'], dtype=np.float64).reshape(-1, 6)}
+            for rel, r in images.items()}, reused
@@ -1,62 +1,41 @@
 import os
-import cv2
 from ultralytics import YOLO
 
-def augment_dataset_by_flipping(data_root):
+from augment_engine import run_augmentation
+from dataset_fingerprint import attach_fingerprint, fingerprint_dataset, load_fingerprint
+from hw_profile import prepare_launch
+from image_cache import build_cache
+from incremental_finetune import FULL_SCHEDULE, compare_with_base, full_plan, plan_incremental
+from lab_trainer import make_trainer
+from train_profiler import attach_profiler
+from virtual_augment import warn_offline_variants
+
+def augment_dataset_by_flipping(data_root, workers=None):
     """
     掃描訓練集，自動生成水平翻轉的圖片與標籤 (YOLO 格式)
+    已處理過的原圖記錄在 augment_manifest.json，重跑時只處理新增或被修改的圖片/標籤
     """
     train_img_dir = os.path.join(data_root, "train", "images")
-    train_lab_dir = os.path.join(data_root, "train", "labels")
     
     if not os.path.exists(train_img_dir):
         print(f"⚠️ 找不到訓練資料夾，跳過翻轉步驟：{train_img_dir}")
         return
 
     print("🔄 正在啟動資料翻轉擴充 (Offline Augmentation)...")
-    img_list = [f for f in os.listdir(train_img_dir) if f.lower().endswith(('.jpg', '.jpeg', '.png'))]
-    
-    count = 0
-    for img_name in img_list:
-        # 避免重複翻轉已經翻轉過的檔案
-        if "_flip" in img_name:
-            continue
-            
-        base_name = os.path.splitext(img_name)[0]
-        img_path = os.path.join(train_img_dir, img_name)
-        lab_path = os.path.join(train_lab_dir, base_name + ".txt")
-        
-        # 1. 翻轉圖片並儲存
-        output_img_path = os.path.join(train_img_dir, f"{base_name}_flip.jpg")
-        if not os.path.exists(output_img_path):
-            img = cv2.imread(img_path)
-            if img is None: continue
-            flipped_img = cv2.flip(img, 1) # 1 代表水平翻轉
-            cv2.imwrite(output_img_path, flipped_img)
-
-        # 2. 翻轉標籤並儲存
-        if os.path.exists(lab_path):
-            output_lab_path = os.path.join(train_lab_dir, f"{base_name}_flip.txt")
-            if not os.path.exists(output_lab_path):
-                with open(lab_path, 'r') as f:
-                    lines = f.readlines()
-                
-                new_labels = []
-                for line in lines:
-                    parts = line.split()
-                    if len(parts) == 5:
-                        cls, x, y, w, h = map(float, parts)
-                        # 水平翻轉核心邏輯：新的 x 座標 = 1.0 - 原本的 x 座標
-                        new_x = 1.0 - x
-                        new_labels.append(f"{int(cls)} {new_x:.6f} {y:.6f} {w:.6f} {h:.6f}")
-                
-                with open(output_lab_path, 'w') as f:
-                    f.write("\n".join(new_labels))
-                count += 1
+    # 避免重複翻轉已經翻轉過的檔案 (只排除 _flip，與舊版行為一致)
+    stats = run_augmentation(data_root, workers=workers, suffixes=("_flip",), exclude=("_flip",),
+                             augmenter="augment_dataset_by_flipping")
+    count = stats['variants_written'] if stats else 0
                     
     print(f"✅ 資料翻轉擴充完成！共新增了 {count} 組圖片與標籤。")
 
-def finetune_grocery_model():
+def finetune_grocery_model(virtual_augment=False, image_cache=False, incremental=False):
+    """
+    virtual_augment=True 時不寫出 _flip 檔案，改在讀取資料時於記憶體中水平翻轉 (每個 epoch 同樣是原圖 + 翻轉各一次)
+    image_cache=True 時沿用 (或增量更新) memmap 影像快取，與 main.py 連續執行時不必重新解碼
+    incremental=True 時只針對基礎權重之後新增 / 修改的圖片做短排程微調 (見 incremental_finetune.py)；
+    類別數與基礎權重不同 (新增 SKU) 時自動改回完整排程
+    """
     # --- 1. 路徑設定 ---
     # 資料集根目錄 (包含 train/val 資料夾的地方)
     DATA_ROOT = r"D:\product_recognition\03_AI_Lab\yolo11_data"
@@ -70,34 +49,70 @@ def finetune_grocery_model():
     
     # --- 2. 執行線下擴充 ---
     # 這步會改動硬碟空間，只需執行一次（腳本內已包含過濾邏輯）
-    augment_dataset_by_flipping(DATA_ROOT)
+    # 虛擬模式則完全不寫檔，翻轉在 DataLoader 中完成
+    if virtual_augment:
+        warn_offline_variants(DATA_ROOT)
+    else:
+        augment_dataset_by_flipping(DATA_ROOT)
 
     # --- 3. 載入模型與微調訓練 ---
     if not os.path.exists(PREVIOUS_BEST_MODEL):
         print(f"❌ 錯誤：找不到基礎權重檔案 {PREVIOUS_BEST_MODEL}")
         return
 
+    # 增量模式：比對基礎權重旁的資料集指紋，新圖片加權抽樣 (擴充已經跑完，新圖片的 _flip 也算新資料)
+    if incremental:
+        plan = plan_incremental(DATA_YAML_PATH, PREVIOUS_BEST_MODEL,
+                                os.path.join(DATA_ROOT, "incremental_sampling.json"))
+        if plan is None:
+            return
+        incremental = not plan['full']
+        fingerprint = plan['fingerprint']
+        schedule = plan['train_args']
+        sample_weights = plan['sampling_path']
+    else:
+        fingerprint = fingerprint_dataset(DATA_YAML_PATH, previous=load_fingerprint(PREVIOUS_BEST_MODEL))
+        schedule = dict(FULL_SCHEDULE)   # 10代沒進步自動停止
+        sample_weights = None
+
+    cache_dir = build_cache(DATA_YAML_PATH, imgsz=640) if image_cache else None
+
     print(f"🔄 載入 {PREVIOUS_BEST_MODEL} 進行微調...")
     model = YOLO(PREVIOUS_BEST_MODEL)
+    # 舊權重沒有指紋時 plan_incremental 看不出類別變化，這裡再以權重本身的類別數確認一次
+    if incremental and len(model.names) != len(fingerprint['names']):
+        print(f"⚠️ 基礎權重有 {len(model.names)} 個類別，資料集有 {len(fingerprint['names'])} 個")
+        plan = full_plan(fingerprint, plan['train_diff'], plan['val_diff'], plan['new_classes'])
+        incremental, schedule, sample_weights = False, plan['train_args'], None
+
+    # 依硬體決定 device / batch / workers (GPU 維持 batch=16、workers=2；CPU 自動估算)
+    launch_args = prepare_launch(model, PREVIOUS_BEST_MODEL, imgsz=640, gpu_batch=16, gpu_workers=2)
+    attach_profiler(model)   # 效能紀錄：python train_profiler.py 可與 main.py 的訓練比較
+    attach_fingerprint(model, fingerprint)   # 權重旁存資料集指紋，下次增量微調以它為基準
 
     model.train(
         data=DATA_YAML_PATH,
-        epochs=250,
         imgsz=640,
-        batch=16,
+        **launch_args,
+        **schedule,
         project='03_AI_Lab/runs/train',
-        name=PROJECT_NAME,
-        exist_ok=True,
-        device=0,
+        name=PROJECT_NAME + ('_incremental' if incremental else ''),
+        exist_ok=not incremental,   # 每次增量微調各自一個資料夾，之後可以接著當基礎權重
         lr0=0.001,      # 微調使用較小學習率
-        patience=10,    # 10代沒進步自動停止
-        workers=2,
-        augment=True    # 開啟 YOLO 內建的線上增強
+        augment=True,   # 開啟 YOLO 內建的線上增強
+        trainer=make_trainer(virtual_augment=virtual_augment, virtual_suffixes=("_flip",),
+                             image_cache_dir=cache_dir, sample_weights=sample_weights),
     )
 
     # --- 4. 驗證與導出 ---
-    print("📊 執行最後驗證...")
-    model.val()
+    if incremental:
+        # 基礎權重對未變動驗證圖的預測沿用快取，只推論新權重與新圖片
+        print("📊 與基礎權重比較...")
+        compare_with_base(PREVIOUS_BEST_MODEL, str(model.trainer.best), DATA_YAML_PATH, plan,
+                          report_dir=str(model.trainer.save_dir))
+    else:
+        print("📊 執行最後驗證...")
+        model.val()
 
     print("📦 正在導出手機端專用 ONNX...")
     onnx_path = model.export(format='onnx', opset=13)
@@ -0,0 +1,56 @@
+import json
+import os
+
+from image_cache import norm_path
+
+# ==========================================
+# 加權抽樣清單 (給 LabTrainer 使用)
+# ==========================================
+# 訓練器以 WeightedRandomSampler (可重複抽樣) 取代一般的隨機打亂：
+# {
+#   "version": 1, "source": "incremental" / "hard_mining",
+#   "default": 1.0,                       # 清單沒有列到的圖片
+#   "epoch_samples": 640,                 # 每個 epoch 抽幾張 (null = 與資料集相同)
+#   "weights": {"D:/.../train/images/a.jpg": 8.0, ...}
+# }
+# 權重是相對值，只有比例有意義。路徑一律以 norm_path 比對 (與影像快取相同)。
+
+WEIGHTS_VERSION = 1
+
+
+def save_sample_weights(path, weights, epoch_samples=None, default=1.0, source=None):
+    """weights：{圖片路徑: 權重}"""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    data = {
+        'version': WEIGHTS_VERSION,
+        'source': source,
+        'default': default,
+        'epoch_samples': epoch_samples,
+        'weights': {norm_path(p): round(float(w), 6) for p, w in weights.items()},
+    }
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=1)
+    return path
+
+
+def load_sample_weights(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    if data.get('version') != WEIGHTS_VERSION:
+        raise ValueError(f"不支援的抽樣清單版本：{path}")
+    return data
+
+
+def weights_for(im_files, spec):
+    """依資料集的圖片順序展開成權重清單，並回傳有被清單列到的張數"""
+    table = spec['weights']
+    default = spec.get('default', 1.0)
+    weights, matched = [], 0
+    for path in im_files:
+        w = table.get(norm_path(path))
+        if w is None:
+            w = default
+        else:
+            matched += 1
+        weights.append(w)
+    return weights, matched
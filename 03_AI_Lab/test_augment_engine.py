@@ -0,0 +1,37 @@
+import os
+
+import cv2
+import numpy as np
+
+from aug_manifest import AugmentManifest
+from augment_engine import AUG_SUFFIXES, run_augmentation
+
+# 離線回歸測試 (pytest)：python -m pytest test_augment_engine.py
+
+
+def _dataset(tmp_path, names):
+    root = str(tmp_path)
+    img_dir, lab_dir = os.path.join(root, "train", "images"), os.path.join(root, "train", "labels")
+    os.makedirs(img_dir)
+    os.makedirs(lab_dir)
+    rng = np.random.default_rng(0)
+    for name in names:
+        cv2.imwrite(os.path.join(img_dir, name + ".jpg"), rng.integers(0, 255, (32, 48, 3), dtype=np.uint8))
+        with open(os.path.join(lab_dir, name + ".txt"), 'w') as f:
+            f.write("0 0.25 0.5 0.2 0.2\n")
+    return root, img_dir, lab_dir
+
+
+def test_deleted_source_prunes_record_and_variants(tmp_path):
+    root, img_dir, lab_dir = _dataset(tmp_path, ["a", "b"])
+    run_augmentation(root, workers=1)
+    assert len(os.listdir(img_dir)) == 2 * (len(AUG_SUFFIXES) + 1)
+
+    os.remove(os.path.join(img_dir, "a.jpg"))
+    os.remove(os.path.join(lab_dir, "a.txt"))
+    stats = run_augmentation(root, workers=1)
+
+    assert stats['pruned'] == 1
+    assert sorted(os.listdir(img_dir)) == sorted(["b.jpg"] + [f"b{s}.jpg" for s in AUG_SUFFIXES])
+    assert sorted(os.listdir(lab_dir)) == sorted(["b.txt"] + [f"b{s}.txt" for s in AUG_SUFFIXES])
+    assert list(AugmentManifest(root).sources) == ["train/images/b.jpg"]
@@ -0,0 +1,16 @@
+import numpy as np
+
+from det_metrics import confusion_matrix
+
+# 離線回歸測試 (pytest)：python -m pytest test_det_metrics.py
+
+
+def test_confusion_matrix_skips_labels_outside_class_range(capsys):
+    gt = {'a.jpg': np.array([[0, 0, 0, 10, 10], [5, 20, 20, 30, 30], [-1, 40, 40, 50, 50],
+                             [np.nan, 60, 60, 70, 70]], dtype=float)}
+    pred = {'a.jpg': np.array([[0, 0.9, 0, 0, 10, 10], [1, 0.9, 20, 20, 30, 30]], dtype=float)}
+    matrix = confusion_matrix(pred, gt, nc=2)
+    assert matrix.tolist() == [[1, 0, 0],
+                               [0, 0, 0],
+                               [0, 1, 0]]   # 類別 5 的標註被略過，配到它的預測算背景誤判
+    assert "略過 3 個" in capsys.readouterr().out
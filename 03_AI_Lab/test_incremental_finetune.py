@@ -0,0 +1,72 @@
+import json
+import os
+
+from dataset_fingerprint import fingerprint_dataset, save_fingerprint
+from incremental_finetune import FULL_SCHEDULE, INCREMENTAL_EPOCHS, NEW_SHARE, plan_incremental
+
+# 離線回歸測試 (pytest)：python -m pytest test_incremental_finetune.py
+# 資料集只有幾張假圖片 (指紋只看檔案內容，不需要真的能解碼)
+
+
+def _write_yaml(root, names):
+    with open(os.path.join(root, "data.yaml"), 'w', encoding='utf-8') as f:
+        f.write(f"path: {root}\ntrain: train/images\nval: val/images\nnames: {json.dumps(names)}\n")
+    return os.path.join(root, "data.yaml")
+
+
+def _add_image(root, split, name, cls=0):
+    for sub in ("images", "labels"):
+        os.makedirs(os.path.join(root, split, sub), exist_ok=True)
+    with open(os.path.join(root, split, "images", name + ".jpg"), 'wb') as f:
+        f.write(f"{split}/{name}".encode())
+    with open(os.path.join(root, split, "labels", name + ".txt"), 'w') as f:
+        f.write(f"{cls} 0.5 0.5 0.2 0.2\n")
+
+
+def _dataset(tmp_path, names=("cola", "tea"), train=6):
+    root = str(tmp_path / "data")
+    for i in range(train):
+        _add_image(root, "train", f"old{i}", i % len(names))
+    _add_image(root, "val", "v0")
+    data_yaml = _write_yaml(root, list(names))
+    # 基礎權重：旁邊存下訓練當時的指紋
+    weights_dir = tmp_path / "weights"
+    weights_dir.mkdir()
+    (weights_dir / "best.pt").write_bytes(b"weights")
+    save_fingerprint(str(weights_dir), fingerprint_dataset(data_yaml))
+    return root, data_yaml, str(weights_dir / "best.pt"), str(tmp_path / "sampling.json")
+
+
+def test_no_new_images_needs_no_finetune(tmp_path):
+    _, data_yaml, weights, sampling = _dataset(tmp_path)
+    assert plan_incremental(data_yaml, weights, sampling) is None
+    assert not os.path.exists(sampling)
+
+
+def test_new_images_are_oversampled_on_short_schedule(tmp_path):
+    root, data_yaml, weights, sampling = _dataset(tmp_path)
+    _add_image(root, "train", "new0")
+    _add_image(root, "train", "new1")
+    plan = plan_incremental(data_yaml, weights, sampling)
+
+    assert not plan['full']
+    assert plan['train_diff']['added'] == ["train/images/new0.jpg", "train/images/new1.jpg"]
+    assert len(plan['train_diff']['unchanged']) == 6
+    assert plan['train_args']['epochs'] == INCREMENTAL_EPOCHS
+    with open(sampling, 'r', encoding='utf-8') as f:
+        spec = json.load(f)
+    assert spec['epoch_samples'] == plan['epoch_samples'] == 8   # 全部只有 8 張
+    assert abs(sum(spec['weights'].values()) - NEW_SHARE) < 1e-9
+    assert abs(spec['default'] * 6 - (1 - NEW_SHARE)) < 1e-9
+
+
+def test_new_class_falls_back_to_full_schedule(tmp_path):
+    root, data_yaml, weights, sampling = _dataset(tmp_path)
+    _write_yaml(root, ["cola", "tea", "juice"])
+    _add_image(root, "train", "juice0", cls=2)
+    plan = plan_incremental(data_yaml, weights, sampling)
+
+    assert plan['full']
+    assert plan['new_classes'] == ["juice"]
+    assert plan['train_args'] == FULL_SCHEDULE
+    assert plan['sampling_path'] is None and not os.path.exists(sampling)
@@ -0,0 +1,436 @@
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+
+from bench_models import peak_rss_mb
+
+# ==========================================
+# 訓練效能分析 (掛在 Ultralytics 訓練器 callback 上)
+# ==========================================
+# 回答「時間花在哪裡」：JPEG 解碼、mosaic / copy_paste 等增強，還是 forward / backward。
+#   - 每個 batch：等資料的時間 (上一個 on_train_batch_end -> 這一個 on_train_batch_start，
+#     也就是 DataLoader next() 卡住的時間) 與計算時間 (batch_start -> batch_end)
+#   - 等待超過 STARVE_MS 的 batch 視為 DataLoader 佇列見底 (worker 供不應求)
+#   - 每個 epoch：圖片/秒、驗證 + 存檔時間、GPU 峰值記憶體、主行程與 worker 的 RSS
+#   - 訓練開始時在主行程抽樣跑一小段資料管線，逐步計時 (讀圖 / Mosaic / CopyPaste / ...)，
+#     因為真正的增強在 worker 子行程裡，callback 看不到
+# 紀錄寫在 runs/train/<name>/train_profile.jsonl，訓練結束時彙總成 train_profile_summary.json；
+# 直接執行本檔可比較多次訓練 (搭配 args.yaml 的 batch / workers / 增強參數)。
+
+LOG_NAME = "train_profile.jsonl"
+SUMMARY_NAME = "train_profile_summary.json"
+RUNS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "runs", "train")
+
+STARVE_MS = 2.0          # next() 超過這個時間才拿到 batch，代表預取佇列是空的
+PIPELINE_SAMPLES = 64    # 訓練開始時抽樣分析資料管線的張數 (0 = 不分析)
+LOAD_STEP = "load_image"
+# 比較報表中顯示的訓練參數
+TUNING_ARGS = ('batch', 'workers', 'imgsz', 'cache', 'device', 'mosaic', 'mixup', 'copy_paste',
+               'degrees', 'shear', 'perspective', 'close_mosaic', 'amp')
+
+
+# ------------------------------------------
+# 小工具
+# ------------------------------------------
+def _percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    k = (len(values) - 1) * q / 100
+    lo = int(k)
+    hi = min(lo + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+
+def _workers_rss_mb():
+    """DataLoader worker (子行程) 的記憶體合計；沒有 psutil 時回傳 None"""
+    try:
+        import psutil
+    except ImportError:
+        return None
+    total = 0
+    for child in psutil.Process().children(recursive=True):
+        try:
+            total += child.memory_info().rss
+        except psutil.Error:
+            pass
+    return total / 1024 ** 2
+
+
+def _cuda(trainer):
+    device = getattr(trainer, 'device', None)
+    if device is None or getattr(device, 'type', None) != 'cuda':
+        return None
+    import torch
+    return torch.cuda
+
+
+def _flatten(transforms):
+    """把巢狀的 Compose 攤平成 [步驟]，例如 [Mosaic, RandomPerspective, CopyPaste, MixUp, ...]"""
+    steps = []
+    for t in getattr(transforms, 'transforms', [transforms]):
+        if hasattr(t, 'transforms') and isinstance(t.transforms, list):
+            steps.extend(_flatten(t))
+        else:
+            steps.append(t)
+    return steps
+
+
+# ------------------------------------------
+# 資料管線抽樣分析 (在主行程執行)
+# ------------------------------------------
+def profile_pipeline(dataset, samples=PIPELINE_SAMPLES):
+    """
+    依序呼叫 get_image_and_label 與每個增強步驟並計時，回傳每張圖各步驟的平均毫秒數
+    Mosaic / CopyPaste / MixUp 會再讀其他圖片，那部分時間算在 load_image，不算在增強本身
+    """
+    n = len(dataset)
+    if not samples or not n or not hasattr(dataset, 'get_image_and_label'):
+        return None
+    steps = _flatten(getattr(dataset, 'transforms', None)) if getattr(dataset, 'transforms', None) else []
+
+    load_s = [0.0]
+    original = dataset.get_image_and_label
+
+    def timed_load(index):
+        t0 = time.perf_counter()
+        try:
+            return original(index)
+        finally:
+            load_s[0] += time.perf_counter() - t0
+
+    totals = {LOAD_STEP: 0.0}
+    count = min(samples, n)
+    # 實例屬性會蓋過類別方法 (含 VirtualAugMixin / MemmapCacheMixin 的版本)，結束後移除
+    dataset.get_image_and_label = timed_load
+    start = time.perf_counter()
+    try:
+        for k in range(count):
+            labels = dataset.get_image_and_label(k * n // count)
+            for step in steps:
+                name = type(step).__name__
+                before = load_s[0]
+                t0 = time.perf_counter()
+                labels = step(labels)
+                own = time.perf_counter() - t0 - (load_s[0] - before)
+                totals[name] = totals.get(name, 0.0) + own
+    finally:
+        del dataset.get_image_and_label
+    elapsed = time.perf_counter() - start
+    totals[LOAD_STEP] = load_s[0]
+
+    per_sample_ms = elapsed * 1000 / count
+    return {
+        'samples': count,
+        'per_sample_ms': round(per_sample_ms, 3),
+        'steps_ms': {name: round(s * 1000 / count, 3) for name, s in totals.items()},
+        'steps_share': {name: round(s / elapsed, 4) if elapsed else 0.0 for name, s in totals.items()},
+        'single_worker_imgs_per_s': round(1000 / per_sample_ms, 2) if per_sample_ms else None,
+    }
+
+
+# ------------------------------------------
+# Callback
+# ------------------------------------------
+class TrainProfiler:
+    def __init__(self, pipeline_samples=PIPELINE_SAMPLES, log_batches=True, starve_ms=STARVE_MS, sync_cuda=True):
+        """
+        log_batches：每個 batch 都寫一行紀錄 (關掉時只寫 epoch 彙總)
+        sync_cuda：batch 結束時等 GPU 算完，計算時間才不會被非同步執行低估
+        """
+        self.pipeline_samples = pipeline_samples
+        self.log_batches = log_batches
+        self.starve_ms = starve_ms
+        self.sync_cuda = sync_cuda
+        self.path = None
+        self._file = None
+
+    # --- 紀錄 ---
+    def _write(self, record):
+        if self._file is None:
+            return
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+
+    def _reset_epoch(self, trainer):
+        self.batches = []
+        self.images = 0
+        self.epoch_start = time.perf_counter()
+        self.batch_end = self.epoch_start
+        self.train_end = None
+        cuda = _cuda(trainer)
+        if cuda:
+            cuda.reset_peak_memory_stats(trainer.device)
+
+    # --- callback ---
+    def on_train_start(self, trainer):
+        os.makedirs(trainer.save_dir, exist_ok=True)
+        self.path = os.path.join(trainer.save_dir, LOG_NAME)
+        # 接續訓練 (resume / exist_ok) 時附加在後面
+        self._file = open(self.path, 'a', encoding='utf-8')
+        dataset = trainer.train_loader.dataset
+        # 加權抽樣時每個 epoch 的張數由 sampler 決定，不一定等於資料集大小
+        self.dataset_size = len(getattr(trainer.train_loader, 'sampler', None) or dataset)
+        self._write({'event': 'start', 'time': time.time(),
+                     'args': {k: v for k, v in vars(trainer.args).items() if k in TUNING_ARGS},
+                     'dataset': type(dataset).__name__, 'images': self.dataset_size,
+                     'batches_per_epoch': len(trainer.train_loader), 'starve_ms': self.starve_ms})
+
+        if self.pipeline_samples:
+            print(f"⏱️ 分析資料管線 (抽樣 {self.pipeline_samples} 張)...")
+            pipeline = profile_pipeline(dataset, self.pipeline_samples)
+            if pipeline:
+                self._write({'event': 'pipeline', **pipeline})
+                top = sorted(pipeline['steps_ms'].items(), key=lambda kv: -kv[1])[:4]
+                print(f"   每張 {pipeline['per_sample_ms']:.1f} ms："
+                      + "、".join(f"{name} {ms:.1f}" for name, ms in top))
+
+    def on_train_epoch_start(self, trainer):
+        self._reset_epoch(trainer)
+
+    def on_train_batch_start(self, trainer):
+        self.batch_start = time.perf_counter()
+
+    def on_train_batch_end(self, trainer):
+        cuda = _cuda(trainer)
+        if cuda and self.sync_cuda:
+            cuda.synchronize(trainer.device)
+        now = time.perf_counter()
+        wait = self.batch_start - self.batch_end
+        compute = now - self.batch_start
+        images = min(trainer.batch_size, max(self.dataset_size - self.images, 0)) or trainer.batch_size
+        self.images += images
+        self.batches.append((wait, compute))
+        self.batch_end = now
+        if self.log_batches:
+            self._write({'event': 'batch', 'epoch': trainer.epoch, 'batch': len(self.batches) - 1,
+                         'images': images, 'wait_ms': round(wait * 1000, 3), 'compute_ms': round(compute * 1000, 3),
+                         'starved': wait * 1000 > self.starve_ms})
+
+    def on_train_epoch_end(self, trainer):
+        self.train_end = time.perf_counter()
+
+    def on_fit_epoch_end(self, trainer):
+        if not self.batches:
+            return
+        now = time.perf_counter()
+        waits = [w for w, _ in self.batches]
+        computes = [c for _, c in self.batches]
+        wait_s, compute_s = sum(waits), sum(computes)
+        train_s = (self.train_end or now) - self.epoch_start
+        starved = sum(1 for w in waits if w * 1000 > self.starve_ms)
+
+        cuda = _cuda(trainer)
+        gpu_peak = cuda.max_memory_reserved(trainer.device) / 1024 ** 3 if cuda else None
+        workers_rss = _workers_rss_mb()
+        rss = peak_rss_mb()
+        self._write({
+            'event': 'epoch',
+            'epoch': trainer.epoch,
+            'batches': len(self.batches),
+            'images': self.images,
+            'mosaic': bool(getattr(trainer.train_loader.dataset, 'mosaic', False)),
+            'train_s': round(train_s, 3),
+            'data_wait_s': round(wait_s, 3),
+            'compute_s': round(compute_s, 3),
+            'data_wait_share': round(wait_s / (wait_s + compute_s), 4) if wait_s + compute_s else 0.0,
+            'first_batch_wait_s': round(waits[0], 3),
+            'wait_p50_ms': round(_percentile(waits, 50) * 1000, 3),
+            'wait_p95_ms': round(_percentile(waits, 95) * 1000, 3),
+            'compute_p50_ms': round(_percentile(computes, 50) * 1000, 3),
+            'starved_batches': starved,
+            'starved_ratio': round(starved / len(self.batches), 4),
+            'imgs_per_s': round(self.images / train_s, 2) if train_s else None,
+            'compute_imgs_per_s': round(self.images / compute_s, 2) if compute_s else None,
+            'val_save_s': round(now - self.train_end, 3) if self.train_end else None,
+            'epoch_s': round(trainer.epoch_time, 3) if trainer.epoch_time else None,
+            'gpu_peak_gb': round(gpu_peak, 3) if gpu_peak is not None else None,
+            'rss_peak_mb': round(rss, 1) if rss is not None else None,
+            'workers_rss_mb': round(workers_rss, 1) if workers_rss is not None else None,
+        })
+
+    def on_train_end(self, trainer):
+        if self._file is None:
+            return
+        self._file.close()
+        self._file = None
+        summary = summarize(trainer.save_dir, save=True)
+        if summary:
+            print_summary(summary)
+
+    def teardown(self, trainer):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def attach_profiler(model, **kwargs):
+    """把 TrainProfiler 掛在 model 上 (用法同 hw_profile.attach_profile)，回傳 profiler"""
+    profiler = TrainProfiler(**kwargs)
+    for event in ('on_train_start', 'on_train_epoch_start', 'on_train_batch_start', 'on_train_batch_end',
+                  'on_train_epoch_end', 'on_fit_epoch_end', 'on_train_end', 'teardown'):
+        model.add_callback(event, getattr(profiler, event))
+    return profiler
+
+
+# ------------------------------------------
+# 彙總與比較
+# ------------------------------------------
+def load_records(run_dir):
+    path = os.path.join(run_dir, LOG_NAME)
+    if not os.path.exists(path):
+        return []
+    records = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    pass   # 訓練被中斷時最後一行可能不完整
+    return records
+
+
+def _verdict(totals, pipeline, workers):
+    """依數據給出調整方向 (只是提示，不會自動改設定)"""
+    if not totals:
+        return ""
+    if totals['data_wait_share'] >= 0.2 or totals['starved_ratio'] >= 0.3:
+        hint = "資料供應不足：GPU/CPU 在等 DataLoader"
+        if pipeline:
+            step, _ = max(((k, v) for k, v in pipeline['steps_ms'].items()), key=lambda kv: kv[1])
+            hint += f"，管線最慢的是 {step}"
+            if step == LOAD_STEP:
+                hint += " (可開 image_cache 或 cache=ram)"
+            else:
+                hint += " (可調降該增強的機率)"
+        return hint + "；可先增加 workers"
+    if workers and totals['data_wait_share'] < 0.02 and pipeline and pipeline.get('single_worker_imgs_per_s'):
+        capacity = pipeline['single_worker_imgs_per_s'] * workers
+        if capacity > 2 * totals['compute_imgs_per_s']:
+            return f"計算為瓶頸，workers={workers} 供應有餘 (估計 {capacity:.0f} 張/秒)，可減少 workers 或加大 batch"
+    return "計算為瓶頸：資料管線跟得上"
+
+
+def summarize(run_dir, save=False):
+    """由 train_profile.jsonl 彙總 (中斷的訓練也能彙總)；save=True 時寫成 train_profile_summary.json"""
+    records = load_records(run_dir)
+    if not records:
+        return None
+    start = next((r for r in reversed(records) if r['event'] == 'start'), {})
+    pipeline = next((r for r in reversed(records) if r['event'] == 'pipeline'), None)
+    epochs = [r for r in records if r['event'] == 'epoch']
+
+    totals = {}
+    if epochs:
+        wait = sum(r['data_wait_s'] for r in epochs)
+        compute = sum(r['compute_s'] for r in epochs)
+        images = sum(r['images'] for r in epochs)
+        batches = sum(r['batches'] for r in epochs)
+        epoch_times = [r['epoch_s'] for r in epochs if r.get('epoch_s')]
+        totals = {
+            'epochs': len(epochs),
+            'mean_epoch_s': round(sum(epoch_times) / len(epoch_times), 3) if epoch_times else None,
+            'mean_train_s': round(sum(r['train_s'] for r in epochs) / len(epochs), 3),
+            'mean_val_save_s': round(sum(r['val_save_s'] or 0 for r in epochs) / len(epochs), 3),
+            'imgs_per_s': round(images / sum(r['train_s'] for r in epochs), 2),
+            'compute_imgs_per_s': round(images / compute, 2) if compute else None,
+            'data_wait_share': round(wait / (wait + compute), 4) if wait + compute else 0.0,
+            'starved_ratio': round(sum(r['starved_batches'] for r in epochs) / batches, 4) if batches else 0.0,
+            'gpu_peak_gb': max((r['gpu_peak_gb'] for r in epochs if r.get('gpu_peak_gb') is not None), default=None),
+            'rss_peak_mb': max((r['rss_peak_mb'] for r in epochs if r.get('rss_peak_mb') is not None), default=None),
+            'workers_rss_mb': max((r['workers_rss_mb'] for r in epochs if r.get('workers_rss_mb') is not None),
+                                  default=None),
+        }
+
+    args = dict(start.get('args', {}))
+    args.update(_read_args_yaml(run_dir, keep=args))
+    summary = {
+        'run': os.path.basename(os.path.normpath(str(run_dir))),
+        'run_dir': str(run_dir),
+        'args': args,
+        'images': start.get('images'),
+        'dataset': start.get('dataset'),
+        'totals': totals,
+        'pipeline': {k: pipeline[k] for k in ('samples', 'per_sample_ms', 'steps_ms', 'steps_share',
+                                             'single_worker_imgs_per_s')} if pipeline else None,
+    }
+    summary['verdict'] = _verdict(totals, summary['pipeline'], args.get('workers'))
+    if save:
+        with open(os.path.join(run_dir, SUMMARY_NAME), 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+    return summary
+
+
+def _read_args_yaml(run_dir, keep=None):
+    """補上 Ultralytics 寫的 args.yaml 中的訓練參數 (沒有 profile 紀錄的舊訓練也能比較)"""
+    path = os.path.join(run_dir, "args.yaml")
+    if not os.path.exists(path):
+        return {}
+    import yaml
+    with open(path, encoding='utf-8') as f:
+        args = yaml.safe_load(f) or {}
+    return {k: args[k] for k in TUNING_ARGS if k in args and k not in (keep or {})}
+
+
+def print_summary(summary):
+    t = summary['totals']
+    print(f"📊 訓練效能摘要：{summary['run']}")
+    if t:
+        print(f"   {t['epochs']} epochs | 平均每 epoch {t['mean_epoch_s'] or t['mean_train_s']} 秒 "
+              f"(驗證+存檔 {t['mean_val_save_s']} 秒) | {t['imgs_per_s']} 張/秒")
+        print(f"   等資料佔 {t['data_wait_share']:.1%} | 佇列見底的 batch {t['starved_ratio']:.1%} | "
+              f"GPU 峰值 {t['gpu_peak_gb']} GB | RSS 峰值 {t['rss_peak_mb']} MB (worker {t['workers_rss_mb']} MB)")
+    if summary['pipeline']:
+        steps = sorted(summary['pipeline']['steps_ms'].items(), key=lambda kv: -kv[1])
+        print("   資料管線 (每張 ms)：" + "、".join(f"{name} {ms:.1f}" for name, ms in steps))
+    if summary['verdict']:
+        print(f"   👉 {summary['verdict']}")
+
+
+def compare_runs(run_dirs):
+    """彙總多次訓練並印出比較表，回傳 summary 清單"""
+    summaries = [s for s in (summarize(d) for d in run_dirs) if s and s['totals']]
+    if not summaries:
+        print("⚠️ 找不到任何 train_profile.jsonl")
+        return []
+
+    header = (f"{'run':<40} {'batch':>5} {'wrk':>4} {'mosaic':>6} {'mixup':>5} {'c_p':>4} "
+              f"{'s/epoch':>8} {'img/s':>7} {'wait%':>6} {'starve%':>7} {'GPU GB':>6} {'decode ms':>9} {'aug ms':>7}")
+    print(header)
+    print("-" * len(header))
+    for s in sorted(summaries, key=lambda s: -(s['totals']['imgs_per_s'] or 0)):
+        a, t, p = s['args'], s['totals'], s['pipeline'] or {}
+        steps = p.get('steps_ms', {})
+        decode = steps.get(LOAD_STEP)
+        aug = sum(v for k, v in steps.items() if k != LOAD_STEP) if steps else None
+        print(f"{s['run'][:40]:<40} {str(a.get('batch', '')):>5} {str(a.get('workers', '')):>4} "
+              f"{str(a.get('mosaic', '')):>6} {str(a.get('mixup', '')):>5} {str(a.get('copy_paste', '')):>4} "
+              f"{t['mean_epoch_s'] or t['mean_train_s']:>8} {t['imgs_per_s']:>7} "
+              f"{t['data_wait_share'] * 100:>5.1f}% {t['starved_ratio'] * 100:>6.1f}% "
+              f"{'' if t['gpu_peak_gb'] is None else t['gpu_peak_gb']:>6} "
+              f"{'' if decode is None else f'{decode:.1f}':>9} {'' if aug is None else f'{aug:.1f}':>7}")
+    print()
+    for s in summaries:
+        if s['verdict']:
+            print(f"👉 {s['run']}：{s['verdict']}")
+    return summaries
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="比較各次訓練的效能紀錄 (train_profile.jsonl)")
+    parser.add_argument('runs', nargs='*', help=f"訓練資料夾，預設為 {RUNS_DIR} 底下全部")
+    parser.add_argument('--json', help="另外把比較結果寫成 JSON")
+    opts = parser.parse_args()
+
+    run_dirs = opts.runs or sorted(os.path.dirname(p) for p in glob.glob(os.path.join(RUNS_DIR, "*", LOG_NAME)))
+    result = compare_runs(run_dirs)
+    if opts.json and result:
+        with open(opts.json, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"💾 已寫入 {opts.json}")
+    sys.exit(0 if result else 1)
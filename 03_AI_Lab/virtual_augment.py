@@ -0,0 +1,60 @@
+import yolo_labels
+from aug_manifest import AugmentManifest
+from augment_engine import AUG_SUFFIXES, VARIANT_FUNCS
+
+# ==========================================
+# 虛擬擴充 (On-the-fly)：變體只存在記憶體，不寫入硬碟
+# ==========================================
+# 線下擴充讓每張原圖在一個 epoch 中以 (原圖, _flip, _bright, _dark) 各出現一次；
+# 虛擬擴充的資料集長度同樣是 原圖數 x (變體數 + 1)，索引 i 對應原圖 i % n 的第 i // n 種變體，
+# 所以每個 epoch 的樣本數、optimizer 步數都與線下模式相同，epochs / patience 不必換算；
+# 差別只是不需要多存 3 份 JPEG，也不用每個 epoch 重新解碼它們。
+# 變體套在 load_image 之後 (已縮放到 imgsz)，只作用在索引 i 本身這一塊：
+# Mosaic 另外三塊取自 dataset.buffer，而 load_image 收到的一律是 i % n，buffer 裡只有原圖，
+# 所以那三塊永遠是原圖 (線下模式的 buffer 則可能混有變體檔案)。
+
+# 標籤轉換函式 -> 對 Ultralytics Instances (正規化 xywh) 的等效操作
+_INSTANCE_OPS = {
+    yolo_labels.hflip: lambda instances: instances.fliplr(1),
+    yolo_labels.vflip: lambda instances: instances.flipud(1),
+}
+
+
+class VirtualAugMixin:
+    """
+    混入 YOLODataset，在 get_image_and_label 時依索引套用對應的擴充變體 (i // n)
+    virtual_suffixes 由訓練器在建立資料集後設定 (預設三種變體全開)
+    """
+
+    virtual_suffixes = AUG_SUFFIXES
+
+    def __len__(self):
+        n = super().__len__()
+        return n * (len(self.virtual_suffixes) + 1) if self.augment else n
+
+    def get_image_and_label(self, index):
+        n = len(self.labels)
+        label = super().get_image_and_label(index % n)
+        if not self.augment:
+            return label
+
+        # 0 代表原圖，其餘對應各個變體
+        k = index // n
+        if k == 0:
+            return label
+
+        func, label_func = VARIANT_FUNCS[self.virtual_suffixes[k - 1]]
+        label['img'] = func(label['img'])
+        if label_func is not None:
+            _INSTANCE_OPS[label_func](label['instances'])
+        return label
+
+
+def warn_offline_variants(data_root):
+    """虛擬模式下若硬碟上還有線下變體，會被重複抽樣，提醒先清理"""
+    manifest = AugmentManifest(data_root)
+    count = sum(len(r['variants']) for r in manifest.sources.values())
+    if count:
+        print(f"⚠️ 偵測到 {count} 個線下擴充變體仍在硬碟上，虛擬模式會讓它們再被擴充一次；"
+              f"建議先執行 Tools.py 的 clean_augmented_files")
+    return count
@@ -0,0 +1,142 @@
+import os
+
+import numpy as np
+
+from inference.preprocess import letterbox_params  # 影像與標籤共用同一套 letterbox 算法
+
+# ==========================================
+# YOLO 標籤批次處理 (NumPy 向量化)
+# ==========================================
+# 標籤一律以 shape (N, 5) 的 float64 陣列表示：[class, x, y, w, h] (座標已正規化到 0~1)
+# 幾何轉換一次處理整個陣列，寫回時只做一次格式化，不再逐行 map(float, parts)。
+
+LINE_FMT = "%d %.6f %.6f %.6f %.6f"
+EMPTY = np.zeros((0, 5), dtype=np.float64)
+
+
+def parse_labels(text):
+    """解析標籤文字；欄位數不是 5 的行會被略過 (與舊版邏輯相同)"""
+    rows = [p for p in (line.split() for line in text.splitlines()) if len(p) == 5]
+    if not rows:
+        return EMPTY.copy()
+    return np.array(rows, dtype=np.float64)
+
+
+def load_labels(path):
+    """讀取單一標籤檔；檔案不存在時回傳 None"""
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as f:
+        return parse_labels(f.read())
+
+
+def load_label_dir(folder):
+    """讀取整個 labels 資料夾，回傳 {檔名(不含副檔名): (N, 5) 陣列}"""
+    labels = {}
+    if not os.path.isdir(folder):
+        return labels
+    with os.scandir(folder) as it:
+        for e in it:
+            if e.is_file() and e.name.endswith('.txt'):
+                with open(e.path, 'r') as f:
+                    labels[e.name[:-4]] = parse_labels(f.read())
+    return labels
+
+
+def format_labels(labels):
+    """一次格式化整個陣列，輸出與舊版 f"{int(cls)} {x:.6f} ..." 逐字元相同 (結尾不換行)"""
+    if len(labels) == 0:
+        return ""
+    fmt = "\n".join([LINE_FMT] * len(labels))
+    return fmt % tuple(labels.ravel().tolist())
+
+
+def save_labels(path, labels):
+    with open(path, 'w') as f:
+        f.write(format_labels(labels))
+
+
+# ------------------------------------------
+# 幾何轉換 (皆回傳新陣列，不修改輸入)
+# ------------------------------------------
+
+def hflip(labels):
+    """水平翻轉：x' = 1 - x"""
+    out = labels.copy()
+    out[:, 1] = 1.0 - out[:, 1]
+    return out
+
+
+def vflip(labels):
+    """垂直翻轉：y' = 1 - y"""
+    out = labels.copy()
+    out[:, 2] = 1.0 - out[:, 2]
+    return out
+
+
+def rot90(labels, clockwise=True):
+    """
+    旋轉 90 度 (對應 cv2.ROTATE_90_CLOCKWISE / COUNTERCLOCKWISE)
+    寬高互換，中心點依旋轉方向重新計算
+    """
+    out = labels.copy()
+    x, y, w, h = labels[:, 1], labels[:, 2], labels[:, 3], labels[:, 4]
+    if clockwise:
+        out[:, 1], out[:, 2] = 1.0 - y, x
+    else:
+        out[:, 1], out[:, 2] = y, 1.0 - x
+    out[:, 3], out[:, 4] = h, w
+    return out
+
+
+def crop(labels, img_w, img_h, box, min_area_ratio=0.2):
+    """
+    裁切：box = (x0, y0, x1, y1) 像素座標
+    框會被截到裁切範圍內，保留面積不足原本 min_area_ratio 的框直接丟棄
+    """
+    x0, y0, x1, y1 = box
+    cw, ch = x1 - x0, y1 - y0
+
+    xyxy = xywhn_to_xyxy(labels, img_w, img_h)
+    area = (xyxy[:, 2] - xyxy[:, 0]) * (xyxy[:, 3] - xyxy[:, 1])
+    xyxy[:, [0, 2]] = np.clip(xyxy[:, [0, 2]], x0, x1) - x0
+    xyxy[:, [1, 3]] = np.clip(xyxy[:, [1, 3]], y0, y1) - y0
+    new_area = (xyxy[:, 2] - xyxy[:, 0]) * (xyxy[:, 3] - xyxy[:, 1])
+
+    keep = new_area > np.maximum(area * min_area_ratio, 0.0)
+    return xyxy_to_xywhn(labels[keep, 0], xyxy[keep], cw, ch)
+
+
+def letterbox(labels, img_w, img_h, new_shape=640):
+    """等比例縮放並補邊到 new_shape，回傳相對於補邊後畫布的正規化標籤"""
+    if isinstance(new_shape, int):
+        new_shape = (new_shape, new_shape)
+    r, _, (left, top) = letterbox_params(img_h, img_w, new_shape)
+    out = labels.copy()
+    out[:, 1] = (labels[:, 1] * img_w * r + left) / new_shape[1]
+    out[:, 2] = (labels[:, 2] * img_h * r + top) / new_shape[0]
+    out[:, 3] = labels[:, 3] * img_w * r / new_shape[1]
+    out[:, 4] = labels[:, 4] * img_h * r / new_shape[0]
+    return out
+
+
+# ------------------------------------------
+# 座標格式轉換
+# ------------------------------------------
+
+def xywhn_to_xyxy(labels, img_w, img_h):
+    """正規化中心點格式 -> 像素 (x0, y0, x1, y1)，回傳 shape (N, 4)"""
+    x, y = labels[:, 1] * img_w, labels[:, 2] * img_h
+    w, h = labels[:, 3] * img_w, labels[:, 4] * img_h
+    return np.stack([x - w / 2, y - h / 2, x + w / 2, y + h / 2], axis=1)
+
+
+def xyxy_to_xywhn(cls, xyxy, img_w, img_h):
+    """像素 (x0, y0, x1, y1) + 類別 -> (N, 5) 正規化標籤"""
+    out = np.empty((len(xyxy), 5), dtype=np.float64)
+    out[:, 0] = cls
+    out[:, 1] = (xyxy[:, 0] + xyxy[:, 2]) / 2 / img_w
+    out[:, 2] = (xyxy[:, 1] + xyxy[:, 3]) / 2 / img_h
+    out[:, 3] = (xyxy[:, 2] - xyxy[:, 0]) / img_w
+    out[:, 4] = (xyxy[:, 3] - xyxy[:, 1]) / img_h
+    return out
@@ -1,35 +1,53 @@
-import firebase_admin
-from firebase_admin import credentials, firestore
 import json
 import os
-from datetime import datetime
+import sys
+import time
+
 from dotenv import load_dotenv # 引入 dotenv
 
+from firebase_client import get_db
+from json_stream import iter_json_array, iter_jsonl, write_json_array
+from watermark import Watermark, stream_new_docs
+
 
 # 載入環境變數
 load_dotenv()
 
 
-# 🚩 演習重點：從環境變數讀取金鑰路徑與基礎路徑
-FIREBASE_KEY = os.getenv('FIREBASE_KEY_PATH')
+# 🚩 演習重點：從環境變數讀取基礎路徑 (金鑰與模擬器設定在 firebase_client.py)
 BASE_PATH = os.getenv('BASE_SAVE_PATH', r'D:\product_recognition\04_App_Dev')
 
+# ==========================================
+# 增量下載 (水位 + JSON Lines)
+# ==========================================
+# 每個集合記一個水位 (pull_state.json)，只查詢 where(欄位 > 水位) 的新文件，
+# 收到一筆就附加一行到 <集合>.jsonl，不先收集成 list；
+# compaction 再把 .jsonl 合併進 snapshot (products.json / sales.json)，同一個 id 以新的為準。
+# 讀取次數只跟新增 / 更新的文件數有關，不再隨歷史資料增加。
+#
+# Firestore 的範圍查詢只會回傳同型別的值：App 寫入的是 Timestamp，
+# push_sql_to_cloud.py 寫入的 lastUpdate 是字串，所以兩種型別各有一個水位、各查一次 (還沒看過的型別從下限查起)。
+# 被刪除的文件不會出現在增量查詢裡，需要時用 --full 重新建立 snapshot。
+#
+# products 每次都完整下載：收銀機結帳用 FieldValue.increment 扣庫存，不會更新 lastUpdate，
+# 依 lastUpdate 增量下載會拿到過期的庫存 (json_to_sql.py 再匯入就錯了)。商品數量少，完整下載的成本不高。
+
+COLLECTIONS = {
+    # 集合名稱: 判斷新舊的欄位 (None = 每次完整下載)
+    'sales': 'timestamp',
+    'products': None,
+}
+STATE_FILE = os.path.join(BASE_PATH, 'pull_state.json')
+COMPACT_EVERY = 500   # journal 累積超過這麼多行就自動 compaction
 
-# 1. 初始化 Firebase 連線
-if not firebase_admin._apps:
-    if FIREBASE_KEY and os.path.exists(FIREBASE_KEY):
-        # 🚩 修正：使用環境變數變數，而非硬編碼字串
-        cred = credentials.Certificate(FIREBASE_KEY)
-        firebase_admin.initialize_app(cred)
-    else:
-        print("❌ 錯誤：找不到 Firebase 金鑰，請檢查 .env 設定")
-        exit()
 
-db = firestore.client()
+def snapshot_path(collection_name):
+    return os.path.join(BASE_PATH, f'{collection_name}.json')
+
+
+def journal_path(collection_name):
+    return os.path.join(BASE_PATH, f'{collection_name}.jsonl')
 
-# 定義儲存路徑
-PRODUCTS_OUT = os.path.join(BASE_PATH, 'products.json')
-SALES_OUT = os.path.join(BASE_PATH, 'sales.json')
 
 def json_serializable(item):
     """處理 Firebase 回傳資料中無法直接轉 JSON 的型態"""
@@ -42,31 +60,123 @@ def json_serializable(item):
             json_serializable(value)
     return item
 
-def pull_collection(collection_name, output_file):
-    print(f"🚀 正在從 Firebase 抓取 [{collection_name}] 集合...")
-    
-    docs = db.collection(collection_name).stream()
-    data_list = []
-    
-    for doc in docs:
-        item = doc.to_dict()
-        item['id'] = doc.id # 保留文件 ID
-        # 處理時間物件轉換
-        data_list.append(json_serializable(item))
-    
-    if not data_list:
+
+# ------------------------------------------
+# 水位
+# ------------------------------------------
+
+def load_state():
+    if os.path.exists(STATE_FILE):
+        with open(STATE_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return {}
+
+
+def save_state(state):
+    tmp_path = STATE_FILE + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, STATE_FILE)
+
+
+# ------------------------------------------
+# 下載與 compaction
+# ------------------------------------------
+
+def _to_item(doc, field, mark):
+    item = doc.to_dict()
+    item['id'] = doc.id # 保留文件 ID
+    mark.observe(item.get(field))
+    return json_serializable(item)
+
+
+def pull_collection(collection_name, field=None, full=False, db=None):
+    """
+    增量下載一個集合，回傳本次收到的文件數
+    第一次執行 (沒有水位)、full=True 或集合沒有增量欄位時完整下載，直接重建 snapshot
+    """
+    db = db or get_db()
+    field = field or COLLECTIONS[collection_name]
+    state = load_state()
+    saved = state.get(collection_name)
+    # 水位兩種型別都是空的 (上次完整下載時集合是空的)：沒有可比較的值，再完整下載一次
+    full = (full or field is None or saved is None or saved.get('field') != field
+            or Watermark(saved).empty())
+    mark = Watermark(None if full else saved)
+    start = time.perf_counter()
+    os.makedirs(BASE_PATH, exist_ok=True)
+
+    if full:
+        print(f"🚀 正在從 Firebase 完整抓取 [{collection_name}] 集合...")
+        docs = (_to_item(doc, field, mark) for doc in db.collection(collection_name).stream())
+        count = write_json_array(snapshot_path(collection_name), docs)
+        # snapshot 已是最新，舊的 journal 不再需要
+        if os.path.exists(journal_path(collection_name)):
+            os.remove(journal_path(collection_name))
+    else:
+        print(f"🚀 正在從 Firebase 抓取 [{collection_name}] 的新資料 ({field} > 水位)...")
+        count = 0
+        with open(journal_path(collection_name), 'a', encoding='utf-8') as f:
+            for doc in stream_new_docs(db, collection_name, field, mark):
+                f.write(json.dumps(_to_item(doc, field, mark), ensure_ascii=False) + "\n")
+                count += 1
+            f.flush()
+            os.fsync(f.fileno())
+
+    # 資料確實寫入後才更新水位；中途失敗時下次會重新抓取，compaction 會去除重複
+    if field is None:
+        state.pop(collection_name, None)
+    else:
+        state[collection_name] = mark.to_dict(field)
+    save_state(state)
+
+    seconds = time.perf_counter() - start
+    if full and count == 0:
         print(f"⚠️ 雲端 [{collection_name}] 是空的。")
-        return
+    else:
+        print(f"✅ [{collection_name}] 收到 {count} 筆 ({seconds:.2f} 秒)")
+    return count
+
+
+def compact(collection_name):
+    """把 journal 合併進 snapshot：記憶體只需要放 journal 裡的文件，snapshot 逐筆串流"""
+    journal = journal_path(collection_name)
+    updates = {}
+    for item in iter_jsonl(journal):
+        updates[item.get('id')] = item
+    if not updates:
+        return 0
+
+    snapshot = snapshot_path(collection_name)
+    merged = len(updates)
+
+    def items():
+        if os.path.exists(snapshot):
+            for item in iter_json_array(snapshot):
+                yield updates.pop(item.get('id'), item)
+        yield from updates.values()
+
+    total = write_json_array(snapshot, items())
+    os.remove(journal)
+    print(f"🗜️ [{collection_name}] 合併 {merged} 筆新資料，snapshot 共 {total} 筆：{snapshot}")
+    return merged
+
 
-    # 確保資料夾存在
-    os.makedirs(os.path.dirname(output_file), exist_ok=True)
+def journal_lines(collection_name):
+    path = journal_path(collection_name)
+    if not os.path.exists(path):
+        return 0
+    with open(path, 'rb') as f:
+        return sum(1 for _ in f)
 
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(data_list, f, ensure_ascii=False, indent=2)
-    
-    print(f"✅ 成功！[{collection_name}] 已存至: {output_file}")
 
 if __name__ == "__main__":
-    # 同時抓取兩個集合
-    pull_collection('products', PRODUCTS_OUT)
-    pull_collection('sales', SALES_OUT)
\ No newline at end of file
+    # 用法：python "Cloud pullback.py" [--full] [--compact]
+    #   --full    忽略水位，完整重新下載 (同時處理雲端已刪除的文件)
+    #   --compact 下載後一定把 journal 合併進 snapshot (預設超過 COMPACT_EVERY 行才合併)
+    FULL = '--full' in sys.argv
+    FORCE_COMPACT = '--compact' in sys.argv
+    for name in COLLECTIONS:
+        pull_collection(name, full=FULL)
+        if FORCE_COMPACT or journal_lines(name) >= COMPACT_EVERY:
+            compact(name)
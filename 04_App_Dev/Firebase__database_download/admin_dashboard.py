@@ -1,31 +1,30 @@
-
 #請使用streamlit run "D:\product_recognition\04_App_Dev\admin_dashboard.py"
 
 import streamlit as st
-import firebase_admin
-from firebase_admin import credentials, firestore
 import pandas as pd
-import os
 from dotenv import load_dotenv
 
+from dashboard_data import from_env
+
 # 1. 載入環境變數 (會從專案目錄下的 .env 讀取)
 load_dotenv()
 
-FIREBASE_KEY = os.getenv('FIREBASE_KEY_PATH')
+st.set_page_config(page_title="雜貨店雲端後台", layout="wide")
+
 
-# 1. 初始化 Firebase
-if not firebase_admin._apps:
-    if FIREBASE_KEY and os.path.exists(FIREBASE_KEY):
-       cred = credentials.Certificate('FIREBASE_KEY')
-       firebase_admin.initialize_app(cred)
-    else:
-        st.error("❌ 找不到 Firebase 金鑰檔案，請檢查 .env 設定！")
-        st.stop() # 停止執行後續程式碼
+# 1. 初始化資料層：整個 Streamlit 行程共用一份 (含快取與 Firestore 監聽)，重跑腳本時不會重新讀取
+@st.cache_resource
+def get_data():
+    return from_env()
 
-db = firestore.client()
 
-st.set_page_config(page_title="雜貨店雲端後台", layout="wide")
-st.title("🏬 雜貨店管理員後台") 
+try:
+    data = get_data()
+except FileNotFoundError as e:
+    st.error(f"❌ {e}")
+    st.stop() # 停止執行後續程式碼
+
+st.title("🏬 雜貨店管理員後台")
 
 # --- 側邊欄：功能導航 ---
 menu = st.sidebar.selectbox("功能選單", ["庫存管理", "銷售統計", "AI 辨識分析"])
@@ -33,56 +32,109 @@ menu = st.sidebar.selectbox("功能選單", ["庫存管理", "銷售統計", "AI
 # --- 功能 1：庫存管理 ---
 if menu == "庫存管理":
     st.header("📦 即時庫存監控")
-    
-    # 從 Firebase 抓取資料
-    products_ref = db.collection('products')
-    docs = products_ref.stream()
-    
-    items = []
-    for doc in docs:
-        d = doc.to_dict()
-        d['id'] = doc.id
-        items.append(d)
-    
-    df = pd.DataFrame(items)
-    
+
+    # 編輯用的 snapshot：第一次進頁面時從快取取一份 (含每個文件的版本)，寫回時以它為比對基準；
+    # 監聽在背景更新快取不會打斷正在編輯的表格，按「重新載入」才換成最新資料
+    if 'inventory_snapshot' not in st.session_state:
+        st.session_state.inventory_snapshot = data.inventory_snapshot()
+        st.session_state.inventory_rev = st.session_state.get('inventory_rev', 0) + 1
+    rows, versions = st.session_state.inventory_snapshot
+    df = pd.DataFrame(rows)
+
+    # 上一次寫回的結果 (寫回後會重跑頁面)
+    for level, message in st.session_state.pop('inventory_messages', []):
+        getattr(st, level)(message)
+
     # 顯示編輯表格
     if not df.empty:
         # 低庫存預警
         low_stock = df[df['stock'] < 10]
         if not low_stock.empty:
             st.warning(f"注意！有 {len(low_stock)} 項商品庫存不足！")
-        
-        st.data_editor(df, key="inventory_editor", use_container_width=True)
-        
-        if st.button("更新雲端資料"):
-            # 這裡可以寫回傳邏輯
-            st.success("已同步更新至手機端！")
+
+        edited = st.data_editor(df, key=f"inventory_editor_{st.session_state.inventory_rev}",
+                                disabled=['id', 'lastUpdate'], use_container_width=True)
+
+        save_col, reload_col = st.columns([1, 1])
+        with save_col:
+            save = st.button("更新雲端資料")
+        with reload_col:
+            reload = st.button("🔄 重新載入")
+
+        if save:
+            result = data.save_products(rows, edited.to_dict('records'), versions)
+            messages = []
+            if not result['changes']:
+                messages.append(('info', "沒有任何變更。"))
+            if result['written']:
+                messages.append(('success', f"已同步更新 {len(result['written'])} 項商品至手機端！"))
+            if result['conflicts']:
+                names = "、".join((cur or {}).get('name') or doc_id for doc_id, cur in result['conflicts'].items())
+                messages.append(('error', f"以下商品在載入後已被其他裝置修改 (例如結帳扣庫存)，未覆蓋：{names}。"
+                                          "請確認最新資料後重新編輯。"))
+            st.session_state.inventory_messages = messages
+        if save or reload:
+            del st.session_state.inventory_snapshot
+            st.rerun()
 
 # --- 功能 2：銷售統計 ---
 elif menu == "銷售統計":
     st.header("💰 每日消額與淨利分析")
-    
-    sales_ref = db.collection('sales').order_by('timestamp', direction='DESCENDING')
-    sales_docs = sales_ref.stream()
-    
-    sales_data = []
-    for doc in sales_docs:
-        s = doc.to_dict()
-        # 處理時間格式
-        s['time'] = s['timestamp'].strftime('%Y-%m-%d %H:%M') if s.get('timestamp') else "N/A"
-        sales_data.append(s)
-    
+
+    # 今日 / 本週 / 本月：讀預先彙總的表，不必載入全部銷售
+    summary = data.rollup_summary()
+    if summary:
+        st.caption(f"統計日：{summary['day']} (台灣時間)")
+        for col, key, label in zip(st.columns(3), ('today', 'week', 'month'), ('今日營業額', '本週營業額', '本月營業額')):
+            with col:
+                t = summary[key]
+                st.metric(label, f"$ {t['revenue']:,.0f}", f"{t['orders']} 筆 / {t['qty']} 件", delta_color="off")
+
+        chart_col, top_col = st.columns([3, 2])
+        with chart_col:
+            st.subheader("今日每小時營業額")
+            st.bar_chart(pd.DataFrame(summary['hourly']).set_index('hour')['revenue'])
+        with top_col:
+            st.subheader("本月熱銷商品")
+            top = pd.DataFrame(summary['top_sellers'], columns=['product_name', 'revenue', 'qty'])
+            st.dataframe(top.rename(columns={'product_name': '商品', 'revenue': '營業額', 'qty': '件數'}),
+                         hide_index=True, use_container_width=True)
+    else:
+        st.info("找不到本地資料庫，請先執行 json_to_sql.py 建立銷售彙總。")
+
+    # 累計數字 (Firestore 聚合查詢 / SQL COUNT，與上面的期間數字分開)
+    totals = data.sales_totals()
+    col1, col2 = st.columns(2)
+    with col1:
+        st.metric("累計營業額", f"$ {totals['total']:,.0f}")
+    with col2:
+        st.metric("累計交易筆數", totals['count'])
+
+    # 游標分頁：cursors[i] 是第 i 頁的起點 (第 0 頁為 None)
+    if 'sales_cursors' not in st.session_state:
+        st.session_state.sales_cursors = [None]
+    cursors = st.session_state.sales_cursors
+    sales_data, next_cursor = data.sales_page(cursors[-1])
+
     if sales_data:
+        for s in sales_data:
+            # 處理時間格式
+            s['time'] = s['timestamp'].strftime('%Y-%m-%d %H:%M') if s.get('timestamp') else "N/A"
         sdf = pd.DataFrame(sales_data)
-        
-        col1, col2 = st.columns(2)
-        with col1:
-            st.metric("今日總營業額", f"$ {sdf['total_amount'].sum()}")
-        with col2:
-            st.metric("交易筆數", len(sdf))
-            
+
         st.subheader("最近交易紀錄")
         st.table(sdf[['time', 'total_amount', 'items']])
+
+        prev_col, page_col, next_col = st.columns([1, 2, 1])
+        with prev_col:
+            if st.button("⬅️ 上一頁", disabled=len(cursors) == 1):
+                cursors.pop()
+                st.rerun()
+        with page_col:
+            st.caption(f"第 {len(cursors)} 頁")
+        with next_col:
+            if st.button("下一頁 ➡️", disabled=next_cursor is None):
+                cursors.append(next_cursor)
+                st.rerun()
     else:
-        st.info("目前尚無銷售資料。")
\ No newline at end of file
+        st.info("目前尚無銷售資料。")
@@ -0,0 +1,297 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from dotenv import load_dotenv
+
+from inventory_writeback import diff_products, write_back
+from local_db import applying_remote, connect, ensure_schema, upsert_sales
+from sales_rollup import ensure_rollups, summary
+
+# 載入環境變數
+load_dotenv()
+
+# ==========================================
+# 後台資料存取層 (快取 + 分頁 + 即時監聽)
+# ==========================================
+# Streamlit 每次點擊都會重跑整個腳本；資料改由這裡提供，重跑時直接讀快取：
+#   - TTLCache：不依賴 Streamlit 的 TTL 快取，可以單獨測試 (clock 可替換)
+#   - 商品：Firestore on_snapshot 監聽，只有變更的文件會計讀取，快取原地更新、不會過期；
+#     同時記下每個文件的 update_time，後台寫回庫存時當作樂觀鎖的版本 (inventory_writeback.py)
+#   - 銷售：以 (timestamp, id) 為游標分頁，每頁分別快取；總額 / 筆數用聚合查詢 (count / sum)
+#     只監聽啟動之後的新銷售，有新單時讓銷售相關快取失效
+#   - 今日 / 本週 / 本月與熱銷商品：讀本地 grocery_system.db 的彙總表 (sales_rollup.py)，成本與歷史筆數無關；
+#     Firestore 監聽到的新銷售會寫入本地鏡像，由觸發器更新彙總
+#   - DASHBOARD_BACKEND=sqlite 時改讀本地 grocery_system.db (json_to_sql.py / 同步腳本維護的鏡像)
+# 快取暖機之後，切換選單不會再產生任何 Firestore 讀取。
+
+DASHBOARD_BACKEND = os.getenv('DASHBOARD_BACKEND', 'firestore')   # firestore | sqlite
+DB_FILE = os.getenv('DB_PATH', r'D:\product_recognition\04_App_Dev\Firebase__database_download\grocery_system.db')
+
+PRODUCTS_TTL = 300   # 秒；有監聽時不會過期
+SALES_TTL = 60       # 秒；有監聽時銷售分頁與總額也不會過期 (新銷售由監聽讓快取失效)
+PAGE_SIZE = 20
+
+
+class TTLCache:
+    """執行緒安全的 TTL 快取 (監聽的 callback 在背景執行緒執行)"""
+
+    def __init__(self, clock=time.monotonic):
+        self._clock = clock
+        self._items = {}
+        self._lock = threading.RLock()
+        self.stats = {'hits': 0, 'misses': 0}
+
+    def get(self, key, loader, ttl):
+        """有未過期的值就回傳，否則呼叫 loader() 並快取 ttl 秒 (ttl=None 表示不過期)"""
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is not None and (entry[1] is None or entry[1] > self._clock()):
+                self.stats['hits'] += 1
+                return entry[0]
+            # 載入時持有鎖：多個使用者同時重跑時只會讀一次
+            self.stats['misses'] += 1
+            value = loader()
+            self.set(key, value, ttl)
+            return value
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._items[key] = (value, None if ttl is None else self._clock() + ttl)
+
+    def peek(self, key, default=None):
+        with self._lock:
+            entry = self._items.get(key)
+            return entry[0] if entry is not None else default
+
+    def invalidate(self, prefix=""):
+        """移除 key 以 prefix 開頭的項目 (key 可以是字串或以字串開頭的 tuple)"""
+        with self._lock:
+            for key in [k for k in self._items if (k[0] if isinstance(k, tuple) else k).startswith(prefix)]:
+                del self._items[key]
+
+
+def _parse_time(value):
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value)
+        except ValueError:
+            return None
+    return value
+
+
+class DashboardData:
+    def __init__(self, backend=DASHBOARD_BACKEND, db=None, db_file=DB_FILE, cache=None, page_size=PAGE_SIZE):
+        self.backend = backend
+        self.db_file = db_file
+        self.page_size = page_size
+        self.cache = cache or TTLCache()
+        self.stats = {'backend_queries': 0}
+        self._db = db
+        self._watches = []
+        self._rollups_ready = False
+
+    # --- 後端連線 ---
+
+    @property
+    def db(self):
+        if self._db is None:
+            from firebase_client import get_db
+            self._db = get_db()
+        return self._db
+
+    def _sqlite(self):
+        # 唯讀開啟；每次查詢一個連線 (Streamlit 每個 session 在不同執行緒)
+        uri = "file:" + os.path.abspath(self.db_file).replace("\\", "/") + "?mode=ro"
+        return sqlite3.connect(uri, uri=True)
+
+    def _writable(self):
+        """寫入本地鏡像用的連線 (第一次使用時補建資料表與彙總)"""
+        conn = connect(self.db_file)
+        if not self._rollups_ready:
+            ensure_schema(conn)
+            ensure_rollups(conn)
+            self._rollups_ready = True
+        return conn
+
+    def _query(self, func):
+        self.stats['backend_queries'] += 1
+        return func()
+
+    # --- 商品 ---
+
+    def products(self):
+        """商品列表 (dict 含 id / name / price / category / stock / lastUpdate)"""
+        return self.inventory_snapshot()[0]
+
+    def inventory_snapshot(self):
+        """
+        (商品列表, {id: 文件 update_time}) —— 兩者取自同一份快取，後台編輯前保存起來，寫回時用來比對與加前置條件
+        讀本地 SQLite 時沒有 update_time，versions 為空 dict
+        """
+        cached = self.cache.get('products', lambda: self._query(self._load_products), PRODUCTS_TTL)
+        items = cached['items']
+        return [dict(items[k]) for k in sorted(items)], dict(cached['versions'])
+
+    def _load_products(self):
+        if self.backend == 'sqlite':
+            with self._sqlite() as conn:
+                rows = conn.execute("SELECT id, name, price, class, stock, last_update FROM products").fetchall()
+            return {'items': {r[0]: {'id': r[0], 'name': r[1], 'price': r[2], 'category': r[3],
+                                     'stock': r[4], 'lastUpdate': r[5]} for r in rows},
+                    'versions': {}}
+        items, versions = {}, {}
+        for doc in self.db.collection('products').stream():
+            d = doc.to_dict()
+            d['id'] = doc.id
+            items[doc.id] = d
+            versions[doc.id] = doc.update_time
+        return {'items': items, 'versions': versions}
+
+    def save_products(self, before, after, versions):
+        """
+        後台編輯後寫回：只送有改的欄位 (一個 WriteBatch)，以 versions 當前置條件，並同步寫入本地 SQLite
+        回傳 inventory_writeback.write_back() 的結果，另加 'changes' (比對出的變更)
+        """
+        changes = diff_products(before, after)
+        result = write_back(self.db, changes, versions, self.db_file)
+        result['changes'] = changes
+        if result['written'] and self.backend == 'sqlite':
+            self.cache.invalidate('products')   # Firestore 由監聽更新快取
+        return result
+
+    # --- 銷售 ---
+
+    def sales_page(self, cursor=None, page_size=None):
+        """
+        依時間由新到舊回傳一頁銷售與下一頁的游標 (最後一筆的 (timestamp, id))；沒有下一頁時游標為 None
+        """
+        size = page_size or self.page_size
+        rows = self.cache.get(('sales_page', cursor, size), lambda: self._query(lambda: self._load_page(cursor, size)),
+                              self._sales_ttl())
+        next_cursor = (rows[-1]['timestamp'], rows[-1]['id']) if len(rows) == size else None
+        return rows, next_cursor
+
+    def _sales_ttl(self):
+        """監聽中：新銷售會觸發 _on_sales 讓快取失效，不必再靠 TTL 重讀 Firestore"""
+        return None if self._watches else SALES_TTL
+
+    def _load_page(self, cursor, size):
+        if self.backend == 'sqlite':
+            sql = "SELECT id, total_amount, timestamp, items FROM sales"
+            args = []
+            if cursor is not None:
+                ts = cursor[0].isoformat() if hasattr(cursor[0], 'isoformat') else cursor[0]
+                sql += " WHERE (timestamp, id) < (?, ?)"
+                args += [ts, cursor[1]]
+            sql += " ORDER BY timestamp DESC, id DESC LIMIT ?"
+            with self._sqlite() as conn:
+                rows = conn.execute(sql, args + [size]).fetchall()
+            return [{'id': r[0], 'total_amount': r[1], 'timestamp': _parse_time(r[2]),
+                     'items': json.loads(r[3]) if r[3] else []} for r in rows]
+
+        # 與 SQLite 相同以 (timestamp, id) 排序：同一時間的銷售跨頁時才不會被跳過
+        sales = self.db.collection('sales')
+        query = sales.order_by('timestamp', direction='DESCENDING').order_by('__name__', direction='DESCENDING')
+        if cursor is not None:
+            query = query.start_after({'timestamp': cursor[0], '__name__': sales.document(cursor[1])})
+        rows = []
+        for doc in query.limit(size).stream():
+            s = doc.to_dict()
+            s['id'] = doc.id
+            s['timestamp'] = _parse_time(s.get('timestamp'))
+            rows.append(s)
+        return rows
+
+    def sales_totals(self):
+        """全部銷售的筆數與總額"""
+        return self.cache.get('sales_totals', lambda: self._query(self._load_totals), self._sales_ttl())
+
+    def _load_totals(self):
+        if self.backend == 'sqlite':
+            with self._sqlite() as conn:
+                count, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(total_amount), 0) FROM sales").fetchone()
+            return {'count': count, 'total': total}
+        # 聚合查詢：每 1000 筆只計 1 次讀取，不必把所有銷售下載回來
+        agg = self.db.collection('sales').count(alias='count')
+        agg.sum('total_amount', alias='total')
+        results = {r.alias: r.value for r in agg.get()[0]}
+        return {'count': results['count'], 'total': results['total']}
+
+    def rollup_summary(self, today=None):
+        """
+        今日 / 本週 / 本月的營業額、筆數、件數，今日每小時營業額與本月熱銷商品
+        讀本地彙總表 (最多 31 天 x 商品數列)；沒有本地資料庫時回傳 None
+        """
+        return self.cache.get(('sales_rollup', today), lambda: self._query(lambda: self._load_rollup(today)),
+                              SALES_TTL)
+
+    def _load_rollup(self, today):
+        if not os.path.exists(self.db_file):
+            return None
+        if not self._rollups_ready:
+            self._writable().close()
+        with self._sqlite() as conn:
+            return summary(conn, today)
+
+    # --- 即時監聽 (只有 Firestore) ---
+
+    def start_listeners(self, since=None):
+        if self.backend != 'firestore' or self._watches:
+            return
+        self._watches.append(self.db.collection('products').on_snapshot(self._on_products))
+        since = since or datetime.now().astimezone()
+        self._watches.append(self.db.collection('sales').where('timestamp', '>', since).on_snapshot(self._on_sales))
+
+    def stop_listeners(self):
+        for watch in self._watches:
+            watch.unsubscribe()
+        self._watches = []
+
+    def _on_products(self, docs, changes, read_time):
+        cached = self.cache.peek('products') or {'items': {}, 'versions': {}}
+        by_id, versions = dict(cached['items']), dict(cached['versions'])
+        for change in changes:
+            doc = change.document
+            if change.type.name == 'REMOVED':
+                by_id.pop(doc.id, None)
+                versions.pop(doc.id, None)
+            else:
+                d = doc.to_dict()
+                d['id'] = doc.id
+                by_id[doc.id] = d
+                versions[doc.id] = doc.update_time
+        self.cache.set('products', {'items': by_id, 'versions': versions}, ttl=None)
+
+    def _on_sales(self, docs, changes, read_time):
+        if changes:
+            self._mirror_sales([c.document for c in changes if c.type.name != 'REMOVED'])
+            self.cache.invalidate('sales')
+
+    def _mirror_sales(self, docs):
+        """新銷售寫入本地鏡像；sales / sale_items 的觸發器會更新受影響的彙總 bucket"""
+        if not docs or not os.path.exists(self.db_file):
+            return
+        sales = []
+        for doc in docs:
+            s = doc.to_dict()
+            s['id'] = doc.id
+            if hasattr(s.get('timestamp'), 'isoformat'):
+                s['timestamp'] = s['timestamp'].isoformat()
+            sales.append(s)
+        conn = self._writable()
+        try:
+            with conn, applying_remote(conn):
+                upsert_sales(conn, sales)
+        finally:
+            conn.close()
+
+
+def from_env():
+    """依 .env 的 DASHBOARD_BACKEND 建立資料層；Firestore 時同時啟動監聽"""
+    data = DashboardData()
+    data.start_listeners()
+    return data
@@ -0,0 +1,422 @@
+import copy
+import json
+import os
+import threading
+import uuid
+from datetime import datetime, timezone
+
+# ==========================================
+# 本機 Fake Firestore (離線測試用)
+# ==========================================
+# 只實作同步腳本用到的 API：collection / document / set(merge) / update / delete / get，
+# where / order_by / limit / start_after / stream，batch() (WriteBatch，上限 500 筆)，
+# count / sum 聚合查詢，get_all，write_option 前置條件 (last_update_time / exists)，Increment / SERVER_TIMESTAMP，
+# 以及 on_snapshot 監聽 (commit 後在呼叫端執行緒通知變更)。
+# stats 紀錄 RPC 次數 (commits / writes / reads)，用來確認同步是不是批次送出；
+# fail_next 可以注入暫時性錯誤，測試指數退避重試。
+# 給 path 時資料會存成 JSON 檔，多個腳本 (上傳、下載、後台) 可以共用同一份假資料。
+
+MAX_BATCH_WRITES = 500
+
+
+class ServiceUnavailable(Exception):
+    """與 google.api_core.exceptions.ServiceUnavailable 同名，代表可重試的暫時性錯誤"""
+
+
+class InvalidArgument(Exception):
+    pass
+
+
+class FailedPrecondition(Exception):
+    """與 google.api_core.exceptions.FailedPrecondition 同名：write_option 的前置條件不成立"""
+
+
+class Increment:
+    """與 google.cloud.firestore.Increment 相同：在伺服器端把欄位加上 value (欄位不存在或不是數字時視為 0)"""
+
+    def __init__(self, value):
+        self.value = value
+
+
+class _ServerTimestamp:
+    def __repr__(self):
+        return 'SERVER_TIMESTAMP'
+
+
+# 與 google.cloud.firestore.SERVER_TIMESTAMP 相同：commit 時換成伺服器時間 (同一批寫入時間相同)
+SERVER_TIMESTAMP = _ServerTimestamp()
+
+
+class FakeWriteOption:
+    def __init__(self, last_update_time=None, exists=None):
+        self.last_update_time = last_update_time
+        self.exists = exists
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+def _merge(target, data, now):
+    for key, value in data.items():
+        if value is SERVER_TIMESTAMP:
+            target[key] = now
+        elif isinstance(value, Increment):
+            current = target.get(key)
+            target[key] = (current if isinstance(current, (int, float)) else 0) + value.value
+        elif isinstance(value, dict) and isinstance(target.get(key), dict):
+            _merge(target[key], value, now)
+        else:
+            target[key] = copy.deepcopy(value)
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return {'__datetime__': value.isoformat()}
+    raise TypeError(f"無法序列化 {type(value).__name__}")
+
+
+def _json_hook(obj):
+    if '__datetime__' in obj:
+        return datetime.fromisoformat(obj['__datetime__'])
+    return obj
+
+
+class FakeSnapshot:
+    def __init__(self, reference, data, update_time=None):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+        self.exists = data is not None
+        self.update_time = update_time
+
+    def to_dict(self):
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+    def get(self, field):
+        return copy.deepcopy(self._data.get(field)) if self._data else None
+
+
+class FakeDocumentReference:
+    def __init__(self, client, collection, doc_id):
+        self._client = client
+        self._collection = collection
+        self.id = doc_id
+        self.path = f"{collection}/{doc_id}"
+
+    def set(self, data, merge=False):
+        self._client._commit([('set', self, data, merge, None)])
+
+    def update(self, data, option=None):
+        self._client._commit([('update', self, data, False, option)])
+
+    def delete(self, option=None):
+        self._client._commit([('delete', self, None, False, option)])
+
+    def get(self):
+        return self._client._get(self)
+
+
+class FakeQuery:
+    _OPS = {
+        '==': lambda a, b: a == b, '!=': lambda a, b: a != b,
+        '<': lambda a, b: a < b, '<=': lambda a, b: a <= b,
+        '>': lambda a, b: a > b, '>=': lambda a, b: a >= b,
+        'in': lambda a, b: a in b, 'array_contains': lambda a, b: b in (a or []),
+    }
+
+    def __init__(self, client, collection, filters=(), orders=(), limit=None, cursor=None):
+        self._client = client
+        self._collection = collection
+        self._filters = tuple(filters)
+        self._orders = tuple(orders)
+        self._limit = limit
+        self._cursor = cursor
+
+    def _copy(self, **changes):
+        args = {'filters': self._filters, 'orders': self._orders, 'limit': self._limit, 'cursor': self._cursor}
+        args.update(changes)
+        return FakeQuery(self._client, self._collection, **args)
+
+    def where(self, field_path=None, op_string=None, value=None, filter=None):
+        if filter is not None:   # 新版 API：where(filter=FieldFilter(...))
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        return self._copy(filters=self._filters + ((field_path, op_string, value),))
+
+    def order_by(self, field_path, direction='ASCENDING'):
+        return self._copy(orders=self._orders + ((field_path, direction == 'DESCENDING'),))
+
+    def limit(self, count):
+        return self._copy(limit=count)
+
+    def start_after(self, document):
+        if isinstance(document, FakeSnapshot):
+            values = dict(document.to_dict() or {}, __name__=document.id)
+        else:
+            values = dict(document)
+        return self._copy(cursor=values)
+
+    @staticmethod
+    def _sort_value(doc, field):
+        """'__name__' 代表文件 id (與 Firestore 的 FieldPath.document_id() 相同)"""
+        return doc[0] if field == '__name__' else doc[1][field]
+
+    @staticmethod
+    def _cursor_value(cursor, field):
+        value = cursor.get(field)
+        return value.id if field == '__name__' and isinstance(value, FakeDocumentReference) else value
+
+    def _matches(self, data):
+        for field, op, value in self._filters:
+            if field not in data:
+                return False
+            try:
+                if not self._OPS[op](data[field], value):
+                    return False
+            except TypeError:
+                return False
+        return True
+
+    def stream(self):
+        docs = [(doc_id, data) for doc_id, data in self._client._snapshot(self._collection)
+                if self._matches(data)]
+        for field, descending in reversed(self._orders):
+            docs = [d for d in docs if field == '__name__' or field in d[1]]
+            docs.sort(key=lambda d, f=field: self._sort_value(d, f), reverse=descending)
+        if self._cursor is not None and self._orders:
+            cursor = tuple(self._cursor_value(self._cursor, f) for f, _ in self._orders)
+            descending = self._orders[0][1]
+            docs = [d for d in docs if (tuple(self._sort_value(d, f) for f, _ in self._orders) < cursor
+                                        if descending else
+                                        tuple(self._sort_value(d, f) for f, _ in self._orders) > cursor)]
+        if self._limit is not None:
+            docs = docs[:self._limit]
+        self._client._count_reads(len(docs))
+        for doc_id, data in docs:
+            ref = FakeDocumentReference(self._client, self._collection, doc_id)
+            yield FakeSnapshot(ref, data, self._client._update_times.get(ref.path))
+
+    def get(self):
+        return list(self.stream())
+
+    def count(self, alias=None):
+        return FakeAggregationQuery(self).count(alias)
+
+    def sum(self, field_path, alias=None):
+        return FakeAggregationQuery(self).sum(field_path, alias)
+
+    def on_snapshot(self, callback):
+        """callback(docs, changes, read_time)；第一次回傳目前符合的所有文件 (ADDED)"""
+        return self._client._watch(self, callback)
+
+
+class FakeAggregationResult:
+    def __init__(self, alias, value):
+        self.alias = alias
+        self.value = value
+
+
+class FakeAggregationQuery:
+    """與 google-cloud-firestore 的 AggregationQuery 相同：get() 回傳 [[AggregationResult, ...]]"""
+
+    def __init__(self, query):
+        self._query = query
+        self._aggregations = []
+
+    def count(self, alias=None):
+        self._aggregations.append(('count', None, alias or 'count'))
+        return self
+
+    def sum(self, field_path, alias=None):
+        self._aggregations.append(('sum', field_path, alias or f'sum_{field_path}'))
+        return self
+
+    def get(self):
+        docs = [data for _, data in self._query._client._snapshot(self._query._collection)
+                if self._query._matches(data)]
+        # 聚合查詢每 1000 筆索引項目計 1 次讀取
+        self._query._client._count_reads(len(docs) // 1000 + 1)
+        results = []
+        for kind, field, alias in self._aggregations:
+            if kind == 'count':
+                value = len(docs)
+            else:
+                value = sum(d[field] for d in docs if isinstance(d.get(field), (int, float)))
+            results.append(FakeAggregationResult(alias, value))
+        return [results]
+
+
+class FakeChangeType:
+    def __init__(self, name):
+        self.name = name
+
+
+class FakeDocumentChange:
+    def __init__(self, kind, document):
+        self.type = FakeChangeType(kind)
+        self.document = document
+
+
+class FakeWatch:
+    def __init__(self, client, query, callback):
+        self._client = client
+        self.query = query
+        self.callback = callback
+
+    def unsubscribe(self):
+        self._client._unwatch(self)
+
+
+class FakeCollection(FakeQuery):
+    def __init__(self, client, name):
+        super().__init__(client, name)
+        self.id = name
+
+    def document(self, doc_id=None):
+        return FakeDocumentReference(self._client, self._collection, doc_id or uuid.uuid4().hex[:20])
+
+
+class FakeWriteBatch:
+    def __init__(self, client):
+        self._client = client
+        self._ops = []
+
+    def set(self, reference, data, merge=False):
+        self._ops.append(('set', reference, data, merge, None))
+
+    def update(self, reference, data, option=None):
+        self._ops.append(('update', reference, data, False, option))
+
+    def delete(self, reference, option=None):
+        self._ops.append(('delete', reference, None, False, option))
+
+    def commit(self):
+        if len(self._ops) > MAX_BATCH_WRITES:
+            raise InvalidArgument(f"maximum {MAX_BATCH_WRITES} writes allowed per request")
+        self._client._commit(self._ops)
+        return self._ops
+
+
+class FakeClient:
+    def __init__(self, path=None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._data = {}
+        self._update_times = {}
+        self.stats = {'commits': 0, 'writes': 0, 'reads': 0}
+        self.fail_next = 0   # 接下來幾次 commit 要丟出 ServiceUnavailable
+        self._watches = []
+        if path and os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self._data = json.load(f, object_hook=_json_hook)
+
+    def collection(self, name):
+        return FakeCollection(self, name)
+
+    def batch(self):
+        return FakeWriteBatch(self)
+
+    def write_option(self, last_update_time=None, exists=None):
+        return FakeWriteOption(last_update_time, exists)
+
+    def get_all(self, references):
+        for ref in references:
+            yield self._get(ref)
+
+    # --- 內部：所有讀寫都經過這裡，方便統計 RPC 次數 ---
+
+    def _snapshot(self, collection):
+        with self._lock:
+            return [(doc_id, copy.deepcopy(data)) for doc_id, data in self._data.get(collection, {}).items()]
+
+    def _count_reads(self, n):
+        with self._lock:
+            self.stats['reads'] += max(n, 1)
+
+    def _get(self, ref):
+        with self._lock:
+            self.stats['reads'] += 1
+            data = self._data.get(ref._collection, {}).get(ref.id)
+            return FakeSnapshot(ref, copy.deepcopy(data), self._update_times.get(ref.path))
+
+    def _commit(self, ops):
+        with self._lock:
+            if self.fail_next > 0:
+                self.fail_next -= 1
+                raise ServiceUnavailable("503 The service is currently unavailable (fake)")
+            # 先檢查再套用，整批要嘛全部成功、要嘛全部失敗
+            for op, ref, _, _, option in ops:
+                exists = ref.id in self._data.get(ref._collection, {})
+                if op == 'update' and not exists:
+                    raise ValueError(f"404 No document to update: {ref.path}")
+                if option is not None and option.exists is not None and option.exists != exists:
+                    raise FailedPrecondition(f"exists={option.exists} 不成立：{ref.path}")
+                if (option is not None and option.last_update_time is not None
+                        and self._update_times.get(ref.path) != option.last_update_time):
+                    raise FailedPrecondition(f"文件在 {option.last_update_time} 之後已被修改：{ref.path}")
+            now = _now()
+            touched = {}
+            for op, ref, data, merge, _ in ops:
+                docs = self._data.setdefault(ref._collection, {})
+                before = touched.setdefault(ref.path, (ref, copy.deepcopy(docs.get(ref.id))))
+                if op == 'delete':
+                    docs.pop(ref.id, None)
+                    self._update_times.pop(ref.path, None)
+                    continue
+                if op == 'set' and not merge:
+                    docs[ref.id] = {}
+                _merge(docs.setdefault(ref.id, {}), data, now)
+                self._update_times[ref.path] = now
+            self.stats['commits'] += 1
+            self.stats['writes'] += len(ops)
+            if self.path:
+                self._save()
+            notify = self._changes_for_watches(touched, now)
+        for watch, docs, changes in notify:
+            watch.callback(docs, changes, now)
+
+    # --- 監聽 ---
+
+    def _watch(self, query, callback):
+        watch = FakeWatch(self, query, callback)
+        docs = query.get()
+        with self._lock:
+            self._watches.append(watch)
+        callback(docs, [FakeDocumentChange('ADDED', d) for d in docs], _now())
+        return watch
+
+    def _unwatch(self, watch):
+        with self._lock:
+            if watch in self._watches:
+                self._watches.remove(watch)
+
+    def _changes_for_watches(self, touched, now):
+        """依 commit 前後是否符合查詢條件，產生 ADDED / MODIFIED / REMOVED (只計變更的文件讀取)"""
+        notify = []
+        for watch in self._watches:
+            query, changes = watch.query, []
+            for path, (ref, before) in touched.items():
+                if ref._collection != query._collection:
+                    continue
+                after = self._data.get(ref._collection, {}).get(ref.id)
+                was = before is not None and query._matches(before)
+                now_in = after is not None and query._matches(after)
+                if not (was or now_in):
+                    continue
+                kind = 'MODIFIED' if was and now_in else ('ADDED' if now_in else 'REMOVED')
+                snap = FakeSnapshot(ref, copy.deepcopy(after if now_in else before), now)
+                changes.append(FakeDocumentChange(kind, snap))
+            if changes:
+                self.stats['reads'] += len(changes)
+                # 與 Firestore 相同，docs 是查詢目前的完整結果 (只有變更的文件計讀取)
+                docs = [FakeSnapshot(FakeDocumentReference(self, query._collection, doc_id), copy.deepcopy(data),
+                                     self._update_times.get(f"{query._collection}/{doc_id}"))
+                        for doc_id, data in self._data.get(query._collection, {}).items() if query._matches(data)]
+                notify.append((watch, docs, changes))
+        return notify
+
+    def _save(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._data, f, ensure_ascii=False, default=_json_default)
+        os.replace(tmp_path, self.path)
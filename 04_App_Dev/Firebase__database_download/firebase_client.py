@@ -0,0 +1,72 @@
+import os
+
+from dotenv import load_dotenv
+
+# 載入環境變數
+load_dotenv()
+
+# ==========================================
+# Firestore 連線 (延遲初始化)
+# ==========================================
+# import 時不連線、也不會因為找不到金鑰就 exit()，第一次呼叫 get_db() 才建立 client：
+#   FIRESTORE_FAKE=1          -> 本機記憶體中的 fake_firestore (離線測試)
+#   FIRESTORE_FAKE=<檔案>.json -> 同上，但資料存在檔案裡，多個腳本可以共用
+#   FIRESTORE_EMULATOR_HOST   -> Firebase 模擬器 (firebase emulators:start)，不需要金鑰
+#   其他                       -> FIREBASE_KEY_PATH 指定的服務帳戶金鑰
+
+FIREBASE_KEY = os.getenv('FIREBASE_KEY_PATH', r"D:\product_recognition\04_App_Dev\serviceAccountKey.json")
+EMULATOR_PROJECT = os.getenv('GCLOUD_PROJECT', 'demo-grocery')
+
+_db = None
+
+
+def get_db():
+    global _db
+    if _db is not None:
+        return _db
+
+    fake = os.getenv('FIRESTORE_FAKE')
+    if fake:
+        from fake_firestore import FakeClient
+        _db = FakeClient(None if fake in ('1', 'memory') else fake)
+        return _db
+
+    if os.getenv('FIRESTORE_EMULATOR_HOST'):
+        # 模擬器不驗證身分：直接用 google-cloud-firestore (firebase_admin 的相依套件) 建立 client
+        from google.auth.credentials import AnonymousCredentials
+        from google.cloud import firestore as gcloud_firestore
+        _db = gcloud_firestore.Client(project=EMULATOR_PROJECT, credentials=AnonymousCredentials())
+        return _db
+
+    import firebase_admin
+    from firebase_admin import credentials, firestore
+    if not firebase_admin._apps:
+        if not (FIREBASE_KEY and os.path.exists(FIREBASE_KEY)):
+            raise FileNotFoundError(f"找不到 Firebase 金鑰檔案 {FIREBASE_KEY}，請檢查 .env 的 FIREBASE_KEY_PATH")
+        firebase_admin.initialize_app(credentials.Certificate(FIREBASE_KEY))
+    _db = firestore.client()
+    return _db
+
+
+def set_db(db):
+    """測試時注入指定的 client (例如 FakeClient())"""
+    global _db
+    _db = db
+
+
+def increment(db, amount):
+    """FieldValue.increment：依 client 種類回傳對應的 sentinel (fake_firestore 或 google-cloud-firestore)"""
+    if type(db).__name__ == 'FakeClient':
+        from fake_firestore import Increment
+    else:
+        from google.cloud.firestore import Increment
+    return Increment(amount)
+
+
+def server_timestamp(db):
+    """FieldValue.serverTimestamp()：與 increment 相同，依 client 種類回傳對應的 sentinel"""
+    if type(db).__name__ == 'FakeClient':
+        from fake_firestore import SERVER_TIMESTAMP
+    else:
+        from google.cloud.firestore import SERVER_TIMESTAMP
+    return SERVER_TIMESTAMP
@@ -0,0 +1,158 @@
+import math
+import os
+import sqlite3
+from datetime import datetime
+
+from dotenv import load_dotenv
+
+from local_db import applying_remote
+
+# 載入環境變數
+load_dotenv()
+
+# ==========================================
+# 後台庫存寫回 (只送有改的欄位 + 樂觀鎖)
+# ==========================================
+# st.data_editor 回傳整張表；這裡與載入時的 snapshot 逐格比對，只把有改的欄位
+# 用一個 WriteBatch 寫回 Firestore (調整 3 項商品的價格 = 3 筆寫入、1 次 commit)，並同步寫入 grocery_system.db。
+#
+# 衝突偵測：每筆 update 都帶前置條件 last_update_time = 載入時文件的 update_time。
+# 結帳 App 用 FieldValue.increment 扣庫存時不會更新 lastUpdate 欄位，但文件的 update_time 一定會變，
+# 所以用 update_time 當版本才攔得到「後台載入之後又賣掉了」的情況。
+# 前置條件不成立時整批都不會寫入；重新讀取有改的文件 (只讀這幾筆)，
+#   - 後台要改的欄位在雲端也被改了 (例如 stock 被結帳扣掉) -> 衝突，不覆蓋，回報給使用者
+#   - 只是其他欄位變了 (改價格時剛好有人結帳) -> 不算衝突，用新的 update_time 再送一次
+
+DB_FILE = os.getenv('DB_PATH', r'D:\product_recognition\04_App_Dev\Firebase__database_download\grocery_system.db')
+
+BATCH_LIMIT = 500
+# Firestore 欄位 -> SQLite products 欄位 (後台可以編輯的欄位)
+EDITABLE_FIELDS = {'name': 'name', 'price': 'price', 'category': 'class', 'stock': 'stock'}
+# 前置條件不成立 (google.api_core.exceptions 的類別名稱；fake_firestore 也使用相同名稱)
+PRECONDITION_ERRORS = {'FailedPrecondition', 'Aborted'}
+MAX_ATTEMPTS = 3
+
+
+def _clean(value):
+    """DataFrame 來的值：numpy 純量轉回 Python，NaN / NaT 視為空值"""
+    if hasattr(value, 'item'):
+        value = value.item()
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value
+
+
+def diff_products(before, after, fields=EDITABLE_FIELDS):
+    """
+    比對載入時的商品列與編輯後的商品列 (list of dict，以 id 對應)
+    回傳 {id: {欄位: (原值, 新值)}}，只包含真的有改的欄位
+    """
+    original = {row['id']: row for row in before}
+    changes = {}
+    for row in after:
+        old = original.get(_clean(row.get('id')))
+        if old is None:
+            continue   # data_editor 為固定列數，不處理新增 / 刪除
+        changed = {}
+        for field in fields:
+            a, b = _clean(old.get(field)), _clean(row.get(field))
+            if a != b:
+                changed[field] = (a, b)
+        if changed:
+            changes[old['id']] = changed
+    return changes
+
+
+def _now_iso():
+    return datetime.now().astimezone().isoformat()
+
+
+def _commit_updates(db, updates, versions, stamp):
+    """updates: {id: {欄位: 新值}}；每筆帶 update_time 前置條件，每 500 筆一個 batch"""
+    ids = list(updates)
+    commits = 0
+    for i in range(0, len(ids), BATCH_LIMIT):
+        batch = db.batch()
+        for doc_id in ids[i:i + BATCH_LIMIT]:
+            option = db.write_option(last_update_time=versions[doc_id]) if versions.get(doc_id) else None
+            batch.update(db.collection('products').document(doc_id), dict(updates[doc_id], lastUpdate=stamp),
+                         option=option)
+        batch.commit()
+        commits += 1
+    return commits
+
+
+def _resolve(db, changes, versions):
+    """
+    重新讀取有改的文件，分成「可以安全寫入」與「衝突」
+    回傳 (可寫入的 {id: {欄位: 新值}}、最新的 versions、衝突 {id: 雲端目前的資料或 None})
+    """
+    refs = [db.collection('products').document(doc_id) for doc_id in changes]
+    ok, fresh, conflicts = {}, {}, {}
+    for snap in db.get_all(refs):
+        current = snap.to_dict() if snap.exists else None
+        fields = changes[snap.id]
+        # 雲端值等於原值 (沒人動過) 或等於新值 (已經寫入過) 都可以安全寫入
+        if current is None or any(_clean(current.get(f)) not in (old, new) for f, (old, new) in fields.items()):
+            conflicts[snap.id] = current
+            continue
+        ok[snap.id] = {f: new for f, (_, new) in fields.items()}
+        fresh[snap.id] = snap.update_time
+    return ok, {**versions, **fresh}, conflicts
+
+
+def mirror_to_sqlite(db_file, updates, stamp):
+    """把寫入雲端成功的欄位同步到本地 products 表"""
+    if not updates or not os.path.exists(db_file):
+        return 0
+    conn = sqlite3.connect(db_file)
+    try:
+        # 雲端已經寫入：不記入 sync_engine.py 的 change_log
+        with conn, applying_remote(conn):
+            for doc_id, fields in updates.items():
+                cols = [f"{EDITABLE_FIELDS[f]} = ?" for f in fields] + ["last_update = ?"]
+                conn.execute(f"UPDATE products SET {', '.join(cols)} WHERE id = ?",
+                             list(fields.values()) + [stamp, doc_id])
+    finally:
+        conn.close()
+    return len(updates)
+
+
+def write_back(db, changes, versions=None, db_file=DB_FILE):
+    """
+    changes 為 diff_products() 的結果；versions 為 {id: 載入時的 update_time}
+    沒有版本的商品 (例如後台讀的是本地 SQLite) 會先讀取雲端目前的值，確認要改的欄位沒被動過
+    回傳 {'written': [id...], 'conflicts': {id: 雲端目前的資料}, 'commits': n}
+    """
+    result = {'written': [], 'conflicts': {}, 'commits': 0}
+    if not changes:
+        return result
+    versions = dict(versions or {})
+    stamp = _now_iso()
+
+    unknown = {doc_id: f for doc_id, f in changes.items() if not versions.get(doc_id)}
+    updates = {doc_id: {f: new for f, (_, new) in fields.items()}
+               for doc_id, fields in changes.items() if doc_id not in unknown}
+    if unknown:
+        ok, versions, conflicts = _resolve(db, unknown, versions)
+        updates.update(ok)
+        result['conflicts'].update(conflicts)
+
+    for attempt in range(MAX_ATTEMPTS):
+        if not updates:
+            break
+        try:
+            result['commits'] += _commit_updates(db, updates, versions, stamp)
+            break
+        except Exception as e:
+            if type(e).__name__ not in PRECONDITION_ERRORS or attempt == MAX_ATTEMPTS - 1:
+                raise
+            # 有文件在載入後被改過：只重讀這幾筆，沒衝突的用新版本再送一次
+            # (超過 500 筆分批時，前面成功的 batch 會以相同內容再寫一次，結果不變)
+            pending = {doc_id: changes[doc_id] for doc_id in updates}
+            updates, versions, conflicts = _resolve(db, pending, versions)
+            result['conflicts'].update(conflicts)
+
+    result['written'] = list(updates)
+    mirror_to_sqlite(db_file, updates, stamp)
+    return result
@@ -0,0 +1,88 @@
+import json
+import os
+
+# ==========================================
+# 串流讀寫 JSON (不必把整份檔案載入記憶體)
+# ==========================================
+# snapshot：一般的 JSON 陣列 (products.json / sales.json)，每個元素一行，json.load 仍然可以讀
+# journal ：JSON Lines (.jsonl)，增量下載時一邊收到文件一邊附加
+
+CHUNK_SIZE = 1 << 16
+
+
+def iter_json_array(path, chunk_size=CHUNK_SIZE):
+    """逐一產生 JSON 陣列中的元素 (標準函式庫 raw_decode，分段讀檔)"""
+    decoder = json.JSONDecoder()
+    with open(path, 'r', encoding='utf-8') as f:
+        buf, pos, eof = "", 0, False
+
+        def fill():
+            nonlocal buf, pos, eof
+            more = f.read(chunk_size)
+            eof = not more
+            buf, pos = buf[pos:] + more, 0
+
+        def skip(chars):
+            nonlocal pos
+            while True:
+                while pos < len(buf) and buf[pos] in chars:
+                    pos += 1
+                if pos < len(buf) or eof:
+                    return
+                fill()
+
+        fill()
+        skip(" \t\r\n\ufeff")
+        if pos >= len(buf):
+            return   # 空檔案
+        if buf[pos] != '[':
+            raise ValueError(f"{path} 不是 JSON 陣列")
+        pos += 1
+
+        while True:
+            skip(" \t\r\n,")
+            if pos >= len(buf):
+                raise ValueError(f"{path} 在陣列結束前就結束了")
+            if buf[pos] == ']':
+                return
+            try:
+                item, end = decoder.raw_decode(buf, pos)
+                if end == len(buf) and not eof:
+                    raise ValueError   # 可能剛好停在數字中間，讀更多再解析一次
+            except ValueError:
+                if eof:
+                    raise
+                fill()
+                continue
+            pos = end
+            yield item
+
+
+def write_json_array(path, items):
+    """把 items 逐筆寫成 JSON 陣列 (先寫暫存檔再取代)，回傳筆數"""
+    tmp_path = path + ".tmp"
+    count = 0
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write("[")
+        for item in items:
+            f.write(",\n" if count else "\n")
+            f.write(json.dumps(item, ensure_ascii=False))
+            count += 1
+        f.write("\n]\n")
+    os.replace(tmp_path, path)
+    return count
+
+
+def iter_jsonl(path):
+    """讀取 JSON Lines；下載中斷時最後一行可能不完整，直接略過"""
+    if not os.path.exists(path):
+        return
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
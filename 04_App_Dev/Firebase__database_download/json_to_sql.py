@@ -1,8 +1,13 @@
-import sqlite3
-import json
 import os
+import time
+from itertools import islice
+
 from dotenv import load_dotenv
 
+from json_stream import iter_json_array, iter_jsonl
+from local_db import applying_remote, connect, ensure_schema, upsert_sales
+from sales_rollup import bulk_load, ensure_rollups
+
 # 1. 載入環境變數
 load_dotenv()
 
@@ -11,71 +16,91 @@ load_dotenv()
 BASE_PATH = os.getenv('BASE_SAVE_PATH', r'D:\product_recognition\04_App_Dev\Firebase__database_download')
 PRODUCTS_JSON = os.path.join(BASE_PATH, 'products.json')
 SALES_JSON = os.path.join(BASE_PATH, 'sales.json')
+SALES_JOURNAL = os.path.join(BASE_PATH, 'sales.jsonl')   # Cloud pullback.py 尚未合併的增量資料
 DB_FILE = os.path.join(BASE_PATH, "grocery_system.db")
 
+CHUNK_SIZE = 5000   # 每次 executemany 的筆數；整個匯入仍然是同一個交易
+
+
+def iter_records(path):
+    """
+    逐筆讀取 JSON 陣列，不把整個檔案載入記憶體
+    有安裝 ijson 時使用它 (C 實作較快)，否則用標準函式庫的 raw_decode
+    """
+    try:
+        import ijson
+    except ImportError:
+        yield from iter_json_array(path)
+        return
+    with open(path, 'rb') as f:
+        yield from ijson.items(f, 'item', use_float=True)
+
+
+def chunked(iterable, size=CHUNK_SIZE):
+    it = iter(iterable)
+    while True:
+        chunk = list(islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def load_products(conn, records):
+    rows = ((p.get('id'), p.get('name'), p.get('price'),
+             p.get('category'),     # 這裡改拿 category
+             p.get('stock', 0),
+             p.get('lastUpdate'))   # 這裡改拿 lastUpdate
+            for p in records)
+    count = 0
+    for chunk in chunked(rows):
+        conn.executemany('''
+            INSERT OR REPLACE INTO products (id, name, price, class, stock, last_update)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', chunk)
+        count += len(chunk)
+    return count
 
-def init_sql_database():
+
+def load_sales(conn, records):
+    """同一筆銷售重複匯入時覆蓋原本的資料與品項 (可重複執行)"""
+    count = items = 0
+    for chunk in chunked(records):
+        items += upsert_sales(conn, chunk)
+        count += len(chunk)
+    return count, items
+
+
+def init_sql_database(db_file=DB_FILE, products_json=PRODUCTS_JSON, sales_json=SALES_JSON,
+                      sales_journal=SALES_JOURNAL):
     # 建立或連接到資料庫檔
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-
-    # --- A. 建立產品資料表 ---
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS products (
-            id TEXT PRIMARY KEY,
-            name TEXT,
-            price REAL,
-            class TEXT,       -- 對應 JSON 中的 category
-            stock INTEGER,
-            last_update TEXT  -- 對應 JSON 中的 lastUpdate
-        )
-    ''')
-
-    # --- B. 建立銷售紀錄資料表 ---
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS sales (
-            id TEXT PRIMARY KEY,
-            total_amount REAL,
-            timestamp TEXT,
-            items TEXT -- 存儲為 JSON 字串
-        )
-    ''')
-
-    # 2. 匯入產品資料 (修正欄位對應)
-    if os.path.exists(PRODUCTS_JSON):
-        with open(PRODUCTS_JSON, 'r', encoding='utf-8') as f:
-            products = json.load(f)
-            for p in products:
-                # 🚩 修正重點：使用 p.get('category') 填入 class 欄位
-                # 🚩 修正重點：使用 p.get('lastUpdate') 填入 last_update 欄位
-                cursor.execute('''
-                    INSERT OR REPLACE INTO products (id, name, price, class, stock, last_update)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                ''', (
-                    p.get('id'), 
-                    p.get('name'), 
-                    p.get('price'), 
-                    p.get('category'), # 這裡改拿 category
-                    p.get('stock', 0), 
-                    p.get('lastUpdate') # 這裡改拿 lastUpdate
-                ))
-        print(f"✅ 產品資料已匯入 SQL ({len(products)} 筆)，已修正 class 與 last_update 欄位。")
-
-    # 3. 匯入銷售資料 (保持不變)
-    if os.path.exists(SALES_JSON):
-        with open(SALES_JSON, 'r', encoding='utf-8') as f:
-            sales = json.load(f)
-            for s in sales:
-                items_str = json.dumps(s.get('items', []), ensure_ascii=False)
-                cursor.execute('''
-                    INSERT OR REPLACE INTO sales (id, total_amount, timestamp, items)
-                    VALUES (?, ?, ?, ?)
-                ''', (s.get('id'), s.get('total_amount'), s.get('timestamp'), items_str))
-        print(f"✅ 銷售紀錄已匯入 SQL ({len(sales)} 筆)")
-
-    conn.commit()
-    conn.close()
-    print(f"✨ 本地 SQL 資料庫已重新生成：{DB_FILE}")
+    start = time.perf_counter()
+    conn = connect(db_file)
+    ensure_schema(conn)
+    ensure_rollups(conn)   # 匯入時由觸發器同步更新銷售彙總
+
+    try:
+        # 整個匯入在同一個交易中：中途失敗會全部還原，不會留下一半的資料
+        # 匯入的是雲端下載的資料：不記入 sync_engine.py 的 change_log
+        with conn, applying_remote(conn):
+            # 2. 匯入產品資料
+            if os.path.exists(products_json):
+                n = load_products(conn, iter_records(products_json))
+                print(f"✅ 產品資料已匯入 SQL ({n} 筆)")
+
+            # 3. 匯入銷售資料 (snapshot + 尚未合併的 journal，後者較新會覆蓋前者)
+            if os.path.exists(sales_json):
+                with bulk_load(conn):   # 整份 snapshot：暫停彙總觸發器，匯入後一次重算
+                    n, items = load_sales(conn, iter_records(sales_json))
+                print(f"✅ 銷售紀錄已匯入 SQL ({n} 筆，{items} 個品項)")
+            if os.path.exists(sales_journal):
+                # journal 只有少量新銷售：由觸發器逐筆更新彙總
+                n, items = load_sales(conn, iter_jsonl(sales_journal))
+                print(f"✅ 增量銷售紀錄已匯入 SQL ({n} 筆，{items} 個品項)")
+    finally:
+        conn.close()
+
+    print(f"✨ 本地 SQL 資料庫已更新：{db_file} ({time.perf_counter() - start:.2f} 秒)")
+
 
 if __name__ == "__main__":
-    init_sql_database()
\ No newline at end of file
+    init_sql_database()
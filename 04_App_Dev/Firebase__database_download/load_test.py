@@ -0,0 +1,451 @@
+import argparse
+import json
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+from dotenv import load_dotenv
+
+from dashboard_data import DashboardData
+from fake_firestore import FakeClient
+from firebase_client import get_db, increment, server_timestamp
+from json_to_sql import init_sql_database
+from push_sql_to_cloud import BATCH_LIMIT, commit_ops_with_backoff, push_sql_to_cloud
+from sync_engine import sync
+
+# 1. 載入環境變數
+load_dotenv()
+
+
+# 🚩 演習重點：商品目錄與 json_to_sql.py 一樣從 .env 的 BASE_SAVE_PATH 讀取
+BASE_PATH = os.getenv('BASE_SAVE_PATH', r'D:\product_recognition\04_App_Dev\Firebase__database_download')
+PRODUCTS_JSON = os.path.join(BASE_PATH, 'products.json')
+
+# ==========================================
+# 尖峰時段壓力測試 (結帳 + 同步 + 後台同時進行)
+# ==========================================
+# 以 products.json 的商品產生擬真的銷售 (熱門商品 Zipf 分布、大多數購物籃 1~3 項)，
+# 分階段提高每秒銷售數，每個階段同時跑：
+#   - 多台收銀機：與 App 的 _syncTransactionToCloud 相同，一個 WriteBatch = 每項商品 FieldValue.increment(-qty)
+#     + 一筆 sales (timestamp 為 serverTimestamp)；依排程時間開放迴圈送出，後端變慢時排隊時間會反映在 response
+#   - sync_engine.py 定期雙向同步到本地 SQLite 鏡像：量測每次同步耗時，以及銷售 commit 到出現在本地的延遲
+#   - admin_dashboard.py 的資料層 (dashboard_data.py)：每次輪詢前讓銷售快取失效 (尖峰時每次都有新單)，
+#     量測總額 / 第一頁 / 今日彙總的查詢時間
+# 開始前以 json_to_sql.py 匯入商品與歷史銷售、push_sql_to_cloud.py 推上雲端，兩者的耗時也列入報告；
+# 結束後檢查雲端庫存 = 初始庫存 - 售出量、本地庫存與銷售筆數和雲端一致。
+# 預設使用記憶體中的 fake_firestore，完全離線；--cloud env 則依 firebase_client.py 使用模擬器或 FIRESTORE_FAKE 檔案
+# (為了安全，不允許對正式 Firestore 壓測)。
+# 用法：python load_test.py [--stages 5,10,20,40] [--seconds 10] [--out report.json] [--baseline 上次的 report.json]
+# 與 baseline 相比 p95 變慢超過 TOLERANCE 倍 (或資料不一致) 時以非 0 結束，可以放進 CI 抓效能退化。
+
+STAGES = (5, 10, 20, 40)    # 每個階段的目標銷售數 / 秒
+STAGE_SECONDS = 10
+COUNTERS = 4                # 同時結帳的收銀機數
+SYNC_INTERVAL = 2.0         # 秒
+POLL_INTERVAL = 1.0         # 秒
+HISTORY_SALES = 5000        # 開始前匯入的歷史銷售
+HISTORY_DAYS = 30
+ZIPF_S = 1.1                # 商品熱門程度的 Zipf 指數
+MEAN_EXTRA_ITEMS = 0.8      # 購物籃品項數 = 1 + 指數分布 (平均約 1.8 項)
+MAX_ITEMS = 8
+QTY_CHOICES = (1, 1, 1, 1, 2, 2, 3)
+# 台灣時間每小時的來客比例 (歷史銷售的時間分布)
+HOUR_WEIGHTS = (1, 1, 0, 0, 0, 0, 1, 3, 5, 4, 4, 5, 8, 7, 5, 5, 6, 8, 10, 9, 7, 5, 3, 2)
+LOCAL_TZ = timezone(timedelta(hours=8))
+
+TOLERANCE = 1.5             # 與 baseline 比較：p95 超過 baseline x TOLERANCE + SLACK_MS 視為退化
+SLACK_MS = 5.0
+GATED_METRICS = ('commit_ms', 'sync_lag_ms', 'sync_ms', 'dashboard_totals_ms', 'dashboard_page_ms',
+                 'dashboard_rollup_ms')
+
+
+# ------------------------------------------
+# 銷售產生器
+# ------------------------------------------
+
+def load_catalog(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        rows = json.load(f)
+    return [p for p in rows if p.get('id') and p.get('name') and isinstance(p.get('price'), (int, float))]
+
+
+class SaleGenerator:
+    """每台收銀機一個 (random.Random 不共用，結果可用 seed 重現)"""
+
+    def __init__(self, products, seed=None):
+        self.rng = random.Random(seed)
+        # 熱門順序也由 seed 決定：第 k 名的權重為 1 / k^ZIPF_S
+        self.products = sorted(products, key=lambda p: p['id'])
+        random.Random(0 if seed is None else seed // 1000).shuffle(self.products)
+        self.weights = [1 / (rank + 1) ** ZIPF_S for rank in range(len(self.products))]
+
+    def cart(self):
+        n = min(MAX_ITEMS, 1 + int(self.rng.expovariate(1 / MEAN_EXTRA_ITEMS)))
+        merged = {}
+        for p in self.rng.choices(self.products, self.weights, k=n):
+            item = merged.setdefault(p['id'], {'id': p['id'], 'name': p['name'], 'price': p['price'], 'qty': 0})
+            item['qty'] += self.rng.choice(QTY_CHOICES)
+        return list(merged.values())
+
+    def history_time(self, now, days=HISTORY_DAYS):
+        """過去 days 天內、依 HOUR_WEIGHTS 分布的時間 (UTC)"""
+        day = (now.astimezone(LOCAL_TZ) - timedelta(days=self.rng.randrange(days))).date()
+        hour = self.rng.choices(range(24), HOUR_WEIGHTS)[0]
+        local = datetime(day.year, day.month, day.day, hour, self.rng.randrange(60), self.rng.randrange(60),
+                         self.rng.randrange(1000) * 1000, tzinfo=LOCAL_TZ)
+        return min(local, now - timedelta(minutes=1)).astimezone(timezone.utc)
+
+
+def sale_doc(cart, timestamp):
+    """與 App 寫入的 sales 文件相同的欄位"""
+    return {'timestamp': timestamp,
+            'total_amount': sum(i['price'] * i['qty'] for i in cart),
+            'items': [{'name': i['name'], 'qty': i['qty'], 'price': i['price']} for i in cart]}
+
+
+def checkout(db, cart):
+    """模擬 App 結帳：同一個 WriteBatch 扣庫存 (increment) 並寫入銷售，回傳銷售的文件 id"""
+    batch = db.batch()
+    for item in cart:
+        batch.update(db.collection('products').document(item['id']), {'stock': increment(db, -item['qty'])})
+    ref = db.collection('sales').document()
+    batch.set(ref, sale_doc(cart, server_timestamp(db)))
+    batch.commit()
+    return ref.id
+
+
+# ------------------------------------------
+# 量測
+# ------------------------------------------
+
+def _pct(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {}
+        self.errors = Counter()
+
+    def add(self, name, value):
+        with self._lock:
+            self.samples.setdefault(name, []).append(value)
+
+    def error(self, name, exc=None):
+        with self._lock:
+            self.errors[f"{name}: {type(exc).__name__}" if exc is not None else name] += 1
+
+    def summary(self):
+        with self._lock:
+            return {name: {'n': len(v), 'p50': round(_pct(v, 50), 2), 'p95': round(_pct(v, 95), 2),
+                           'p99': round(_pct(v, 99), 2), 'max': round(max(v), 2)}
+                    for name, v in sorted(self.samples.items()) if v}
+
+
+# ------------------------------------------
+# 準備：匯入商品與歷史銷售 (json_to_sql.py)、推上雲端 (push_sql_to_cloud.py)、第一次完整同步
+# ------------------------------------------
+
+def prepare(db, workdir, catalog, history, seed=None):
+    products_json = os.path.join(workdir, 'products.json')
+    sales_json = os.path.join(workdir, 'sales.json')
+    db_file = os.path.join(workdir, 'grocery_system.db')
+    gen = SaleGenerator(catalog, seed)
+    now = datetime.now(timezone.utc)
+
+    sales = []
+    for i in range(history):
+        sale = sale_doc(gen.cart(), gen.history_time(now))
+        sale['id'] = f"history_{i:07d}"
+        sales.append(sale)
+    with open(products_json, 'w', encoding='utf-8') as f:
+        json.dump(catalog, f, ensure_ascii=False)
+    with open(sales_json, 'w', encoding='utf-8') as f:
+        json.dump([dict(s, timestamp=s['timestamp'].isoformat()) for s in sales], f, ensure_ascii=False)
+
+    timings = {}
+    start = time.perf_counter()
+    init_sql_database(db_file, products_json, sales_json, os.path.join(workdir, 'sales.jsonl'))
+    timings['json_to_sql_s'] = round(time.perf_counter() - start, 3)
+
+    start = time.perf_counter()
+    push_sql_to_cloud(db=db, db_file=db_file, full=True)
+    timings['push_sql_to_cloud_s'] = round(time.perf_counter() - start, 3)
+
+    # 歷史銷售直接寫進雲端 (timestamp 為 Timestamp 型別，與 App 相同)，不列入計時
+    for i in range(0, len(sales), BATCH_LIMIT):
+        commit_ops_with_backoff(db, [('set', 'sales', s['id'], {k: v for k, v in s.items() if k != 'id'})
+                                     for s in sales[i:i + BATCH_LIMIT]])
+
+    start = time.perf_counter()
+    sync(db=db, db_file=db_file)
+    timings['initial_sync_s'] = round(time.perf_counter() - start, 3)
+    return db_file, timings
+
+
+# ------------------------------------------
+# 一個階段：收銀機 + 同步 + 後台同時進行
+# ------------------------------------------
+
+def run_stage(db, db_file, dashboard, generators, rate, seconds, sold,
+              sync_interval=SYNC_INTERVAL, poll_interval=POLL_INTERVAL):
+    rec = Recorder()
+    pending = {}   # 銷售 id -> commit 完成時間 (尚未出現在本地鏡像)
+    lock = threading.Lock()
+    stop = threading.Event()
+    start = time.perf_counter()
+    deadline = start + seconds
+
+    def counter(gen):
+        per_counter = rate / len(generators)
+        scheduled = time.perf_counter()
+        while True:
+            # 卜瓦松到達：依排程時間送出，不因前一筆變慢而延後 (否則會低估尖峰時的等待)
+            scheduled += gen.rng.expovariate(per_counter)
+            if scheduled >= deadline:
+                return
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            cart = gen.cart()
+            sent = time.perf_counter()
+            try:
+                sale_id = checkout(db, cart)
+            except Exception as e:
+                rec.error('checkout', e)
+                continue
+            done = time.perf_counter()
+            rec.add('commit_ms', (done - sent) * 1000)
+            rec.add('response_ms', (done - scheduled) * 1000)
+            with lock:
+                pending[sale_id] = done
+                for item in cart:
+                    sold[item['id']] += item['qty']
+
+    def run_sync():
+        sync_start = time.perf_counter()
+        try:
+            sync(db=db, db_file=db_file)
+        except Exception as e:
+            rec.error('sync', e)
+            return
+        done = time.perf_counter()
+        rec.add('sync_ms', (done - sync_start) * 1000)
+        with lock:
+            ids = list(pending)
+        conn = sqlite3.connect(db_file)
+        try:
+            arrived = []
+            for i in range(0, len(ids), 500):
+                chunk = ids[i:i + 500]
+                arrived += [r[0] for r in conn.execute(
+                    f"SELECT id FROM sales WHERE id IN ({','.join('?' * len(chunk))})", chunk)]
+        finally:
+            conn.close()
+        with lock:
+            for sale_id in arrived:
+                rec.add('sync_lag_ms', (done - pending.pop(sale_id)) * 1000)
+
+    def syncer():
+        while not stop.is_set():
+            run_sync()
+            stop.wait(sync_interval)
+
+    def poller():
+        queries = (('totals', dashboard.sales_totals), ('page', dashboard.sales_page),
+                   ('rollup', dashboard.rollup_summary))
+        while not stop.is_set():
+            dashboard.cache.invalidate('sales')
+            for name, query in queries:
+                t0 = time.perf_counter()
+                try:
+                    query()
+                except Exception as e:
+                    rec.error(f'dashboard_{name}', e)
+                    continue
+                rec.add(f'dashboard_{name}_ms', (time.perf_counter() - t0) * 1000)
+            stop.wait(poll_interval)
+
+    counters = [threading.Thread(target=counter, args=(g,), daemon=True) for g in generators]
+    background = [threading.Thread(target=syncer, daemon=True), threading.Thread(target=poller, daemon=True)]
+    for t in counters + background:
+        t.start()
+    for t in counters:
+        t.join()
+    elapsed = time.perf_counter() - start
+    stop.set()
+    for t in background:
+        t.join()
+
+    # 收尾：再同步一次，這個階段的銷售都應該已經到本地
+    run_sync()
+    if pending:
+        rec.errors['not_synced'] += len(pending)
+
+    commits = len(rec.samples.get('commit_ms', []))
+    return {'rate': rate, 'seconds': seconds, 'sales': commits, 'achieved_rate': round(commits / elapsed, 2),
+            'metrics': rec.summary(), 'errors': dict(rec.errors)}
+
+
+# ------------------------------------------
+# 結束後的一致性檢查
+# ------------------------------------------
+
+def check_consistency(db, db_file, initial_stock, sold):
+    problems = []
+    cloud = {doc.id: doc.to_dict().get('stock') for doc in db.collection('products').stream()}
+    conn = sqlite3.connect(db_file)
+    try:
+        local = dict(conn.execute("SELECT id, stock FROM products"))
+        local_sales = conn.execute("SELECT COUNT(*) FROM sales").fetchone()[0]
+    finally:
+        conn.close()
+    for product_id, stock in sorted(initial_stock.items()):
+        expected = stock - sold.get(product_id, 0)
+        if cloud.get(product_id) != expected:
+            problems.append(f"雲端 {product_id} 庫存 {cloud.get(product_id)}，應為 {expected}")
+        if local.get(product_id) != cloud.get(product_id):
+            problems.append(f"本地 {product_id} 庫存 {local.get(product_id)}，雲端為 {cloud.get(product_id)}")
+    cloud_sales = db.collection('sales').count(alias='count').get()[0][0].value
+    if local_sales != cloud_sales:
+        problems.append(f"本地銷售 {local_sales} 筆，雲端 {cloud_sales} 筆")
+    return problems
+
+
+def compare_with_baseline(report, baseline, tolerance=TOLERANCE):
+    """依目標速率對應階段，比較 GATED_METRICS 的 p95；回傳退化項目"""
+    regressions = []
+    before = {s['rate']: s for s in baseline.get('stages', [])}
+    for stage in report['stages']:
+        old = before.get(stage['rate'])
+        if old is None:
+            continue
+        for name in GATED_METRICS:
+            a, b = old['metrics'].get(name), stage['metrics'].get(name)
+            if a and b and b['p95'] > a['p95'] * tolerance + SLACK_MS:
+                regressions.append(f"{stage['rate']}/s {name} p95 {a['p95']:.1f} -> {b['p95']:.1f} ms")
+    return regressions
+
+
+def _p95(stage, name):
+    m = stage['metrics'].get(name)
+    return f"{m['p95']:.1f}" if m else "-"
+
+
+def print_report(report):
+    setup = report['setup']
+    print(f"\n📦 準備：json_to_sql {setup['json_to_sql_s']} 秒 | push_sql_to_cloud {setup['push_sql_to_cloud_s']} 秒 | "
+          f"首次同步 {setup['initial_sync_s']} 秒 ({report['config']['history']} 筆歷史銷售)")
+    print(f"{'目標/s':>7} {'實際/s':>7} {'累積銷售':>8} | {'commit p50/p95':>15} {'response p95':>12} | "
+          f"{'同步 p95':>9} {'延遲 p95':>9} | {'後台 總額/分頁/彙總 p95 (ms)':>24} | 錯誤")
+    for s in report['stages']:
+        commit = s['metrics'].get('commit_ms')
+        commit_text = f"{commit['p50']:.1f}/{commit['p95']:.1f}" if commit else "-"
+        dash = "/".join(_p95(s, f'dashboard_{n}_ms') for n in ('totals', 'page', 'rollup'))
+        errors = ", ".join(f"{k} x{v}" for k, v in s['errors'].items()) or "無"
+        print(f"{s['rate']:>7} {s['achieved_rate']:>7} {s['volume']:>8} | {commit_text:>15} "
+              f"{_p95(s, 'response_ms'):>12} | {_p95(s, 'sync_ms'):>9} {_p95(s, 'sync_lag_ms'):>9} | "
+              f"{dash:>24} | {errors}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="結帳 + 同步 + 後台的尖峰時段壓力測試 (預設完全離線)")
+    parser.add_argument('--products', default=PRODUCTS_JSON, help="商品目錄 (products.json)")
+    parser.add_argument('--stages', default=",".join(str(r) for r in STAGES), help="各階段每秒銷售數，以逗號分隔")
+    parser.add_argument('--seconds', type=float, default=STAGE_SECONDS, help="每個階段的秒數")
+    parser.add_argument('--counters', type=int, default=COUNTERS, help="同時結帳的收銀機數")
+    parser.add_argument('--history', type=int, default=HISTORY_SALES, help="開始前匯入的歷史銷售筆數")
+    parser.add_argument('--sync-interval', type=float, default=SYNC_INTERVAL)
+    parser.add_argument('--poll-interval', type=float, default=POLL_INTERVAL)
+    parser.add_argument('--dashboard', choices=('firestore', 'sqlite'), default='firestore',
+                        help="後台資料來源 (同 DASHBOARD_BACKEND)")
+    parser.add_argument('--cloud', choices=('fake', 'env'), default='fake',
+                        help="fake = 記憶體中的 fake_firestore；env = 依 FIRESTORE_EMULATOR_HOST / FIRESTORE_FAKE")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--workdir', help="SQLite 與匯入檔的資料夾 (預設為暫存資料夾，結束後刪除)")
+    parser.add_argument('--out', help="報告輸出 (JSON)")
+    parser.add_argument('--baseline', help="上一次的報告，p95 退化時以非 0 結束")
+    args = parser.parse_args()
+
+    if args.cloud == 'env':
+        if not (os.getenv('FIRESTORE_EMULATOR_HOST') or os.getenv('FIRESTORE_FAKE')):
+            print("❌ --cloud env 需要 FIRESTORE_EMULATOR_HOST 或 FIRESTORE_FAKE，不對正式 Firestore 壓測")
+            sys.exit(1)
+        db = get_db()
+    else:
+        db = FakeClient()
+
+    catalog = load_catalog(args.products)
+    if not catalog:
+        print(f"❌ {args.products} 沒有可用的商品")
+        sys.exit(1)
+    stages = [float(r) for r in args.stages.split(',') if r.strip()]
+    workdir = args.workdir or tempfile.mkdtemp(prefix='load_test_')
+    os.makedirs(workdir, exist_ok=True)
+
+    try:
+        db_file, setup = prepare(db, workdir, catalog, args.history, args.seed)
+        initial_stock = {p['id']: p.get('stock', 0) for p in catalog}
+        sold = Counter()
+        dashboard = DashboardData(backend=args.dashboard, db=db, db_file=db_file)
+        report = {'config': {'cloud': args.cloud, 'dashboard': args.dashboard, 'counters': args.counters,
+                             'history': args.history, 'products': len(catalog), 'seconds': args.seconds,
+                             'sync_interval': args.sync_interval, 'poll_interval': args.poll_interval},
+                  'setup': setup, 'stages': []}
+        volume = args.history
+        for i, rate in enumerate(stages):
+            print(f"🛒 階段 {i + 1}/{len(stages)}：每秒 {rate:g} 筆 x {args.seconds:g} 秒 ({args.counters} 台收銀機)")
+            generators = [SaleGenerator(catalog, args.seed * 1000 + i * 100 + c) for c in range(args.counters)]
+            stage = run_stage(db, db_file, dashboard, generators, rate, args.seconds, sold,
+                              args.sync_interval, args.poll_interval)
+            volume += stage['sales']
+            stage['volume'] = volume
+            report['stages'].append(stage)
+        report['consistency'] = check_consistency(db, db_file, initial_stock, sold)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print_report(report)
+    failed = False
+    if report['consistency']:
+        failed = True
+        print(f"❌ 資料不一致 ({len(report['consistency'])} 項)：")
+        for problem in report['consistency'][:20]:
+            print(f"   - {problem}")
+    else:
+        print("✅ 雲端 / 本地的庫存與銷售筆數一致")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        differs = [k for k, v in report['config'].items() if baseline.get('config', {}).get(k) != v]
+        if differs:
+            print(f"⚠️ baseline 的設定不同 ({', '.join(differs)})，比較結果僅供參考")
+        report['regressions'] = compare_with_baseline(report, baseline)
+        if report['regressions']:
+            failed = True
+            print("❌ 與 baseline 相比變慢：")
+            for line in report['regressions']:
+                print(f"   - {line}")
+        else:
+            print(f"✅ 與 baseline 相比沒有超過 {TOLERANCE} 倍的退化")
+
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"📝 報告已寫入 {args.out}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+import json
+import sqlite3
+from contextlib import contextmanager
+
+# ==========================================
+# 本地 SQLite：連線設定與資料表結構 (各腳本共用)
+# ==========================================
+# WAL：讀 (後台) 與寫 (匯入 / 同步) 可以同時進行，commit 不必每次都重寫整個 journal
+# sale_items：把 sales.items 的 JSON 字串拆成一列一個品項，統計單品銷量不必再逐筆解析 JSON
+
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",     # WAL 模式下斷電只會遺失最後幾筆交易，不會損毀資料庫
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-65536",      # 64 MB page cache
+    "PRAGMA mmap_size=268435456",    # 256 MB
+    "PRAGMA foreign_keys=ON",
+)
+
+SCHEMA = (
+    '''
+    CREATE TABLE IF NOT EXISTS products (
+        id TEXT PRIMARY KEY,
+        name TEXT,
+        price REAL,
+        class TEXT,       -- 對應 JSON 中的 category
+        stock INTEGER,
+        last_update TEXT  -- 對應 JSON 中的 lastUpdate
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS sales (
+        id TEXT PRIMARY KEY,
+        total_amount REAL,
+        timestamp TEXT,
+        items TEXT -- 存儲為 JSON 字串 (保留原始內容，統計請用 sale_items)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS sale_items (
+        sale_id TEXT NOT NULL REFERENCES sales(id) ON DELETE CASCADE,
+        product_name TEXT,
+        price REAL,
+        qty INTEGER
+    )
+    ''',
+    # 同步狀態 (水位等)；key = 'sync.applying' 時表示正在寫入來自雲端的資料
+    "CREATE TABLE IF NOT EXISTS sync_state (key TEXT PRIMARY KEY, value TEXT)",
+    "CREATE INDEX IF NOT EXISTS idx_sales_timestamp ON sales(timestamp)",
+    "CREATE INDEX IF NOT EXISTS idx_sale_items_product ON sale_items(product_name)",
+    "CREATE INDEX IF NOT EXISTS idx_sale_items_sale ON sale_items(sale_id)",
+)
+
+
+def connect(db_file):
+    conn = sqlite3.connect(db_file)
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+def ensure_schema(conn):
+    for statement in SCHEMA:
+        conn.execute(statement)
+    conn.commit()
+
+
+SYNC_APPLYING = 'sync.applying'
+
+
+@contextmanager
+def applying_remote(conn):
+    """
+    寫入來自雲端的資料 (下載、匯入 snapshot、後台寫回後的鏡像) 時使用：
+    sync_engine.py 的觸發器看到這個旗標就不記入 change_log，資料不會被當成本地變更再推回雲端
+    旗標與資料寫在同一個交易裡，交易失敗時一起還原
+    """
+    conn.execute("CREATE TABLE IF NOT EXISTS sync_state (key TEXT PRIMARY KEY, value TEXT)")
+    conn.execute("INSERT OR REPLACE INTO sync_state (key, value) VALUES (?, '1')", (SYNC_APPLYING,))
+    try:
+        yield
+    finally:
+        conn.execute("DELETE FROM sync_state WHERE key = ?", (SYNC_APPLYING,))
+
+
+def item_rows(sale_id, items):
+    """一筆銷售的 items -> sale_items 的列"""
+    return [(sale_id, it.get('name'), it.get('price'), it.get('qty', 1))
+            for it in items or [] if isinstance(it, dict)]
+
+
+def upsert_sales(conn, sales):
+    """
+    寫入 (或覆蓋) 一批銷售與其品項，回傳品項數
+    同一筆銷售重複寫入時，先刪除舊品項再插入 (sales_rollup 的觸發器會據此扣回 / 加上彙總)
+    """
+    rows = [(s.get('id'), s.get('total_amount'), s.get('timestamp'),
+             json.dumps(s.get('items', []), ensure_ascii=False)) for s in sales]
+    conn.executemany('''
+        INSERT INTO sales (id, total_amount, timestamp, items) VALUES (?, ?, ?, ?)
+        ON CONFLICT(id) DO UPDATE SET
+            total_amount = excluded.total_amount, timestamp = excluded.timestamp, items = excluded.items
+    ''', rows)
+    conn.executemany("DELETE FROM sale_items WHERE sale_id = ?", [(r[0],) for r in rows])
+    lines = [row for s in sales for row in item_rows(s.get('id'), s.get('items'))]
+    conn.executemany("INSERT INTO sale_items (sale_id, product_name, price, qty) VALUES (?, ?, ?, ?)", lines)
+    return len(lines)
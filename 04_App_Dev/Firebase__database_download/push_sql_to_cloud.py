@@ -1,77 +1,201 @@
-import sqlite3
-import firebase_admin
-from firebase_admin import credentials, firestore
 import os
+import random
+import sqlite3
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
 from dotenv import load_dotenv
 
+from firebase_client import get_db
+
 # 1. 載入環境變數
 load_dotenv()
 
 
-# 🚩 演習重點：從環境變數讀取金鑰路徑與資料庫路徑
-SERVICE_ACCOUNT_PATH = os.getenv('FIREBASE_KEY_PATH', r"D:\product_recognition\04_App_Dev\serviceAccountKey.json")
+# 🚩 演習重點：從環境變數讀取資料庫路徑 (金鑰與模擬器設定在 firebase_client.py)
 DB_FILE = os.getenv('DB_PATH', r'D:\product_recognition\04_App_Dev\Firebase__database_download\grocery_system.db')
 
+# ==========================================
+# 批次同步設定
+# ==========================================
+# 每個 WriteBatch 最多 500 筆 (Firestore 單次 commit 上限)，多個 batch 以有限的執行緒同時送出；
+# 只推送 last_update 不早於上次成功同步的商品 (水位記在 SQLite 的 sync_state 表)：
+# 用 >= 而不是 >，與水位同一時間戳記、但在上次推送之後才寫入的商品也會送出 (merge 重送同一筆沒有副作用)。
+# 本地修改商品時要一併更新 last_update (用 update_product())；沒有 last_update 的舊資料推送前會補上時間。
+# 全店調價 1000 項商品 = 2 次 commit，而不是 1000 次 round trip。
+# 注意：這裡推送的是庫存絕對值，會蓋掉收銀機在這之後扣的庫存；雙向同步請改用 sync_engine.py (以增量推送庫存)。
+BATCH_LIMIT = 500
+MAX_WORKERS = 4
+MAX_RETRIES = 5
+BASE_DELAY = 0.5   # 秒，每次重試加倍並加上隨機抖動
+WATERMARK_KEY = 'products.last_update'
+
+# 可以重試的暫時性錯誤 (google.api_core.exceptions 的類別名稱；fake_firestore 也使用相同名稱)
+RETRYABLE_ERRORS = {'ServiceUnavailable', 'DeadlineExceeded', 'Aborted', 'ResourceExhausted',
+                    'InternalServerError', 'TooManyRequests', 'GatewayTimeout'}
+
+
+def ensure_sync_state(conn):
+    conn.execute("CREATE TABLE IF NOT EXISTS sync_state (key TEXT PRIMARY KEY, value TEXT)")
+
+
+def get_watermark(conn, key=WATERMARK_KEY):
+    ensure_sync_state(conn)
+    row = conn.execute("SELECT value FROM sync_state WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else None
+
+
+def set_watermark(conn, value, key=WATERMARK_KEY):
+    ensure_sync_state(conn)
+    conn.execute("INSERT OR REPLACE INTO sync_state (key, value) VALUES (?, ?)", (key, value))
+    conn.commit()
+
+
+def commit_with_backoff(db, collection, docs, max_retries=MAX_RETRIES, base_delay=BASE_DELAY):
+    """
+    以一個 WriteBatch 寫入 docs [(doc_id, data), ...]，暫時性錯誤時指數退避重試
+    回傳重試次數；不可重試的錯誤或超過次數時丟出例外
+    """
+    # set(merge=True)：不覆蓋雲端其他可能存在的自定義欄位
+    return commit_ops_with_backoff(db, [('merge', collection, doc_id, data) for doc_id, data in docs],
+                                   max_retries, base_delay)
+
+
+def commit_ops_with_backoff(db, ops, max_retries=MAX_RETRIES, base_delay=BASE_DELAY):
+    """
+    ops: [(kind, collection, doc_id, data), ...]，kind 為 merge (set merge=True) / set / delete，最多 500 筆
+    整批放進一個 WriteBatch；暫時性錯誤時指數退避重試，回傳重試次數
+    """
+    for attempt in range(max_retries + 1):
+        batch = db.batch()
+        for kind, collection, doc_id, data in ops:
+            ref = db.collection(collection).document(doc_id)
+            if kind == 'delete':
+                batch.delete(ref)
+            else:
+                batch.set(ref, data, merge=kind == 'merge')
+        try:
+            batch.commit()
+            return attempt
+        except Exception as e:
+            if type(e).__name__ not in RETRYABLE_ERRORS or attempt == max_retries:
+                raise
+            delay = min(base_delay * 2 ** attempt, 30) * (0.5 + random.random())
+            print(f"⏳ 第 {attempt + 1} 次重試 ({type(e).__name__})，等待 {delay:.1f} 秒")
+            time.sleep(delay)
+
 
-# 2. 初始化 Firebase
-if not firebase_admin._apps:
-    if SERVICE_ACCOUNT_PATH and os.path.exists(SERVICE_ACCOUNT_PATH):
-        # 🚩 修正：確保使用變數而非硬編碼字串
-        cred = credentials.Certificate(SERVICE_ACCOUNT_PATH)
-        firebase_admin.initialize_app(cred)
-    else:
-        print(f"❌ 錯誤：找不到金鑰檔案 {SERVICE_ACCOUNT_PATH}")
-        exit()
-
-        
-db = firestore.client()
-
-def push_sql_to_cloud():
-    if not os.path.exists(DB_FILE):
-        print(f"❌ 錯誤：找不到資料庫檔案 {DB_FILE}")
-        return
-
-    # 連結本地 SQL
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    
+def _now_iso():
+    return datetime.now(timezone.utc).isoformat()
+
+
+def update_product(conn, product_id, **fields):
+    """
+    本地修改商品並蓋上 last_update，下次推送才會帶上這筆
+    fields 使用 SQLite 欄位名稱 (name / price / class / stock)
+    """
+    columns = [f"{name} = ?" for name in fields] + ["last_update = ?"]
+    conn.execute(f"UPDATE products SET {', '.join(columns)} WHERE id = ?",
+                 list(fields.values()) + [_now_iso(), product_id])
+
+
+def _to_doc(row):
+    p_id, name, price, p_class, stock, last_update = row
+    # SQL 的 'class' 對應回 Firebase 的 'category'，'last_update' 對應回 'lastUpdate'
+    return p_id, {
+        'id': p_id,
+        'name': name,
+        'price': price,
+        'category': p_class,
+        'stock': stock,
+        'lastUpdate': last_update,
+    }
+
+
+def _safe_watermark(chunks, ok, old):
+    """
+    batch 可能不依順序完成：水位只能推進到「第一個失敗 batch 之前」，
+    而且不能超過失敗 batch 中最早的 last_update (查詢用 >=，等於水位的商品下次會重送)
+    """
+    failed = [i for i, success in enumerate(ok) if not success]
+    if not failed:
+        stamps = [r[5] for chunk in chunks for r in chunk if r[5]]
+        return max(stamps) if stamps else old
+    limit = min(r[5] for r in chunks[failed[0]] if r[5]) if any(r[5] for r in chunks[failed[0]]) else None
+    stamps = [r[5] for chunk in chunks[:failed[0]] for r in chunk
+              if r[5] and (limit is None or r[5] <= limit)]
+    return max(stamps) if stamps else old
+
+
+def push_sql_to_cloud(db=None, db_file=DB_FILE, full=False, chunk_size=BATCH_LIMIT,
+                      workers=MAX_WORKERS, max_retries=MAX_RETRIES):
+    """
+    把本地 SQL 的商品推送到 Firestore products 集合
+    full=True 時忽略水位，全部重新推送
+    回傳統計 dict
+    """
+    if not os.path.exists(db_file):
+        print(f"❌ 錯誤：找不到資料庫檔案 {db_file}")
+        return None
+
+    start = time.perf_counter()
+    conn = sqlite3.connect(db_file)
     try:
-        # 讀取本地所有的產品資料
+        watermark = None if full else get_watermark(conn)
+        # 沒有 last_update 的商品 (舊資料或直接改 SQL 新增的) 補上時間，之後才能依水位增量推送
+        with conn:
+            conn.execute("UPDATE products SET last_update = ? WHERE last_update IS NULL", (_now_iso(),))
+        # 讀取水位之後有更動的產品資料 (依 last_update 排序，水位才能安全推進)
         print("🔍 正在讀取本地 SQL 資料...")
-        cursor.execute("SELECT id, name, price, class, stock, last_update FROM products")
-        rows = cursor.fetchall()
-        
+        if watermark is None:
+            rows = conn.execute("SELECT id, name, price, class, stock, last_update FROM products "
+                                "WHERE id IS NOT NULL ORDER BY last_update").fetchall()
+        else:
+            rows = conn.execute("SELECT id, name, price, class, stock, last_update FROM products "
+                                "WHERE id IS NOT NULL AND last_update >= ? ORDER BY last_update",
+                                (watermark,)).fetchall()
+
+        stats = {'rows': len(rows), 'batches': 0, 'retries': 0, 'failed': 0, 'watermark': watermark}
         if not rows:
-            print("⚠️ SQL 資料庫中沒有產品資料。")
-            return
-
-        print(f"🚀 開始同步 {len(rows)} 筆資料至 Firebase...")
-        
-        for row in rows:
-            p_id, name, price, p_class, stock, last_update = row
-            
-            # 準備上傳的資料字典
-            # 這裡將 SQL 的 'class' 對應回 Firebase 的 'category'
-            # 將 SQL 的 'last_update' 對應回 Firebase 的 'lastUpdate'
-            doc_data = {
-                'id': p_id,
-                'name': name,
-                'price': price,
-                'category': p_class,
-                'stock': stock,
-                'lastUpdate': last_update
-            }
-            
-            # 執行同步：使用 set(merge=True) 以免覆蓋掉雲端其他可能存在的自定義欄位
-            db.collection('products').document(p_id).set(doc_data, merge=True)
-            print(f"✅ 同步成功：{name} ({p_id})")
-            
-        print("\n✨ 所有本地更動已成功推播至雲端 Firebase！")
-
-    except Exception as e:
-        print(f"❌ 同步過程中發生錯誤：{e}")
+            print(f"✅ 沒有需要同步的商品 (水位：{watermark or '無'})")
+            return stats
+
+        db = db or get_db()
+        chunks = [rows[i:i + chunk_size] for i in range(0, len(rows), chunk_size)]
+        print(f"🚀 開始同步 {len(rows)} 筆資料至 Firebase ({len(chunks)} 個 batch，最多 {workers} 個同時送出)...")
+
+        ok = [False] * len(chunks)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(commit_with_backoff, db, 'products', [_to_doc(r) for r in chunk], max_retries)
+                       for chunk in chunks]
+            for i, fut in enumerate(futures):
+                try:
+                    stats['retries'] += fut.result()
+                    ok[i] = True
+                    stats['batches'] += 1
+                except Exception as e:
+                    stats['failed'] += len(chunks[i])
+                    print(f"❌ 第 {i + 1} 個 batch 同步失敗 ({len(chunks[i])} 筆)：{e}")
+
+        new_watermark = _safe_watermark(chunks, ok, watermark)
+        if new_watermark != watermark:
+            set_watermark(conn, new_watermark)
+        stats['watermark'] = new_watermark
+        stats['seconds'] = round(time.perf_counter() - start, 3)
+
+        if stats['failed']:
+            print(f"⚠️ {stats['failed']} 筆未同步，下次執行會從水位 {new_watermark or '起點'} 重新推送")
+        else:
+            print(f"\n✨ {len(rows)} 筆本地更動已推播至雲端 Firebase "
+                  f"({stats['batches']} 次 commit，重試 {stats['retries']} 次，{stats['seconds']} 秒)")
+        return stats
     finally:
         conn.close()
 
+
 if __name__ == "__main__":
-    push_sql_to_cloud()
\ No newline at end of file
+    # 用法：python push_sql_to_cloud.py [--full]
+    # 離線測試：FIRESTORE_FAKE=fake_cloud.json python push_sql_to_cloud.py
+    push_sql_to_cloud(full='--full' in sys.argv)
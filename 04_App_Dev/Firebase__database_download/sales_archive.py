@@ -0,0 +1,416 @@
+import argparse
+import json
+import os
+import sqlite3
+import time
+import uuid
+from datetime import date, datetime, timezone
+
+from dotenv import load_dotenv
+
+from json_stream import iter_json_array, iter_jsonl
+from push_sql_to_cloud import get_watermark, set_watermark
+from sales_rollup import LOCAL_TZ
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:   # 只有匯出 / 查詢封存時才需要
+    pa = None
+
+# 1. 載入環境變數
+load_dotenv()
+
+
+# 🚩 演習重點：不將絕對路徑寫死，透過 .env 讀取基礎目錄
+BASE_PATH = os.getenv('BASE_SAVE_PATH', r'D:\product_recognition\04_App_Dev\Firebase__database_download')
+DB_FILE = os.getenv('DB_PATH', os.path.join(BASE_PATH, "grocery_system.db"))
+ARCHIVE_DIR = os.getenv('SALES_ARCHIVE_PATH', os.path.join(BASE_PATH, 'sales_archive'))
+
+# ==========================================
+# 銷售封存 (Parquet，依日期分區)
+# ==========================================
+# 長期分析 (年增率、單品趨勢) 不適合讀 sales.json 或 SQLite 的 items JSON 字串：
+#   sales_archive/sales/date=YYYY-MM-DD/part-*.parquet       一筆銷售一列 (id, timestamp, total_amount, item_count)
+#   sales_archive/sale_items/date=YYYY-MM-DD/part-*.parquet  一個品項一列 (sale_id, timestamp, product_name, price, qty)
+# date 為台灣時間的日期 (與 sales_rollup.py 相同)；Hive 分區格式，pyarrow / pandas / DuckDB 都能直接讀。
+#   - 匯出：從 SQLite 依 rowid 水位匯出新的銷售，加上 archive_pending (觸發器記下的已修改銷售) 重新匯出；
+#     或直接吃 Cloud pullback.py 的 sales.json / sales.jsonl (依 timestamp 水位，記在封存資料夾的 export_state.json)
+#     每次匯出在各分區新增一個 part 檔，匯出後立刻合併這次寫到的分區
+#   - compaction：把同一分區的多個小檔合併成一個，同一筆銷售出現多次時以最後匯出的為準
+#   - 查詢：依日期只打開範圍內的分區 (partition pruning)，只讀需要的欄位，逐批 (RecordBatch) 處理；
+#     分區裡有多個檔案 (合併前中斷) 時先去除重複再計算，同一筆銷售不會被算兩次
+#     掃一整年的記憶體用量與單一分區大小有關，與資料總量無關
+# 銷售時間被改到別天時，舊分區的那一份不會被移除 (需要時刪掉封存以 --full 重新匯出)。
+
+ROWID_KEY = 'archive.sales.rowid'
+STATE_FILE = 'export_state.json'   # JSON 來源的 timestamp 水位 (放在封存資料夾)
+BATCH_ROWS = 50000   # 每次從 SQLite 讀取 / 查詢時每批的列數
+
+# 已匯出的銷售被修改時 (upsert_sales 的 ON CONFLICT DO UPDATE 不會改變 rowid)，記下來下次重新匯出
+PENDING_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS archive_pending (seq INTEGER PRIMARY KEY AUTOINCREMENT, sale_id TEXT NOT NULL)",
+    '''
+    CREATE TRIGGER IF NOT EXISTS archive_sales_update AFTER UPDATE OF total_amount, timestamp, items ON sales
+    WHEN NEW.total_amount IS NOT OLD.total_amount OR NEW.timestamp IS NOT OLD.timestamp OR NEW.items IS NOT OLD.items
+    BEGIN INSERT INTO archive_pending (sale_id) VALUES (NEW.id); END
+    ''',
+)
+
+SCHEMAS = {}
+if pa is not None:
+    SCHEMAS = {
+        'sales': pa.schema([('id', pa.string()), ('timestamp', pa.timestamp('us', tz='UTC')),
+                            ('total_amount', pa.float64()), ('item_count', pa.int32())]),
+        'sale_items': pa.schema([('sale_id', pa.string()), ('timestamp', pa.timestamp('us', tz='UTC')),
+                                 ('product_name', pa.string()), ('price', pa.float64()), ('qty', pa.int32())]),
+    }
+KEYS = {'sales': 'id', 'sale_items': 'sale_id'}
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise ImportError("銷售封存需要 pyarrow：pip install pyarrow")
+
+
+def _parse_time(value):
+    """ISO 字串 / datetime -> UTC datetime；沒有時區視為本機時間"""
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            return None
+    if not isinstance(value, datetime):
+        return None
+    return (value if value.tzinfo else value.astimezone()).astimezone(timezone.utc)
+
+
+def _partition_dir(archive_dir, dataset, day):
+    return os.path.join(archive_dir, dataset, f"date={day}")
+
+
+def _part_name():
+    # 檔名依寫入時間排序：compaction 以檔名順序判斷哪一份較新
+    return f"part-{datetime.now(timezone.utc).strftime('%Y%m%d%H%M%S%f')}-{uuid.uuid4().hex[:6]}.parquet"
+
+
+def _write_part(path_dir, table):
+    os.makedirs(path_dir, exist_ok=True)
+    path = os.path.join(path_dir, _part_name())
+    pq.write_table(table, path + ".tmp", compression='zstd')
+    os.replace(path + ".tmp", path)
+    return path
+
+
+# ------------------------------------------
+# 匯出
+# ------------------------------------------
+
+class _PartitionBuffer:
+    """把列依 (資料集, 日期) 暫存，flush 時每個分區寫一個 part 檔"""
+
+    def __init__(self, archive_dir):
+        self.archive_dir = archive_dir
+        self.rows = {}
+        self.files = 0
+        self.touched = set()
+        self.latest = None
+
+    def add(self, sale, since=None):
+        ts = _parse_time(sale.get('timestamp'))
+        if ts is None or (since is not None and ts < since):
+            return False
+        if self.latest is None or ts > self.latest:
+            self.latest = ts
+        day = ts.astimezone(LOCAL_TZ).date().isoformat()
+        items = [it for it in sale.get('items') or [] if isinstance(it, dict)]
+        self.rows.setdefault(('sales', day), []).append(
+            {'id': sale.get('id'), 'timestamp': ts, 'total_amount': sale.get('total_amount'),
+             'item_count': len(items)})
+        for it in items:
+            self.rows.setdefault(('sale_items', day), []).append(
+                {'sale_id': sale.get('id'), 'timestamp': ts, 'product_name': it.get('name'),
+                 'price': it.get('price'), 'qty': it.get('qty', 1)})
+        return True
+
+    def flush(self):
+        for (dataset, day), rows in self.rows.items():
+            table = pa.Table.from_pylist(rows, schema=SCHEMAS[dataset])
+            path_dir = _partition_dir(self.archive_dir, dataset, day)
+            _write_part(path_dir, table)
+            self.touched.add((path_dir, dataset))
+            self.files += 1
+        self.rows = {}
+
+    def compact_touched(self):
+        """合併這次寫到的分區 (通常只有最近幾天)，回傳合併的檔案數"""
+        return sum(compact_partition(path_dir, dataset) for path_dir, dataset in sorted(self.touched))
+
+
+def _load_state(archive_dir):
+    try:
+        with open(os.path.join(archive_dir, STATE_FILE), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_state(archive_dir, state):
+    os.makedirs(archive_dir, exist_ok=True)
+    path = os.path.join(archive_dir, STATE_FILE)
+    with open(path + ".tmp", 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def export_records(records, archive_dir=ARCHIVE_DIR, since=None):
+    """
+    匯出銷售 dict (sales.json / sales.jsonl 的格式：id、timestamp、total_amount、items)
+    since：只匯出 timestamp >= since 的銷售 (UTC datetime)；沒有時間的銷售無法分區，會略過
+    回傳 {'sales', 'files', 'merged', 'latest'}
+    """
+    _require_pyarrow()
+    buffer = _PartitionBuffer(archive_dir)
+    count = 0
+    for sale in records:
+        count += buffer.add(sale, since)
+    buffer.flush()
+    return {'sales': count, 'files': buffer.files, 'merged': buffer.compact_touched(), 'latest': buffer.latest}
+
+
+def export_json(path, archive_dir=ARCHIVE_DIR, full=False):
+    """
+    從 sales.json / sales.jsonl 匯出 timestamp 不早於水位的銷售
+    水位那一刻的銷售會再匯出一次 (同一時間可能有多筆)，合併時以新的為準，不會重複計算
+    """
+    state = _load_state(archive_dir)
+    since = None if full else _parse_time(state.get(path))
+    records = iter_jsonl(path) if path.endswith('.jsonl') else iter_json_array(path)
+    stats = export_records(records, archive_dir, since)
+    if stats['latest'] is not None:
+        state[path] = stats['latest'].isoformat()
+        _save_state(archive_dir, state)
+    return stats
+
+
+def ensure_pending(conn):
+    with conn:
+        for statement in PENDING_SCHEMA:
+            conn.execute(statement)
+
+
+def _add_sqlite_rows(conn, buffer, rows):
+    """rows: [(rowid, id, timestamp, total_amount)]；品項取自 sale_items"""
+    items = {}
+    ids = [r[1] for r in rows]
+    for i in range(0, len(ids), 900):   # SQLite 參數上限
+        chunk = ids[i:i + 900]
+        for sale_id, name, price, qty in conn.execute(
+                f"SELECT sale_id, product_name, price, qty FROM sale_items "
+                f"WHERE sale_id IN ({','.join('?' * len(chunk))})", chunk):
+            items.setdefault(sale_id, []).append({'name': name, 'price': price, 'qty': qty})
+    return sum(buffer.add({'id': sale_id, 'timestamp': ts, 'total_amount': total, 'items': items.get(sale_id, [])})
+               for _, sale_id, ts, total in rows)
+
+
+def export_from_sqlite(db_file=DB_FILE, archive_dir=ARCHIVE_DIR, full=False):
+    """
+    從 grocery_system.db 匯出 rowid 大於水位的新銷售，以及上次匯出後被修改過的銷售 (archive_pending)
+    full=True 時從頭匯出；回傳 {'sales', 'files', 'merged'}
+    """
+    _require_pyarrow()
+    conn = sqlite3.connect(db_file)
+    try:
+        ensure_pending(conn)
+        start_rowid = 0 if full else int(get_watermark(conn, ROWID_KEY) or 0)
+        pending_seq = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM archive_pending").fetchone()[0]
+        buffer = _PartitionBuffer(archive_dir)
+        count = 0
+
+        # 1. 已匯出過、之後被修改的銷售 (rowid 在水位之後的會在第 2 步匯出，不重複寫入同一個檔案)
+        edited = [r[0] for r in conn.execute("SELECT DISTINCT sale_id FROM archive_pending WHERE seq <= ?",
+                                             (pending_seq,))]
+        for i in range(0, len(edited), 900):
+            chunk = edited[i:i + 900]
+            rows = conn.execute(f"SELECT rowid, id, timestamp, total_amount FROM sales "
+                                f"WHERE rowid <= ? AND id IN ({','.join('?' * len(chunk))})",
+                                [start_rowid] + chunk).fetchall()
+            count += _add_sqlite_rows(conn, buffer, rows)
+        buffer.flush()
+
+        # 2. 新銷售
+        last = start_rowid
+        while True:
+            rows = conn.execute("SELECT rowid, id, timestamp, total_amount FROM sales WHERE rowid > ? "
+                                "ORDER BY rowid LIMIT ?", (last, BATCH_ROWS)).fetchall()
+            if not rows:
+                break
+            count += _add_sqlite_rows(conn, buffer, rows)
+            buffer.flush()
+            last = rows[-1][0]
+
+        merged = buffer.compact_touched()
+        # 檔案確實寫入後才推進水位、清除已重新匯出的紀錄 (匯出期間的新修改留到下次)
+        conn.execute("DELETE FROM archive_pending WHERE seq <= ?", (pending_seq,))
+        set_watermark(conn, str(last), ROWID_KEY)
+    finally:
+        conn.close()
+    return {'sales': count, 'files': buffer.files, 'merged': merged}
+
+
+# ------------------------------------------
+# compaction
+# ------------------------------------------
+
+def _part_files(path_dir):
+    return sorted(os.path.join(path_dir, f) for f in os.listdir(path_dir) if f.endswith('.parquet'))
+
+
+def _latest_rows(files, dataset, columns=None):
+    """
+    讀取同一分區的多個 part 檔，同一個 key 只保留最後寫入的檔案中的列
+    (只在分區內去重：銷售時間被改到別天時，舊分區的那一份不會被移除)
+    """
+    key = KEYS[dataset]
+    names = SCHEMAS[dataset].names if columns is None else list(dict.fromkeys([key] + list(columns)))
+    tables = []
+    for i, f in enumerate(files):
+        t = pq.read_table(f, columns=names, schema=SCHEMAS[dataset])
+        tables.append(t.append_column('_file', pa.array([i] * t.num_rows, pa.int32())))
+    table = pa.concat_tables(tables)
+    latest = table.group_by(key).aggregate([('_file', 'max')]).rename_columns([key, '_file'])
+    table = table.join(latest, keys=[key, '_file'], join_type='inner').drop_columns(['_file'])
+    return table.select(names if columns is None else list(columns))
+
+
+def compact_partition(path_dir, dataset):
+    """把分區內的多個 part 檔合併成一個；同一個 key 以最後寫入的檔案為準"""
+    files = _part_files(path_dir)
+    if len(files) < 2:
+        return 0
+    table = _latest_rows(files, dataset).sort_by([('timestamp', 'ascending')])
+    _write_part(path_dir, table)
+    for f in files:
+        os.remove(f)
+    return len(files)
+
+
+def compact(archive_dir=ARCHIVE_DIR, min_files=2):
+    """合併所有 part 檔數 >= min_files 的分區，回傳合併的檔案數"""
+    _require_pyarrow()
+    merged = 0
+    for dataset in SCHEMAS:
+        root = os.path.join(archive_dir, dataset)
+        if not os.path.isdir(root):
+            continue
+        for name in sorted(os.listdir(root)):
+            path_dir = os.path.join(root, name)
+            if name.startswith('date=') and len(_part_files(path_dir)) >= min_files:
+                merged += compact_partition(path_dir, dataset)
+    return merged
+
+
+# ------------------------------------------
+# 查詢
+# ------------------------------------------
+
+def partitions(archive_dir, dataset, start=None, end=None):
+    """日期範圍內 (含頭尾) 的分區目錄；只看目錄名稱，不打開檔案"""
+    root = os.path.join(archive_dir, dataset)
+    if not os.path.isdir(root):
+        return []
+    start, end = str(start) if start else None, str(end) if end else None
+    result = []
+    for name in sorted(os.listdir(root)):
+        if not name.startswith('date='):
+            continue
+        day = name[5:]
+        if (start is None or day >= start) and (end is None or day <= end):
+            result.append(os.path.join(root, name))
+    return result
+
+
+def scan(dataset='sale_items', start=None, end=None, columns=None, archive_dir=ARCHIVE_DIR, batch_size=BATCH_ROWS):
+    """
+    逐批讀取日期範圍內的封存資料 (只讀 columns 指定的欄位)，產生 pyarrow.RecordBatch
+    已合併的分區直接串流；還有多個 part 檔的分區先在記憶體中去除重複 (只放一天的資料)
+    """
+    _require_pyarrow()
+    for path_dir in partitions(archive_dir, dataset, start, end):
+        files = _part_files(path_dir)
+        if len(files) == 1:
+            source = ds.dataset(files, schema=SCHEMAS[dataset], format='parquet')
+            yield from source.to_batches(columns=columns, batch_size=batch_size)
+        elif files:
+            yield from _latest_rows(files, dataset, columns).to_batches(max_chunksize=batch_size)
+
+
+def product_totals(start=None, end=None, archive_dir=ARCHIVE_DIR):
+    """期間內各商品的銷售件數與營業額 (逐批累加，記憶體只放商品數列)"""
+    totals = {}
+    for batch in scan('sale_items', start, end, ['product_name', 'price', 'qty'], archive_dir):
+        revenue = pc.multiply(pc.fill_null(batch.column('price'), 0), pc.fill_null(batch.column('qty'), 0))
+        grouped = pa.table({'product_name': batch.column('product_name'), 'qty': batch.column('qty'),
+                            'revenue': revenue}).group_by('product_name').aggregate([('qty', 'sum'),
+                                                                                     ('revenue', 'sum')])
+        for name, qty, rev in zip(*(grouped.column(c).to_pylist() for c in ('product_name', 'qty_sum',
+                                                                            'revenue_sum'))):
+            t = totals.setdefault(name, {'qty': 0, 'revenue': 0.0})
+            t['qty'] += qty or 0
+            t['revenue'] += rev or 0
+    return totals
+
+
+def daily_revenue(start=None, end=None, archive_dir=ARCHIVE_DIR):
+    """期間內每天 (台灣時間) 的營業額與筆數：{日期: {'revenue', 'orders'}}"""
+    totals = {}
+    for part in partitions(archive_dir, 'sales', start, end):
+        day = os.path.basename(part)[5:]
+        for batch in scan('sales', day, day, ['total_amount'], archive_dir):
+            t = totals.setdefault(day, {'revenue': 0.0, 'orders': 0})
+            t['revenue'] += pc.sum(batch.column('total_amount')).as_py() or 0
+            t['orders'] += batch.num_rows
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description="銷售封存 (Parquet)：匯出、合併、查詢")
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('export', help="匯出新的銷售 (預設來源為 grocery_system.db)")
+    p.add_argument('--db', default=DB_FILE)
+    p.add_argument('--json', help="改從 sales.json 或 sales.jsonl 匯出")
+    p.add_argument('--full', action='store_true', help="忽略水位，從頭匯出")
+    sub.add_parser('compact', help="合併各分區的小檔")
+    p = sub.add_parser('report', help="期間內的熱銷商品與每日營業額")
+    p.add_argument('--start', help="YYYY-MM-DD (含)")
+    p.add_argument('--end', help="YYYY-MM-DD (含)")
+    p.add_argument('--top', type=int, default=10)
+    parser.add_argument('--archive', default=ARCHIVE_DIR)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.command == 'export':
+        if args.json:
+            stats = export_json(args.json, args.archive, args.full)
+        else:
+            stats = export_from_sqlite(args.db, args.archive, args.full)
+        print(f"✅ 匯出 {stats['sales']} 筆銷售，新增 {stats['files']} 個檔案，合併 {stats['merged']} 個小檔 "
+              f"({time.perf_counter() - start:.2f} 秒)")
+    elif args.command == 'compact':
+        print(f"🗜️ 合併了 {compact(args.archive)} 個檔案 ({time.perf_counter() - start:.2f} 秒)")
+    else:
+        days = daily_revenue(args.start, args.end, args.archive)
+        products = sorted(product_totals(args.start, args.end, args.archive).items(),
+                          key=lambda kv: kv[1]['revenue'], reverse=True)
+        revenue = sum(d['revenue'] for d in days.values())
+        orders = sum(d['orders'] for d in days.values())
+        print(f"📅 {args.start or '最早'} ~ {args.end or date.today()}：{len(days)} 天，{orders} 筆，$ {revenue:,.0f}")
+        for i, (name, t) in enumerate(products[:args.top], 1):
+            print(f"   {i:>2}. {name}  $ {t['revenue']:,.0f}  ({t['qty']} 件)")
+        print(f"⏱️ {time.perf_counter() - start:.2f} 秒")
+
+
+if __name__ == "__main__":
+    main()
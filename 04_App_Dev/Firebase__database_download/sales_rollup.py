@@ -0,0 +1,267 @@
+import argparse
+import os
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+from dotenv import load_dotenv
+
+from local_db import connect, ensure_schema
+
+# 載入環境變數
+load_dotenv()
+
+# ==========================================
+# 銷售彙總 (每小時 / 每日 / 每日單品)
+# ==========================================
+# 後台不再每次把全部銷售讀進 DataFrame 加總，改讀預先彙總好的表：
+#   rollup_hourly        (hour, revenue, orders, qty)            hour = 'YYYY-MM-DDTHH' (台灣時間)
+#   rollup_daily         (day, revenue, orders, qty)             day  = 'YYYY-MM-DD'
+#   rollup_product_daily (day, product_name, revenue, qty)
+# 彙總由 sales / sale_items 上的觸發器維護：不管是 json_to_sql.py 匯入 (含 Cloud pullback.py 的增量 journal)
+# 還是後台監聽到的新銷售，每寫入一筆只會對受影響的幾個 bucket 做一次 UPSERT 加減，不必重算。
+# 查詢「今日 / 本週 / 本月」最多讀 31 列日彙總，熱銷商品最多讀 31 天 x 商品數列，與歷史銷售筆數無關。
+#
+# 注意：revenue 以 sales.total_amount 為準 (訂單層級)；單品 revenue 為 price * qty。
+
+DB_FILE = os.getenv('DB_PATH', r'D:\product_recognition\04_App_Dev\Firebase__database_download\grocery_system.db')
+
+LOCAL_OFFSET_HOURS = 8   # 台灣沒有日光節約時間，固定 UTC+8
+LOCAL_TZ = timezone(timedelta(hours=LOCAL_OFFSET_HOURS))
+
+# SQLite 會依字串中的時區 (+00:00 / Z) 換算成 UTC，再加上 8 小時得到台灣時間的 bucket
+_SHIFT = f"'+{LOCAL_OFFSET_HOURS} hours'"
+HOUR_EXPR = "strftime('%Y-%m-%dT%H', {ts}, " + _SHIFT + ")"
+DAY_EXPR = "date({ts}, " + _SHIFT + ")"
+
+TABLES = (
+    '''
+    CREATE TABLE IF NOT EXISTS rollup_hourly (
+        hour TEXT PRIMARY KEY,
+        revenue REAL NOT NULL DEFAULT 0,
+        orders INTEGER NOT NULL DEFAULT 0,
+        qty INTEGER NOT NULL DEFAULT 0
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS rollup_daily (
+        day TEXT PRIMARY KEY,
+        revenue REAL NOT NULL DEFAULT 0,
+        orders INTEGER NOT NULL DEFAULT 0,
+        qty INTEGER NOT NULL DEFAULT 0
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS rollup_product_daily (
+        day TEXT NOT NULL,
+        product_name TEXT NOT NULL,
+        revenue REAL NOT NULL DEFAULT 0,
+        qty INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (day, product_name)
+    )
+    ''',
+)
+
+
+# ==========================================
+# 觸發器
+# ==========================================
+
+def _bump(table, keys, columns, select):
+    """把 select 的結果加到彙總表 (select 的欄位順序為 keys + columns)"""
+    updates = ", ".join(f"{c} = {c} + excluded.{c}" for c in columns)
+    return (f"INSERT INTO {table} ({', '.join(keys + columns)}) {select} "
+            f"ON CONFLICT({', '.join(keys)}) DO UPDATE SET {updates};")
+
+
+def _sale_sql(row, sign):
+    """訂單層級：營業額與筆數 (row 為 NEW / OLD)"""
+    cond = f"WHERE {row}.timestamp IS NOT NULL"
+    amount = f"{sign}COALESCE({row}.total_amount, 0), {sign}1"
+    return (_bump('rollup_hourly', ['hour'], ['revenue', 'orders'],
+                  f"SELECT {HOUR_EXPR.format(ts=row + '.timestamp')}, {amount} {cond}") +
+            _bump('rollup_daily', ['day'], ['revenue', 'orders'],
+                  f"SELECT {DAY_EXPR.format(ts=row + '.timestamp')}, {amount} {cond}"))
+
+
+def _item_sql(row, sign):
+    """品項層級：件數與單品營業額，時間取自所屬的 sales 列"""
+    source = f"FROM sales s WHERE s.id = {row}.sale_id AND s.timestamp IS NOT NULL"
+    qty = f"COALESCE({row}.qty, 0)"
+    return (_bump('rollup_hourly', ['hour'], ['qty'],
+                  f"SELECT {HOUR_EXPR.format(ts='s.timestamp')}, {sign}{qty} {source}") +
+            _bump('rollup_daily', ['day'], ['qty'],
+                  f"SELECT {DAY_EXPR.format(ts='s.timestamp')}, {sign}{qty} {source}") +
+            _bump('rollup_product_daily', ['day', 'product_name'], ['revenue', 'qty'],
+                  f"SELECT {DAY_EXPR.format(ts='s.timestamp')}, COALESCE({row}.product_name, ''), "
+                  f"{sign}COALESCE({row}.price, 0) * {qty}, {sign}{qty} {source}"))
+
+
+def _move_items_sql(ts, sign):
+    """銷售時間被修改時，把既有品項的件數從舊 bucket 搬到新 bucket"""
+    source = (f"FROM sale_items WHERE sale_id = NEW.id AND OLD.timestamp IS NOT NEW.timestamp "
+              f"AND {ts} IS NOT NULL")
+    return (_bump('rollup_hourly', ['hour'], ['qty'],
+                  f"SELECT {HOUR_EXPR.format(ts=ts)}, {sign}SUM(COALESCE(qty, 0)) {source} HAVING COUNT(*) > 0") +
+            _bump('rollup_daily', ['day'], ['qty'],
+                  f"SELECT {DAY_EXPR.format(ts=ts)}, {sign}SUM(COALESCE(qty, 0)) {source} HAVING COUNT(*) > 0") +
+            _bump('rollup_product_daily', ['day', 'product_name'], ['revenue', 'qty'],
+                  f"SELECT {DAY_EXPR.format(ts=ts)}, COALESCE(product_name, ''), "
+                  f"{sign}SUM(COALESCE(price, 0) * COALESCE(qty, 0)), {sign}SUM(COALESCE(qty, 0)) "
+                  f"{source} GROUP BY COALESCE(product_name, '')"))
+
+
+TRIGGERS = {
+    'rollup_sales_insert': f"AFTER INSERT ON sales BEGIN {_sale_sql('NEW', '')} END",
+    'rollup_sales_update': f"AFTER UPDATE OF total_amount, timestamp ON sales BEGIN "
+                           f"{_sale_sql('OLD', '-')} {_sale_sql('NEW', '')} "
+                           f"{_move_items_sql('OLD.timestamp', '-')} {_move_items_sql('NEW.timestamp', '')} END",
+    # 先刪品項 (此時 sales 列還在，品項觸發器查得到時間)，之後的 ON DELETE CASCADE 就沒有東西可刪
+    'rollup_sales_before_delete': "BEFORE DELETE ON sales BEGIN DELETE FROM sale_items WHERE sale_id = OLD.id; END",
+    'rollup_sales_delete': f"AFTER DELETE ON sales BEGIN {_sale_sql('OLD', '-')} END",
+    'rollup_items_insert': f"AFTER INSERT ON sale_items BEGIN {_item_sql('NEW', '')} END",
+    'rollup_items_delete': f"AFTER DELETE ON sale_items BEGIN {_item_sql('OLD', '-')} END",
+    'rollup_items_update': f"AFTER UPDATE ON sale_items BEGIN {_item_sql('OLD', '-')} {_item_sql('NEW', '')} END",
+}
+
+
+def _create_triggers(conn):
+    for name, body in TRIGGERS.items():
+        conn.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {body}")
+
+
+def ensure_rollups(conn):
+    """建立彙總表與觸發器；第一次建立時從現有的 sales / sale_items 重算一次"""
+    existed = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'rollup_daily'").fetchone() is not None
+    with conn:
+        for statement in TABLES:
+            conn.execute(statement)
+        _create_triggers(conn)
+        if not existed:
+            rebuild(conn)
+
+
+@contextmanager
+def bulk_load(conn):
+    """
+    大量匯入 (整份 sales.json) 時暫停觸發器，結束後一次重算
+    逐筆觸發 UPSERT 約慢一倍；重算只要一次 GROUP BY。不會 commit，與匯入同屬呼叫端的交易
+    """
+    for name in TRIGGERS:
+        conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+    try:
+        yield
+    finally:
+        _create_triggers(conn)
+    rebuild(conn)
+
+
+def rebuild(conn):
+    """從頭重算所有彙總 (成本與銷售筆數成正比)；不會 commit，請在呼叫端的交易中執行"""
+    hour, day = HOUR_EXPR.format(ts='timestamp'), DAY_EXPR.format(ts='timestamp')
+    item_hour, item_day = HOUR_EXPR.format(ts='s.timestamp'), DAY_EXPR.format(ts='s.timestamp')
+    items = "FROM sale_items i JOIN sales s ON s.id = i.sale_id WHERE s.timestamp IS NOT NULL"
+    for table in ('rollup_hourly', 'rollup_daily', 'rollup_product_daily'):
+        conn.execute(f"DELETE FROM {table}")
+    conn.execute(f"INSERT INTO rollup_hourly (hour, revenue, orders) SELECT {hour}, "
+                 f"SUM(COALESCE(total_amount, 0)), COUNT(*) FROM sales WHERE timestamp IS NOT NULL GROUP BY 1")
+    conn.execute(f"INSERT INTO rollup_daily (day, revenue, orders) SELECT {day}, "
+                 f"SUM(COALESCE(total_amount, 0)), COUNT(*) FROM sales WHERE timestamp IS NOT NULL GROUP BY 1")
+    conn.execute(_bump('rollup_hourly', ['hour'], ['qty'],
+                       f"SELECT {item_hour}, SUM(COALESCE(i.qty, 0)) {items} GROUP BY 1"))
+    conn.execute(_bump('rollup_daily', ['day'], ['qty'],
+                       f"SELECT {item_day}, SUM(COALESCE(i.qty, 0)) {items} GROUP BY 1"))
+    conn.execute(f"INSERT INTO rollup_product_daily (day, product_name, revenue, qty) "
+                 f"SELECT {item_day}, COALESCE(i.product_name, ''), "
+                 f"SUM(COALESCE(i.price, 0) * COALESCE(i.qty, 0)), SUM(COALESCE(i.qty, 0)) {items} GROUP BY 1, 2")
+
+
+# ==========================================
+# 查詢 (後台使用)
+# ==========================================
+
+def local_today(now=None):
+    now = now or datetime.now(timezone.utc)
+    return now.astimezone(LOCAL_TZ).date()
+
+
+def period_range(period, today):
+    """'today' / 'week' (週一起) / 'month' -> (起日, 迄日) 字串，含頭尾"""
+    if period == 'today':
+        start = today
+    elif period == 'week':
+        start = today - timedelta(days=today.weekday())
+    elif period == 'month':
+        start = today.replace(day=1)
+    else:
+        raise ValueError(f"未知的期間：{period}")
+    return start.isoformat(), today.isoformat()
+
+
+def period_totals(conn, start, end):
+    revenue, orders, qty = conn.execute(
+        "SELECT COALESCE(SUM(revenue), 0), COALESCE(SUM(orders), 0), COALESCE(SUM(qty), 0) "
+        "FROM rollup_daily WHERE day BETWEEN ? AND ?", (start, end)).fetchone()
+    return {'revenue': revenue, 'orders': orders, 'qty': qty}
+
+
+def hourly(conn, day):
+    """某一天 (台灣時間) 0~23 時的營業額與筆數，沒有銷售的小時補 0"""
+    rows = {r[0][-2:]: r[1:] for r in conn.execute(
+        "SELECT hour, revenue, orders, qty FROM rollup_hourly WHERE hour BETWEEN ? AND ?",
+        (f"{day}T00", f"{day}T23"))}
+    return [{'hour': h, 'revenue': rows.get(f"{h:02d}", (0, 0, 0))[0],
+             'orders': rows.get(f"{h:02d}", (0, 0, 0))[1], 'qty': rows.get(f"{h:02d}", (0, 0, 0))[2]}
+            for h in range(24)]
+
+
+def top_sellers(conn, start, end, limit=10, by='revenue'):
+    if by not in ('revenue', 'qty'):
+        raise ValueError("by 只能是 revenue 或 qty")
+    rows = conn.execute(
+        f"SELECT product_name, SUM(revenue) AS revenue, SUM(qty) AS qty FROM rollup_product_daily "
+        f"WHERE day BETWEEN ? AND ? GROUP BY product_name ORDER BY {by} DESC, product_name LIMIT ?",
+        (start, end, limit)).fetchall()
+    return [{'product_name': r[0], 'revenue': r[1], 'qty': r[2]} for r in rows]
+
+
+def summary(conn, today=None, top=10):
+    """後台「銷售統計」頁需要的所有數字：今日 / 本週 / 本月、今日每小時、本月熱銷商品"""
+    today = today or local_today()
+    result = {'day': today.isoformat()}
+    for period in ('today', 'week', 'month'):
+        result[period] = period_totals(conn, *period_range(period, today))
+    result['hourly'] = hourly(conn, today.isoformat())
+    result['top_sellers'] = top_sellers(conn, *period_range('month', today), limit=top)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="建立 / 重算銷售彙總並列出今日、本週、本月營業額")
+    parser.add_argument('--db', default=DB_FILE)
+    parser.add_argument('--rebuild', action='store_true', help="從 sales / sale_items 全部重算")
+    args = parser.parse_args()
+
+    conn = connect(args.db)
+    try:
+        ensure_schema(conn)
+        ensure_rollups(conn)
+        if args.rebuild:
+            with conn:
+                rebuild(conn)
+            print("🔁 已重算所有彙總")
+        s = summary(conn)
+    finally:
+        conn.close()
+
+    print(f"📅 {s['day']} (台灣時間)")
+    for period, label in (('today', '今日'), ('week', '本週'), ('month', '本月')):
+        t = s[period]
+        print(f"   {label}：$ {t['revenue']:,.0f}，{t['orders']} 筆，{t['qty']} 件")
+    print("🏆 本月熱銷：")
+    for i, p in enumerate(s['top_sellers'], 1):
+        print(f"   {i:>2}. {p['product_name']}  $ {p['revenue']:,.0f}  ({p['qty']} 件)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,348 @@
+import argparse
+import json
+import os
+import time
+from datetime import datetime, timezone
+
+from dotenv import load_dotenv
+
+from firebase_client import get_db, increment
+from local_db import SYNC_APPLYING, applying_remote, connect, ensure_schema, upsert_sales
+from push_sql_to_cloud import BATCH_LIMIT, MAX_RETRIES, commit_ops_with_backoff, get_watermark, set_watermark
+from sales_rollup import ensure_rollups
+from watermark import Watermark, stream_new_docs
+
+# 1. 載入環境變數
+load_dotenv()
+
+
+# 🚩 演習重點：從環境變數讀取資料庫路徑 (金鑰與模擬器設定在 firebase_client.py)
+DB_FILE = os.getenv('DB_PATH', r'D:\product_recognition\04_App_Dev\Firebase__database_download\grocery_system.db')
+
+# ==========================================
+# 雙向增量同步 (grocery_system.db <-> Firestore)
+# ==========================================
+# 取代「Cloud pullback.py -> json_to_sql.py -> push_sql_to_cloud.py」三段全量流程：
+#   - 本地變更：products / sales 上的觸發器寫入 change_log (誰改了哪一筆、庫存變化量)，
+#     寫入來自雲端的資料時用 local_db.applying_remote() 暫停記錄，才不會又被推回去
+#   - 下載：products 依 lastUpdate、sales 依 timestamp 的水位，只查比水位新的文件，直接寫進 SQLite
+#   - 上傳：把 change_log 依文件合併，每 500 筆一個 WriteBatch；庫存送 Increment(變化量) 而不是絕對值，
+#     收銀機同時扣的庫存不會被舊資料蓋掉。淨變化為 0 的文件不送
+#   - 庫存視為計數器：本地庫存 = 雲端庫存 + 尚未上傳的本地變化量
+#     收銀機用 FieldValue.increment 扣庫存時不會更新 lastUpdate，所以雲端扣的庫存由「新下載的銷售」推算：
+#     銷售時間晚於該商品上次下載的 update_time 才扣 (同一個 WriteBatch 寫入的銷售與扣庫存時間相同)；
+#     扣過的銷售記在 sync_sales_applied。不能看 sales 表有沒有這筆：後台監聽 (dashboard_data.py) 也會先寫入 sales
+#   - 名稱 / 價格 / 分類兩邊都改時，以較新的時間為準 (本地看 change_log 的時間，雲端看 lastUpdate)，並計入 conflicts
+# 什麼都沒變時，一次完整的同步只有查詢、沒有任何寫入。
+# 雲端刪除的文件不會出現在增量查詢裡，需要時用 --full 重新下載。
+
+PULL_KEYS = {'products': 'sync.pull.products', 'sales': 'sync.pull.sales'}
+PULL_FIELDS = {'products': 'lastUpdate', 'sales': 'timestamp'}
+
+_LOGGING = f"NOT EXISTS (SELECT 1 FROM sync_state WHERE key = '{SYNC_APPLYING}')"
+_NOW = "strftime('%Y-%m-%dT%H:%M:%f+00:00', 'now')"
+_FIELDS_CHANGED = "(NEW.name IS NOT OLD.name OR NEW.price IS NOT OLD.price OR NEW.class IS NOT OLD.class)"
+
+SCHEMA = (
+    '''
+    CREATE TABLE IF NOT EXISTS change_log (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        entity TEXT NOT NULL,                    -- products / sales
+        doc_id TEXT NOT NULL,
+        stock_delta INTEGER NOT NULL DEFAULT 0,  -- 庫存變化量
+        fields INTEGER NOT NULL DEFAULT 0,       -- 1 = 庫存以外的欄位有變 (或新增 / 刪除)
+        changed_at TEXT NOT NULL
+    )
+    ''',
+    "CREATE INDEX IF NOT EXISTS idx_change_log_doc ON change_log(entity, doc_id)",
+    '''
+    CREATE TABLE IF NOT EXISTS sync_products (
+        id TEXT PRIMARY KEY,
+        remote_time TEXT  -- 最後一次下載到的文件 update_time；在這之前的雲端銷售已經反映在庫存裡
+    )
+    ''',
+)
+
+# 已經反映在本地庫存的銷售 (推算扣過庫存，或本來就是本地建立後上傳的)
+APPLIED_SCHEMA = "CREATE TABLE sync_sales_applied (sale_id TEXT PRIMARY KEY)"
+
+
+def _log(entity, doc_id, stock_delta, fields):
+    return (f"INSERT INTO change_log (entity, doc_id, stock_delta, fields, changed_at) "
+            f"VALUES ('{entity}', {doc_id}, {stock_delta}, {fields}, {_NOW});")
+
+
+TRIGGERS = {
+    'sync_products_insert': f"AFTER INSERT ON products WHEN {_LOGGING} BEGIN "
+                            f"{_log('products', 'NEW.id', 'COALESCE(NEW.stock, 0)', 1)} END",
+    'sync_products_update': f"AFTER UPDATE ON products WHEN {_LOGGING} "
+                            f"AND (NEW.stock IS NOT OLD.stock OR {_FIELDS_CHANGED}) BEGIN "
+                            f"{_log('products', 'NEW.id', 'COALESCE(NEW.stock, 0) - COALESCE(OLD.stock, 0)', _FIELDS_CHANGED)} END",
+    'sync_products_delete': f"AFTER DELETE ON products WHEN {_LOGGING} BEGIN {_log('products', 'OLD.id', 0, 1)} END",
+    'sync_sales_insert': f"AFTER INSERT ON sales WHEN {_LOGGING} BEGIN {_log('sales', 'NEW.id', 0, 1)} END",
+    'sync_sales_update': f"AFTER UPDATE OF total_amount, timestamp, items ON sales WHEN {_LOGGING} BEGIN "
+                         f"{_log('sales', 'NEW.id', 0, 1)} END",
+    'sync_sales_delete': f"AFTER DELETE ON sales WHEN {_LOGGING} BEGIN {_log('sales', 'OLD.id', 0, 1)} END",
+}
+
+
+def ensure_sync(conn):
+    """建立 change_log 與觸發器 (以及同步會用到的資料表與銷售彙總)"""
+    ensure_schema(conn)
+    ensure_rollups(conn)
+    with conn:
+        for statement in SCHEMA:
+            conn.execute(statement)
+        for name, body in TRIGGERS.items():
+            conn.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {body}")
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sync_sales_applied'").fetchone() is None:
+            conn.execute(APPLIED_SCHEMA)
+            _seed_applied(conn)
+
+
+def _seed_applied(conn):
+    """
+    舊資料庫第一次建立 sync_sales_applied：時間不晚於銷售水位的銷售是同步下載過的，視為已扣過；
+    比水位新的 (後台監聽先寫入的) 留給下次下載推算
+    """
+    saved = get_watermark(conn, PULL_KEYS['sales'])
+    mark = Watermark(json.loads(saved)) if saved else Watermark()
+    if mark.timestamp is None:
+        return
+    rows = conn.execute("SELECT id, timestamp FROM sales").fetchall()
+    conn.executemany("INSERT OR IGNORE INTO sync_sales_applied (sale_id) VALUES (?)",
+                     [(r[0],) for r in rows if (_as_datetime(r[1]) or mark.timestamp) <= mark.timestamp])
+
+
+# ------------------------------------------
+# 工具
+# ------------------------------------------
+
+def _now_iso():
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _as_datetime(value):
+    """Timestamp / ISO 字串 -> 有時區的 datetime (沒有時區的字串視為本機時間)"""
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            return None
+    if not isinstance(value, datetime):
+        return None
+    return value if value.tzinfo else value.astimezone()
+
+
+def _load_mark(conn, entity, full):
+    """已存的水位；full、沒有水位或水位兩種型別都是空的 (上次下載時集合是空的) 時回傳 None = 完整下載"""
+    saved = get_watermark(conn, PULL_KEYS[entity])
+    if full or saved is None:
+        return None
+    saved = json.loads(saved)
+    return None if Watermark(saved).empty() else saved
+
+
+def pending_changes(conn, entity):
+    """change_log 依文件合併：{doc_id: (庫存變化量, 欄位是否有變, 最後變更時間, 最大 seq)}"""
+    rows = conn.execute("SELECT doc_id, SUM(stock_delta), MAX(fields), MAX(changed_at), MAX(seq) FROM change_log "
+                        "WHERE entity = ? GROUP BY doc_id ORDER BY MIN(seq)", (entity,)).fetchall()
+    return {r[0]: r[1:] for r in rows}
+
+
+# ------------------------------------------
+# 下載 (雲端 -> 本地)
+# ------------------------------------------
+
+def pull_products(conn, db, full=False):
+    saved = _load_mark(conn, 'products', full)
+    mark = Watermark(saved)
+    docs = (db.collection('products').stream() if saved is None
+            else stream_new_docs(db, 'products', PULL_FIELDS['products'], mark))
+    pending = pending_changes(conn, 'products')
+    stats = {'received': 0, 'conflicts': 0}
+
+    with conn:
+        with applying_remote(conn):
+            for doc in docs:
+                d = doc.to_dict()
+                mark.observe(d.get('lastUpdate'))
+                stats['received'] += 1
+                delta, fields, changed_at, _ = pending.get(doc.id, (0, 0, None, None))
+                local = conn.execute("SELECT name, price, class, last_update FROM products WHERE id = ?",
+                                     (doc.id,)).fetchone()
+                remote_stamp = d.get('lastUpdate')
+                if hasattr(remote_stamp, 'isoformat'):
+                    remote_stamp = remote_stamp.isoformat()
+                values = (d.get('name'), d.get('price'), d.get('category'), remote_stamp)
+                if fields and local is not None:
+                    values = local
+                    # lastUpdate 與本地相同表示只是自己上次上傳的結果；不同才是兩邊都改了
+                    if remote_stamp != local[3]:
+                        stats['conflicts'] += 1
+                        remote_time, local_time = _as_datetime(remote_stamp), _as_datetime(changed_at)
+                        if remote_time and local_time and remote_time > local_time:
+                            # 雲端較新：欄位以雲端為準，本地只剩庫存變化量要推送
+                            conn.execute("UPDATE change_log SET fields = 0 "
+                                         "WHERE entity = 'products' AND doc_id = ?", (doc.id,))
+                            values = (d.get('name'), d.get('price'), d.get('category'), remote_stamp)
+                # 計數器：雲端庫存 + 尚未上傳的本地變化量
+                stock = (d.get('stock') or 0) + (delta or 0)
+                conn.execute('''
+                    INSERT INTO products (id, name, price, class, stock, last_update) VALUES (?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(id) DO UPDATE SET name = excluded.name, price = excluded.price,
+                        class = excluded.class, stock = excluded.stock, last_update = excluded.last_update
+                ''', (doc.id, values[0], values[1], values[2], stock, values[3]))
+                conn.execute("INSERT OR REPLACE INTO sync_products (id, remote_time) VALUES (?, ?)",
+                             (doc.id, doc.update_time.isoformat() if doc.update_time else None))
+        # 資料與水位在同一個交易中 commit
+        set_watermark(conn, json.dumps(mark.to_dict(PULL_FIELDS['products'])), PULL_KEYS['products'])
+    return stats
+
+
+def pull_sales(conn, db, full=False):
+    saved = _load_mark(conn, 'sales', full)
+    mark = Watermark(saved)
+    docs = (db.collection('sales').stream() if saved is None
+            else stream_new_docs(db, 'sales', PULL_FIELDS['sales'], mark))
+    name_to_id = dict(conn.execute("SELECT name, id FROM products WHERE name IS NOT NULL"))
+    remote_times = {k: _as_datetime(v) for k, v in conn.execute("SELECT id, remote_time FROM sync_products")}
+    local_sales = pending_changes(conn, 'sales')   # 本地建立、還沒上傳的銷售：庫存已經在本地扣過
+    stats = {'received': 0, 'stock_updates': 0, 'unmatched_items': 0}
+
+    with conn:
+        with applying_remote(conn):
+            for doc in docs:
+                s = doc.to_dict()
+                s['id'] = doc.id
+                mark.observe(s.get('timestamp'))
+                stats['received'] += 1
+                sold_at = _as_datetime(s.get('timestamp'))
+                if hasattr(s.get('timestamp'), 'isoformat'):
+                    s['timestamp'] = s['timestamp'].isoformat()
+                applied = (doc.id in local_sales or conn.execute(
+                    "SELECT 1 FROM sync_sales_applied WHERE sale_id = ?", (doc.id,)).fetchone() is not None)
+                if not applied and sold_at is not None:
+                    for item in s.get('items') or []:
+                        product_id = name_to_id.get(item.get('name'))
+                        if product_id is None:
+                            stats['unmatched_items'] += 1
+                            continue
+                        seen = remote_times.get(product_id)
+                        # 上次下載的商品文件已經包含這筆銷售扣的庫存時，不再重複扣
+                        if seen is not None and sold_at > seen:
+                            conn.execute("UPDATE products SET stock = COALESCE(stock, 0) - ? WHERE id = ?",
+                                         (item.get('qty', 1), product_id))
+                            stats['stock_updates'] += 1
+                if not applied:
+                    conn.execute("INSERT OR IGNORE INTO sync_sales_applied (sale_id) VALUES (?)", (doc.id,))
+                upsert_sales(conn, [s])
+        set_watermark(conn, json.dumps(mark.to_dict(PULL_FIELDS['sales'])), PULL_KEYS['sales'])
+    return stats
+
+
+# ------------------------------------------
+# 上傳 (本地 -> 雲端)
+# ------------------------------------------
+
+def _product_op(conn, db, doc_id, delta, fields, stamp):
+    row = conn.execute("SELECT name, price, class FROM products WHERE id = ?", (doc_id,)).fetchone()
+    if row is None:
+        return ('delete', 'products', doc_id, None)
+    if not delta and not fields:
+        return None   # 淨變化為 0 (例如 +1 又 -1)
+    data = {'lastUpdate': stamp}
+    if fields:
+        data.update({'id': doc_id, 'name': row[0], 'price': row[1], 'category': row[2]})
+    if delta:
+        data['stock'] = increment(db, delta)
+    return ('merge', 'products', doc_id, data)
+
+
+def _sale_op(conn, doc_id):
+    row = conn.execute("SELECT total_amount, timestamp, items FROM sales WHERE id = ?", (doc_id,)).fetchone()
+    if row is None:
+        return ('delete', 'sales', doc_id, None)
+    # timestamp 以 Timestamp 型別上傳，與 App 寫入的銷售相同，範圍查詢才查得到
+    return ('set', 'sales', doc_id, {'total_amount': row[0], 'timestamp': _as_datetime(row[1]) or row[1],
+                                     'items': json.loads(row[2]) if row[2] else []})
+
+
+def push_local(conn, db, chunk_size=BATCH_LIMIT, max_retries=MAX_RETRIES):
+    stamp = _now_iso()
+    work = []   # (entity, doc_id, max_seq, op)
+    for entity in ('products', 'sales'):
+        for doc_id, (delta, fields, _, max_seq) in pending_changes(conn, entity).items():
+            op = _product_op(conn, db, doc_id, delta, fields, stamp) if entity == 'products' else _sale_op(conn, doc_id)
+            work.append((entity, doc_id, max_seq, op))
+    stats = {'docs': sum(1 for w in work if w[3] is not None), 'batches': 0, 'retries': 0}
+
+    # 淨變化為 0 的紀錄直接清掉，不必送出
+    skipped = [w for w in work if w[3] is None]
+    work = [w for w in work if w[3] is not None]
+    with conn:
+        conn.executemany("DELETE FROM change_log WHERE entity = ? AND doc_id = ? AND seq <= ?",
+                         [(e, d, seq) for e, d, seq, _ in skipped])
+
+    for i in range(0, len(work), chunk_size):
+        chunk = work[i:i + chunk_size]
+        stats['retries'] += commit_ops_with_backoff(db, [w[3] for w in chunk], max_retries)
+        stats['batches'] += 1
+        # 送出成功才刪除這些紀錄 (只刪到讀取時的 seq，上傳期間的新變更留到下次)
+        with conn:
+            with applying_remote(conn):
+                conn.executemany("DELETE FROM change_log WHERE entity = ? AND doc_id = ? AND seq <= ?",
+                                 [(e, d, seq) for e, d, seq, _ in chunk])
+                conn.executemany("UPDATE products SET last_update = ? WHERE id = ?",
+                                 [(stamp, d) for e, d, _, op in chunk if e == 'products' and op[0] == 'merge'])
+                # 本地建立的銷售之後再下載回來時不再扣庫存
+                conn.executemany("INSERT OR IGNORE INTO sync_sales_applied (sale_id) VALUES (?)",
+                                 [(d,) for e, d, _, op in chunk if e == 'sales' and op[0] == 'set'])
+    return stats
+
+
+# ------------------------------------------
+# 一次完整同步
+# ------------------------------------------
+
+def sync(db=None, db_file=DB_FILE, full=False, pull=True, push=True):
+    """先下載 (商品 -> 銷售) 再上傳；回傳各階段的統計"""
+    start = time.perf_counter()
+    db = db or get_db()
+    conn = connect(db_file)
+    stats = {}
+    try:
+        ensure_sync(conn)
+        if pull:
+            stats['products'] = pull_products(conn, db, full)
+            stats['sales'] = pull_sales(conn, db, full)
+        if push:
+            stats['push'] = push_local(conn, db)
+    finally:
+        conn.close()
+    stats['seconds'] = round(time.perf_counter() - start, 3)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="grocery_system.db 與 Firestore 雙向增量同步")
+    parser.add_argument('--db', default=DB_FILE)
+    parser.add_argument('--full', action='store_true', help="忽略水位，完整重新下載")
+    parser.add_argument('--pull-only', action='store_true')
+    parser.add_argument('--push-only', action='store_true')
+    args = parser.parse_args()
+
+    # 離線測試：FIRESTORE_FAKE=fake_cloud.json python sync_engine.py
+    stats = sync(db_file=args.db, full=args.full, pull=not args.push_only, push=not args.pull_only)
+    if 'products' in stats:
+        p, s = stats['products'], stats['sales']
+        print(f"⬇️ 商品 {p['received']} 筆 (欄位衝突 {p['conflicts']} 筆)，銷售 {s['received']} 筆 "
+              f"(推算扣庫存 {s['stock_updates']} 次，對不到商品 {s['unmatched_items']} 個品項)")
+    if 'push' in stats:
+        p = stats['push']
+        print(f"⬆️ 上傳 {p['docs']} 筆文件 ({p['batches']} 次 commit，重試 {p['retries']} 次)")
+    print(f"✨ 同步完成 ({stats['seconds']} 秒)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+from datetime import datetime, timezone
+
+from dashboard_data import SALES_TTL, DashboardData, TTLCache
+from fake_firestore import SERVER_TIMESTAMP, FakeClient
+
+# 離線回歸測試 (pytest)：python -m pytest test_dashboard_data.py
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _sales(db, n, timestamp=None):
+    for i in range(n):
+        db.collection('sales').document(f"s{i:02d}").set(
+            {'timestamp': timestamp or datetime(2026, 1, 1, i, tzinfo=timezone.utc), 'total_amount': 10,
+             'items': [{'name': 'Cola', 'qty': 1, 'price': 10}]})
+
+
+def _all_pages(data):
+    cursor, ids = None, []
+    while True:
+        rows, cursor = data.sales_page(cursor)
+        ids += [r['id'] for r in rows]
+        if cursor is None:
+            return ids
+
+
+def test_ttl_cache_expires_and_invalidates_by_prefix():
+    clock = FakeClock()
+    cache = TTLCache(clock=clock)
+    loads = []
+
+    def loader(value):
+        return lambda: loads.append(value) or value
+
+    assert cache.get('sales_totals', loader(1), ttl=10) == 1
+    assert cache.get('sales_totals', loader(2), ttl=10) == 1
+    clock.now = 11
+    assert cache.get('sales_totals', loader(3), ttl=10) == 3
+    assert cache.get(('sales_page', None, 20), loader(4), ttl=None) == 4
+    cache.set('products', 5)
+    clock.now = 10 ** 6
+    assert cache.get(('sales_page', None, 20), loader(6), ttl=None) == 4   # ttl=None 不會過期
+
+    cache.invalidate('sales')               # 字串與 tuple 的 key 都以 prefix 比對
+    assert cache.peek('sales_totals') is None and cache.peek(('sales_page', None, 20)) is None
+    assert cache.peek('products') == 5
+    assert loads == [1, 3, 4]
+    assert cache.stats == {'hits': 2, 'misses': 3}
+
+
+def test_pages_do_not_skip_sales_with_the_same_timestamp(tmp_path):
+    db = FakeClient()
+    _sales(db, 7, timestamp=datetime(2026, 1, 1, tzinfo=timezone.utc))
+    data = DashboardData(backend='firestore', db=db, db_file=str(tmp_path / "none.db"), page_size=3)
+    assert _all_pages(data) == [f"s{i:02d}" for i in reversed(range(7))]
+
+
+def test_warm_cache_makes_no_firestore_reads(tmp_path):
+    db, clock = FakeClient(), FakeClock()
+    _sales(db, 5)
+    db.collection('products').document('p1').set({'name': 'Cola', 'price': 10, 'stock': 5})
+    data = DashboardData(backend='firestore', db=db, db_file=str(tmp_path / "none.db"),
+                         cache=TTLCache(clock=clock), page_size=2)
+    data.start_listeners()
+    try:
+        def render():
+            return data.products(), _all_pages(data), data.sales_totals()
+
+        first = render()
+        reads = db.stats['reads']
+        clock.now += SALES_TTL * 10         # 閒置很久之後再點選單
+        assert render() == first
+        assert db.stats['reads'] == reads
+
+        # 新銷售：監聽讓銷售快取失效，下一次重跑才重讀
+        db.collection('sales').document('s99').set({'timestamp': SERVER_TIMESTAMP, 'total_amount': 30, 'items': []})
+        products, ids, totals = render()
+        assert ids[0] == 's99' and totals == {'count': 6, 'total': 80}
+        reads = db.stats['reads']
+        render()
+        assert db.stats['reads'] == reads
+    finally:
+        data.stop_listeners()
+
+
+def test_without_listeners_sales_expire_after_ttl(tmp_path):
+    db, clock = FakeClient(), FakeClock()
+    _sales(db, 2)
+    data = DashboardData(backend='firestore', db=db, db_file=str(tmp_path / "none.db"), cache=TTLCache(clock=clock))
+    data.sales_totals()
+    reads = db.stats['reads']
+    data.sales_totals()
+    assert db.stats['reads'] == reads
+    clock.now += SALES_TTL + 1
+    data.sales_totals()
+    assert db.stats['reads'] > reads
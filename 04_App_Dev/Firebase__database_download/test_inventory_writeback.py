@@ -0,0 +1,104 @@
+import sqlite3
+
+from fake_firestore import FakeClient, Increment
+from inventory_writeback import diff_products, write_back
+from local_db import connect, ensure_schema
+
+# 離線回歸測試 (pytest)：python -m pytest test_inventory_writeback.py
+
+
+def _setup(tmp_path):
+    db, db_file = FakeClient(), str(tmp_path / "grocery_system.db")
+    conn = connect(db_file)
+    ensure_schema(conn)
+    with conn:
+        for doc_id, name in (('p1', 'Cola'), ('p2', 'Tea')):
+            db.collection('products').document(doc_id).set({'name': name, 'price': 10, 'category': 'drink',
+                                                            'stock': 10})
+            conn.execute("INSERT INTO products (id, name, price, class, stock) VALUES (?, ?, 10, 'drink', 10)",
+                         (doc_id, name))
+    conn.close()
+    return db, db_file
+
+
+def _load(db):
+    """與後台相同：載入商品列與每個文件的 update_time"""
+    rows, versions = [], {}
+    for doc in db.collection('products').stream():
+        rows.append(dict(doc.to_dict(), id=doc.id))
+        versions[doc.id] = doc.update_time
+    return rows, versions
+
+
+def _edit(rows, doc_id, **fields):
+    return [dict(r, **fields) if r['id'] == doc_id else dict(r) for r in rows]
+
+
+def _checkout(db, doc_id, qty):
+    db.collection('products').document(doc_id).update({'stock': Increment(-qty)})
+
+
+def _cloud(db, doc_id):
+    return db.collection('products').document(doc_id).get().to_dict()
+
+
+def _local(db_file, doc_id):
+    conn = sqlite3.connect(db_file)
+    try:
+        return conn.execute("SELECT price, stock FROM products WHERE id = ?", (doc_id,)).fetchone()
+    finally:
+        conn.close()
+
+
+def test_only_changed_fields_are_written_in_one_commit(tmp_path):
+    db, db_file = _setup(tmp_path)
+    before, versions = _load(db)
+    after = _edit(_edit(before, 'p1', price=12), 'p2', price=15)
+    changes = diff_products(before, after)
+    assert changes == {'p1': {'price': (10, 12)}, 'p2': {'price': (10, 15)}}
+
+    writes = db.stats['writes']
+    result = write_back(db, changes, versions, db_file)
+    assert sorted(result['written']) == ['p1', 'p2'] and result['conflicts'] == {}
+    assert result['commits'] == 1 and db.stats['writes'] - writes == 2
+    assert _cloud(db, 'p1')['price'] == 12 and _local(db_file, 'p2') == (15, 10)
+
+
+def test_precondition_failure_retries_with_fresh_update_time(tmp_path):
+    db, db_file = _setup(tmp_path)
+    before, versions = _load(db)
+    _checkout(db, 'p1', 2)                  # 載入之後收銀機賣出：update_time 變了，但後台沒有改庫存
+    changes = diff_products(before, _edit(before, 'p1', price=12))
+
+    reads = db.stats['reads']
+    result = write_back(db, changes, versions, db_file)
+    assert result['written'] == ['p1'] and result['conflicts'] == {}
+    assert result['commits'] == 1               # 第一次前置條件失敗不算 commit
+    assert db.stats['reads'] - reads == 1       # 只重讀有改的那一筆
+    assert _cloud(db, 'p1')['price'] == 12
+    assert _cloud(db, 'p1')['stock'] == 8       # 收銀機扣的庫存沒有被蓋掉
+
+
+def test_stock_changed_at_register_is_reported_as_conflict(tmp_path):
+    db, db_file = _setup(tmp_path)
+    before, versions = _load(db)
+    _checkout(db, 'p1', 1)
+    after = _edit(_edit(before, 'p1', stock=15), 'p2', price=20)   # 後台補貨 p1，同時改 p2 價格
+    result = write_back(db, diff_products(before, after), versions, db_file)
+
+    assert result['written'] == ['p2']
+    assert list(result['conflicts']) == ['p1'] and result['conflicts']['p1']['stock'] == 9
+    assert _cloud(db, 'p1')['stock'] == 9 and _local(db_file, 'p1') == (10, 10)
+    assert _cloud(db, 'p2')['price'] == 20 and _local(db_file, 'p2') == (20, 10)
+
+
+def test_without_versions_cloud_values_are_checked_first(tmp_path):
+    db, db_file = _setup(tmp_path)
+    before, _ = _load(db)
+    _checkout(db, 'p2', 3)
+    after = _edit(_edit(before, 'p1', price=11), 'p2', stock=20)
+    # 讀本地 SQLite 的後台沒有 update_time：先讀雲端目前的值比對
+    result = write_back(db, diff_products(before, after), {}, db_file)
+    assert result['written'] == ['p1']
+    assert list(result['conflicts']) == ['p2']
+    assert _cloud(db, 'p1')['price'] == 11 and _cloud(db, 'p2')['stock'] == 7
@@ -0,0 +1,107 @@
+import sqlite3
+
+import pytest
+
+import push_sql_to_cloud
+from fake_firestore import FakeClient
+from local_db import connect, ensure_schema
+from push_sql_to_cloud import _safe_watermark, get_watermark, push_sql_to_cloud as push, update_product
+
+# 離線回歸測試 (pytest)：python -m pytest test_push_sql_to_cloud.py
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    """重試的退避等待不真的睡"""
+    delays = []
+    monkeypatch.setattr(push_sql_to_cloud.time, 'sleep', delays.append)
+    return delays
+
+
+def _db_file(tmp_path, n, stamp='2026-01-01T00:00:00+00:00'):
+    db_file = str(tmp_path / "grocery_system.db")
+    conn = connect(db_file)
+    ensure_schema(conn)
+    with conn:
+        conn.executemany("INSERT INTO products (id, name, price, class, stock, last_update) VALUES (?, ?, ?, ?, ?, ?)",
+                         [(f"p{i:04d}", f"item{i}", 10, 'drink', 5, stamp) for i in range(n)])
+    conn.close()
+    return db_file
+
+
+def _edit(db_file, product_id, **fields):
+    conn = sqlite3.connect(db_file)
+    with conn:
+        update_product(conn, product_id, **fields)
+    conn.close()
+
+
+def test_rows_are_written_in_batches_of_500(tmp_path):
+    db, db_file = FakeClient(), _db_file(tmp_path, 1200)
+    stats = push(db=db, db_file=db_file)
+    assert stats['rows'] == 1200 and stats['batches'] == 3 and stats['failed'] == 0
+    assert db.stats['commits'] == 3 and db.stats['writes'] == 1200
+    assert stats['watermark'] == '2026-01-01T00:00:00+00:00'
+
+
+def test_transient_errors_are_retried_with_backoff(tmp_path, no_sleep):
+    db, db_file = FakeClient(), _db_file(tmp_path, 3)
+    db.fail_next = 2
+    stats = push(db=db, db_file=db_file, max_retries=3)
+    assert stats['retries'] == 2 and stats['failed'] == 0
+    # 每次重試等待加倍 (BASE_DELAY * 2^n，再乘上 0.5 ~ 1.5 的抖動)
+    base = push_sql_to_cloud.BASE_DELAY
+    assert len(no_sleep) == 2
+    assert base * 0.5 <= no_sleep[0] <= base * 1.5 and base <= no_sleep[1] <= base * 3
+    assert db.collection('products').document('p0000').get().exists
+
+
+def test_failed_batch_keeps_watermark_and_is_pushed_next_time(tmp_path):
+    db, db_file = FakeClient(), _db_file(tmp_path, 3)
+    db.fail_next = 1
+    stats = push(db=db, db_file=db_file, max_retries=0)
+    assert stats['failed'] == 3 and stats['watermark'] is None
+    assert not db.collection('products').document('p0000').get().exists
+
+    stats = push(db=db, db_file=db_file)
+    assert stats['rows'] == 3 and stats['failed'] == 0
+
+
+def test_safe_watermark_stops_before_first_failed_batch():
+    chunks = [[('a', None, None, None, None, 't1'), ('b', None, None, None, None, 't2')],
+              [('c', None, None, None, None, 't2'), ('d', None, None, None, None, 't3')],
+              [('e', None, None, None, None, 't4')]]
+    assert _safe_watermark(chunks, [True, True, True], 't0') == 't4'
+    # 第 2 批失敗：只推進到 t2 (等於失敗批最早的時間，查詢用 >= 會重送 c)；第 3 批成功也不能跳過去
+    assert _safe_watermark(chunks, [True, False, True], 't0') == 't2'
+    assert _safe_watermark(chunks, [False, True, True], 't0') == 't0'
+
+
+def test_edit_with_same_stamp_as_watermark_is_pushed(tmp_path):
+    db, db_file = FakeClient(), _db_file(tmp_path, 2)
+    push(db=db, db_file=db_file)
+    # 在上次推送之後寫入、但 last_update 與水位相同 (例如從同一份 snapshot 匯入)
+    conn = sqlite3.connect(db_file)
+    with conn:
+        conn.execute("UPDATE products SET price = 99 WHERE id = 'p0001'")
+    conn.close()
+    push(db=db, db_file=db_file)
+    assert db.collection('products').document('p0001').get().get('price') == 99
+
+
+def test_local_edit_and_missing_last_update_are_pushed(tmp_path):
+    db, db_file = FakeClient(), _db_file(tmp_path, 2)
+    push(db=db, db_file=db_file)
+    conn = sqlite3.connect(db_file)
+    with conn:
+        conn.execute("INSERT INTO products (id, name, price, class, stock) VALUES ('new', 'Tea', 20, 'drink', 3)")
+    conn.close()
+    _edit(db_file, 'p0000', price=15)
+
+    stats = push(db=db, db_file=db_file)
+    assert db.collection('products').document('new').get().get('name') == 'Tea'
+    assert db.collection('products').document('p0000').get().get('price') == 15
+    assert stats['watermark'] > '2026-01-01T00:00:00+00:00'
+    conn = sqlite3.connect(db_file)
+    assert get_watermark(conn) == stats['watermark']
+    conn.close()
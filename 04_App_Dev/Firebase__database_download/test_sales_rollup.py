@@ -0,0 +1,71 @@
+from local_db import connect, ensure_schema, upsert_sales
+from sales_rollup import ensure_rollups, rebuild
+
+# 離線回歸測試 (pytest)：python -m pytest test_sales_rollup.py
+# 觸發器逐筆維護的彙總必須與 rebuild() 從頭重算的結果相同
+
+TABLES = {
+    'rollup_hourly': "SELECT hour, revenue, orders, qty FROM rollup_hourly",
+    'rollup_daily': "SELECT day, revenue, orders, qty FROM rollup_daily",
+    'rollup_product_daily': "SELECT day, product_name, revenue, qty FROM rollup_product_daily",
+}
+
+
+def _snapshot(conn):
+    """各彙總表的內容 (觸發器扣回後會留下全為 0 的列，rebuild 不會產生，比較時略過)"""
+    return {table: sorted(r for r in conn.execute(sql) if any(v for v in r[-3:] if not isinstance(v, str)))
+            for table, sql in TABLES.items()}
+
+
+def _sale(sale_id, timestamp, total, *items):
+    return {'id': sale_id, 'timestamp': timestamp, 'total_amount': total,
+            'items': [{'name': name, 'qty': qty, 'price': price} for name, qty, price in items]}
+
+
+def _conn(tmp_path):
+    conn = connect(str(tmp_path / "grocery_system.db"))
+    ensure_schema(conn)
+    ensure_rollups(conn)
+    return conn
+
+
+def _upsert(conn, *sales):
+    with conn:
+        upsert_sales(conn, list(sales))
+
+
+def test_triggers_match_rebuild_after_upserts(tmp_path):
+    conn = _conn(tmp_path)
+    _upsert(conn,
+            _sale('s1', '2026-03-01T15:30:00+00:00', 50, ('Cola', 2, 20), ('Tea', 1, 10)),
+            _sale('s2', '2026-03-01T16:00:00+00:00', 30, ('Cola', 1, 30)),
+            _sale('s3', '2026-03-01T15:59:59.999+00:00', 15, ('Tea', 1, 15)))
+    _upsert(conn, _sale('s1', '2026-03-01T15:30:00+00:00', 50, ('Cola', 2, 20), ('Tea', 1, 10)))   # 原樣重寫
+    _upsert(conn, _sale('s1', '2026-03-01T15:30:00+00:00', 70, ('Cola', 3, 20), ('Tea', 1, 10)))   # 改品項
+    _upsert(conn, _sale('s2', '2026-03-05T01:00:00+08:00', 30, ('Cola', 1, 30)))                   # 移到別天
+    _upsert(conn, _sale('s3', '2026-03-02T04:00:00Z', 45, ('Tea', 3, 15)))                          # 時間與金額都改
+    _upsert(conn, _sale('s4', '2026-03-06T10:00:00+00:00', 10, ('Water', 1, 10)))
+    with conn:
+        conn.execute("DELETE FROM sales WHERE id = 's4'")
+
+    incremental = _snapshot(conn)
+    with conn:
+        rebuild(conn)
+    assert incremental == _snapshot(conn)
+    conn.close()
+
+
+def test_day_boundary_is_taiwan_time(tmp_path):
+    conn = _conn(tmp_path)
+    _upsert(conn,
+            _sale('a', '2026-03-01T15:59:59+00:00', 10, ('Cola', 1, 10)),   # 台灣 23:59:59
+            _sale('b', '2026-03-01T16:00:00+00:00', 20, ('Cola', 2, 10)))   # 台灣隔天 00:00
+    assert list(conn.execute("SELECT day, revenue, orders, qty FROM rollup_daily ORDER BY day")) == [
+        ('2026-03-01', 10, 1, 1), ('2026-03-02', 20, 1, 2)]
+    assert list(conn.execute("SELECT hour FROM rollup_hourly ORDER BY hour")) == [
+        ('2026-03-01T23',), ('2026-03-02T00',)]
+
+    _upsert(conn, _sale('b', '2026-03-01T15:00:00+00:00', 20, ('Cola', 2, 10)))   # 改回前一天
+    assert list(conn.execute("SELECT day, revenue, orders, qty FROM rollup_daily WHERE orders > 0")) == [
+        ('2026-03-01', 30, 2, 3)]
+    conn.close()
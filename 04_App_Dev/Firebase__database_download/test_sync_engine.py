@@ -0,0 +1,171 @@
+import sqlite3
+from datetime import datetime, timezone
+
+from dashboard_data import DashboardData
+from fake_firestore import SERVER_TIMESTAMP, FakeClient, Increment
+from sync_engine import sync
+
+# 離線回歸測試 (pytest)：python -m pytest test_sync_engine.py
+
+
+def _sale(db, amount=100):
+    ref = db.collection('sales').document()
+    ref.set({'timestamp': SERVER_TIMESTAMP, 'total_amount': amount, 'items': []})
+    return ref.id
+
+
+def _product(db, doc_id, name, stock, price=10):
+    db.collection('products').document(doc_id).set({'name': name, 'price': price, 'category': 'drink',
+                                                    'stock': stock, 'lastUpdate': '2026-01-01T00:00:00+00:00'})
+
+
+def _checkout(db, doc_id, name, qty):
+    """與 App 結帳相同：同一個 WriteBatch 扣庫存 (Increment，不更新 lastUpdate) 並寫入銷售"""
+    batch = db.batch()
+    batch.update(db.collection('products').document(doc_id), {'stock': Increment(-qty)})
+    ref = db.collection('sales').document()
+    batch.set(ref, {'timestamp': SERVER_TIMESTAMP, 'total_amount': 10 * qty,
+                    'items': [{'name': name, 'qty': qty, 'price': 10}]})
+    batch.commit()
+    return ref.id
+
+
+def _local_stock(db_file, doc_id):
+    conn = sqlite3.connect(db_file)
+    try:
+        return conn.execute("SELECT stock FROM products WHERE id = ?", (doc_id,)).fetchone()[0]
+    finally:
+        conn.close()
+
+
+def _local_ids(db_file, table):
+    conn = sqlite3.connect(db_file)
+    try:
+        return {r[0] for r in conn.execute(f"SELECT id FROM {table}")}
+    finally:
+        conn.close()
+
+
+def test_empty_first_pull_does_not_stop_later_pulls(tmp_path):
+    db, db_file = FakeClient(), str(tmp_path / "grocery_system.db")
+    sync(db=db, db_file=db_file)            # 雲端還沒有任何銷售：存下的水位兩種型別都是空的
+    sale_id = _sale(db)
+    sync(db=db, db_file=db_file)
+    assert _local_ids(db_file, 'sales') == {sale_id}
+
+    second = _sale(db)                      # 之後回到一般的增量查詢
+    sync(db=db, db_file=db_file)
+    assert _local_ids(db_file, 'sales') == {sale_id, second}
+
+
+def test_type_not_seen_in_first_pull_is_pulled_later(tmp_path):
+    db, db_file = FakeClient(), str(tmp_path / "grocery_system.db")
+    products = db.collection('products')
+    products.document('a').set({'name': 'A', 'price': 10, 'stock': 5, 'lastUpdate': '2026-01-01T00:00:00+00:00'})
+    sync(db=db, db_file=db_file)            # 只看過字串型別的 lastUpdate
+
+    products.document('b').set({'name': 'B', 'price': 20, 'stock': 5,
+                                'lastUpdate': datetime(2026, 1, 2, tzinfo=timezone.utc)})
+    sync(db=db, db_file=db_file)
+    assert _local_ids(db_file, 'products') == {'a', 'b'}
+
+
+def test_checkout_mirrored_by_dashboard_still_decrements_stock(tmp_path):
+    db, db_file = FakeClient(), str(tmp_path / "grocery_system.db")
+    _product(db, 'p1', 'Cola', 10)
+    sync(db=db, db_file=db_file)
+    dashboard = DashboardData(db=db, db_file=db_file)
+    dashboard.start_listeners()             # 監聽會先把新銷售寫進同一個 sales 表
+    try:
+        sale_id = _checkout(db, 'p1', 'Cola', 3)
+        assert sale_id in _local_ids(db_file, 'sales')
+        stats = sync(db=db, db_file=db_file)
+    finally:
+        dashboard.stop_listeners()
+    assert stats['sales']['stock_updates'] == 1
+    assert _local_stock(db_file, 'p1') == 7 == db.collection('products').document('p1').get().get('stock')
+    assert sync(db=db, db_file=db_file)['sales']['stock_updates'] == 0   # 同一筆不會再扣一次
+    assert _local_stock(db_file, 'p1') == 7
+
+
+def _local_product(db_file, doc_id):
+    conn = sqlite3.connect(db_file)
+    try:
+        return conn.execute("SELECT name, price, stock FROM products WHERE id = ?", (doc_id,)).fetchone()
+    finally:
+        conn.close()
+
+
+def _local_exec(db_file, sql, args=()):
+    conn = sqlite3.connect(db_file)
+    try:
+        with conn:
+            conn.execute(sql, args)
+    finally:
+        conn.close()
+
+
+def test_sync_over_unchanged_store_makes_no_writes(tmp_path):
+    db, db_file = FakeClient(), str(tmp_path / "grocery_system.db")
+    _product(db, 'p1', 'Cola', 10)
+    _checkout(db, 'p1', 'Cola', 1)
+    sync(db=db, db_file=db_file)
+    writes = db.stats['writes']
+    stats = sync(db=db, db_file=db_file)
+    assert db.stats['writes'] == writes
+    assert stats['push']['docs'] == 0
+    assert stats['products']['received'] == stats['sales']['received'] == 0
+
+
+def test_local_stock_change_is_pushed_as_increment(tmp_path):
+    db, db_file = FakeClient(), str(tmp_path / "grocery_system.db")
+    _product(db, 'p1', 'Cola', 10)
+    sync(db=db, db_file=db_file)
+    _local_exec(db_file, "UPDATE products SET stock = stock + 5 WHERE id = 'p1'")   # 本地進貨 +5
+    _checkout(db, 'p1', 'Cola', 2)          # 同時收銀機賣出 2 瓶
+    stats = sync(db=db, db_file=db_file)
+    assert stats['sales']['stock_updates'] == 1
+    assert stats['push']['docs'] == 1
+    # 送的是 Increment(+5)，不是本地的絕對值，收銀機扣的 2 瓶不會被蓋掉
+    assert db.collection('products').document('p1').get().get('stock') == 13
+    assert _local_product(db_file, 'p1')[2] == 13
+
+
+def test_checkout_decrement_is_inferred_from_sales(tmp_path):
+    db, db_file = FakeClient(), str(tmp_path / "grocery_system.db")
+    _product(db, 'p1', 'Cola', 10)
+    sync(db=db, db_file=db_file)
+    _checkout(db, 'p1', 'Cola', 2)
+    _checkout(db, 'p1', 'Cola', 1)
+    stats = sync(db=db, db_file=db_file)
+    # 扣庫存不會更新 lastUpdate：商品文件沒有被重新下載，庫存由兩筆新銷售推算
+    assert stats['products']['received'] == 0
+    assert stats['sales']['stock_updates'] == 2
+    assert _local_product(db_file, 'p1')[2] == 7
+
+
+def test_field_conflict_newer_cloud_edit_wins(tmp_path):
+    db, db_file = FakeClient(), str(tmp_path / "grocery_system.db")
+    _product(db, 'p1', 'Cola', 10)
+    sync(db=db, db_file=db_file)
+    _local_exec(db_file, "UPDATE products SET name = 'Cola Zero' WHERE id = 'p1'")
+    db.collection('products').document('p1').set({'price': 25, 'lastUpdate': '2099-01-01T00:00:00+00:00'},
+                                                  merge=True)
+    stats = sync(db=db, db_file=db_file)
+    assert stats['products']['conflicts'] == 1
+    assert _local_product(db_file, 'p1') == ('Cola', 25, 10)
+    assert db.collection('products').document('p1').get().get('name') == 'Cola'
+
+
+def test_field_conflict_newer_local_edit_wins(tmp_path):
+    db, db_file = FakeClient(), str(tmp_path / "grocery_system.db")
+    _product(db, 'p1', 'Cola', 10)
+    sync(db=db, db_file=db_file)
+    db.collection('products').document('p1').set({'price': 25, 'lastUpdate': '2026-01-02T00:00:00+00:00'},
+                                                  merge=True)
+    _local_exec(db_file, "UPDATE products SET name = 'Cola Zero' WHERE id = 'p1'")
+    stats = sync(db=db, db_file=db_file)
+    assert stats['products']['conflicts'] == 1
+    cloud = db.collection('products').document('p1').get().to_dict()
+    assert (cloud['name'], cloud['price']) == ('Cola Zero', 10)
+    assert _local_product(db_file, 'p1') == ('Cola Zero', 10, 10)
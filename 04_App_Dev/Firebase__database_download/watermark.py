@@ -0,0 +1,47 @@
+from datetime import datetime, timezone
+
+# ==========================================
+# 增量查詢的水位 (Cloud pullback.py / sync_engine.py 共用)
+# ==========================================
+# Firestore 的範圍查詢只會回傳同型別的值：App 寫入的是 Timestamp，
+# 同步腳本寫入的 lastUpdate 是字串，所以兩種型別各有一個水位、各查一次。
+# 還沒看過的型別從最小值查起 (否則之後出現的另一種型別永遠查不到)；
+# 兩種都沒看過 (例如第一次下載時集合是空的) 視為沒有水位，由呼叫端完整下載。
+
+# 各型別的下限：比所有實際值都小
+MIN_TIMESTAMP = datetime(1970, 1, 1, tzinfo=timezone.utc)
+MIN_STRING = ''
+
+
+class Watermark:
+    """記錄本次看到的最大值：Timestamp 與字串分開記"""
+
+    def __init__(self, saved=None):
+        saved = saved or {}
+        self.timestamp = datetime.fromisoformat(saved['timestamp']) if saved.get('timestamp') else None
+        self.string = saved.get('string')
+
+    def empty(self):
+        return self.timestamp is None and self.string is None
+
+    def observe(self, value):
+        if hasattr(value, 'isoformat'):
+            if self.timestamp is None or value > self.timestamp:
+                self.timestamp = value
+        elif isinstance(value, str):
+            if self.string is None or value > self.string:
+                self.string = value
+
+    def to_dict(self, field):
+        return {'field': field,
+                'timestamp': self.timestamp.isoformat() if self.timestamp else None,
+                'string': self.string}
+
+
+def stream_new_docs(db, collection_name, field, mark):
+    """依型別分別查詢比水位新的文件 (還沒看過的型別從下限查起)"""
+    ref = db.collection(collection_name)
+    bounds = (mark.timestamp if mark.timestamp is not None else MIN_TIMESTAMP,
+              mark.string if mark.string is not None else MIN_STRING)
+    for value in bounds:
+        yield from ref.where(field, '>', value).order_by(field).stream()
@@ -0,0 +1,171 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+# 目錄格式與讀取器放在 03_AI_Lab/inference/catalog.py (推論服務也用同一份)
+LAB_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "03_AI_Lab")
+sys.path.insert(0, LAB_DIR)
+from dataset_check import load_data_yaml  # noqa: E402
+from inference.catalog import HEADER_SIZE, CatalogIndex, pack_catalog  # noqa: E402
+
+# ==========================================
+# 商品目錄建置：labels.txt + products.json -> assets/models/catalog.bin
+# ==========================================
+# 模型輸出的類別編號 (labels.txt / data.yaml 的順序) 與商品價格原本只靠名稱字串隱性對應，
+# 而商品資料散在三份 products.json。這裡先交叉檢查，全部一致才產生目錄檔：
+#   - labels.txt 與 data.yaml 的 names 順序完全相同 (模型的 class_id 就是這個順序)
+#   - 三份 products.json 的商品 id 集合相同，每個商品的價格 / 名稱 / 類別相同
+#   - 每個辨識類別都能在商品資料中找到，價格為非負整數
+# 任何不一致都會列出並以非 0 結束，不會等到收銀台才發現價格對不上。
+# 找不到 data.yaml 時同樣視為失敗；確定不需要比對順序時才加 --no-data-check。
+# 用法：python build_catalog.py [--data data.yaml] [--check] [--no-data-check]
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+LABELS_PATH = os.path.join(APP_DIR, "assets", "models", "labels.txt")
+CATALOG_PATH = os.path.join(APP_DIR, "assets", "models", "catalog.bin")
+PRODUCT_SOURCES = [
+    os.path.join(APP_DIR, "assets", "products.json"),
+    os.path.join(APP_DIR, "new_project", "assets", "products.json"),
+    os.path.join(APP_DIR, "Firebase__database_download", "products.json"),
+]
+# 先找 repo 內的資料集，再找實驗室電腦上的固定路徑
+DATA_CANDIDATES = [
+    os.path.join(LAB_DIR, "yolo11_data", "drink", "data.yaml"),
+    r"D:\product_recognition\03_AI_Lab\yolo11_data\drink\data.yaml",
+]
+DEFAULT_DATA = next((p for p in DATA_CANDIDATES if os.path.exists(p)), DATA_CANDIDATES[0])
+# 比對的欄位 (App 端的 products.json 用 class，Firestore 匯出用 category)
+FIELDS = ('price', 'name', 'category')
+
+
+def load_labels(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def load_products(path, errors):
+    """讀取一份 products.json，回傳 {id: {'id', 'price', 'name', 'category'}}；格式錯誤記在 errors"""
+    name = os.path.relpath(path, APP_DIR)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            rows = json.load(f)
+    except (OSError, ValueError) as e:
+        errors.append(f"{name}：無法讀取 ({e})")
+        return {}
+
+    products = {}
+    for i, row in enumerate(rows):
+        pid = row.get('id')
+        if not pid:
+            errors.append(f"{name} 第 {i} 筆沒有 id")
+            continue
+        if pid in products:
+            errors.append(f"{name}：商品 id 重複 {pid}")
+        price = row.get('price')
+        if isinstance(price, float) and price.is_integer():
+            price = int(price)
+        if not isinstance(price, int) or isinstance(price, bool) or price < 0:
+            errors.append(f"{name}：{pid} 的價格不是非負整數 ({price!r})")
+        category = row.get('class', row.get('category'))
+        if not category:
+            errors.append(f"{name}：{pid} 沒有類別 (class / category)")
+        products[pid] = {'id': pid, 'price': price, 'name': row.get('name') or pid,
+                         'category': (category or '').lower().strip()}
+    return products
+
+
+def validate(labels, sources, names=None):
+    """回傳 (錯誤清單, 以第一份來源為準的 {類別名稱: 商品})"""
+    errors = []
+    if not labels:
+        errors.append("labels.txt 是空的")
+    dupes = sorted({l for l in labels if labels.count(l) > 1})
+    if dupes:
+        errors.append(f"labels.txt 有重複的類別：{', '.join(dupes)}")
+
+    if names is not None and names != labels:
+        if len(names) != len(labels):
+            errors.append(f"data.yaml 有 {len(names)} 個類別，labels.txt 有 {len(labels)} 個")
+        diffs = [f"#{i} {a} != {b}" for i, (a, b) in enumerate(zip(names, labels)) if a != b]
+        if diffs:
+            errors.append("data.yaml 與 labels.txt 的類別順序不同：" + "、".join(diffs[:10]))
+
+    loaded = {path: load_products(path, errors) for path in sources}
+    reference_path = sources[0]
+    reference = loaded[reference_path]
+    ref_name = os.path.relpath(reference_path, APP_DIR)
+    for path, products in loaded.items():
+        if path == reference_path or not products:
+            continue
+        name = os.path.relpath(path, APP_DIR)
+        missing = sorted(set(reference) - set(products))
+        extra = sorted(set(products) - set(reference))
+        if missing:
+            errors.append(f"{name} 缺少 {len(missing)} 項商品：{', '.join(missing[:10])}")
+        if extra:
+            errors.append(f"{name} 多出 {len(extra)} 項 {ref_name} 沒有的商品：{', '.join(extra[:10])}")
+        for pid in sorted(set(reference) & set(products)):
+            for field in FIELDS:
+                a, b = reference[pid][field], products[pid][field]
+                if a != b:
+                    errors.append(f"{pid} 的 {field} 不一致：{ref_name}={a!r}、{name}={b!r}")
+
+    unknown = [l for l in labels if l not in reference]
+    if unknown:
+        errors.append(f"以下辨識類別在商品資料中找不到：{', '.join(unknown)}")
+    return errors, {l: reference[l] for l in labels if l in reference}
+
+
+def build(data_yaml=DEFAULT_DATA, output=CATALOG_PATH, check=False, data_check=True):
+    labels = load_labels(LABELS_PATH)
+    names = None
+    if not data_check:
+        print("⚠️ 已指定 --no-data-check，略過 data.yaml 與 labels.txt 的順序檢查")
+    elif data_yaml and os.path.exists(data_yaml):
+        names = load_data_yaml(data_yaml)['names']
+    else:
+        print(f"❌ 找不到 {data_yaml}，無法比對類別順序 (用 --data 指定，或加 --no-data-check 略過)")
+        return False
+
+    errors, products = validate(labels, PRODUCT_SOURCES, names)
+    if errors:
+        print(f"❌ 商品目錄檢查失敗 ({len(errors)} 項)：")
+        for e in errors:
+            print(f"   - {e}")
+        return False
+
+    data = pack_catalog(labels, products, built_at=time.time())
+    if check:
+        # 只比較內容 (header 最後 4 bytes 是建置時間)
+        try:
+            with open(output, 'rb') as f:
+                current = f.read()
+        except OSError:
+            current = b""
+        if current[:HEADER_SIZE - 4] + current[HEADER_SIZE:] != data[:HEADER_SIZE - 4] + data[HEADER_SIZE:]:
+            print(f"❌ {output} 不是最新的，請執行 python build_catalog.py")
+            return False
+        print(f"✅ {output} 為最新 ({len(labels)} 個類別)")
+        return True
+
+    with open(output + ".tmp", 'wb') as f:
+        f.write(data)
+    os.replace(output + ".tmp", output)
+
+    catalog = CatalogIndex(data)
+    assert all(catalog.lookup(i)['product_id'] == products[l]['id'] for i, l in enumerate(labels))
+    print(f"✅ 已產生 {output}：{len(labels)} 個類別、{len(catalog.categories)} 種分類、{len(data)} bytes")
+    return True
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="檢查商品資料並產生 App / 推論服務共用的商品目錄 (catalog.bin)")
+    parser.add_argument('--data', default=DEFAULT_DATA, help="訓練用的 data.yaml (比對類別順序)")
+    parser.add_argument('--output', default=CATALOG_PATH)
+    parser.add_argument('--check', action='store_true', help="只檢查，不寫檔；目錄檔過期時失敗")
+    parser.add_argument('--no-data-check', dest='data_check', action='store_false',
+                        help="略過 data.yaml 類別順序檢查 (找不到 data.yaml 時預設會失敗)")
+    args = parser.parse_args()
+    sys.exit(0 if build(args.data, args.output, args.check, args.data_check) else 1)
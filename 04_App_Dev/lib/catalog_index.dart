@@ -0,0 +1,72 @@
+import 'dart:convert';
+import 'dart:typed_data';
+import 'package:flutter/services.dart';
+
+// 讀取 build_catalog.py 產生的 assets/models/catalog.bin
+// 格式與 03_AI_Lab/inference/catalog.py 相同 (little-endian)：header 52 bytes、分類表、每個類別 18 bytes 的 record、字串池
+// 第 i 筆 record 對應 labels.txt 第 i 個類別，查詢直接算位移，不需解析 JSON
+
+class CatalogEntry {
+  final String productId;
+  final String name;
+  final int price;
+  final String category;
+
+  const CatalogEntry(this.productId, this.name, this.price, this.category);
+}
+
+class CatalogIndex {
+  static const int _version = 1;
+
+  final ByteData _data;
+  final int count;
+  final int _recordSize;
+  final int _recordsOffset;
+  final int _stringsOffset;
+  final List<String> categories = [];
+
+  CatalogIndex._(this._data, this.count, this._recordSize, this._recordsOffset, this._stringsOffset);
+
+  static Future<CatalogIndex> load([String asset = "assets/models/catalog.bin"]) async {
+    return CatalogIndex.fromBytes(await rootBundle.load(asset));
+  }
+
+  factory CatalogIndex.fromBytes(ByteData data) {
+    if (String.fromCharCodes(data.buffer.asUint8List(data.offsetInBytes, 4)) != "PCAT") {
+      throw const FormatException("不是商品目錄檔");
+    }
+    final version = data.getUint16(4, Endian.little);
+    if (version != _version) throw FormatException("不支援的商品目錄版本: $version");
+
+    final nCategories = data.getUint16(10, Endian.little);
+    final categoriesOffset = data.getUint32(16, Endian.little);
+    final index = CatalogIndex._(
+      data,
+      data.getUint32(12, Endian.little),
+      data.getUint16(8, Endian.little),
+      data.getUint32(20, Endian.little),
+      data.getUint32(24, Endian.little),
+    );
+    for (var i = 0; i < nCategories; i++) {
+      final pos = categoriesOffset + i * 6;
+      index.categories.add(index._string(data.getUint32(pos, Endian.little), data.getUint16(pos + 4, Endian.little)));
+    }
+    return index;
+  }
+
+  String _string(int offset, int length) {
+    return utf8.decode(_data.buffer.asUint8List(_data.offsetInBytes + _stringsOffset + offset, length));
+  }
+
+  /// classId 為模型輸出的類別編號；超出範圍回傳 null
+  CatalogEntry? lookup(int classId) {
+    if (classId < 0 || classId >= count) return null;
+    final pos = _recordsOffset + classId * _recordSize;
+    return CatalogEntry(
+      _string(_data.getUint32(pos + 4, Endian.little), _data.getUint16(pos + 8, Endian.little)),
+      _string(_data.getUint32(pos + 10, Endian.little), _data.getUint16(pos + 14, Endian.little)),
+      _data.getInt32(pos, Endian.little),
+      categories[_data.getUint16(pos + 16, Endian.little)],
+    );
+  }
+}
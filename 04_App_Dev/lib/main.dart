@@ -7,6 +7,7 @@
   import 'package:flutter/services.dart';
   import 'package:image_picker/image_picker.dart';
   import 'detector_service.dart'; // 確保檔案路徑正確
+  import 'catalog_index.dart'; // 打包在 App 內的商品目錄 (build_catalog.py 產生)
   import 'package:firebase_core/firebase_core.dart'; // 新增
   import 'package:cloud_firestore/cloud_firestore.dart'; // 新增
   import 'firebase_options.dart'; // 新增 (需執行過 flutterfire configure)
@@ -89,6 +90,7 @@
   }
 
   Future<void> _initApp() async {
+    await _loadCatalog();        // 先用內建商品目錄，離線也能結帳
     await _loadProductData();    // 監聽雲端資料庫
     await _detector.loadModel(); // 載入 AI 模型
     if (mounted) setState(() => _isDataLoaded = true);
@@ -124,6 +126,24 @@
   }
 
   // D. 資料載入 (修正解析邏輯)
+  // 內建商品目錄：與 labels.txt 一起建置、已驗證過價格，Firestore 快照到達後會整批覆蓋
+  Future<void> _loadCatalog() async {
+    try {
+      final catalog = await CatalogIndex.load();
+      if (!mounted || productDatabase.isNotEmpty) return;
+      setState(() {
+        for (var i = 0; i < catalog.count; i++) {
+          final entry = catalog.lookup(i)!;
+          productDatabase[entry.productId] = entry.price;
+          labelTranslation[entry.productId] = entry.name;
+          productCategoryMap[entry.productId] = entry.category;
+        }
+      });
+    } catch (e) {
+      debugPrint("⚠️ 商品目錄載入失敗: $e");
+    }
+  }
+
   Future<void> _loadProductData() async {
     try {
       FirebaseFirestore.instance.collection('products').snapshots().listen((snapshot) {
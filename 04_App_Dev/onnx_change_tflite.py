@@ -1,8 +1,284 @@
-from ultralytics import YOLO
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
 
-# 載入你的 ONNX 模型 (或是原本的 .pt 檔更好)
-model = YOLO(r"D:\product_recognition\04_App_Dev\assets\models\best.onnx") 
+import cv2
+import onnx
+from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
 
-# 匯出為 TFLite 格式
-# format='tflite' 會生成一個包含 .tflite 的資料夾
-model.export(format='tflite', imgsz=640)
\ No newline at end of file
+# 資料集解析、前處理與效能量測沿用 03_AI_Lab 的模組
+LAB_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "03_AI_Lab")
+sys.path.insert(0, LAB_DIR)
+from augment_engine import IMG_EXTS  # noqa: E402
+from bench_models import artifact_kind, run_isolated  # noqa: E402
+from dataset_check import load_data_yaml, resolve_split_dirs  # noqa: E402
+from inference.preprocess import BatchBuffer  # noqa: E402
+
+# ==========================================
+# 模型最佳化：INT8 訓練後量化 (PTQ)
+# ==========================================
+# 1. 從 yolo11_data 的 val 圖片抽樣，作為校正 (calibration) 資料
+# 2. ONNX：.pt 先匯出 FP32 ONNX，再用 ONNX Runtime 靜態量化 (只量化 Conv / MatMul，偵測頭的解碼保持浮點)
+#    TFLite：由 Ultralytics 以同一組校正圖片匯出 int8 TFLite (需要 .pt)
+# 3. 與浮點模型比較：檔案大小、CPU 延遲、每個類別的 AP50、易混淆類別間的誤認率
+# 4. 易混淆類別 (例如 麥香 vs 咖啡廣場) 的退步超過容許值時，拒絕發佈到 App 的 assets/models
+
+DEFAULT_MODEL = r"D:\product_recognition\03_AI_Lab\runs\train\grocery_v4_stable_final\weights\best.pt"
+DEFAULT_DATA = r"D:\product_recognition\03_AI_Lab\yolo11_data\drink\data.yaml"
+APP_MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets", "models")
+
+# 外觀相近、量化後最容易互相認錯的類別組合
+CONFUSABLE_PAIRS = [
+    ("Mai_Xiang_Black_Tea_Aluminum", "Coffee_Square"),
+    ("Mai_Xiang_Black_Tea_Bottled", "Coffee_Square"),
+    ("Mai_Xiang_Milk", "Coffee_Square"),
+    ("King_Tea_Green", "King_Tea_Yellow"),
+    ("HeySong_Sarsaparilla_Iron", "HeySong_Sarsaparilla_Large"),
+    ("Sweat_Run_Bottled", "Sweat_Run_Bottled_Large"),
+    ("Small_Water", "Large_Water"),
+]
+TOLERANCE = 0.02   # AP50 下降或誤認率上升超過 2 個百分點就不發佈
+
+
+# ------------------------------------------
+# 校正資料
+# ------------------------------------------
+
+def sample_calibration(data_yaml, work_dir, count=200, seed=0):
+    """
+    從 val 抽 count 張圖，寫成圖片清單與暫時的 data.yaml (train / val 都指向清單)，
+    讓 ONNX Runtime 與 Ultralytics 的 int8 匯出使用同一組校正圖片
+    """
+    config = load_data_yaml(data_yaml)
+    dirs = resolve_split_dirs(config, data_yaml)
+    split = next(s for s in ("val", "test", "train") if dirs.get(s))
+    images = sorted(os.path.join(d, n) for d in dirs[split] for n in os.listdir(d)
+                    if n.lower().endswith(IMG_EXTS))
+    images = random.Random(seed).sample(images, min(count, len(images)))
+
+    list_path = os.path.join(work_dir, "calibration.txt")
+    with open(list_path, 'w', encoding='utf-8') as f:
+        f.write("\n".join(images) + "\n")
+
+    import yaml
+    calib = {'path': work_dir, 'train': list_path, 'val': list_path,
+             'nc': config.get('nc', len(config['names'])), 'names': config['names']}
+    calib_yaml = os.path.join(work_dir, "calibration.yaml")
+    with open(calib_yaml, 'w', encoding='utf-8') as f:
+        yaml.safe_dump(calib, f, allow_unicode=True)
+    print(f"🎯 校正資料：從 {split} 抽樣 {len(images)} 張")
+    return calib_yaml, images
+
+
+class ImageCalibrationReader(CalibrationDataReader):
+    """逐張讀取校正圖片，前處理與推論服務 (inference.preprocess) 完全相同"""
+
+    def __init__(self, images, input_name, imgsz=640):
+        self.images = images
+        self.input_name = input_name
+        self.buffer = BatchBuffer(1, imgsz)
+        self.rewind()
+
+    def get_next(self):
+        for path in self._iter:
+            img = cv2.imread(path)
+            if img is not None:
+                tensor, _ = self.buffer.fill([img])
+                return {self.input_name: tensor.copy()}
+        return None
+
+    def rewind(self):
+        self._iter = iter(self.images)
+
+
+# ------------------------------------------
+# 匯出與量化
+# ------------------------------------------
+
+def export_float_onnx(pt_path, imgsz=640):
+    from ultralytics import YOLO
+    return str(YOLO(pt_path).export(format='onnx', opset=13, imgsz=imgsz, simplify=True))
+
+
+def quantize_onnx(fp32_path, images, imgsz=640):
+    """ONNX Runtime 靜態量化 (QDQ、per-channel 權重)"""
+    out_path = os.path.splitext(fp32_path)[0] + "_int8.onnx"
+    graph = onnx.load(fp32_path).graph
+    input_name = graph.input[0].name
+    # 偵測頭的 box 座標 (0~640) 與類別分數 (0~1) 共用一個 INT8 scale 會把分數全部量化成 0，只量化有權重的運算
+    exclude = [n.name for n in graph.node if n.name and n.op_type not in ("Conv", "Gemm", "MatMul")]
+    del graph
+
+    print(f"⚙️ ONNX Runtime 靜態量化：{os.path.basename(fp32_path)} -> {os.path.basename(out_path)}")
+    quantize_static(fp32_path, out_path, ImageCalibrationReader(images, input_name, imgsz),
+                    quant_format=QuantFormat.QDQ, per_channel=True,
+                    activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8,
+                    nodes_to_exclude=exclude)
+    return out_path
+
+
+def export_int8_tflite(pt_path, calib_yaml, imgsz=640):
+    """Ultralytics int8 匯出，回傳 (int8 模型, 同時產生的 float32 模型或 None)"""
+    from ultralytics import YOLO
+    out = str(YOLO(pt_path).export(format='tflite', int8=True, data=calib_yaml, imgsz=imgsz))
+    out_dir = out if os.path.isdir(out) else os.path.dirname(out)
+    files = sorted(os.listdir(out_dir))
+    int8 = next((f for f in files if f.endswith("_int8.tflite")), None)
+    int8 = os.path.join(out_dir, int8) if int8 else out
+    fp32 = next((os.path.join(out_dir, f) for f in files if f.endswith("_float32.tflite")), None)
+    return int8, fp32
+
+
+# ------------------------------------------
+# 比較
+# ------------------------------------------
+
+def evaluate(model_path, data_yaml, imgsz=640):
+    """Ultralytics val：整體 mAP、每個類別 AP50 與混淆矩陣 (matrix[預測][真實])"""
+    from ultralytics import YOLO
+    metrics = YOLO(model_path, task='detect').val(data=data_yaml, imgsz=imgsz, batch=1, device='cpu',
+                                                  plots=False, verbose=False)
+    names = [metrics.names[i] for i in sorted(metrics.names)]
+    per_class = {names[c]: round(float(ap), 5) for c, ap in zip(metrics.box.ap_class_index, metrics.box.ap50)}
+    return {'map50': round(float(metrics.box.map50), 5), 'map50_95': round(float(metrics.box.map), 5),
+            'per_class': per_class, 'names': names,
+            'confusion': metrics.confusion_matrix.matrix.astype(int).tolist()}
+
+
+def confusion_rate(result, a, b):
+    """a、b 兩類的真實物件中，被認成另一類的比例"""
+    names, m = result['names'], result['confusion']
+    ia, ib = names.index(a), names.index(b)
+    total = sum(row[ia] + row[ib] for row in m)
+    return (m[ib][ia] + m[ia][ib]) / total if total else 0.0
+
+
+def compare_accuracy(reference, quantized, pairs=CONFUSABLE_PAIRS, tolerance=TOLERANCE):
+    delta = {name: round(quantized['per_class'].get(name, 0.0) - ap, 5)
+             for name, ap in reference['per_class'].items()}
+    checks = []
+    for a, b in pairs:
+        missing = [n for n in (a, b) if n not in reference['names'] or n not in quantized['names']]
+        if missing:
+            # 類別改名或打錯字：這組沒辦法檢查，當作不通過，不能讓發佈閘門空過
+            checks.append({'pair': [a, b], 'missing': missing, 'ap50_drop': None, 'confusion_rise': None,
+                           'passed': False})
+            continue
+        ap_drop = max(-delta.get(a, 0.0), -delta.get(b, 0.0))
+        rise = confusion_rate(quantized, a, b) - confusion_rate(reference, a, b)
+        checks.append({'pair': [a, b], 'ap50_drop': round(ap_drop, 5), 'confusion_rise': round(rise, 5),
+                       'passed': ap_drop <= tolerance and rise <= tolerance})
+    return {'map50_delta': round(quantized['map50'] - reference['map50'], 5),
+            'per_class_ap50_delta': delta, 'confusable_pairs': checks,
+            'passed': all(c['passed'] for c in checks)}
+
+
+def measure_latency(model_path, img_dir, count=50, imgsz=640):
+    config = {'img_dir': img_dir, 'count': count, 'imgsz': imgsz, 'conf': 0.25, 'threads': None, 'data_yaml': None}
+    result = run_isolated(artifact_kind(model_path), os.path.abspath(model_path), config)
+    return result.get('latency', {}).get('p50_ms'), result.get('peak_rss_mb')
+
+
+def compare_pair(name, float_path, int8_path, data_yaml, img_dir, imgsz, tolerance):
+    print(f"📊 [{name}] {os.path.basename(float_path)} vs {os.path.basename(int8_path)}")
+    reference, quantized = evaluate(float_path, data_yaml, imgsz), evaluate(int8_path, data_yaml, imgsz)
+    (float_ms, float_rss), (int8_ms, int8_rss) = (measure_latency(float_path, img_dir, imgsz=imgsz),
+                                                  measure_latency(int8_path, img_dir, imgsz=imgsz))
+    float_size, int8_size = os.path.getsize(float_path), os.path.getsize(int8_path)
+    return {
+        'float': float_path, 'int8': int8_path,
+        'size_mb': [round(float_size / 1024 ** 2, 2), round(int8_size / 1024 ** 2, 2)],
+        'size_reduction': round(1 - int8_size / float_size, 4),
+        'p50_ms': [float_ms, int8_ms],
+        'latency_change': round(int8_ms / float_ms - 1, 4) if float_ms and int8_ms else None,
+        'peak_rss_mb': [float_rss, int8_rss],
+        'map50': [reference['map50'], quantized['map50']],
+        'accuracy': compare_accuracy(reference, quantized, tolerance=tolerance),
+    }
+
+
+def print_pair(name, r):
+    print(f"   [{name}] 大小 {r['size_mb'][0]} -> {r['size_mb'][1]} MB (-{r['size_reduction']:.0%})"
+          f" | p50 {r['p50_ms'][0]} -> {r['p50_ms'][1]} ms"
+          f" | mAP50 {r['map50'][0]:.3f} -> {r['map50'][1]:.3f}")
+    worst = sorted(r['accuracy']['per_class_ap50_delta'].items(), key=lambda kv: kv[1])[:5]
+    print("   退步最多的類別：" + "、".join(f"{k} {v:+.3f}" for k, v in worst))
+    for c in r['accuracy']['confusable_pairs']:
+        mark = "✅" if c['passed'] else "❌"
+        if c.get('missing'):
+            print(f"   {mark} {c['pair'][0]} / {c['pair'][1]}：模型沒有類別 {', '.join(c['missing'])} (請更新 CONFUSABLE_PAIRS)")
+            continue
+        print(f"   {mark} {c['pair'][0]} / {c['pair'][1]}：AP50 -{c['ap50_drop']:.3f}，誤認率 {c['confusion_rise']:+.3f}")
+
+
+# ------------------------------------------
+# 整體流程
+# ------------------------------------------
+
+def optimize_model(model_path=DEFAULT_MODEL, data_yaml=DEFAULT_DATA, imgsz=640, calib_count=200,
+                   tolerance=TOLERANCE, publish_dir=APP_MODEL_DIR):
+    start = time.perf_counter()
+    is_pt = model_path.lower().endswith('.pt')
+    work_dir = tempfile.mkdtemp(prefix="int8_calib_")
+    report = {'source': model_path, 'data': data_yaml, 'tolerance': tolerance, 'results': {}}
+    try:
+        calib_yaml, images = sample_calibration(data_yaml, work_dir, calib_count)
+        img_dir = os.path.dirname(images[0])
+        outputs = {}
+
+        # ONNX INT8 (後台推論服務用)
+        fp32_onnx = export_float_onnx(model_path, imgsz) if is_pt else model_path
+        outputs['onnx'] = (fp32_onnx, quantize_onnx(fp32_onnx, images, imgsz))
+
+        # TFLite INT8 (App 用)；Ultralytics 只能從 .pt 匯出
+        if is_pt:
+            int8_tflite, fp32_tflite = export_int8_tflite(model_path, calib_yaml, imgsz)
+            outputs['tflite'] = (fp32_tflite or model_path, int8_tflite)
+        else:
+            print("⚠️ 來源是 ONNX，略過 TFLite (Ultralytics 需要 .pt 才能匯出 TFLite)")
+
+        for name, (float_path, int8_path) in outputs.items():
+            report['results'][name] = compare_pair(name, float_path, int8_path, data_yaml, img_dir, imgsz, tolerance)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print("\n===== 量化結果 =====")
+    for name, r in report['results'].items():
+        print_pair(name, r)
+
+    report['passed'] = all(r['accuracy']['passed'] for r in report['results'].values())
+    if report['passed'] and publish_dir and 'tflite' in report['results']:
+        target = os.path.join(publish_dir, "best_int8.tflite")
+        shutil.copy2(report['results']['tflite']['int8'], target)
+        report['published'] = target
+        print(f"🚀 已發佈到 {target} (App 需把 detector_service.dart 的 modelPath 改成 best_int8.tflite)")
+    elif not report['passed']:
+        print(f"⛔ 易混淆類別退步超過 {tolerance:.0%}，不發佈 INT8 模型")
+
+    report['seconds'] = round(time.perf_counter() - start, 1)
+    report_path = os.path.join(os.path.dirname(os.path.abspath(model_path)), "quantize_report.json")
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"📝 報告已寫入 {report_path}")
+    return report
+
+
+if __name__ == '__main__':
+    # 用法：python onnx_change_tflite.py [best.pt 或 best.onnx] [--data data.yaml] [--calib 200] [--tolerance 0.02]
+    parser = argparse.ArgumentParser(description="INT8 量化 (ONNX + TFLite)，易混淆類別退步過多時不發佈")
+    parser.add_argument('model', nargs='?', default=DEFAULT_MODEL)
+    parser.add_argument('--data', default=DEFAULT_DATA)
+    parser.add_argument('--imgsz', type=int, default=640)
+    parser.add_argument('--calib', type=int, default=200, help="校正圖片張數")
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE)
+    parser.add_argument('--no-publish', action='store_true', help="只產生報告，不複製到 assets/models")
+    args = parser.parse_args()
+
+    result = optimize_model(args.model, args.data, args.imgsz, args.calib, args.tolerance,
+                            None if args.no_publish else APP_MODEL_DIR)
+    sys.exit(0 if result['passed'] else 1)
@@ -1,41 +1,126 @@
 import os
+import sys
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 
-def clean_augmented_files(data_root):
+# 擴充清單 (augment_manifest.json) 的讀寫邏輯放在 03_AI_Lab
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "03_AI_Lab"))
+from aug_manifest import MANIFEST_NAME, AugmentManifest  # noqa: E402
+
+# 舊資料集 (擴充清單出現之前) 用過的後綴，只在 include_untracked=True 時才以檔名比對
+LEGACY_TAGS = ["_flip", "_bright", "_dark", "_blur", "_noise"]
+
+
+def find_manifests(data_root):
+    """找出 data_root 底下所有資料集的擴充清單 (不進入 images / labels 資料夾)"""
+    found = []
+    for root, dirs, files in os.walk(data_root):
+        dirs[:] = [d for d in dirs if d not in ("images", "labels")]
+        if MANIFEST_NAME in files:
+            found.append(root)
+    return found
+
+
+def _sizes_by_scandir(paths):
+    """同一資料夾只 scandir 一次，取得所有目標檔案的大小"""
+    by_dir = defaultdict(set)
+    for p in paths:
+        by_dir[os.path.dirname(p)].add(os.path.basename(p))
+
+    sizes = {}
+    for folder, names in by_dir.items():
+        if not os.path.isdir(folder):
+            continue
+        with os.scandir(folder) as it:
+            for e in it:
+                if e.name in names and e.is_file():
+                    sizes[e.path] = e.stat().st_size
+    return sizes
+
+
+def _untracked_files(data_root, tracked):
+    """以檔名後綴找出清單以外的擴充檔 (所有 split 的 images / labels)"""
+    found = []
+    for root, dirs, files in os.walk(data_root):
+        if os.path.basename(root) not in ("images", "labels"):
+            continue
+        for filename in files:
+            stem = os.path.splitext(filename)[0]
+            path = os.path.join(root, filename)
+            if path not in tracked and any(stem.endswith(tag) for tag in LEGACY_TAGS):
+                found.append(path)
+    return found
+
+
+def clean_augmented_files(data_root, dry_run=False, workers=8, include_untracked=False):
     """
-    🧹 專門刪除 YOLO 格式資料集中的擴充檔案
-    包含: .jpg, .png, .txt (標籤)
+    🧹 依擴充清單刪除 YOLO 格式資料集中的擴充檔案
+    包含: .jpg, .png, .txt (標籤)，涵蓋清單中記錄的所有 split 與後綴
+    dry_run=True 時只列出會刪除的檔案與可回收空間，不做任何更動
+    include_untracked=True 時另外以舊後綴比對清單以外的檔案 (清單出現前產生的擴充檔)
     """
-    # 定義要掃描的子路徑 (可根據需求增加，如 val, test)
-    sub_dirs = [
-        os.path.join("train", "images"),
-        os.path.join("train", "labels")    ]
-    
-    tags = ["_blur", "_noise"]
-    count = 0
-
     print(f"🚀 開始清理路徑: {data_root}")
 
-    for sub in sub_dirs:
-        folder_path = os.path.join(data_root, sub)
-        
-        if not os.path.exists(folder_path):
-            print(f"ℹ️ 跳過不存在的資料夾: {sub}")
-            continue
+    # 1. 從每個資料集的清單收集要刪的檔案
+    manifests = [AugmentManifest(root) for root in find_manifests(data_root)]
+    targets = []
+    for manifest in manifests:
+        for record in manifest.sources.values():
+            for variant in record['variants'].values():
+                for rel_path in (variant['image'], variant['label']):
+                    if rel_path:
+                        targets.append(manifest.abs(rel_path))
+    if not manifests:
+        print("ℹ️ 找不到任何擴充清單 (augment_manifest.json)")
+
+    if include_untracked:
+        targets += _untracked_files(data_root, set(targets))
+
+    sizes = _sizes_by_scandir(targets)
+    existing = [p for p in targets if p in sizes]
+    total_bytes = sum(sizes.values())
+
+    if dry_run:
+        for path in existing[:20]:
+            print(f"   🗑️ {path}")
+        if len(existing) > 20:
+            print(f"   ... 另有 {len(existing) - 20} 個檔案")
+        print(f"🔎 [Dry-run] 將刪除 {len(existing)} 個擴充檔案，可回收 {total_bytes / 1024 / 1024:.1f} MB")
+        return {'files': len(existing), 'bytes': total_bytes, 'failed': 0}
+
+    # 2. 平行刪除
+    def remove(path):
+        try:
+            os.remove(path)
+            return None
+        except OSError as e:
+            return path, e
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        failed = dict(e for e in pool.map(remove, existing) if e)
+    for path, e in failed.items():
+        print(f"❌ 無法刪除 {os.path.basename(path)}: {e}")
 
-        for filename in os.listdir(folder_path):
-            # 檢查檔名是否包含指定的標籤
-            if any(tag in filename for tag in tags):
-                file_path = os.path.join(folder_path, filename)
-                try:
-                    os.remove(file_path)
-                    count += 1
-                except Exception as e:
-                    print(f"❌ 無法刪除 {filename}: {e}")
+    # 3. 從清單移除已刪除的變體紀錄，下次擴充會重新產生
+    for manifest in manifests:
+        for record in manifest.sources.values():
+            kept = {s: v for s, v in record['variants'].items()
+                    if any(p and manifest.abs(p) in failed for p in (v['image'], v['label']))}
+            if len(kept) != len(record['variants']):
+                record['variants'] = kept
+                manifest.dirty = True
+        manifest.save()
 
-    print(f"✅ 清理完畢！總共刪除了 {count} 個擴充檔案。")
+    count = len(existing) - len(failed)
+    reclaimed = total_bytes - sum(sizes[p] for p in failed)
+    print(f"✅ 清理完畢！總共刪除了 {count} 個擴充檔案，回收 {reclaimed / 1024 / 1024:.1f} MB。")
+    return {'files': count, 'bytes': reclaimed, 'failed': len(failed)}
 
 # --- 測試區塊：如果你直接執行 Tools.py 就會執行這裡 ---
 if __name__ == "__main__":
     # 這裡填入你的資料集根目錄
     TARGET_PATH = r"D:\product_recognition\03_AI_Lab\yolo11_data"
-    clean_augmented_files(TARGET_PATH)
\ No newline at end of file
+    # 加上 --dry-run 先預覽；加上 --untracked 一併清除清單出現前的舊擴充檔
+    clean_augmented_files(TARGET_PATH,
+                          dry_run="--dry-run" in sys.argv,
+                          include_untracked="--untracked" in sys.argv)